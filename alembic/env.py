@@ -1,6 +1,7 @@
 from logging.config import fileConfig
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
+from sqlalchemy import text
 from alembic import context
 import os
 import sys
@@ -76,11 +77,22 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
+        if connection.dialect.name == "postgresql":
+            # DDL, ожидающий блокировку, задерживает все записи в таблицу:
+            # лучше упасть быстро и повторить миграцию
+            connection.execute(
+                text(f"SET lock_timeout = '{settings.MIGRATION_LOCK_TIMEOUT}'")
+            )
+            connection.commit()
+
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
             compare_type=True,
             compare_server_default=True,
+            # Отдельная транзакция на миграцию: блокировки не копятся,
+            # autocommit_block() для CONCURRENTLY работает между миграциями
+            transaction_per_migration=True,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,330 @@
+"""Partition requests table by month on created_at
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 12:00:00.000000
+
+Строки копируются в новую таблицу пачками, пока приложение продолжает
+писать в requests; эксклюзивная блокировка берется только на короткое
+переключение таблиц (см. upgrade). Прерванную миграцию перед повтором
+нужно откатить: DROP TABLE requests_partitioned, триггера синхронизации
+и ограничения requests_created_at_not_null.
+"""
+
+from alembic import op
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = "003"
+down_revision = "002"
+branch_labels = None
+depends_on = None
+
+# Сколько месяцев вперед создаем партиции при миграции
+MONTHS_AHEAD = 3
+
+# Внешние ключи requests -> справочники (см. 41b7968bb5eb)
+REQUEST_FOREIGN_KEYS = [
+    (
+        "fk_requests_advertising_campaign_id",
+        "advertising_campaign_id",
+        "advertising_campaigns",
+        "SET NULL",
+    ),
+    ("fk_requests_city_id", "city_id", "cities", "RESTRICT"),
+    ("fk_requests_request_type_id", "request_type_id", "request_types", "RESTRICT"),
+    ("fk_requests_direction_id", "direction_id", "directions", "SET NULL"),
+    ("fk_requests_master_id", "master_id", "masters", "SET NULL"),
+]
+
+# Индексы на родительской таблице автоматически создаются в каждой партиции
+REQUEST_INDEXES = [
+    ("idx_requests_created_at", "(created_at DESC)"),
+    ("idx_requests_status", "(status)"),
+    ("idx_requests_city_id", "(city_id)"),
+    ("idx_requests_client_phone", "(client_phone)"),
+    ("idx_requests_master_id", "(master_id)"),
+    ("idx_requests_request_type_id", "(request_type_id)"),
+    ("idx_requests_advertising_campaign_id", "(advertising_campaign_id)"),
+    ("idx_requests_phone_time_window", "(client_phone, created_at DESC)"),
+    ("ix_requests_id", "(id)"),
+]
+
+# Колонки requests на момент миграции (version добавляется в 005)
+REQUEST_COLUMNS = [
+    "id",
+    "advertising_campaign_id",
+    "city_id",
+    "request_type_id",
+    "client_phone",
+    "client_name",
+    "address",
+    "meeting_date",
+    "direction_id",
+    "problem",
+    "status",
+    "master_id",
+    "master_notes",
+    "result",
+    "expenses",
+    "net_amount",
+    "master_handover",
+    "ats_number",
+    "call_center_name",
+    "call_center_notes",
+    "bso_file_path",
+    "expense_file_path",
+    "recording_file_path",
+    "avito_chat_id",
+    "created_at",
+    "updated_at",
+]
+
+# Строк в одной пачке копирования
+COPY_BATCH_SIZE = 10_000
+
+# Новая таблица до переключения
+NEW_TABLE = "requests_partitioned"
+
+
+def _column_list() -> str:
+    return ", ".join(REQUEST_COLUMNS)
+
+
+def _index_statement(name: str, columns: str, table: str, suffix: str = "") -> str:
+    return f"CREATE INDEX {name}{suffix} ON {table} {columns}"
+
+
+def _create_partitioned_table():
+    """Пустая партиционированная копия requests с индексами и FK"""
+    op.execute(
+        f"""
+        CREATE TABLE {NEW_TABLE} (
+            LIKE requests INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.execute(f"ALTER TABLE {NEW_TABLE} ALTER COLUMN created_at SET NOT NULL")
+    op.execute(f"ALTER TABLE {NEW_TABLE} ADD PRIMARY KEY (id, created_at)")
+
+    # Партиции от самого старого месяца до MONTHS_AHEAD месяцев вперед
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            month_start date := date_trunc(
+                'month', COALESCE((SELECT min(created_at) FROM requests), now())
+            )::date;
+            last_month date := (date_trunc('month', now()) + interval '{MONTHS_AHEAD} months')::date;
+        BEGIN
+            WHILE month_start <= last_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF {NEW_TABLE} FOR VALUES FROM (%L) TO (%L)',
+                    'requests_p' || to_char(month_start, 'YYYY_MM'),
+                    to_char(month_start, 'YYYY-MM-DD') || ' 00:00:00+00',
+                    to_char(month_start + interval '1 month', 'YYYY-MM-DD') || ' 00:00:00+00'
+                );
+                month_start := (month_start + interval '1 month')::date;
+            END LOOP;
+        END $$;
+        """
+    )
+    op.execute(f"CREATE TABLE requests_default PARTITION OF {NEW_TABLE} DEFAULT")
+
+    # На пустой таблице индексы и FK создаются мгновенно и дальше
+    # поддерживаются при копировании. Имена индексов старой таблицы еще
+    # заняты, поэтому временный суффикс снимается при переключении
+    for name, column, referred_table, ondelete in REQUEST_FOREIGN_KEYS:
+        op.create_foreign_key(
+            name, NEW_TABLE, referred_table, [column], ["id"], ondelete=ondelete
+        )
+    for name, columns in REQUEST_INDEXES:
+        op.execute(_index_statement(name, columns, NEW_TABLE, suffix="_new"))
+
+
+def _create_sync_trigger():
+    """Изменения requests во время копирования повторяются в новой таблице"""
+    # Новые строки с NULL в ключе партиционирования больше не появляются;
+    # существующие заполняются перед копированием
+    op.execute(
+        "ALTER TABLE requests ADD CONSTRAINT requests_created_at_not_null "
+        "CHECK (created_at IS NOT NULL) NOT VALID"
+    )
+
+    updates = ", ".join(
+        f"{column} = EXCLUDED.{column}"
+        for column in REQUEST_COLUMNS
+        if column not in ("id", "created_at")
+    )
+    values = ", ".join(f"NEW.{column}" for column in REQUEST_COLUMNS)
+    op.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION requests_sync_partitioned() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM {NEW_TABLE} WHERE id = OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO {NEW_TABLE} ({_column_list()})
+                VALUES ({values})
+                ON CONFLICT (id, created_at) DO UPDATE SET {updates};
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER trg_requests_sync_partitioned
+        AFTER INSERT OR UPDATE OR DELETE ON requests
+        FOR EACH ROW EXECUTE FUNCTION requests_sync_partitioned()
+        """
+    )
+
+
+def _copy_rows(bind):
+    """Копирование пачками по id, каждая пачка - отдельная транзакция
+
+    FOR SHARE не дает изменить строки пачки, пока она не зафиксирована:
+    триггер синхронизации всегда видит уже скопированную строку.
+    """
+    low, high = bind.execute(text("SELECT min(id), max(id) FROM requests")).first()
+    if low is None:
+        return
+    statement = text(
+        f"""
+        INSERT INTO {NEW_TABLE} ({_column_list()})
+        SELECT {_column_list()} FROM requests
+        WHERE id >= :start AND id < :end
+        FOR SHARE
+        ON CONFLICT (id, created_at) DO NOTHING
+        """
+    )
+    for start in range(low, high + 1, COPY_BATCH_SIZE):
+        bind.execute(statement, {"start": start, "end": start + COPY_BATCH_SIZE})
+
+
+def _swap_tables():
+    """Короткое переключение: новая таблица занимает место requests"""
+    op.execute("LOCK TABLE requests IN ACCESS EXCLUSIVE MODE")
+    op.execute("DROP TRIGGER trg_requests_sync_partitioned ON requests")
+    op.execute("DROP FUNCTION requests_sync_partitioned()")
+
+    # Уникальный ключ партиционированной таблицы обязан включать created_at,
+    # поэтому FK files.request_id заменяем триггером каскадного удаления
+    op.execute("ALTER TABLE files DROP CONSTRAINT IF EXISTS fk_files_request_id")
+    op.execute("ALTER TABLE files DROP CONSTRAINT IF EXISTS files_request_id_fkey")
+
+    # Пересоздается приложением (DatabaseOptimizer.create_materialized_views)
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS mv_requests_summary")
+
+    # Последовательность id переходит к новой таблице
+    op.execute("ALTER SEQUENCE requests_id_seq OWNED BY NONE")
+    op.execute("DROP TABLE requests CASCADE")
+    op.execute(f"ALTER TABLE {NEW_TABLE} RENAME TO requests")
+    op.execute(
+        f"ALTER TABLE requests RENAME CONSTRAINT {NEW_TABLE}_pkey TO requests_pkey"
+    )
+    for name, _ in REQUEST_INDEXES:
+        op.execute(f"ALTER INDEX {name}_new RENAME TO {name}")
+    op.execute("ALTER SEQUENCE requests_id_seq OWNED BY requests.id")
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION requests_delete_files() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM files WHERE request_id = OLD.id;
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER trg_requests_delete_files
+        AFTER DELETE ON requests
+        FOR EACH ROW EXECUTE FUNCTION requests_delete_files()
+        """
+    )
+
+
+def upgrade() -> None:
+    """Перенос requests в партиционированную таблицу без долгой блокировки
+
+    1. Пустая партиционированная таблица и триггер, повторяющий в ней все
+       изменения requests (короткая транзакция миграции, без чтения данных).
+    2. Копирование существующих строк пачками вне транзакции миграции -
+       запись в requests в это время продолжается.
+    3. Переключение в отдельной транзакции: ACCESS EXCLUSIVE держится только
+       на время переименований, без копирования данных.
+    """
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    _create_partitioned_table()
+    _create_sync_trigger()
+
+    with op.get_context().autocommit_block():
+        # Ключ партиционирования не может быть NULL
+        bind.execute(
+            text("UPDATE requests SET created_at = now() WHERE created_at IS NULL")
+        )
+        _copy_rows(bind)
+
+    _swap_tables()
+
+    # После COMMIT переключения, чтобы не держать эксклюзивную блокировку
+    with op.get_context().autocommit_block():
+        bind.execute(text("ANALYZE requests"))
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    op.execute("DROP TRIGGER IF EXISTS trg_requests_delete_files ON requests")
+    op.execute("DROP FUNCTION IF EXISTS requests_delete_files()")
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS mv_requests_summary")
+
+    op.execute("ALTER TABLE requests RENAME TO requests_partitioned")
+    op.execute(
+        "ALTER TABLE requests_partitioned RENAME CONSTRAINT requests_pkey TO requests_partitioned_pkey"
+    )
+    op.execute(
+        """
+        CREATE TABLE requests (
+            LIKE requests_partitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+        )
+        """
+    )
+    op.execute("ALTER TABLE requests ADD PRIMARY KEY (id)")
+    op.execute("ALTER TABLE requests ALTER COLUMN created_at DROP NOT NULL")
+    # Откат выполняется в окно обслуживания: копирование в одной транзакции
+    op.execute(
+        f"INSERT INTO requests ({_column_list()}) "
+        f"SELECT {_column_list()} FROM requests_partitioned"
+    )
+
+    op.execute("ALTER SEQUENCE requests_id_seq OWNED BY NONE")
+    op.execute("DROP TABLE requests_partitioned CASCADE")
+    op.execute("ALTER SEQUENCE requests_id_seq OWNED BY requests.id")
+
+    for name, column, referred_table, ondelete in REQUEST_FOREIGN_KEYS:
+        op.create_foreign_key(
+            name, "requests", referred_table, [column], ["id"], ondelete=ondelete
+        )
+
+    for name, columns in REQUEST_INDEXES:
+        op.execute(_index_statement(name, columns, "requests"))
+
+    op.create_foreign_key(
+        "fk_files_request_id",
+        "files",
+        "requests",
+        ["request_id"],
+        ["id"],
+        ondelete="CASCADE",
+    )
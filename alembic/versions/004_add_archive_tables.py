@@ -0,0 +1,133 @@
+"""Add archive tables for requests, transactions and files
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "004"
+down_revision = "003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "requests_archive",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "advertising_campaign_id",
+            sa.Integer(),
+            sa.ForeignKey("advertising_campaigns.id", ondelete="SET NULL"),
+        ),
+        sa.Column(
+            "city_id",
+            sa.Integer(),
+            sa.ForeignKey("cities.id", ondelete="RESTRICT"),
+            nullable=False,
+        ),
+        sa.Column(
+            "request_type_id",
+            sa.Integer(),
+            sa.ForeignKey("request_types.id", ondelete="RESTRICT"),
+            nullable=False,
+        ),
+        sa.Column("client_phone", sa.String(20), nullable=False),
+        sa.Column("client_name", sa.String(200)),
+        sa.Column("address", sa.Text()),
+        sa.Column("meeting_date", sa.DateTime(timezone=True)),
+        sa.Column(
+            "direction_id",
+            sa.Integer(),
+            sa.ForeignKey("directions.id", ondelete="SET NULL"),
+        ),
+        sa.Column("problem", sa.Text()),
+        sa.Column("status", sa.String(50)),
+        sa.Column(
+            "master_id",
+            sa.Integer(),
+            sa.ForeignKey("masters.id", ondelete="SET NULL"),
+        ),
+        sa.Column("master_notes", sa.Text()),
+        sa.Column("result", sa.Numeric(10, 2)),
+        sa.Column("expenses", sa.DECIMAL(10, 2)),
+        sa.Column("net_amount", sa.DECIMAL(10, 2)),
+        sa.Column("master_handover", sa.DECIMAL(10, 2)),
+        sa.Column("ats_number", sa.String(50)),
+        sa.Column("call_center_name", sa.String(200)),
+        sa.Column("call_center_notes", sa.Text()),
+        sa.Column("bso_file_path", sa.String(500)),
+        sa.Column("expense_file_path", sa.String(500)),
+        sa.Column("recording_file_path", sa.String(500)),
+        sa.Column("avito_chat_id", sa.String(100)),
+        sa.Column("created_at", sa.DateTime(timezone=True)),
+        sa.Column("updated_at", sa.DateTime(timezone=True)),
+        sa.Column(
+            "archived_at", sa.DateTime(timezone=True), server_default=sa.func.now()
+        ),
+    )
+    op.create_index(
+        "ix_requests_archive_client_phone", "requests_archive", ["client_phone"]
+    )
+    op.create_index(
+        "ix_requests_archive_created_at", "requests_archive", ["created_at"]
+    )
+
+    op.create_table(
+        "transactions_archive",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "city_id",
+            sa.Integer(),
+            sa.ForeignKey("cities.id", ondelete="RESTRICT"),
+            nullable=False,
+        ),
+        sa.Column(
+            "transaction_type_id",
+            sa.Integer(),
+            sa.ForeignKey("transaction_types.id", ondelete="RESTRICT"),
+            nullable=False,
+        ),
+        sa.Column("amount", sa.DECIMAL(10, 2), nullable=False),
+        sa.Column("notes", sa.Text()),
+        sa.Column("file_path", sa.String(500)),
+        sa.Column("specified_date", sa.Date(), nullable=False),
+        sa.Column("payment_reason", sa.Text()),
+        sa.Column("expense_receipt_path", sa.Text()),
+        sa.Column("created_at", sa.DateTime(timezone=True)),
+        sa.Column(
+            "archived_at", sa.DateTime(timezone=True), server_default=sa.func.now()
+        ),
+    )
+    op.create_index(
+        "ix_transactions_archive_created_at", "transactions_archive", ["created_at"]
+    )
+
+    op.create_table(
+        "files_archive",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("request_id", sa.Integer()),
+        sa.Column("transaction_id", sa.Integer()),
+        sa.Column("file_type", sa.String(50), nullable=False),
+        sa.Column("file_path", sa.String(500), nullable=False),
+        sa.Column("uploaded_at", sa.DateTime(timezone=True)),
+        sa.Column(
+            "archived_at", sa.DateTime(timezone=True), server_default=sa.func.now()
+        ),
+    )
+    op.create_index("ix_files_archive_request_id", "files_archive", ["request_id"])
+    op.create_index(
+        "ix_files_archive_transaction_id", "files_archive", ["transaction_id"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("files_archive")
+    op.drop_table("transactions_archive")
+    op.drop_table("requests_archive")
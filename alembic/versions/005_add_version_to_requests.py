@@ -0,0 +1,30 @@
+"""Add version column to requests for optimistic locking
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "005"
+down_revision = "004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Константный DEFAULT в PostgreSQL 11+ не переписывает таблицу, а колонка
+    # на партиционированном родителе добавляется во все партиции
+    op.add_column(
+        "requests",
+        sa.Column("version", sa.Integer(), nullable=False, server_default="1"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("requests", "version")
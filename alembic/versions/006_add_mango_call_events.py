@@ -0,0 +1,33 @@
+"""Add mango_call_events for webhook call_id idempotency
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "006"
+down_revision = "005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "mango_call_events",
+        sa.Column("call_id", sa.String(100), primary_key=True),
+        sa.Column("request_id", sa.Integer()),
+        sa.Column("from_number", sa.String(20)),
+        sa.Column(
+            "created_at", sa.DateTime(timezone=True), server_default=sa.func.now()
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("mango_call_events")
@@ -0,0 +1,50 @@
+"""Add mango_webhook_events queue for asynchronous webhook ingestion
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "007"
+down_revision = "006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "mango_webhook_events",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("call_id", sa.String(100)),
+        sa.Column("from_number", sa.String(20)),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False, server_default="pending"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("last_error", sa.Text()),
+        sa.Column("received_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("claimed_at", sa.DateTime(timezone=True)),
+        sa.Column("processed_at", sa.DateTime(timezone=True)),
+    )
+    op.create_index(
+        "idx_mango_webhook_events_pending",
+        "mango_webhook_events",
+        ["status", "next_attempt_at"],
+    )
+    op.create_index(
+        "idx_mango_webhook_events_phone",
+        "mango_webhook_events",
+        ["from_number", "id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_mango_webhook_events_phone", "mango_webhook_events")
+    op.drop_index("idx_mango_webhook_events_pending", "mango_webhook_events")
+    op.drop_table("mango_webhook_events")
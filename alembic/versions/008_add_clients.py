@@ -0,0 +1,53 @@
+"""Add clients directory maintained on request creation
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "008"
+down_revision = "007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "clients",
+        sa.Column("phone", sa.String(20), primary_key=True),
+        sa.Column("first_seen", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("last_request_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("request_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("last_request_id", sa.Integer()),
+    )
+
+    # Заполнение по существующим заявкам, включая архивные
+    op.execute(
+        """
+        INSERT INTO clients
+            (phone, first_seen, last_request_at, request_count, last_request_id)
+        SELECT
+            client_phone,
+            MIN(created_at),
+            MAX(created_at),
+            COUNT(*),
+            (ARRAY_AGG(id ORDER BY created_at DESC, id DESC))[1]
+        FROM (
+            SELECT id, client_phone, created_at FROM requests
+            UNION ALL
+            SELECT id, client_phone, created_at FROM requests_archive
+        ) all_requests
+        WHERE client_phone IS NOT NULL AND created_at IS NOT NULL
+        GROUP BY client_phone
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("clients")
@@ -0,0 +1,195 @@
+"""Normalize phone numbers to E.164 and index them
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19 20:00:00.000000
+
+Миграция безопасна в рабочее время: номера приводятся к E.164 пачками по
+диапазонам id (каждая пачка - своя короткая транзакция), справочник
+клиентов пересчитывается только по измененным номерам, индексы строятся
+CONCURRENTLY. Прерванную миграцию можно просто запустить повторно.
+"""
+
+from alembic import op
+from sqlalchemy import text
+
+from app.index_builder import IndexSpec, partition_index_name
+
+
+# revision identifiers, used by Alembic.
+revision = "009"
+down_revision = "008"
+branch_labels = None
+depends_on = None
+
+# Строк в одной пачке нормализации
+BATCH_SIZE = 10_000
+
+# (таблица, колонка) с номерами телефонов; формат как в app/core/phone.py
+PHONE_COLUMNS = [
+    ("requests", "client_phone"),
+    ("requests_archive", "client_phone"),
+    ("advertising_campaigns", "phone_number"),
+    ("masters", "phone_number"),
+]
+
+# Таблицы, по которым ведется справочник clients
+CLIENT_SOURCES = {"requests", "requests_archive"}
+
+# Российский номер из 10 цифр или 11 цифр с ведущей 7/8
+DIGITS = "regexp_replace({column}, '\\D', '', 'g')"
+NORMALIZABLE = "{digits} ~ '^([78][0-9]{{10}}|[0-9]{{10}})$'"
+
+NORMALIZE_SQL = """
+    UPDATE {table}
+    SET {column} = '+7' || right({digits}, 10)
+    WHERE id >= :start AND id < :end
+      AND {normalizable}
+      AND {column} <> '+7' || right({digits}, 10)
+    RETURNING {column}
+"""
+
+# Пересчет клиентов по измененным номерам. Записи, обновленные приложением
+# во время миграции, не откатываются назад: берутся крайние значения
+MERGE_CLIENTS_SQL = """
+    INSERT INTO clients
+        (phone, first_seen, last_request_at, request_count, last_request_id)
+    SELECT
+        client_phone,
+        MIN(created_at),
+        MAX(created_at),
+        COUNT(*),
+        (ARRAY_AGG(id ORDER BY created_at DESC, id DESC))[1]
+    FROM (
+        SELECT id, client_phone, created_at FROM requests
+        WHERE client_phone = ANY(:phones)
+        UNION ALL
+        SELECT id, client_phone, created_at FROM requests_archive
+        WHERE client_phone = ANY(:phones)
+    ) changed_requests
+    WHERE created_at IS NOT NULL
+    GROUP BY client_phone
+    ON CONFLICT (phone) DO UPDATE SET
+        first_seen = LEAST(clients.first_seen, EXCLUDED.first_seen),
+        last_request_at = GREATEST(clients.last_request_at, EXCLUDED.last_request_at),
+        request_count = GREATEST(clients.request_count, EXCLUDED.request_count),
+        last_request_id = CASE
+            WHEN EXCLUDED.last_request_at >= clients.last_request_at
+            THEN EXCLUDED.last_request_id
+            ELSE clients.last_request_id
+        END
+"""
+
+# Клиенты под старым форматом номера: их заявки уже учтены под E.164
+DELETE_STALE_CLIENTS_SQL = """
+    DELETE FROM clients
+    WHERE phone IN (
+        SELECT phone FROM clients
+        WHERE {normalizable} AND phone <> '+7' || right({digits}, 10)
+        LIMIT :limit
+    )
+""".format(
+    normalizable=NORMALIZABLE.format(digits=DIGITS.format(column="phone")),
+    digits=DIGITS.format(column="phone"),
+)
+
+# Поиск по равенству (B-tree); для requests индексы по client_phone уже есть
+PHONE_INDEXES = [
+    IndexSpec(
+        name="ix_advertising_campaigns_phone_number",
+        table="advertising_campaigns",
+        body="(phone_number)",
+    ),
+    IndexSpec(name="ix_masters_phone_number", table="masters", body="(phone_number)"),
+]
+
+# Поиск по части номера (LIKE '%4567%') - триграммный индекс
+TRIGRAM_INDEX = IndexSpec(
+    name="idx_requests_client_phone_trgm",
+    table="requests",
+    body="USING gin (client_phone gin_trgm_ops)",
+)
+
+
+def _id_batches(bind, table):
+    """Диапазоны id [start, end) по BATCH_SIZE"""
+    low, high = bind.execute(text(f"SELECT min(id), max(id) FROM {table}")).first()
+    if low is None:
+        return
+    for start in range(low, high + 1, BATCH_SIZE):
+        yield start, start + BATCH_SIZE
+
+
+def _normalize_phones(bind, table, column):
+    digits = DIGITS.format(column=column)
+    statement = text(
+        NORMALIZE_SQL.format(
+            table=table,
+            column=column,
+            digits=digits,
+            normalizable=NORMALIZABLE.format(digits=digits),
+        )
+    )
+    for start, end in _id_batches(bind, table):
+        phones = set(
+            bind.execute(statement, {"start": start, "end": end}).scalars().all()
+        )
+        if phones and table in CLIENT_SOURCES:
+            bind.execute(text(MERGE_CLIENTS_SQL), {"phones": sorted(phones)})
+
+
+def _create_partitioned_index(bind, spec):
+    """Индекс партиционированной таблицы, как в IndexBuilder.build_index
+
+    Пустой индекс родителя (ON ONLY), индексы партиций CONCURRENTLY и
+    ATTACH PARTITION; родитель становится валидным после последней партиции.
+    """
+    bind.execute(text(spec.create_sql(concurrently=False, only=True)))
+    partitions = bind.execute(
+        text(
+            """
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = :table AND c.relkind = 'r'
+            ORDER BY c.relname
+            """
+        ),
+        {"table": spec.table},
+    ).scalars()
+    for partition in partitions.all():
+        name = partition_index_name(partition, spec.name)
+        bind.execute(text(spec.create_sql(name=name, table=partition)))
+        bind.execute(text(f"ALTER INDEX {spec.name} ATTACH PARTITION {name}"))
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # Вне транзакции миграции: каждая пачка и каждый индекс фиксируются сразу
+    with op.get_context().autocommit_block():
+        for table, column in PHONE_COLUMNS:
+            _normalize_phones(bind, table, column)
+
+        while bind.execute(
+            text(DELETE_STALE_CLIENTS_SQL), {"limit": BATCH_SIZE}
+        ).rowcount:
+            pass
+
+        for spec in PHONE_INDEXES:
+            bind.execute(text(spec.create_sql()))
+        _create_partitioned_index(bind, TRIGRAM_INDEX)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    # Исходный формат номеров не восстанавливается
+    op.execute("DROP INDEX IF EXISTS idx_requests_client_phone_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_masters_phone_number")
+    op.execute("DROP INDEX IF EXISTS ix_advertising_campaigns_phone_number")
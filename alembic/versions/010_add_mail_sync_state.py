@@ -0,0 +1,33 @@
+"""Add mail_sync_state for incremental IMAP sync of call recordings
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "010"
+down_revision = "009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "mail_sync_state",
+        sa.Column("mailbox", sa.String(255), primary_key=True),
+        sa.Column("uidvalidity", sa.BigInteger(), nullable=False),
+        sa.Column("last_uid", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column(
+            "updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("mail_sync_state")
@@ -0,0 +1,36 @@
+"""Add media_blobs for the content-addressed media store
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "011"
+down_revision = "010"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "media_blobs",
+        sa.Column("path", sa.String(500), primary_key=True),
+        sa.Column("sha256", sa.String(64), nullable=False),
+        sa.Column("size_bytes", sa.BigInteger(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False, server_default="1"),
+        sa.Column(
+            "created_at", sa.DateTime(timezone=True), server_default=sa.func.now()
+        ),
+    )
+    op.create_index("ix_media_blobs_sha256", "media_blobs", ["sha256"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_media_blobs_sha256", table_name="media_blobs")
+    op.drop_table("media_blobs")
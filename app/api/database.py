@@ -4,6 +4,7 @@ API для мониторинга и управления оптимизацие
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Dict, Any, Optional
+from datetime import datetime
 from ..core.auth import require_admin
 from ..core.models import Administrator
 from ..db_optimization import (
@@ -13,12 +14,22 @@ from ..db_optimization import (
     db_optimizer,
 )
 from ..database_indexes import (
+    DATABASE_INDEXES,
+    PERFORMANCE_INDEXES,
     create_database_indexes,
     analyze_query_performance,
     get_database_statistics,
 )
+from ..database_indexes_v2 import (
+    FUNCTIONAL_INDEXES,
+    PERFORMANCE_INDEXES_V2,
+    SPECIALIZED_INDEXES,
+)
+from ..index_builder import index_builder
 import logging
 from app.core.cache import cache_manager
+from app.core.config import settings
+from app.monitoring.slow_queries import slow_query_log
 
 logger = logging.getLogger(__name__)
 
@@ -55,25 +66,48 @@ async def get_optimization_report(current_user: Administrator = Depends(require_
         )
 
 
-@router.post("/create-indexes")
-async def create_indexes(current_user: Administrator = Depends(require_admin)):
-    """Создание индексов для оптимизации"""
+@router.post("/create-indexes", status_code=202)
+async def create_indexes(
+    include_v2: bool = Query(False, description="Also build v2 index set"),
+    current_user: Administrator = Depends(require_admin),
+):
+    """Запуск фоновой сборки индексов (CONCURRENTLY, без блокировки записи)"""
     try:
-        await create_database_indexes()
+        indexes = DATABASE_INDEXES + PERFORMANCE_INDEXES
+        if include_v2:
+            indexes += PERFORMANCE_INDEXES_V2 + SPECIALIZED_INDEXES + FUNCTIONAL_INDEXES
+        job = await index_builder.start_job(indexes)
         await cache_manager.invalidate_http_cache("/api/v1/database/status")
         await cache_manager.invalidate_http_cache("/api/v1/database/indexes")
         return {
-            "status": "success",
-            "message": "Database indexes created successfully",
-            "timestamp": "2025-01-15T15:00:00Z",
+            "status": "accepted",
+            "message": "Index build started",
+            "job_id": job["id"],
+            "data": job,
+            "timestamp": datetime.now().isoformat(),
         }
     except Exception as e:
-        logger.error(f"Failed to create indexes: {e}")
+        logger.error(f"Failed to start index build: {e}")
         raise HTTPException(
             status_code=500, detail=f"Failed to create indexes: {str(e)}"
         )
 
 
+@router.get("/index-jobs/{job_id}")
+async def get_index_job(
+    job_id: str, current_user: Administrator = Depends(require_admin)
+):
+    """Состояние фоновой сборки индексов и прогресс текущего индекса"""
+    job = await index_builder.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Index build job not found")
+    return {
+        "status": "success",
+        "data": job,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
 @router.post("/refresh-views")
 async def refresh_views(current_user: Administrator = Depends(require_admin)):
     """Обновление материализованных представлений"""
@@ -98,14 +132,15 @@ async def cleanup_old_data(
     days_to_keep: int = Query(365, ge=30, le=3650, description="Days to keep data"),
     current_user: Administrator = Depends(require_admin),
 ):
-    """Очистка старых данных"""
+    """Перенос старых данных в архив"""
     try:
-        await cleanup_database(days_to_keep)
+        archived = await cleanup_database(days_to_keep)
         await cache_manager.invalidate_http_cache("/api/v1/database/status")
         await cache_manager.invalidate_http_cache("/api/v1/database/indexes")
         return {
             "status": "success",
             "message": f"Database cleanup completed, kept data for {days_to_keep} days",
+            "archived": archived,
             "timestamp": "2025-01-15T15:00:00Z",
         }
     except Exception as e:
@@ -203,7 +238,16 @@ async def get_slow_queries(
     ),
     current_user: Administrator = Depends(require_admin),
 ):
-    """Получение медленных запросов"""
+    """
+    Получение медленных запросов
+
+    Основной источник - собственный захват медленных запросов приложения
+    (fingerprint, форма параметров, эндпоинт, сводка плана EXPLAIN).
+    Данные pg_stat_statements добавляются, если расширение установлено.
+    """
+    captured = slow_query_log.get_slow_queries(limit=limit, min_time_ms=min_time)
+
+    pg_stat_statements = []
     try:
         from ..core.database import engine
         from sqlalchemy import text
@@ -211,7 +255,7 @@ async def get_slow_queries(
         async with engine.begin() as conn:
             result = await conn.execute(
                 text(
-                    f"""
+                    """
                 SELECT 
                     query,
                     calls,
@@ -220,14 +264,15 @@ async def get_slow_queries(
                     rows,
                     100.0 * shared_blks_hit / nullif(shared_blks_hit + shared_blks_read, 0) AS hit_percent
                 FROM pg_stat_statements 
-                WHERE mean_time > {min_time}
+                WHERE mean_time > :min_time
                 ORDER BY mean_time DESC 
-                LIMIT {limit}
+                LIMIT :limit
             """
-                )
+                ),
+                {"min_time": min_time, "limit": limit},
             )
 
-            slow_queries = [
+            pg_stat_statements = [
                 {
                     "query": row[0][:500] + "..." if len(row[0]) > 500 else row[0],
                     "calls": row[1],
@@ -238,27 +283,20 @@ async def get_slow_queries(
                 }
                 for row in result.fetchall()
             ]
-
-            return {
-                "status": "success",
-                "data": {
-                    "slow_queries": slow_queries,
-                    "total_found": len(slow_queries),
-                    "min_time_threshold": min_time,
-                },
-                "timestamp": "2025-01-15T15:00:00Z",
-            }
     except Exception as e:
-        logger.warning(f"pg_stat_statements not available or failed: {e}")
-        return {
-            "status": "warning",
-            "data": {
-                "slow_queries": [],
-                "total_found": 0,
-                "message": "pg_stat_statements extension not available",
-            },
-            "timestamp": "2025-01-15T15:00:00Z",
-        }
+        logger.debug(f"pg_stat_statements not available or failed: {e}")
+
+    return {
+        "status": "success",
+        "data": {
+            "slow_queries": captured,
+            "total_found": len(captured),
+            "min_time_threshold": min_time,
+            "capture_threshold_ms": settings.SLOW_QUERY_THRESHOLD_MS,
+            "pg_stat_statements": pg_stat_statements,
+        },
+        "timestamp": datetime.now().isoformat(),
+    }
 
 
 @router.get("/index-usage")
@@ -18,7 +18,7 @@ from fastapi.responses import FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from ..core.database import get_db
+from ..core.database import get_db, release_connection
 from ..core.auth import get_current_user
 from ..core.models import Master, Employee, Administrator, Request, Transaction, File
 from ..core.config import settings
@@ -129,6 +129,8 @@ async def download_file(
     try:
         # Проверяем права доступа
         has_access = await check_file_access_permission(file_path, current_user, db)
+        # Дальше работаем только с файловой системой
+        await release_connection(db)
         if not has_access:
             # Логируем отказ в доступе
             logging.warning(
@@ -210,6 +212,8 @@ async def view_file(
     try:
         # Проверяем права доступа
         has_access = await check_file_access_permission(file_path, current_user, db)
+        # Дальше работаем только с файловой системой
+        await release_connection(db)
         if not has_access:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
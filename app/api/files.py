@@ -6,7 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.responses import JSONResponse
 import logging
 from ..core.database import get_db
-from ..core.auth import get_current_active_user
+from ..core.auth import get_current_active_user, require_admin
 from ..core.models import Master, Employee, Administrator
 from ..core.config import settings
 from ..utils.file_security import (
@@ -14,6 +14,7 @@ from ..utils.file_security import (
     FileSecurityError,
     delete_file_safely,
 )
+from ..utils.media_store import media_store
 from app.core.cache import cache_manager
 
 router = APIRouter()
@@ -150,3 +151,11 @@ async def upload_expense_receipt(
     except Exception as e:
         logging.error(f"Ошибка при сохранении файла: {e}")
         raise HTTPException(status_code=500, detail="Ошибка при сохранении файла")
+
+
+@router.get("/storage-stats/")
+async def get_storage_stats(
+    current_user: Master | Employee | Administrator = Depends(require_admin),
+):
+    """Размер хранилища файлов и экономия от дедупликации"""
+    return await media_store.stats()
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Request, HTTPException, Depends, Header
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional
+from typing import Optional, cast
 from ..core.database import get_db
 from ..core import crud, schemas
 from ..core.enhanced_schemas import RequestStatus
@@ -12,9 +12,18 @@ import urllib.parse
 import hmac
 import hashlib
 from app.core.cache import cache_manager
+from ..core.phone import canonical_phone
+from ..services.mango_ingest import enqueue_event
 
 router = APIRouter()
 
+CALL_KEY = "mango_call:{call_id}"
+# Сколько ключ "в обработке" живет в Redis, если процесс упал до COMMIT
+CALL_CLAIM_TTL = 60
+
+# Заявка создается только по завершенному звонку
+FINAL_CALL_STATES = ("Disconnected", "Completed", "Finished")
+
 
 # Функция для проверки безопасности webhook
 async def verify_webhook_security(
@@ -42,11 +51,15 @@ async def verify_webhook_security(
             logging.warning("MANGO WEBHOOK: Missing signature header")
             raise HTTPException(status_code=403, detail="Missing signature")
 
-        # Здесь должна быть проверка подписи по алгоритму Mango
-        # Пока просто базовая проверка
-        expected_signature = (
-            x_signature  # TODO: Implement actual signature verification
-        )
+        # HMAC-SHA256 от сырого тела запроса (hex, допускается префикс sha256=)
+        body = await request.body()
+        expected_signature = hmac.new(
+            settings.MANGO_WEBHOOK_SECRET.encode(), body, hashlib.sha256
+        ).hexdigest()
+        signature = x_signature.strip().lower().removeprefix("sha256=")
+        if not hmac.compare_digest(signature, expected_signature):
+            logging.warning(f"MANGO WEBHOOK: Invalid signature from IP: {client_ip}")
+            raise HTTPException(status_code=403, detail="Invalid signature")
 
     logging.info(f"MANGO WEBHOOK: Accepted request from IP: {client_ip}")
     return True
@@ -87,8 +100,40 @@ async def mango_webhook(
 
     logging.warning(f"MANGO PARSED DATA: {data}")
 
+    if settings.MANGO_INGEST_ASYNC:
+        return await _enqueue_call_event(db, data)
+
+    try:
+        return await handle_call_event(db, data)
+    except Exception as e:
+        return {"ok": True, "detail": f"Ошибка создания заявки: {str(e)}"}
+
+
+async def _enqueue_call_event(db: AsyncSession, data: dict):
+    """Сохранение события в очередь без обработки (MANGO_INGEST_ASYNC)"""
+    from ..monitoring.prometheus_metrics import metrics_collector
+
+    # Промежуточные события отбрасываются сразу, в очередь они не попадают
+    if data.get("call_state") not in FINAL_CALL_STATES:
+        metrics_collector.record_mango_ingest("skipped")
+        return {"ok": True, "detail": "Ignoring intermediate state"}
+
+    event_id = await enqueue_event(db, data)
+    metrics_collector.record_mango_ingest("queued")
+    logging.warning(f"MANGO EVENT QUEUED: ID {event_id}, CallID {data.get('call_id')}")
+    return {"ok": True, "queued": True, "event_id": event_id}
+
+
+async def handle_call_event(db: AsyncSession, data: dict):
+    """
+    Обработка события звонка: создание заявки или отметка о дубликате.
+
+    Ошибка создания заявки пробрасывается после отката - синхронный вебхук
+    отвечает на нее 200, воркер очереди повторяет обработку.
+    """
     # Получаем информацию о звонке
-    from_number = data.get("from", {}).get("number")
+    # Номер клиента приводится к E.164: так он хранится в заявках и клиентах
+    from_number = canonical_phone(data.get("from", {}).get("number"))
     to_number = data.get("to", {}).get("number")
     call_id = data.get("call_id")
     seq = data.get("seq")
@@ -105,7 +150,7 @@ async def mango_webhook(
 
     # ВАЖНО: Обрабатываем заявку только для завершенных звонков
     # Игнорируем промежуточные события, чтобы избежать дублей
-    if call_state not in ["Disconnected", "Completed", "Finished"]:
+    if call_state not in FINAL_CALL_STATES:
         logging.warning(
             f"MANGO SKIP: Call state '{call_state}' not final, waiting for completion"
         )
@@ -119,52 +164,95 @@ async def mango_webhook(
         logging.warning("MANGO SKIP: No line_number found")
         return {"ok": True, "detail": "Нет номера для поиска РК"}
 
-    # ДВОЙНАЯ ПРОВЕРКА на дубликаты: по телефону И по call_id
+    # 1. Быстрый путь: повтор события отсекается в Redis (SET NX) без запросов к БД.
+    # Ключ не занят и не найден - кеш недоступен: решает регистрация в БД
+    call_key = CALL_KEY.format(call_id=call_id)
+    if (
+        not await cache_manager.add(call_key, "processing", CALL_CLAIM_TTL)
+        and await cache_manager.get(call_key) is not None
+    ):
+        logging.warning(f"MANGO DUPLICATE BLOCKED BY CALL_ID (cache): CallID {call_id}")
+        return {"ok": True, "detail": f"Звонок уже обработан (call_id: {call_id})"}
 
-    # 1. Проверка по номеру телефона (за последние 30 минут)
-    existing_by_phone = await crud.get_existing_new_request_by_phone(db, from_number)
-    if existing_by_phone:
+    # 2. Атомарная регистрация call_id в БД (PK): параллельный дубликат отклоняется
+    try:
+        claimed = await crud.claim_call_event(db, call_id, from_number)
+    except Exception:
+        await cache_manager.delete(call_key)
+        raise
+    if not claimed:
+        await db.rollback()
+        event = await crud.get_call_event(db, call_id)
+        request_id = event.request_id if event else None
+        await cache_manager.set(
+            call_key, {"request_id": request_id}, settings.MANGO_CALL_ID_TTL
+        )
         logging.warning(
-            f"MANGO DUPLICATE BLOCKED BY PHONE: Phone {from_number}, existing request ID {existing_by_phone.id}, created at {existing_by_phone.created_at}"
+            f"MANGO DUPLICATE BLOCKED BY CALL_ID: CallID {call_id}, existing request ID {request_id}"
         )
         return {
             "ok": True,
-            "detail": f"Заявка уже существует по телефону (ID: {existing_by_phone.id})",
+            "detail": f"Заявка уже существует по call_id (ID: {request_id})",
         }
 
-    # 2. Проверка по call_id (если есть запись в примечаниях)
     try:
-        from sqlalchemy import select
-        from ..core.models import Request
-
-        existing_by_call_id = await db.execute(
-            select(Request).where(
-                Request.call_center_notes.like(f"%call_id:{call_id}%")
-            )
+        return await _create_request_for_call(
+            db, call_id, call_key, from_number, phone_number
         )
-        existing_call = existing_by_call_id.scalar_one_or_none()
-        if existing_call:
-            logging.warning(
-                f"MANGO DUPLICATE BLOCKED BY CALL_ID: CallID {call_id}, existing request ID {existing_call.id}"
-            )
-            return {
-                "ok": True,
-                "detail": f"Заявка уже существует по call_id (ID: {existing_call.id})",
-            }
     except Exception as e:
-        logging.warning(f"MANGO CALL_ID CHECK ERROR: {e}")
+        logging.error(
+            f"MANGO REQUEST CREATION ERROR: Phone {from_number}, CallID {call_id}, Error: {e}"
+        )
+        # Регистрация звонка откатилась вместе с заявкой - повтор обработает его
+        await db.rollback()
+        await cache_manager.delete(call_key)
+        raise
+
+
+async def _finish_call(
+    db: AsyncSession, call_id: str, call_key: str, request_id: Optional[int]
+):
+    """Фиксация регистрации звонка и запоминание результата в Redis"""
+    if request_id is not None:
+        await crud.set_call_event_request(db, call_id, request_id)
+    await db.commit()
+    await cache_manager.set(
+        call_key, {"request_id": request_id}, settings.MANGO_CALL_ID_TTL
+    )
+
+
+async def _create_request_for_call(
+    db: AsyncSession,
+    call_id: str,
+    call_key: str,
+    from_number: str,
+    phone_number: str,
+):
+    """Создание заявки по зарегистрированному звонку"""
+    # Один поиск клиента по ключу отвечает на оба вопроса: дубль и "Впервые/Повтор"
+    client = await crud.get_client(db, from_number)
+
+    # Повторный звонок с того же номера за 30 минут относится к той же заявке
+    if client is not None and crud.client_has_recent_request(client):
+        await _finish_call(db, call_id, call_key, cast(int, client.last_request_id))
+        logging.warning(
+            f"MANGO DUPLICATE BLOCKED BY PHONE: Phone {from_number}, existing request ID {client.last_request_id}, created at {client.last_request_at}"
+        )
+        return {
+            "ok": True,
+            "detail": f"Заявка уже существует по телефону (ID: {client.last_request_id})",
+        }
 
     # Найти рекламную кампанию по номеру
     campaign = await crud.get_advertising_campaign_by_phone(db, phone_number)
     if not campaign:
+        await _finish_call(db, call_id, call_key, None)
         logging.warning(f"MANGO SKIP: No campaign found for phone {phone_number}")
         return {"ok": True, "detail": "Не найдена РК для номера"}
 
-    city_id = campaign.city_id
-
     # Определяем тип заявки: 'Впервые' или 'Повтор'
     # ВАЖНО: Проверяем ВСЕ заявки, не только за последние 30 минут
-    is_first_time = await crud.check_client_first_time(db, from_number)
+    is_first_time = client is None
     if is_first_time:
         request_type = await crud.get_request_type_by_name(db, "Впервые")
         logging.warning(
@@ -175,17 +263,6 @@ async def mango_webhook(
         logging.warning(f"MANGO TYPE DECISION: Phone {from_number} - REPEAT (Повтор)")
     request_type_id = request_type.id if request_type else None
 
-    # ФИНАЛЬНАЯ ПРОВЕРКА перед созданием (защита от race condition)
-    final_check = await crud.get_existing_new_request_by_phone(db, from_number)
-    if final_check:
-        logging.warning(
-            f"MANGO FINAL CHECK BLOCKED: Phone {from_number}, existing request ID {final_check.id}"
-        )
-        return {
-            "ok": True,
-            "detail": f"Заявка уже существует (финальная проверка, ID: {final_check.id})",
-        }
-
     request_in = schemas.RequestCreate(
         advertising_campaign_id=campaign.id,
         city_id=campaign.city_id,
@@ -206,29 +283,23 @@ async def mango_webhook(
         avito_chat_id=None,
     )
 
-    try:
-        new_request = await crud.create_request(db, request_in)
-        request_type_name = request_type.name if request_type else "Unknown"
+    # create_request фиксирует заявку вместе с регистрацией call_id
+    new_request = await crud.create_request(db, request_in)
+    await _finish_call(db, call_id, call_key, cast(int, new_request.id))
+    request_type_name = request_type.name if request_type else "Unknown"
 
-        logging.warning(
-            f"MANGO REQUEST CREATED: Phone {from_number}, Type: {request_type_name}, ID: {new_request.id}, Campaign: {campaign.name}, CallID: {call_id}"
-        )
+    logging.warning(
+        f"MANGO REQUEST CREATED: Phone {from_number}, Type: {request_type_name}, ID: {new_request.id}, Campaign: {campaign.name}, CallID: {call_id}"
+    )
 
-        await cache_manager.invalidate_http_cache("/api/v1/mango/status")
-        await cache_manager.invalidate_http_cache("/api/v1/mango/webhook")
-        await cache_manager.invalidate_http_cache("/api/mango/status")
-        await cache_manager.invalidate_http_cache("/api/mango/webhook")
+    await cache_manager.invalidate_http_cache("/api/v1/mango/status")
+    await cache_manager.invalidate_http_cache("/api/v1/mango/webhook")
+    await cache_manager.invalidate_http_cache("/api/mango/status")
+    await cache_manager.invalidate_http_cache("/api/mango/webhook")
 
-        return {
-            "ok": True,
-            "request_id": new_request.id,
-            "type": request_type_name,
-            "call_id": call_id,
-        }
-    except Exception as e:
-        logging.error(
-            f"MANGO REQUEST CREATION ERROR: Phone {from_number}, CallID {call_id}, Error: {e}"
-        )
-        # Возможно, заявка уже была создана другим процессом
-        await db.rollback()
-        return {"ok": True, "detail": f"Ошибка создания заявки: {str(e)}"}
+    return {
+        "ok": True,
+        "request_id": new_request.id,
+        "type": request_type_name,
+        "call_id": call_id,
+    }
@@ -9,7 +9,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.core.auth import get_current_user
 from app.core.models import Master, Employee, Administrator
 
@@ -150,7 +150,7 @@ async def get_metrics_overview(current_user: UserType = Depends(get_current_user
 @router.get("/business", response_model=BusinessMetricsResponse)
 async def get_business_metrics(
     current_user: UserType = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """Получение бизнес-метрик"""
     # Обновляем бизнес-метрики
@@ -385,7 +385,7 @@ async def export_metrics_json(
 @router.get("/dashboard/summary")
 async def get_dashboard_summary(
     current_user: UserType = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
     """Получение сводки для дашборда"""
     # Обновляем метрики
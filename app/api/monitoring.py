@@ -61,6 +61,24 @@ async def get_pool_statistics(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail="Failed to get pool statistics")
 
 
+@router.get("/pool/checkout-latency")
+async def get_pool_checkout_latency(
+    engine: str = Query("primary"),
+    window_seconds: int = Query(300, ge=10, le=3600),
+    current_user: dict = Depends(get_current_user),
+):
+    """Перцентили ожидания и удержания соединений по эндпоинтам"""
+    try:
+        stats = pool_monitor.get_checkout_statistics(engine, window_seconds)
+        return JSONResponse(content=stats)
+
+    except Exception as e:
+        logger.error(f"Error getting pool checkout latency: {e}")
+        raise HTTPException(
+            status_code=500, detail="Failed to get pool checkout latency"
+        )
+
+
 @router.get("/pool/slow-queries")
 async def get_slow_queries(
     limit: int = Query(10, ge=1, le=100), current_user: dict = Depends(get_current_user)
@@ -3,6 +3,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from ..core.database import get_db
 from ..core.auth import require_admin
 from ..services.recording_service import recording_service
+from ..services.email_client import rambler_client
+from ..monitoring.event_loop_monitor import event_loop_monitor
 from ..core.models import Master, Employee, Administrator
 from app.core.cache import cache_manager
 
@@ -36,6 +38,8 @@ async def get_recording_service_status(
         "is_running": recording_service.is_running,
         "task_active": recording_service.task is not None
         and not recording_service.task.done(),
+        "last_sync": rambler_client.last_sync_stats,
+        "event_loop_lag": event_loop_monitor.stats(),
     }
 
 
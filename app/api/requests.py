@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import List, Optional, cast
 from fastapi import (
     APIRouter,
     Depends,
@@ -8,6 +8,7 @@ from fastapi import (
     UploadFile,
     File,
     Response,
+    Header,
     Request as FastapiRequest,
 )
 from fastapi.responses import JSONResponse, PlainTextResponse
@@ -17,10 +18,10 @@ from sqlalchemy.orm import selectinload
 import logging
 import os
 from uuid import uuid4
-from datetime import datetime
+from datetime import date, datetime, timedelta
 
 from app.core.cache import cache_manager
-from ..core.database import get_db
+from ..core.database import get_db, get_read_db, release_connection
 from ..core.auth import require_master, require_callcenter
 from ..core.config import settings
 from ..core.crud import (
@@ -34,8 +35,17 @@ from ..core.crud import (
     get_masters,
     get_advertising_campaigns,
     create_advertising_campaign,
+    get_client,
+    get_client_recent_requests,
 )
 from ..core.optimized_crud import OptimizedRequestCRUD
+from ..core.request_transitions import parse_if_match, request_etag
+from ..materialized_views import VIEW_WINDOW_DAYS
+from ..services.archive_service import (
+    count_hot_requests,
+    get_archived_request,
+    search_archived_requests,
+)
 from ..monitoring.performance import (
     get_requests_optimized,
     get_request_optimized,
@@ -74,7 +84,7 @@ router = APIRouter(prefix="/requests", tags=["requests"])
 
 # Эндпоинты для мастеров (в начале файла)
 @router.get("/masters/")
-async def get_masters_list(db: AsyncSession = Depends(get_db)):
+async def get_masters_list(db: AsyncSession = Depends(get_read_db)):
     """Получение списка мастеров"""
     # Временно возвращаем простые словари, минуя Pydantic валидацию
     result = await db.execute(select(Master))
@@ -179,6 +189,95 @@ async def create_new_request(
     return new_request
 
 
+def _request_list_item(req) -> dict:
+    """Элемент списка заявок (горячая или архивная запись)"""
+    return {
+        "id": req.id,
+        "advertising_campaign_id": req.advertising_campaign_id,
+        "city_id": req.city_id,
+        "request_type_id": req.request_type_id,
+        "client_phone": req.client_phone,
+        "client_name": req.client_name,
+        "address": req.address,
+        "meeting_date": (
+            req.meeting_date.isoformat() if req.meeting_date is not None else None
+        ),
+        "direction_id": req.direction_id,
+        "problem": req.problem,
+        "status": req.status,
+        "master_id": req.master_id,
+        "master_notes": req.master_notes,
+        "result": float(req.result) if req.result is not None else None,
+        "expenses": float(req.expenses) if req.expenses is not None else 0,
+        "net_amount": float(req.net_amount) if req.net_amount is not None else 0,
+        "master_handover": (
+            float(req.master_handover) if req.master_handover is not None else 0
+        ),
+        "ats_number": req.ats_number,
+        "call_center_name": req.call_center_name,
+        "call_center_notes": req.call_center_notes,
+        "avito_chat_id": req.avito_chat_id,
+        "created_at": (
+            req.created_at.isoformat() if req.created_at is not None else None
+        ),
+        "city": {"id": req.city.id, "name": req.city.name} if req.city else None,
+        "request_type": (
+            {"id": req.request_type.id, "name": req.request_type.name}
+            if req.request_type
+            else None
+        ),
+        "direction": (
+            {"id": req.direction.id, "name": req.direction.name}
+            if req.direction
+            else None
+        ),
+        "master": (
+            {
+                "id": req.master.id,
+                "full_name": req.master.full_name,
+                "phone_number": req.master.phone_number,
+                "login": req.master.login,
+                "city_id": req.master.city_id,
+                "created_at": (
+                    req.master.created_at.isoformat()
+                    if req.master.created_at is not None
+                    else None
+                ),
+                "city": (
+                    {"id": req.master.city.id, "name": req.master.city.name}
+                    if req.master.city
+                    else None
+                ),
+            }
+            if req.master
+            else None
+        ),
+        "advertising_campaign": (
+            {
+                "id": req.advertising_campaign.id,
+                "name": req.advertising_campaign.name,
+                "phone_number": req.advertising_campaign.phone_number,
+                "city_id": req.advertising_campaign.city_id,
+                "created_at": (
+                    req.advertising_campaign.created_at.isoformat()
+                    if req.advertising_campaign.created_at is not None
+                    else None
+                ),
+                "city": (
+                    {
+                        "id": req.advertising_campaign.city.id,
+                        "name": req.advertising_campaign.city.name,
+                    }
+                    if req.advertising_campaign.city
+                    else None
+                ),
+            }
+            if req.advertising_campaign
+            else None
+        ),
+    }
+
+
 @router.get("/", response_model=List[RequestResponse])
 @performance_monitor
 async def read_requests(
@@ -187,7 +286,8 @@ async def read_requests(
     city_id: Optional[int] = Query(None),
     status: Optional[str] = Query(None),
     master_id: Optional[int] = Query(None),
-    db: AsyncSession = Depends(get_db),
+    include_archived: bool = Query(False, description="Искать также в архиве"),
+    db: AsyncSession = Depends(get_read_db),
     current_user: Master | Employee | Administrator = Depends(require_callcenter),
 ):
     """Получение списка заявок (временно упрощенная версия)"""
@@ -215,95 +315,22 @@ async def read_requests(
     result = await db.execute(query)
     requests = result.scalars().all()
 
+    if include_archived and len(requests) < limit:
+        # Продолжаем выдачу из архива с учетом смещения по горячей таблице
+        hot_total = await count_hot_requests(db, city_id, status, master_id)
+        requests = list(requests) + await search_archived_requests(
+            db,
+            skip=max(0, skip - hot_total),
+            limit=limit - len(requests),
+            city_id=city_id,
+            status=status,
+            master_id=master_id,
+        )
+    # Дальше только сериализация загруженных объектов
+    await release_connection(db)
+
     # Преобразуем в простые словари
-    return [
-        {
-            "id": req.id,
-            "advertising_campaign_id": req.advertising_campaign_id,
-            "city_id": req.city_id,
-            "request_type_id": req.request_type_id,
-            "client_phone": req.client_phone,
-            "client_name": req.client_name,
-            "address": req.address,
-            "meeting_date": (
-                req.meeting_date.isoformat() if req.meeting_date is not None else None
-            ),
-            "direction_id": req.direction_id,
-            "problem": req.problem,
-            "status": req.status,
-            "master_id": req.master_id,
-            "master_notes": req.master_notes,
-            "result": float(req.result) if req.result is not None else None,
-            "expenses": float(req.expenses) if req.expenses is not None else 0,
-            "net_amount": float(req.net_amount) if req.net_amount is not None else 0,
-            "master_handover": (
-                float(req.master_handover) if req.master_handover is not None else 0
-            ),
-            "ats_number": req.ats_number,
-            "call_center_name": req.call_center_name,
-            "call_center_notes": req.call_center_notes,
-            "avito_chat_id": req.avito_chat_id,
-            "created_at": (
-                req.created_at.isoformat() if req.created_at is not None else None
-            ),
-            "city": {"id": req.city.id, "name": req.city.name} if req.city else None,
-            "request_type": (
-                {"id": req.request_type.id, "name": req.request_type.name}
-                if req.request_type
-                else None
-            ),
-            "direction": (
-                {"id": req.direction.id, "name": req.direction.name}
-                if req.direction
-                else None
-            ),
-            "master": (
-                {
-                    "id": req.master.id,
-                    "full_name": req.master.full_name,
-                    "phone_number": req.master.phone_number,
-                    "login": req.master.login,
-                    "city_id": req.master.city_id,
-                    "created_at": (
-                        req.master.created_at.isoformat()
-                        if req.master.created_at is not None
-                        else None
-                    ),
-                    "city": (
-                        {"id": req.master.city.id, "name": req.master.city.name}
-                        if req.master.city
-                        else None
-                    ),
-                }
-                if req.master
-                else None
-            ),
-            "advertising_campaign": (
-                {
-                    "id": req.advertising_campaign.id,
-                    "name": req.advertising_campaign.name,
-                    "phone_number": req.advertising_campaign.phone_number,
-                    "city_id": req.advertising_campaign.city_id,
-                    "created_at": (
-                        req.advertising_campaign.created_at.isoformat()
-                        if req.advertising_campaign.created_at is not None
-                        else None
-                    ),
-                    "city": (
-                        {
-                            "id": req.advertising_campaign.city.id,
-                            "name": req.advertising_campaign.city.name,
-                        }
-                        if req.advertising_campaign.city
-                        else None
-                    ),
-                }
-                if req.advertising_campaign
-                else None
-            ),
-        }
-        for req in requests
-    ]
+    return [_request_list_item(req) for req in requests]
 
 
 @router.put("/{request_id}/", response_model=RequestResponse)
@@ -311,15 +338,25 @@ async def update_existing_request(
     request_id: int,
     request_data: RequestUpdate,
     request: FastapiRequest,  # <-- исправлено
+    response: Response,
+    if_match: Optional[str] = Header(None, alias="If-Match"),
     db: AsyncSession = Depends(get_db),
     current_user: Master | Employee | Administrator = Depends(require_callcenter),
 ):
-    """Обновление заявки"""
+    """Обновление заявки (If-Match: ETag из GET; при устаревшей версии - 409)"""
+    try:
+        expected_version = parse_if_match(if_match)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     updated_request = await update_request(
-        db=db, request_id=request_id, request=request_data
+        db=db,
+        request_id=request_id,
+        request=request_data,
+        expected_version=expected_version,
     )
     if updated_request is None:
         raise HTTPException(status_code=404, detail="Request not found")
+    response.headers["ETag"] = request_etag(cast(int, updated_request.version))
 
     # --- Инвалидация кэша после обновления заявки ---
     from app.core.cache import cache_manager
@@ -387,7 +424,7 @@ async def delete_existing_request(
 @router.get("/cities/", response_model=List[CityResponse])
 @performance_monitor
 async def get_cities_list(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: Master | Employee | Administrator = Depends(require_callcenter),
 ):
     """Получение списка городов"""
@@ -459,7 +496,7 @@ async def delete_city_endpoint(
 
 @router.get("/request-types/", response_model=List[RequestTypeResponse])
 async def get_request_types_list(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: Master | Employee | Administrator = Depends(require_callcenter),
 ):
     """Получение типов заявок"""
@@ -536,7 +573,7 @@ async def delete_request_type_endpoint(
 
 @router.get("/directions/", response_model=List[DirectionResponse])
 async def get_directions_list(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: Master | Employee | Administrator = Depends(require_callcenter),
 ):
     """Получение списка направлений"""
@@ -613,7 +650,7 @@ async def delete_direction_endpoint(
 
 @router.get("/advertising-campaigns/", response_model=List[AdvertisingCampaignResponse])
 async def get_advertising_campaigns_list(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: Master | Employee | Administrator = Depends(require_callcenter),
 ):
     """Получение рекламных кампаний"""
@@ -716,7 +753,7 @@ async def get_callcenter_report(
     status: Optional[str] = Query(None),
     date_from: Optional[str] = Query(None),
     date_to: Optional[str] = Query(None),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: Master | Employee | Administrator = Depends(require_callcenter),
 ):
     """Получение отчета для колл-центра"""
@@ -804,6 +841,61 @@ async def get_callcenter_report(
     }
 
 
+@router.get("/clients/{phone}")
+async def get_client_history(
+    phone: str,
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Master | Employee | Administrator = Depends(require_callcenter),
+):
+    """История клиента по номеру телефона для колл-центра"""
+    client = await get_client(db, phone)
+    if client is None:
+        raise HTTPException(status_code=404, detail="Client not found")
+
+    recent_requests = await get_client_recent_requests(db, phone, limit)
+    return {
+        "phone": client.phone,
+        "first_seen": client.first_seen.isoformat(),
+        "last_request_at": client.last_request_at.isoformat(),
+        "request_count": client.request_count,
+        "last_request_id": client.last_request_id,
+        "recent_requests": [
+            {
+                **row,
+                "created_at": (
+                    row["created_at"].isoformat()
+                    if row["created_at"] is not None
+                    else None
+                ),
+            }
+            for row in recent_requests
+        ],
+    }
+
+
+@router.get("/statistics/")
+async def get_requests_statistics(
+    city_id: Optional[int] = Query(None),
+    date_from: Optional[date] = Query(
+        None, description="Начало периода (по умолчанию 30 дней назад)"
+    ),
+    date_to: Optional[date] = Query(None),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Master | Employee | Administrator = Depends(require_callcenter),
+):
+    """Статистика заявок по статусам и городам
+
+    В пределах последних 30 дней читается из mv_requests_summary;
+    поле freshness показывает, на какой момент актуальны данные.
+    """
+    if date_from is None:
+        date_from = date.today() - timedelta(days=VIEW_WINDOW_DAYS)
+    return await OptimizedRequestCRUD.get_callcenter_statistics(
+        db, city_id=city_id, date_from=date_from, date_to=date_to
+    )
+
+
 # OPTIONS handler для CORS preflight
 @router.options("/{request_id}/")
 async def options_request(request_id: int):
@@ -829,8 +921,12 @@ async def read_request(
 ):
     """Получение заявки по ID (оптимизированная версия)"""
     request = await get_request_optimized(db, request_id=request_id)
+    if request is None:
+        # Закрытые заявки могли быть перенесены в архив
+        request = await get_archived_request(db, request_id)
     if request is None:
         raise HTTPException(status_code=404, detail="Request not found")
+    await release_connection(db)
 
     # Простая сериализация в словарь
     request_data = {
@@ -886,16 +982,21 @@ async def read_request(
             "full_name": request.master.full_name,
         }
 
-    return JSONResponse(
-        content=request_data,
-        headers={
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": settings.get_cors_origin_header(),
-            "Access-Control-Allow-Credentials": "true",
-            "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type, Authorization",
-        },
-    )
+    headers = {
+        "Content-Type": "application/json",
+        "Access-Control-Allow-Origin": settings.get_cors_origin_header(),
+        "Access-Control-Allow-Credentials": "true",
+        "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
+        "Access-Control-Allow-Headers": "Content-Type, Authorization, If-Match",
+        "Access-Control-Expose-Headers": "ETag",
+    }
+    # У архивных заявок версии нет: они только для чтения
+    version = getattr(request, "version", None)
+    if version is not None:
+        request_data["version"] = version
+        headers["ETag"] = request_etag(version)
+
+    return JSONResponse(content=request_data, headers=headers)
 
 
 # --- Загрузка файлов к заявке ---
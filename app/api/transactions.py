@@ -1,9 +1,10 @@
+from datetime import date, timedelta
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query, File, UploadFile
 from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from ..core.database import get_db
+from ..core.database import get_db, get_read_db, release_connection
 from ..core.auth import require_master, get_current_active_user, require_callcenter
 from ..core.config import settings
 from ..core.crud import (
@@ -18,6 +19,18 @@ from ..core.crud import (
     delete_transaction_type,
 )
 from ..core.optimized_crud import OptimizedTransactionCRUD
+from ..materialized_views import VIEW_WINDOW_DAYS
+from ..services.archive_service import (
+    count_hot_transactions,
+    get_archived_transaction,
+    search_archived_transactions,
+)
+from ..services.transaction_import import (
+    TransactionImporter,
+    iter_csv_rows,
+    iter_xlsx_rows,
+)
+from ..validators import ValidationError
 from ..core.schemas import (
     TransactionCreate,
     TransactionUpdate,
@@ -68,11 +81,52 @@ async def create_new_transaction(
     return new_transaction
 
 
+@router.post("/import/")
+async def import_transactions(
+    file: UploadFile = File(...),
+    dry_run: bool = Query(False, description="Only validate rows"),
+    skip_existing: bool = Query(True, description="Skip rows already imported"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Master | Employee | Administrator = Depends(require_master),
+):
+    """
+    Массовый импорт транзакций из выписки (CSV/XLSX)
+
+    Возвращает отчет: число загруженных строк, дубли и ошибки по строкам.
+    """
+    filename = (file.filename or "").lower()
+    if filename.endswith(".csv"):
+        rows = iter_csv_rows(file.file)
+    elif filename.endswith(".xlsx"):
+        rows = iter_xlsx_rows(file.file)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Supported formats: .csv, .xlsx",
+        )
+
+    try:
+        report = await TransactionImporter(db).run(
+            rows, dry_run=dry_run, skip_existing=skip_existing
+        )
+    except ValidationError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.message)
+
+    if report["imported"]:
+        from app.core.cache import cache_manager
+
+        await cache_manager.clear_pattern("transactions:*")
+        await cache_manager.invalidate_http_cache("/api/v1/transactions")
+        await cache_manager.invalidate_http_cache("/api/transactions")
+    return report
+
+
 @router.get("/", response_model=List[TransactionResponse])
 async def read_transactions(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    db: AsyncSession = Depends(get_db),
+    include_archived: bool = Query(False, description="Искать также в архиве"),
+    db: AsyncSession = Depends(get_read_db),
     current_user: Master | Employee | Administrator = Depends(require_master),
 ):
     """Получение списка транзакций (временно упрощенная версия)"""
@@ -94,6 +148,15 @@ async def read_transactions(
     result = await db.execute(query)
     transactions = result.scalars().all()
 
+    if include_archived and len(transactions) < limit:
+        # Продолжаем выдачу из архива с учетом смещения по горячей таблице
+        hot_total = await count_hot_transactions(db)
+        transactions = list(transactions) + await search_archived_transactions(
+            db, skip=max(0, skip - hot_total), limit=limit - len(transactions)
+        )
+    # Дальше только сериализация загруженных объектов
+    await release_connection(db)
+
     # Преобразуем в простые словари
     return [
         {
@@ -126,6 +189,28 @@ async def read_transactions(
     ]
 
 
+@router.get("/summary/")
+async def get_transactions_summary(
+    city_id: Optional[int] = Query(None),
+    date_from: Optional[date] = Query(
+        None, description="Начало периода (по умолчанию 30 дней назад)"
+    ),
+    date_to: Optional[date] = Query(None),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Master | Employee | Administrator = Depends(require_master),
+):
+    """Финансовая сводка за период
+
+    В пределах последних 30 дней читается из mv_financial_summary;
+    поле freshness показывает, на какой момент актуальны данные.
+    """
+    if date_from is None:
+        date_from = date.today() - timedelta(days=VIEW_WINDOW_DAYS)
+    return await OptimizedTransactionCRUD.get_financial_summary(
+        db, city_id=city_id, date_from=date_from, date_to=date_to
+    )
+
+
 @router.get("/{transaction_id}", response_model=TransactionResponse)
 async def read_transaction(
     transaction_id: int,
@@ -134,8 +219,12 @@ async def read_transaction(
 ):
     """Получение транзакции по ID"""
     transaction = await get_transaction(db=db, transaction_id=transaction_id)
+    if transaction is None:
+        # Старые транзакции могли быть перенесены в архив
+        transaction = await get_archived_transaction(db, transaction_id)
     if transaction is None:
         raise HTTPException(status_code=404, detail="Transaction not found")
+    await release_connection(db)
     return transaction
 
 
@@ -203,7 +292,7 @@ async def delete_existing_transaction(
 # Дополнительные эндпоинты для получения справочных данных
 @router.get("/cities/")
 async def get_cities_list(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: Master | Employee | Administrator = Depends(require_master),
 ):
     """Получение списка городов"""
@@ -229,7 +318,7 @@ async def get_cities_list(
 
 @router.get("/transaction-types/")
 async def get_transaction_types_list(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: Master | Employee | Administrator = Depends(require_callcenter),
 ):
     """Получение типов транзакций"""
@@ -2,7 +2,7 @@ from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from ..core.database import get_db
+from ..core.database import get_db, release_connection
 from ..core.auth import (
     require_admin,
     require_director,
@@ -91,6 +91,8 @@ async def read_masters(
 
     result = await db.execute(query)
     masters = result.scalars().all()
+    # Дальше только сериализация загруженных объектов
+    await release_connection(db)
 
     # Преобразуем в простые словари
     masters_data = []
@@ -144,6 +146,7 @@ async def read_master(
     master = await get_master(db=db, master_id=master_id)
     if master is None:
         raise HTTPException(status_code=404, detail="Master not found")
+    await release_connection(db)
     return master
 
 
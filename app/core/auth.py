@@ -7,7 +7,7 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
-from .database import get_db
+from .database import get_db, release_connection
 from .models import Master, Employee, Administrator
 from .schemas import TokenData
 from .config import settings
@@ -184,6 +184,8 @@ async def get_current_user(
         raise credentials_exception
 
     if user is None:
+        # Отклоненный запрос не держит соединение до отправки ответа
+        await release_connection(db)
         raise credentials_exception
 
     return user
@@ -191,9 +193,11 @@ async def get_current_user(
 
 async def get_current_active_user(
     current_user: Union[Master, Employee, Administrator] = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ) -> Union[Master, Employee, Administrator]:
     """Получение активного пользователя"""
     if str(current_user.status) != "active":
+        await release_connection(db)
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
@@ -201,10 +205,11 @@ async def get_current_active_user(
 def check_permissions(required_roles: list):
     """Декоратор для проверки прав доступа"""
 
-    def permission_checker(
+    async def permission_checker(
         current_user: Union[Master, Employee, Administrator] = Depends(
             get_current_active_user
         ),
+        db: AsyncSession = Depends(get_db),
     ):
         if hasattr(current_user, "role"):
             user_role = current_user.role.name
@@ -213,6 +218,7 @@ def check_permissions(required_roles: list):
             user_role = "master"
 
         if user_role not in required_roles:
+            await release_connection(db)
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions"
             )
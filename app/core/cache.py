@@ -136,6 +136,39 @@ class CacheManager:
             logger.error(f"Ошибка установки в кеш: {e}")
             return False
 
+    async def add(
+        self, key: str, value: Any, ttl: Optional[int] = None
+    ) -> Optional[bool]:
+        """
+        Установка значения, только если ключа нет (SET NX).
+
+        Returns:
+            True - ключ занят нами; False - ключ уже есть;
+            None - кеш недоступен (ошибка Redis)
+        """
+        cache_key = self._generate_key(key)
+        ttl = ttl or settings.CACHE_TTL
+
+        try:
+            if self.redis_client:
+                added = await self.redis_client.set(
+                    cache_key, self._serialize_value(value), ex=ttl, nx=True
+                )
+                return bool(added)
+
+            cached_item = self.local_cache.get(cache_key)
+            if cached_item and cached_item["expires"] > datetime.now():
+                return False
+            self.local_cache[cache_key] = {
+                "value": value,
+                "expires": datetime.now() + timedelta(seconds=ttl),
+            }
+            return True
+
+        except Exception as e:
+            logger.error(f"Ошибка установки в кеш: {e}")
+            return None
+
     async def delete(self, key: str) -> bool:
         """Удаление значения из кеша"""
         cache_key = self._generate_key(key)
@@ -0,0 +1,110 @@
+"""
+Справочник рекламных кампаний по номеру линии
+
+Вебхук Mango и привязка записей звонков определяют кампанию (и город) по
+номеру, на который позвонили. Все кампании загружаются в память процесса
+при старте и индексируются по нормализованному номеру, поэтому поиск не
+обращается к БД.
+
+Согласованность между воркерами: при создании или изменении кампании
+процесс перечитывает справочник и записывает новую версию в общий кеш;
+остальные процессы сверяют версию не чаще раза в
+CAMPAIGN_DIRECTORY_SYNC_SECONDS и перечитывают справочник при расхождении.
+Без Redis справочник перечитывается по истечении REFERENCE_CACHE_TTL.
+"""
+
+import logging
+import re
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from .cache import cache_manager
+from .config import settings
+from .models import AdvertisingCampaign
+from .phone import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "campaign_directory:version"
+VERSION_TTL = 30 * 24 * 3600
+
+
+def _phone_key(phone: Optional[str]) -> Optional[str]:
+    """Ключ поиска: E.164 для российских номеров, иначе только цифры"""
+    if not phone:
+        return None
+    return normalize_phone(phone) or re.sub(r"\D", "", str(phone)) or None
+
+
+class CampaignDirectory:
+    """Рекламные кампании в памяти процесса, индекс по номеру линии"""
+
+    def __init__(self):
+        self._by_phone: Dict[str, Dict[str, Any]] = {}
+        self._version: Optional[str] = None
+        self._loaded_at: Optional[float] = None
+        self._checked_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    async def load(self, db: AsyncSession) -> int:
+        """Полная загрузка справочника одним запросом"""
+        version = await cache_manager.get(VERSION_KEY)
+        result = await db.execute(select(*AdvertisingCampaign.__table__.columns))
+        by_phone: Dict[str, Dict[str, Any]] = {}
+        for row in result:
+            key = _phone_key(row.phone_number)
+            # При совпадающих номерах побеждает первая кампания, как в запросе
+            # с ORDER BY id
+            if key and (key not in by_phone or row.id < by_phone[key]["id"]):
+                by_phone[key] = dict(row._mapping)
+        self._by_phone = by_phone
+        self._version = version
+        self._loaded_at = self._checked_at = time.monotonic()
+        return len(by_phone)
+
+    async def _sync(self, db: AsyncSession):
+        now = time.monotonic()
+        if (
+            self._loaded_at is None
+            or now - self._loaded_at > settings.REFERENCE_CACHE_TTL
+        ):
+            await self.load(db)
+            return
+        if now - self._checked_at < settings.CAMPAIGN_DIRECTORY_SYNC_SECONDS:
+            return
+        self._checked_at = now
+        version = await cache_manager.get(VERSION_KEY)
+        if version != self._version:
+            await self.load(db)
+
+    async def find_by_phone(
+        self, db: AsyncSession, phone_number: Optional[str]
+    ) -> Optional[AdvertisingCampaign]:
+        """Кампания по номеру линии (объект не привязан к сессии)"""
+        key = _phone_key(phone_number)
+        if key is None:
+            return None
+        await self._sync(db)
+        row = self._by_phone.get(key)
+        if row is None:
+            return None
+        campaign = AdvertisingCampaign(**row)
+        make_transient_to_detached(campaign)
+        return campaign
+
+    async def changed(self, db: AsyncSession):
+        """Кампании изменились: перечитать и оповестить остальные процессы"""
+        await cache_manager.set(VERSION_KEY, uuid.uuid4().hex, ttl=VERSION_TTL)
+        await self.load(db)
+
+
+# Создаем глобальный экземпляр
+campaign_directory = CampaignDirectory()
@@ -20,6 +20,89 @@ class Settings(BaseSettings):
     DB_MAX_OVERFLOW: int = 20  # Дополнительные соединения при пиковой нагрузке
     DB_POOL_TIMEOUT: int = 30  # Таймаут ожидания соединения (секунды)
     DB_POOL_RECYCLE: int = 3600  # Время жизни соединения (секунды) - 1 час
+    DB_POOL_WAIT_ALERT_MS: int = 100  # Порог p95 ожидания соединения для алерта
+
+    # Prepared statements (asyncpg)
+    # disabled - без кеша; direct - прямое подключение к PostgreSQL;
+    # pgbouncer - уникальные имена statements (PgBouncer >= 1.21, transaction pooling)
+    DB_STATEMENT_CACHE_MODE: str = "disabled"
+    DB_STATEMENT_CACHE_SIZE: int = 256  # Количество statements в кеше на соединение
+
+    # Query tracking (счетчик запросов к БД на HTTP-запрос)
+    QUERY_TRACKING_ENABLED: bool = True
+    QUERY_TRACKING_SAMPLE_RATE: float = 0.01  # Доля отслеживаемых HTTP-запросов
+    QUERY_N_PLUS_ONE_THRESHOLD: int = 5  # Повторов одного запроса для N+1
+    QUERY_COUNT_LOG_THRESHOLD: int = 20  # Запросов к БД для записи в лог на INFO
+    QUERY_TRACKING_HEADERS: bool = False  # X-DB-* заголовки (всегда в development)
+
+    # Slow query capture
+    SLOW_QUERY_THRESHOLD_MS: int = 500
+    SLOW_QUERY_STORE_SIZE: int = 200  # Уникальных запросов в хранилище
+    SLOW_QUERY_EXPLAIN_ENABLED: bool = True
+    SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS: int = 600  # Повторный EXPLAIN для запроса
+    SLOW_QUERY_EXPLAIN_PER_MINUTE: int = 10  # Общий лимит EXPLAIN в минуту
+
+    # Партиционирование requests по месяцам (created_at)
+    REQUESTS_PARTITION_MONTHS_AHEAD: int = 3  # Заранее созданных будущих партиций
+    REQUESTS_PARTITION_RETENTION_MONTHS: int = 0  # 0 - не отсоединять старые
+    REQUESTS_PARTITION_MAINTENANCE_HOURS: int = 24  # Интервал обслуживания
+    REQUESTS_PARTITION_DETACH_LOCK_TIMEOUT: str = "2s"  # Ожидание блокировки DETACH
+    REQUESTS_PARTITION_DETACH_ATTEMPTS: int = 5  # Попыток DETACH за один запуск
+    REQUESTS_PARTITION_DETACH_RETRY_SECONDS: float = 10.0  # Пауза между попытками
+
+    # Архив закрытых заявок и старых транзакций (холодное хранение)
+    ARCHIVE_ENABLED: bool = True
+    ARCHIVE_AFTER_DAYS: int = 365  # Возраст записи для переноса в архив
+    ARCHIVE_REQUEST_STATUSES: str = "Готово,Отказ"  # Закрытые статусы заявок
+    ARCHIVE_BATCH_SIZE: int = 500  # Записей в одной транзакции
+    ARCHIVE_BATCH_PAUSE_SECONDS: float = 0.5  # Пауза между пакетами
+    ARCHIVE_INTERVAL_HOURS: int = 24
+
+    # Обновление материализованных представлений отчетов
+    MV_REFRESH_INTERVAL_SECONDS: int = 60  # Проверка грязных представлений
+
+    # Сколько DDL ждет блокировку, прежде чем отступить (индексы, миграции)
+    INDEX_BUILD_LOCK_TIMEOUT: str = "5s"
+    MIGRATION_LOCK_TIMEOUT: str = "5s"
+
+    # Советник по индексам: неиспользуемые индексы ищутся только по статистике
+    # сканов старше N дней (сброс статистики, рестарт и failover ее обнуляют)
+    INDEX_ADVISOR_MIN_STATS_AGE_DAYS: int = 7
+
+    # Массовый импорт транзакций из выписок
+    TRANSACTION_IMPORT_BATCH_SIZE: int = 5000  # Строк в одном COPY
+    TRANSACTION_IMPORT_MAX_ROWS: int = 100000
+
+    # Справочники в памяти для ответов после INSERT/UPDATE ... RETURNING
+    REFERENCE_CACHE_TTL: int = 300
+    CAMPAIGN_DIRECTORY_SYNC_SECONDS: int = 5  # Сверка версии кампаний в Redis
+
+    # Read replica settings
+    DB_READ_REPLICA_URLS: str = ""  # Comma-separated list of replica URLs
+    DB_REPLICA_POOL_SIZE: int = 5  # Размер пула для каждой реплики
+    DB_REPLICA_MAX_OVERFLOW: int = 10
+    DB_READ_YOUR_WRITES_SECONDS: int = 5  # Окно привязки к primary после записи
+    DB_REPLICA_RETRY_SECONDS: int = 30  # Пауза перед повторным использованием реплики
+
+    @property
+    def get_archive_request_statuses(self) -> List[str]:
+        """Статусы заявок, подлежащих архивированию"""
+        return [
+            status.strip()
+            for status in self.ARCHIVE_REQUEST_STATUSES.split(",")
+            if status.strip()
+        ]
+
+    @property
+    def get_read_replica_urls(self) -> List[str]:
+        """Получить список URL реплик для чтения"""
+        if self.DB_READ_REPLICA_URLS:
+            return [
+                url.strip()
+                for url in self.DB_READ_REPLICA_URLS.split(",")
+                if url.strip()
+            ]
+        return []
 
     # Redis settings for caching
     REDIS_HOST: str = "localhost"
@@ -33,6 +116,12 @@ class Settings(BaseSettings):
     CACHE_ENABLED: bool = True
     CACHE_KEY_PREFIX: str = "request_system"
 
+    # Idempotency-Key для POST/PATCH (ответы хранятся в Redis)
+    IDEMPOTENCY_ENABLED: bool = True
+    IDEMPOTENCY_TTL: int = 86400  # Сколько хранится ответ, секунды
+    IDEMPOTENCY_LOCK_TTL: int = 30  # Ожидание дубликата; срок отметки между продлениями
+    IDEMPOTENCY_MAX_RESPONSE_BYTES: int = 1024 * 1024
+
     @property
     def get_redis_url(self) -> str:
         """Получить URL подключения к Redis"""
@@ -60,6 +149,7 @@ class Settings(BaseSettings):
     # File upload settings
     UPLOAD_DIR: str = "media"
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
+    UPLOAD_CHUNK_SIZE: int = 256 * 1024  # Чтение загрузки кусками
     ALLOWED_FILE_TYPES: str = "jpg,jpeg,png,gif,pdf,doc,docx,mp3,wav"
     MAX_FILES_PER_USER: int = 100
 
@@ -92,6 +182,10 @@ class Settings(BaseSettings):
 
     # Call recordings settings
     RECORDINGS_CHECK_INTERVAL: int = 300  # 5 minutes
+    RECORDINGS_FETCH_CHUNK_BYTES: int = 1024 * 1024  # Кусок потоковой загрузки
+
+    # Интервал замера задержки event loop
+    EVENT_LOOP_LAG_INTERVAL_SECONDS: float = 0.5
 
     # Telegram alerts settings
     TELEGRAM_BOT_TOKEN: Optional[str] = None
@@ -101,6 +195,17 @@ class Settings(BaseSettings):
     # Mango webhook security settings
     MANGO_WEBHOOK_SECRET: Optional[str] = None
     MANGO_ALLOWED_IPS: str = ""  # Comma-separated list of allowed IPs
+    MANGO_CALL_ID_TTL: int = 86400  # Быстрая проверка повтора call_id в Redis
+
+    # Прием вебхука Mango в очередь: ответ 200 сразу, обработка воркерами
+    MANGO_INGEST_ASYNC: bool = False
+    MANGO_INGEST_WORKERS: int = 4  # Параллельно обрабатываемых событий
+    MANGO_INGEST_BATCH_SIZE: int = 50  # Событий за одну выборку
+    MANGO_INGEST_POLL_SECONDS: float = 1.0  # Пауза, когда очередь пуста
+    MANGO_INGEST_MAX_ATTEMPTS: int = 5
+    MANGO_INGEST_RETRY_DELAY_SECONDS: int = 10  # Удваивается с каждой попыткой
+    MANGO_INGEST_CLAIM_TIMEOUT_SECONDS: int = 300  # Возврат "зависших" событий
+    MANGO_INGEST_RETENTION_HOURS: int = 72  # Хранение обработанных событий
 
     @property
     def get_mango_allowed_ips(self) -> List[str]:
@@ -192,6 +297,12 @@ class Settings(BaseSettings):
                 'Generate a secure one using: python -c "import secrets; print(secrets.token_urlsafe(32))"'
             )
 
+        if self.DB_STATEMENT_CACHE_MODE not in ("disabled", "direct", "pgbouncer"):
+            raise ValueError(
+                f"🚨 Invalid DB_STATEMENT_CACHE_MODE '{self.DB_STATEMENT_CACHE_MODE}'. "
+                "Allowed: disabled, direct, pgbouncer"
+            )
+
         # Дополнительная проверка для продакшена
         if self.ENVIRONMENT == "production":
             if len(self.SECRET_KEY) < 64:
@@ -1,9 +1,13 @@
-from typing import List, Optional, Union
+from typing import Any, Dict, List, Optional, Union, cast
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
+from sqlalchemy import bindparam, select, insert, update, delete
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql import Executable
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.future import select
 import logging
+from datetime import datetime, timedelta, timezone
 from .models import (
     City,
     RequestType,
@@ -17,6 +21,8 @@ from .models import (
     Request,
     Transaction,
     File,
+    MangoCallEvent,
+    Client,
 )
 from .schemas import (
     CityCreate,
@@ -45,6 +51,58 @@ from .schemas import (
     FileUpdate,
 )
 from .auth import get_password_hash
+from .reference_data import reference_data
+from .campaign_directory import campaign_directory
+from .phone import canonical_phone
+from ..utils.media_store import media_store
+from .request_transitions import apply_request_update
+
+# Повторный звонок клиента в этом окне относится к его последней заявке
+CLIENT_DUPLICATE_WINDOW_MINUTES = 30
+
+
+def _with_canonical_phone(data: Dict[str, Any], field: str) -> Dict[str, Any]:
+    """Номер телефона в данных записи приводится к E.164"""
+    if data.get(field) is not None:
+        data[field] = canonical_phone(data[field])
+    return data
+
+
+def _column_values(model, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Только поля, которые есть в таблице модели"""
+    columns = model.__table__.columns
+    return {field: value for field, value in data.items() if field in columns}
+
+
+async def _update_returning(
+    db: AsyncSession, model, object_id: int, data: Dict[str, Any], commit=True
+):
+    """UPDATE ... RETURNING: обновленная строка за один запрос"""
+    values = _column_values(model, data)
+    statement: Executable
+    if values:
+        # populate_existing: объект из identity map получает значения из RETURNING
+        statement = (
+            update(model)
+            .where(model.id == object_id)
+            .values(**values)
+            .returning(model)
+            .execution_options(populate_existing=True)
+        )
+    else:
+        statement = select(model).where(model.id == object_id)
+    db_object = (await db.execute(statement)).scalar_one_or_none()
+    if commit:
+        await db.commit()
+    return db_object
+
+
+async def _dialect_insert(db: AsyncSession):
+    """insert() с ON CONFLICT для диалекта текущего соединения"""
+    connection = await db.connection()
+    if connection.dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
 
 
 # CRUD операции для городов
@@ -69,14 +127,8 @@ async def get_city(db: AsyncSession, city_id: int) -> Optional[City]:
 async def update_city(
     db: AsyncSession, city_id: int, city: CityUpdate
 ) -> Optional[City]:
-    result = await db.execute(select(City).where(City.id == city_id))
-    db_city = result.scalar_one_or_none()
-    if db_city:
-        update_data = city.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_city, field, value)
-        await db.commit()
-        await db.refresh(db_city)
+    db_city = await _update_returning(db, City, city_id, city.dict(exclude_unset=True))
+    reference_data.invalidate(City)
     return db_city
 
 
@@ -175,16 +227,10 @@ async def get_transaction_types(db: AsyncSession) -> List[TransactionType]:
 async def update_transaction_type(
     db: AsyncSession, type_id: int, transaction_type: TransactionTypeUpdate
 ) -> Optional[TransactionType]:
-    result = await db.execute(
-        select(TransactionType).where(TransactionType.id == type_id)
+    db_type = await _update_returning(
+        db, TransactionType, type_id, transaction_type.dict(exclude_unset=True)
     )
-    db_type = result.scalar_one_or_none()
-    if db_type:
-        update_data = transaction_type.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_type, field, value)
-        await db.commit()
-        await db.refresh(db_type)
+    reference_data.invalidate(TransactionType)
     return db_type
 
 
@@ -204,10 +250,13 @@ async def delete_transaction_type(db: AsyncSession, type_id: int) -> bool:
 async def create_advertising_campaign(
     db: AsyncSession, campaign: AdvertisingCampaignCreate
 ) -> AdvertisingCampaign:
-    db_campaign = AdvertisingCampaign(**campaign.dict())
+    db_campaign = AdvertisingCampaign(
+        **_with_canonical_phone(campaign.dict(), "phone_number")
+    )
     db.add(db_campaign)
     await db.commit()
     await db.refresh(db_campaign)
+    await campaign_directory.changed(db)
     # Получить с подгруженным city
     result = await db.execute(
         select(AdvertisingCampaign)
@@ -243,31 +292,25 @@ async def get_advertising_campaign(
 async def update_advertising_campaign(
     db: AsyncSession, campaign_id: int, campaign: AdvertisingCampaignUpdate
 ) -> Optional[AdvertisingCampaign]:
-    result = await db.execute(
-        select(AdvertisingCampaign).where(AdvertisingCampaign.id == campaign_id)
+    db_campaign = await _update_returning(
+        db,
+        AdvertisingCampaign,
+        campaign_id,
+        _with_canonical_phone(campaign.dict(exclude_unset=True), "phone_number"),
     )
-    db_campaign = result.scalar_one_or_none()
-    if db_campaign:
-        update_data = campaign.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_campaign, field, value)
-        await db.commit()
-        await db.refresh(db_campaign)
+    reference_data.invalidate(AdvertisingCampaign)
+    await campaign_directory.changed(db)
     return db_campaign
 
 
 async def get_advertising_campaign_by_phone(db, phone_number: str):
-    result = await db.execute(
-        select(AdvertisingCampaign).where(
-            AdvertisingCampaign.phone_number == phone_number
-        )
-    )
-    return result.scalars().first()
+    """Кампания по номеру линии из справочника в памяти (без запроса к БД)"""
+    return await campaign_directory.find_by_phone(db, phone_number)
 
 
 # CRUD операции для мастеров
 async def create_master(db: AsyncSession, master: MasterCreate) -> Master:
-    master_data = master.dict()
+    master_data = _with_canonical_phone(master.dict(), "phone_number")
     password = master_data.pop("password")
     master_data["password_hash"] = get_password_hash(password)
 
@@ -303,15 +346,12 @@ async def get_master(db: AsyncSession, master_id: int) -> Optional[Master]:
 async def update_master(
     db: AsyncSession, master_id: int, master: MasterUpdate
 ) -> Optional[Master]:
-    result = await db.execute(select(Master).where(Master.id == master_id))
-    db_master = result.scalar_one_or_none()
-    if db_master:
-        update_data = master.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_master, field, value)
-        await db.commit()
-        await db.refresh(db_master)
-    return db_master
+    return await _update_returning(
+        db,
+        Master,
+        master_id,
+        _with_canonical_phone(master.dict(exclude_unset=True), "phone_number"),
+    )
 
 
 # CRUD операции для сотрудников
@@ -351,15 +391,9 @@ async def get_employee(db: AsyncSession, employee_id: int) -> Optional[Employee]
 async def update_employee(
     db: AsyncSession, employee_id: int, employee: EmployeeUpdate
 ) -> Optional[Employee]:
-    result = await db.execute(select(Employee).where(Employee.id == employee_id))
-    db_employee = result.scalar_one_or_none()
-    if db_employee:
-        update_data = employee.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_employee, field, value)
-        await db.commit()
-        await db.refresh(db_employee)
-    return db_employee
+    return await _update_returning(
+        db, Employee, employee_id, employee.dict(exclude_unset=True)
+    )
 
 
 # CRUD операции для администраторов
@@ -403,39 +437,54 @@ async def get_administrator(
 async def update_administrator(
     db: AsyncSession, administrator_id: int, administrator: AdministratorUpdate
 ) -> Optional[Administrator]:
-    result = await db.execute(
-        select(Administrator).where(Administrator.id == administrator_id)
+    return await _update_returning(
+        db, Administrator, administrator_id, administrator.dict(exclude_unset=True)
     )
-    db_administrator = result.scalar_one_or_none()
-    if db_administrator:
-        update_data = administrator.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_administrator, field, value)
-        await db.commit()
-        await db.refresh(db_administrator)
-    return db_administrator
 
 
 # CRUD операции для заявок
+async def _attach_request_relations(
+    db: AsyncSession, db_request: Request, load_files: bool = True
+) -> Request:
+    """Связи заявки из справочников в памяти; мастер и файлы - только если есть"""
+    for relation, model, foreign_key in (
+        ("city", City, "city_id"),
+        ("request_type", RequestType, "request_type_id"),
+        ("direction", Direction, "direction_id"),
+        ("advertising_campaign", AdvertisingCampaign, "advertising_campaign_id"),
+    ):
+        related = await reference_data.get(db, model, getattr(db_request, foreign_key))
+        set_committed_value(db_request, relation, related)
+
+    master = None
+    if db_request.master_id is not None:
+        master = await db.get(Master, db_request.master_id)
+    set_committed_value(db_request, "master", master)
+
+    files: List[File] = []
+    if load_files:
+        result = await db.execute(select(File).where(File.request_id == db_request.id))
+        files = list(result.scalars().all())
+    set_committed_value(db_request, "files", files)
+    return db_request
+
+
 async def create_request(db: AsyncSession, request: RequestCreate) -> Request:
-    db_request = Request(**request.dict())
-    db.add(db_request)
-    await db.commit()
-    await db.refresh(db_request)
-    # Получить с подгруженными связанными данными
+    """Создание заявки: INSERT ... RETURNING и COMMIT, связи без SELECT"""
     result = await db.execute(
-        select(Request)
-        .options(
-            selectinload(Request.advertising_campaign),
-            selectinload(Request.city),
-            selectinload(Request.request_type),
-            selectinload(Request.direction),
-            selectinload(Request.master),
-            selectinload(Request.files),
+        insert(Request)
+        .values(
+            **_column_values(
+                Request, _with_canonical_phone(request.dict(), "client_phone")
+            )
         )
-        .where(Request.id == db_request.id)
+        .returning(Request)
     )
-    return result.scalar_one()
+    db_request = result.scalar_one()
+    await _record_client_request(db, db_request)
+    await db.commit()
+    # У новой заявки еще нет файлов
+    return await _attach_request_relations(db, db_request, load_files=False)
 
 
 async def get_requests(
@@ -474,87 +523,21 @@ async def get_request(db: AsyncSession, request_id: int) -> Optional[Request]:
 
 
 async def update_request(
-    db: AsyncSession, request_id: int, request: RequestUpdate
+    db: AsyncSession,
+    request_id: int,
+    request: RequestUpdate,
+    expected_version: Optional[int] = None,
 ) -> Optional[Request]:
-    result = await db.execute(select(Request).where(Request.id == request_id))
-    db_request = result.scalar_one_or_none()
-    if db_request:
-        old_status = db_request.status  # Сохраняем старый статус
-        update_data = request.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_request, field, value)
-        await db.commit()
-        await db.refresh(db_request)
-
-        # === Бизнес-логика по транзакциям ===
-        # Получаем id типа транзакции "Приход"
-        from .models import Transaction, TransactionType
-
-        transaction_type_result = await db.execute(
-            select(TransactionType).where(TransactionType.name == "Приход")
-        )
-        transaction_type = transaction_type_result.scalar_one_or_none()
-        if transaction_type is not None:
-            transaction_type_id = transaction_type.id
-            # Ищем транзакцию по заявке
-            transaction_result = await db.execute(
-                select(Transaction).where(
-                    Transaction.notes == f"Приход по заявке {request_id}"
-                )
-            )
-            transaction = transaction_result.scalar_one_or_none()
-            # Если новый статус Готово
-            if db_request.status == "Готово":
-                if transaction:
-                    # Обновляем существующую транзакцию
-                    transaction.amount = db_request.master_handover
-                    transaction.city_id = db_request.city_id
-                    transaction.transaction_type_id = transaction_type_id
-                    transaction.specified_date = (
-                        db_request.updated_at.date()
-                        if hasattr(db_request, "updated_at") and db_request.updated_at
-                        else db_request.created_at.date()
-                    )
-                    transaction.notes = f"Приход по заявке {request_id}"  # type: ignore[assignment]
-                else:
-                    # Создаём новую транзакцию
-                    from .schemas import TransactionCreate
-
-                    new_transaction = Transaction(
-                        city_id=db_request.city_id,
-                        transaction_type_id=transaction_type_id,
-                        amount=db_request.master_handover,
-                        specified_date=(
-                            db_request.updated_at.date()
-                            if hasattr(db_request, "updated_at")
-                            and db_request.updated_at
-                            else db_request.created_at.date()
-                        ),
-                        notes=f"Приход по заявке {request_id}",
-                    )
-                    db.add(new_transaction)
-            # Если статус был Готово, а стал другой — удаляем транзакцию
-            elif old_status == "Готово" and db_request.status != "Готово":
-                if transaction:
-                    await db.delete(transaction)
-        await db.commit()
-        # === END бизнес-логика ===
-
-        # Получить обновленную заявку с подгруженными связанными данными
-        result = await db.execute(
-            select(Request)
-            .options(
-                selectinload(Request.advertising_campaign),
-                selectinload(Request.city),
-                selectinload(Request.request_type),
-                selectinload(Request.direction),
-                selectinload(Request.master),
-                selectinload(Request.files),
-            )
-            .where(Request.id == request_id)
-        )
-        return result.scalar_one_or_none()
-    return None
+    """Обновление заявки условным UPDATE ... RETURNING с проверкой версии"""
+    db_request = await apply_request_update(
+        db,
+        request_id,
+        _with_canonical_phone(request.dict(exclude_unset=True), "client_phone"),
+        expected_version,
+    )
+    if db_request is None:
+        return None
+    return await _attach_request_relations(db, db_request)
 
 
 async def delete_request(db: AsyncSession, request_id: int) -> bool:
@@ -568,24 +551,44 @@ async def delete_request(db: AsyncSession, request_id: int) -> bool:
 
 
 # CRUD операции для транзакций
+async def _attach_transaction_relations(
+    db: AsyncSession, db_transaction: Transaction, load_files: bool = True
+) -> Transaction:
+    """Город и тип из справочников в памяти, файлы - только для существующих"""
+    set_committed_value(
+        db_transaction,
+        "city",
+        await reference_data.get(db, City, cast(int, db_transaction.city_id)),
+    )
+    set_committed_value(
+        db_transaction,
+        "transaction_type",
+        await reference_data.get(
+            db, TransactionType, cast(int, db_transaction.transaction_type_id)
+        ),
+    )
+    files: List[File] = []
+    if load_files:
+        result = await db.execute(
+            select(File).where(File.transaction_id == db_transaction.id)
+        )
+        files = list(result.scalars().all())
+    set_committed_value(db_transaction, "files", files)
+    return db_transaction
+
+
 async def create_transaction(
     db: AsyncSession, transaction: TransactionCreate
 ) -> Transaction:
-    db_transaction = Transaction(**transaction.dict())
-    db.add(db_transaction)
-    await db.commit()
-    await db.refresh(db_transaction)
-    # Получить с подгруженными связанными данными
+    """Создание транзакции: INSERT ... RETURNING и COMMIT"""
     result = await db.execute(
-        select(Transaction)
-        .options(
-            selectinload(Transaction.city),
-            selectinload(Transaction.transaction_type),
-            selectinload(Transaction.files),
-        )
-        .where(Transaction.id == db_transaction.id)
+        insert(Transaction)
+        .values(**_column_values(Transaction, transaction.dict()))
+        .returning(Transaction)
     )
-    return result.scalar_one()
+    db_transaction = result.scalar_one()
+    await db.commit()
+    return await _attach_transaction_relations(db, db_transaction, load_files=False)
 
 
 async def get_transactions(
@@ -622,29 +625,12 @@ async def get_transaction(
 async def update_transaction(
     db: AsyncSession, transaction_id: int, transaction: TransactionUpdate
 ) -> Optional[Transaction]:
-    result = await db.execute(
-        select(Transaction).where(Transaction.id == transaction_id)
+    db_transaction = await _update_returning(
+        db, Transaction, transaction_id, transaction.dict(exclude_unset=True)
     )
-    db_transaction = result.scalar_one_or_none()
-    if db_transaction:
-        update_data = transaction.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_transaction, field, value)
-        await db.commit()
-        await db.refresh(db_transaction)
-
-        # Получить обновленную транзакцию с подгруженными связанными данными
-        result = await db.execute(
-            select(Transaction)
-            .options(
-                selectinload(Transaction.city),
-                selectinload(Transaction.transaction_type),
-                selectinload(Transaction.files),
-            )
-            .where(Transaction.id == transaction_id)
-        )
-        return result.scalar_one_or_none()
-    return None
+    if db_transaction is None:
+        return None
+    return await _attach_transaction_relations(db, db_transaction)
 
 
 async def delete_transaction(db: AsyncSession, transaction_id: int) -> bool:
@@ -685,127 +671,248 @@ async def get_file(db: AsyncSession, file_id: int) -> Optional[File]:
 async def update_file(
     db: AsyncSession, file_id: int, file: FileUpdate
 ) -> Optional[File]:
-    result = await db.execute(select(File).where(File.id == file_id))
-    db_file = result.scalar_one_or_none()
-    if db_file:
-        update_data = file.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_file, field, value)
-        await db.commit()
-        await db.refresh(db_file)
-    return db_file
+    return await _update_returning(db, File, file_id, file.dict(exclude_unset=True))
 
 
 async def delete_file(db: AsyncSession, file_id: int) -> bool:
     result = await db.execute(select(File).where(File.id == file_id))
     db_file = result.scalar_one_or_none()
     if db_file:
+        file_path = cast(str, db_file.file_path)
         await db.delete(db_file)
         await db.commit()
+        # Файл хранилища удаляется с диска вместе с последней ссылкой
+        await media_store.release(file_path)
         return True
     return False
 
 
-async def get_existing_new_request_by_phone(db, client_phone: str):
-    from .models import Request
-    from sqlalchemy.future import select
-    from datetime import datetime, timedelta
+async def _record_client_request(db: AsyncSession, db_request: Request):
+    """Учет заявки в справочнике клиентов (без COMMIT, в транзакции заявки)"""
+    created_at = db_request.created_at or datetime.now(timezone.utc)
+    table = Client.__table__
+    dialect_insert = await _dialect_insert(db)
+    statement = dialect_insert(table).values(
+        phone=db_request.client_phone,
+        first_seen=created_at,
+        last_request_at=created_at,
+        request_count=1,
+        last_request_id=db_request.id,
+    )
+    await db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["phone"],
+            set_={
+                "last_request_at": statement.excluded.last_request_at,
+                "last_request_id": statement.excluded.last_request_id,
+                "request_count": table.c.request_count + 1,
+            },
+        )
+    )
+
+
+async def get_client(db: AsyncSession, client_phone: str) -> Optional[Client]:
+    """Клиент по номеру телефона (поиск по первичному ключу)"""
+    return await db.get(Client, canonical_phone(client_phone), populate_existing=True)
 
+
+def client_has_recent_request(
+    client: Optional[Client], minutes: int = CLIENT_DUPLICATE_WINDOW_MINUTES
+) -> bool:
+    """Была ли у клиента заявка за последние minutes минут"""
+    if client is None or client.last_request_at is None:
+        return False
+    last_request_at = cast(datetime, client.last_request_at)
+    if last_request_at.tzinfo is None:
+        # SQLite возвращает даты без часового пояса (UTC)
+        last_request_at = last_request_at.replace(tzinfo=timezone.utc)
+    return last_request_at >= datetime.now(timezone.utc) - timedelta(minutes=minutes)
+
+
+async def get_existing_new_request_by_phone(db, client_phone: str):
     # СТРОГАЯ ЗАЩИТА: Проверяем любые заявки за последние 30 минут
     # Это защитит от множественных вызовов webhook'а от Mango Office
-    thirty_minutes_ago = datetime.now() - timedelta(minutes=30)
-
-    result = await db.execute(
-        select(Request)
-        .where(Request.client_phone == client_phone)
-        .where(Request.created_at >= thirty_minutes_ago)
-        .order_by(Request.created_at.desc())
-    )
-    return result.scalars().first()
+    client = await get_client(db, client_phone)
+    if client is None or not client_has_recent_request(client):
+        return None
+    return await db.get(Request, client.last_request_id)
 
 
 async def check_client_first_time(db, client_phone: str):
-    from .models import Request
-    from sqlalchemy.future import select
+    return await get_client(db, client_phone) is None
+
 
+async def get_client_recent_requests(
+    db: AsyncSession, client_phone: str, limit: int = 10
+) -> List[Dict[str, Any]]:
+    """Последние заявки клиента (по индексу client_phone, created_at)"""
     result = await db.execute(
-        select(Request).where(Request.client_phone == client_phone)
+        select(
+            Request.id,
+            Request.status,
+            Request.city_id,
+            Request.request_type_id,
+            Request.master_id,
+            Request.created_at,
+        )
+        .where(Request.client_phone == canonical_phone(client_phone))
+        .order_by(Request.created_at.desc())
+        .limit(limit)
     )
-    return result.scalars().first() is None
+    return [dict(row._mapping) for row in result]
 
 
-async def link_recording_to_request(db, recording_info: dict):
-    """Связывание записи звонка с заявкой по номеру телефона"""
-    from .models import Request
-    from sqlalchemy.future import select
-    from datetime import timedelta
-
-    try:
-        from_number = recording_info.get("from_number")
-        to_number = recording_info.get("to_number")
-        call_datetime = recording_info.get("call_datetime")
-        relative_path = recording_info.get("relative_path")
+async def claim_call_event(db: AsyncSession, call_id: str, from_number: str) -> bool:
+    """
+    Атомарная регистрация звонка Mango по call_id (без COMMIT).
 
-        if not from_number or not call_datetime or not relative_path:
-            return None
+    False - call_id уже зарегистрирован: параллельный дубликат ждет фиксации
+    первой вставки на уникальном индексе и получает конфликт.
+    """
+    dialect_insert = await _dialect_insert(db)
+    result = await db.execute(
+        dialect_insert(MangoCallEvent.__table__)
+        .values(call_id=call_id, from_number=from_number)
+        .on_conflict_do_nothing(index_elements=["call_id"])
+        .returning(MangoCallEvent.__table__.c.call_id)
+    )
+    return result.scalar_one_or_none() is not None
 
-        # Ищем заявку по номеру телефона в окне ±30 минут от времени звонка
-        time_window = timedelta(minutes=30)
-        start_time = call_datetime - time_window
-        end_time = call_datetime + time_window
 
-        # Сначала ищем по номеру звонящего
-        result = await db.execute(
-            select(Request)
-            .where(Request.client_phone == from_number)
-            .where(Request.created_at >= start_time)
-            .where(Request.created_at <= end_time)
-            .order_by(Request.created_at.desc())
-        )
+async def set_call_event_request(db: AsyncSession, call_id: str, request_id: int):
+    """Привязка зарегистрированного звонка к заявке (без COMMIT)"""
+    await db.execute(
+        update(MangoCallEvent.__table__)
+        .where(MangoCallEvent.__table__.c.call_id == call_id)
+        .values(request_id=request_id)
+    )
 
-        request = result.scalars().first()
 
-        # Если не найдено, пробуем найти по номеру, на который звонили
-        if not request:
-            # Ищем рекламную кампанию по номеру
-            from .models import AdvertisingCampaign
+async def get_call_event(db: AsyncSession, call_id: str) -> Optional[MangoCallEvent]:
+    return await db.get(MangoCallEvent, call_id)
 
-            campaign_result = await db.execute(
-                select(AdvertisingCampaign).where(
-                    AdvertisingCampaign.phone_number == to_number
-                )
-            )
-            campaign = campaign_result.scalars().first()
-
-            if campaign:
-                # Ищем заявки по этой кампании
-                result = await db.execute(
-                    select(Request)
-                    .where(Request.advertising_campaign_id == campaign.id)
-                    .where(Request.client_phone == from_number)
-                    .where(Request.created_at >= start_time)
-                    .where(Request.created_at <= end_time)
-                    .order_by(Request.created_at.desc())
-                )
-                request = result.scalars().first()
-
-        if request:
-            # Обновляем заявку, добавляя путь к записи
-            request.recording_file_path = relative_path
-            await db.commit()
-            await db.refresh(request)
-
-            logging.info(
-                f"RECORDING LINKED: File {recording_info['filename']} linked to request {request.id}"
-            )
-            return request
-        else:
-            logging.warning(
-                f"RECORDING NOT LINKED: No request found for phone {from_number} at {call_datetime}"
-            )
-            return None
 
+async def link_recording_to_request(db, recording_info: dict):
+    """Связывание одной записи звонка с заявкой (см. link_recordings_batch)"""
+    try:
+        result = (await link_recordings_batch(db, [recording_info]))[0]
     except Exception as e:
         logging.error(f"ERROR LINKING RECORDING: {e}")
         await db.rollback()
         return None
+
+    if result["status"] != "linked":
+        logging.warning(
+            f"RECORDING NOT LINKED: No request found for phone "
+            f"{recording_info.get('from_number')} at {recording_info.get('call_datetime')}"
+        )
+        return None
+
+    logging.info(
+        f"RECORDING LINKED: File {result['filename']} linked to request {result['request_id']}"
+    )
+    return await db.get(Request, result["request_id"], populate_existing=True)
+
+
+RECORDING_LINK_WINDOW_MINUTES = 30
+
+
+def _as_naive_utc(value: datetime) -> datetime:
+    """Время звонка из имени файла без пояса - сравниваем в наивном UTC"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+async def link_recordings_batch(db: AsyncSession, recordings: List[dict]) -> List[dict]:
+    """
+    Пакетное связывание записей звонков с заявками.
+
+    Кандидаты выбираются одним запросом по списку номеров и общему окну
+    времени (индекс client_phone, created_at), ближайшая по времени заявка
+    для каждой записи выбирается в памяти, пути записей проставляются одним
+    UPDATE (executemany) и одним COMMIT. Если на одну заявку претендуют
+    несколько записей, она достается ближайшей по времени.
+
+    Возвращает результат по каждому файлу: filename, status
+    (linked | not_found | duplicate | invalid) и request_id.
+    """
+    window = timedelta(minutes=RECORDING_LINK_WINDOW_MINUTES)
+    results = []
+    valid = []
+    for recording_info in recordings:
+        result = {
+            "filename": recording_info.get("filename"),
+            "status": "invalid",
+            "request_id": None,
+        }
+        results.append(result)
+        phone = canonical_phone(recording_info.get("from_number"))
+        call_datetime = recording_info.get("call_datetime")
+        if phone and call_datetime and recording_info.get("relative_path"):
+            valid.append((result, recording_info, phone, call_datetime))
+    if not valid:
+        return results
+
+    call_times = [call_datetime for _, _, _, call_datetime in valid]
+    candidates = await db.execute(
+        select(Request.id, Request.client_phone, Request.created_at).where(
+            Request.client_phone.in_(sorted({phone for _, _, phone, _ in valid})),
+            Request.created_at >= min(call_times) - window,
+            Request.created_at <= max(call_times) + window,
+        )
+    )
+    by_phone: Dict[str, List[Any]] = {}
+    for row in candidates:
+        by_phone.setdefault(row.client_phone, []).append(row)
+
+    # Ближайшая заявка в окне; при равном расстоянии - более поздняя
+    claims: Dict[int, tuple] = {}
+    for result, recording_info, phone, call_datetime in valid:
+        result["status"] = "not_found"
+        call_at = _as_naive_utc(call_datetime)
+        best = None
+        for row in by_phone.get(phone, []):
+            distance = abs(_as_naive_utc(row.created_at) - call_at)
+            if distance > window:
+                continue
+            key = (distance, -_as_naive_utc(row.created_at).timestamp())
+            if best is None or key < best[0]:
+                best = (key, row)
+        if best is None:
+            continue
+        key, row = best
+        claim = claims.get(row.id)
+        if claim is not None and claim[0] <= key:
+            result["status"] = "duplicate"
+            result["request_id"] = row.id
+            continue
+        if claim is not None:
+            claim[2]["status"] = "duplicate"
+        claims[row.id] = (key, row, result, recording_info)
+        result["status"] = "linked"
+        result["request_id"] = row.id
+
+    if not claims:
+        return results
+
+    # created_at в условии - отсечение партиций requests
+    table = Request.__table__
+    await db.execute(
+        update(table)
+        .where(
+            table.c.id == bindparam("b_id"),
+            table.c.created_at == bindparam("b_created_at"),
+        )
+        .values(recording_file_path=bindparam("b_path")),
+        [
+            {
+                "b_id": row.id,
+                "b_created_at": row.created_at,
+                "b_path": recording_info["relative_path"],
+            }
+            for _, row, _, recording_info in claims.values()
+        ],
+    )
+    await db.commit()
+    return results
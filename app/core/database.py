@@ -1,42 +1,168 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+    async_sessionmaker,
+)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.exc import OperationalError, InterfaceError
 from sqlalchemy import event, text
+from fastapi import Depends, Request
 import logging
 import asyncio
-from typing import AsyncGenerator
+import hashlib
+import itertools
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, AsyncGenerator, Dict, List, Optional
 from .config import settings
+from .request_context import current_request_scope
+from ..monitoring.prometheus_metrics import metrics_collector as prometheus_collector
 
 logger = logging.getLogger(__name__)
 
-# Создание асинхронного движка базы данных с оптимизированным пулом соединений
-engine = create_async_engine(
+
+def pgbouncer_statement_name() -> str:
+    """Уникальное имя prepared statement (не конфликтует в PgBouncer)"""
+    return f"__asyncpg_{uuid.uuid4().hex}__"
+
+
+def get_statement_cache_connect_args() -> Dict[str, Any]:
+    """Параметры кеша prepared statements asyncpg по DB_STATEMENT_CACHE_MODE"""
+    mode = settings.DB_STATEMENT_CACHE_MODE
+
+    if mode == "direct":
+        return {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+
+    if mode == "pgbouncer":
+        return {
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_name_func": pgbouncer_statement_name,
+            # Собственный кеш asyncpg использует последовательные имена
+            # (__asyncpg_stmt_N__), которые конфликтуют за PgBouncer
+            "statement_cache_size": 0,
+        }
+
+    # Отключаем кеш prepared statements для стабильности
+    return {"prepared_statement_cache_size": 0}
+
+
+class StatementCacheStats:
+    """Статистика попаданий в кеш prepared statements"""
+
+    counters: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+    @classmethod
+    def record(cls, engine_name: str, hit: bool):
+        """Учет одного выполнения запроса"""
+        cls.counters[engine_name]["hits" if hit else "misses"] += 1
+        prometheus_collector.record_prepared_statement(
+            engine_name, "hit" if hit else "miss"
+        )
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """Статистика кеша по движкам"""
+        stats: Dict[str, Any] = {"mode": settings.DB_STATEMENT_CACHE_MODE}
+        for engine_name, counter in cls.counters.items():
+            total = counter["hits"] + counter["misses"]
+            stats[engine_name] = {
+                **counter,
+                "hit_ratio": round(counter["hits"] / total, 4) if total else 0.0,
+            }
+        return stats
+
+    @classmethod
+    def reset(cls):
+        """Сброс статистики"""
+        cls.counters.clear()
+
+
+def track_statement_cache(target_engine: AsyncEngine, engine_name: str):
+    """Подсчет попаданий в кеш prepared statements движка"""
+
+    @event.listens_for(target_engine.sync_engine, "before_cursor_execute")
+    def count_statement_cache(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        dbapi_connection = conn.connection.dbapi_connection
+        cache = getattr(dbapi_connection, "_prepared_statement_cache", None)
+        if cache is None:
+            return
+        StatementCacheStats.record(engine_name, statement in cache)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений с измерением реального времени ожидания checkout"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        connection_record = super()._do_get()
+        # Читается в событии checkout (см. ConnectionPoolMonitor)
+        connection_record.info["checkout_wait"] = time.perf_counter() - started
+        return connection_record
+
+
+def create_database_engine(
+    database_url: str,
+    pool_size: int,
+    max_overflow: int,
+    echo: bool = False,
+    name: str = "primary",
+) -> AsyncEngine:
+    """Создание асинхронного движка с оптимизированным пулом соединений"""
+    if database_url.startswith("sqlite"):
+        # SQLite используется только локально (например, как реплика в тестах)
+        return create_async_engine(
+            database_url,
+            echo=echo,
+            future=True,
+            connect_args={"check_same_thread": False},
+        )
+
+    async_engine = create_async_engine(
+        database_url,
+        echo=echo,
+        future=True,
+        # Оптимизированные настройки пула соединений
+        poolclass=InstrumentedQueuePool,
+        pool_size=pool_size,  # Базовый размер пула
+        max_overflow=max_overflow,  # Дополнительные соединения при пиковой нагрузке
+        pool_timeout=settings.DB_POOL_TIMEOUT,  # Таймаут ожидания соединения
+        pool_recycle=settings.DB_POOL_RECYCLE,  # Время жизни соединения (3600 = 1 час)
+        pool_pre_ping=True,  # Проверка соединения перед использованием
+        pool_reset_on_return="commit",  # Сброс состояния при возврате соединения
+        # Настройки для PostgreSQL
+        connect_args={
+            "server_settings": {
+                "jit": "off",  # Отключаем JIT для стабильности
+                "statement_timeout": "30s",  # Таймаут для запросов
+                "lock_timeout": "10s",  # Таймаут для блокировок
+                "idle_in_transaction_session_timeout": "60s",  # Таймаут для неактивных транзакций
+                "tcp_keepalives_idle": "600",  # TCP keepalive настройки
+                "tcp_keepalives_interval": "30",
+                "tcp_keepalives_count": "3",
+            },
+            "command_timeout": 30,  # Таймаут команд
+            **get_statement_cache_connect_args(),
+        },
+    )
+
+    if settings.DB_STATEMENT_CACHE_MODE != "disabled":
+        track_statement_cache(async_engine, name)
+
+    return async_engine
+
+
+# Создание асинхронного движка базы данных (primary)
+engine = create_database_engine(
     settings.DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
     echo=settings.ENVIRONMENT == "development",  # Логирование только в разработке
-    future=True,
-    # Оптимизированные настройки пула соединений
-    poolclass=AsyncAdaptedQueuePool,
-    pool_size=settings.DB_POOL_SIZE,  # Базовый размер пула
-    max_overflow=settings.DB_MAX_OVERFLOW,  # Дополнительные соединения при пиковой нагрузке
-    pool_timeout=settings.DB_POOL_TIMEOUT,  # Таймаут ожидания соединения
-    pool_recycle=settings.DB_POOL_RECYCLE,  # Время жизни соединения (3600 = 1 час)
-    pool_pre_ping=True,  # Проверка соединения перед использованием
-    pool_reset_on_return="commit",  # Сброс состояния при возврате соединения
-    # Настройки для PostgreSQL
-    connect_args={
-        "server_settings": {
-            "jit": "off",  # Отключаем JIT для стабильности
-            "statement_timeout": "30s",  # Таймаут для запросов
-            "lock_timeout": "10s",  # Таймаут для блокировок
-            "idle_in_transaction_session_timeout": "60s",  # Таймаут для неактивных транзакций
-            "tcp_keepalives_idle": "600",  # TCP keepalive настройки
-            "tcp_keepalives_interval": "30",
-            "tcp_keepalives_count": "3",
-        },
-        "command_timeout": 30,  # Таймаут команд
-        "prepared_statement_cache_size": 0,  # Отключаем кеш prepared statements для стабильности
-    },
 )
 
 # Создание фабрики сессий с оптимизированными настройками
@@ -57,9 +183,9 @@ class ConnectionPoolStats:
     """Класс для сбора статистики пула соединений"""
 
     @staticmethod
-    def get_pool_stats():
+    def get_pool_stats(target_engine: Optional[AsyncEngine] = None):
         """Получение статистики пула соединений"""
-        pool = engine.pool
+        pool = (target_engine or engine).pool
         return {
             "size": getattr(pool, "size", lambda: 0)(),
             "checked_out": getattr(pool, "checkedout", lambda: 0)(),
@@ -111,15 +237,232 @@ def receive_invalidate(dbapi_connection, connection_record, exception):
     logger.warning(f"Connection invalidated: {exception}")
 
 
+# Отслеживание записей в сессии (для read-your-writes)
+@event.listens_for(Session, "after_flush")
+def mark_session_writes(session, flush_context):
+    """Помечаем сессию, в которой были изменения данных"""
+    session.info["has_writes"] = True
+    session.info["uncommitted_writes"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def mark_bulk_writes(orm_execute_state):
+    """Помечаем сессию при bulk INSERT/UPDATE/DELETE"""
+    if (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        orm_execute_state.session.info["has_writes"] = True
+        orm_execute_state.session.info["uncommitted_writes"] = True
+
+
+@event.listens_for(Session, "after_transaction_end")
+def clear_uncommitted_writes(session, transaction):
+    """После commit/rollback корневой транзакции записей в ней больше нет"""
+    if transaction.parent is None:
+        session.info.pop("uncommitted_writes", None)
+
+
+async def release_connection(session: AsyncSession) -> bool:
+    """
+    Вернуть соединение сессии в пул после чтения
+
+    Завершает read-only транзакцию, чтобы соединение не удерживалось
+    до конца обработки запроса (проверка прав, работа с файлами, внешние
+    сервисы). Следующий запрос к БД снова возьмет соединение из пула.
+    Сессии с незафиксированными изменениями не трогаем.
+    """
+    if not session.in_transaction():
+        return False
+    if (
+        session.info.get("uncommitted_writes")
+        or session.new
+        or session.dirty
+        or session.deleted
+    ):
+        return False
+
+    # commit, а не rollback: при expire_on_commit=False загруженные
+    # объекты остаются доступными
+    await session.commit()
+    return True
+
+
+class ReadReplicaRouter:
+    """
+    Маршрутизация read-only запросов на реплики
+
+    - Round-robin между здоровыми репликами
+    - Fallback на primary, если реплик нет или все недоступны
+    - Read-your-writes: после записи клиент читает с primary
+      в течение DB_READ_YOUR_WRITES_SECONDS
+    """
+
+    PIN_CACHE_PREFIX = "db_pin"
+
+    def __init__(self, replica_urls: List[str]):
+        self.engines: Dict[str, AsyncEngine] = {}
+        self.session_factories: Dict[str, async_sessionmaker] = {}
+
+        for index, url in enumerate(replica_urls, start=1):
+            name = f"replica_{index}"
+            replica_engine = create_database_engine(
+                url,
+                pool_size=settings.DB_REPLICA_POOL_SIZE,
+                max_overflow=settings.DB_REPLICA_MAX_OVERFLOW,
+                name=name,
+            )
+            self.engines[name] = replica_engine
+            self.session_factories[name] = async_sessionmaker(
+                replica_engine,
+                class_=AsyncSession,
+                expire_on_commit=False,
+                autoflush=False,
+                autocommit=False,
+            )
+
+        self._round_robin = itertools.cycle(list(self.engines) or [None])
+        self._unhealthy_until: Dict[str, float] = {}
+        self._local_pins: Dict[str, float] = {}
+
+    @property
+    def enabled(self) -> bool:
+        """Настроены ли реплики"""
+        return bool(self.engines)
+
+    def is_healthy(self, name: str) -> bool:
+        """Проверка, можно ли отправлять запросы на реплику"""
+        return self._unhealthy_until.get(name, 0) <= time.monotonic()
+
+    def choose_replica(self) -> Optional[str]:
+        """Выбор следующей здоровой реплики (round-robin)"""
+        for _ in range(len(self.engines)):
+            name = next(self._round_robin)
+            if name and self.is_healthy(name):
+                return name
+        return None
+
+    def mark_unhealthy(self, name: str, error: Exception):
+        """Временное исключение реплики из ротации"""
+        self._unhealthy_until[name] = (
+            time.monotonic() + settings.DB_REPLICA_RETRY_SECONDS
+        )
+        logger.warning(
+            f"Read replica {name} marked unhealthy for "
+            f"{settings.DB_REPLICA_RETRY_SECONDS}s: {error}"
+        )
+
+    def mark_healthy(self, name: str):
+        """Возврат реплики в ротацию"""
+        if self._unhealthy_until.pop(name, None) is not None:
+            logger.info(f"Read replica {name} is healthy again")
+
+    @staticmethod
+    def client_key(request: Optional[Request]) -> Optional[str]:
+        """Ключ клиента для read-your-writes (токен или IP)"""
+        if request is None:
+            return None
+        identity = request.headers.get("authorization") or (
+            request.client.host if request.client else None
+        )
+        if not identity:
+            return None
+        return hashlib.sha256(identity.encode()).hexdigest()[:32]
+
+    @classmethod
+    def current_client_key(cls) -> Optional[str]:
+        """Ключ клиента текущего HTTP-запроса
+
+        ASGI scope запроса хранит QueryTrackingMiddleware, поэтому get_db
+        не нужен параметр Request.
+        """
+        scope = current_request_scope.get()
+        if scope is None:
+            return None
+        return cls.client_key(Request(scope))
+
+    async def pin_to_primary(self, key: str):
+        """Привязка клиента к primary после записи"""
+        ttl = settings.DB_READ_YOUR_WRITES_SECONDS
+        self._local_pins[key] = time.monotonic() + ttl
+        # Redis делает привязку видимой для всех воркеров
+        from .cache import cache_manager
+
+        await cache_manager.set(f"{self.PIN_CACHE_PREFIX}:{key}", 1, ttl)
+
+    async def is_pinned(self, key: str) -> bool:
+        """Проверка, должен ли клиент читать с primary"""
+        expires = self._local_pins.get(key)
+        if expires is not None:
+            if expires > time.monotonic():
+                return True
+            del self._local_pins[key]
+
+        from .cache import cache_manager
+
+        return await cache_manager.get(f"{self.PIN_CACHE_PREFIX}:{key}") is not None
+
+    async def route(self, request: Optional[Request] = None) -> Optional[str]:
+        """Имя реплики для чтения или None для primary"""
+        if not self.enabled:
+            return None
+
+        key = self.client_key(request)
+        if key and await self.is_pinned(key):
+            return None
+
+        return self.choose_replica()
+
+    def session(self, name: Optional[str] = None) -> AsyncSession:
+        """Сессия для чтения: указанная/следующая реплика или primary"""
+        name = name or self.choose_replica()
+        if name is None:
+            return AsyncSessionLocal()
+        return self.session_factories[name]()
+
+    async def check_health(self) -> Dict[str, bool]:
+        """Проверка доступности всех реплик"""
+        results = {}
+        for name, replica_engine in self.engines.items():
+            try:
+                async with replica_engine.connect() as conn:
+                    await conn.execute(text("SELECT 1"))
+                self.mark_healthy(name)
+                results[name] = True
+            except Exception as e:
+                self.mark_unhealthy(name, e)
+                results[name] = False
+        return results
+
+    async def dispose(self):
+        """Закрытие пулов соединений реплик"""
+        for replica_engine in self.engines.values():
+            await replica_engine.dispose()
+
+
+read_router = ReadReplicaRouter(settings.get_read_replica_urls)
+
+
+def get_all_engines() -> Dict[str, AsyncEngine]:
+    """Все движки приложения: primary и реплики"""
+    return {"primary": engine, **read_router.engines}
+
+
 # Dependency для получения сессии базы данных с улучшенной обработкой ошибок
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """
     Dependency для получения сессии базы данных
 
+    Сессия ленивая: соединение берется из пула только при первом запросе
+    к БД, поэтому ответы из кеша и отказы до обращения к БД не занимают пул.
+    Для раннего возврата соединения после чтения - release_connection().
+
     Включает:
     - Автоматическое управление транзакциями
     - Обработку ошибок соединения
     - Мониторинг производительности
+    - Read-your-writes привязку клиента к primary после записи
     - Graceful cleanup
     """
     session = None
@@ -136,6 +479,11 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             await session.commit()
             logger.debug("Transaction committed")
 
+        if read_router.enabled and session.info.get("has_writes"):
+            key = read_router.current_client_key()
+            if key:
+                await read_router.pin_to_primary(key)
+
     except Exception as e:
         # В случае ошибки откатываем транзакцию
         if session and session.in_transaction():
@@ -151,6 +499,48 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             logger.debug(f"Database session closed (duration: {duration:.3f}s)")
 
 
+async def get_read_db(
+    request: Request, primary: AsyncSession = Depends(get_db)
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency для read-only эндпоинтов
+
+    Отдает сессию реплики, если реплики настроены и клиент не писал
+    в последние DB_READ_YOUR_WRITES_SECONDS. Иначе - сессию primary.
+    Сессия primary не берет соединение из пула, пока не выполнен запрос.
+
+    Соединение с репликой берется до вызова эндпоинта: если реплика
+    недоступна, она исключается из ротации, а этот же запрос читает
+    с primary.
+    """
+    replica_name = await read_router.route(request)
+    if replica_name is None:
+        yield primary
+        return
+
+    session = read_router.session(replica_name)
+    try:
+        await session.connection()
+        available = True
+    except (OperationalError, InterfaceError, OSError) as e:
+        await session.close()
+        read_router.mark_unhealthy(replica_name, e)
+        prometheus_collector.record_replica_fallback(replica_name)
+        available = False
+    if not available:
+        yield primary
+        return
+
+    try:
+        yield session
+    except (OperationalError, InterfaceError, OSError) as e:
+        # Следующие запросы пойдут на другие реплики или на primary
+        read_router.mark_unhealthy(replica_name, e)
+        raise
+    finally:
+        await session.close()
+
+
 # Функция для проверки здоровья базы данных
 async def check_database_health() -> dict:
     """Проверка здоровья базы данных"""
@@ -167,6 +557,7 @@ async def check_database_health() -> dict:
                 "status": "healthy",
                 "connection_test": "passed",
                 "pool_stats": pool_stats,
+                "statement_cache": StatementCacheStats.get_stats(),
             }
 
     except Exception as e:
@@ -230,6 +621,7 @@ async def cleanup_connections():
     try:
         # Закрываем все соединения в пуле
         await engine.dispose()
+        await read_router.dispose()
         logger.info("Database connections cleaned up")
 
     except Exception as e:
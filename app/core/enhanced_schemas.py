@@ -495,6 +495,11 @@ class RequestUpdateSchema(BaseModel):
         None, description="Путь к записи разговора"
     )
 
+    # Ожидаемая версия (альтернатива заголовку If-Match)
+    version: Optional[int] = Field(
+        None, ge=1, description="Версия заявки, на которой основано изменение"
+    )
+
 
 class RequestResponseSchema(BaseModel):
     """Схема ответа с информацией о заявке"""
@@ -521,6 +526,7 @@ class RequestResponseSchema(BaseModel):
         None, description="Дата и время встречи", examples=["2025-01-20T14:30:00"]
     )
     status: str = Field(..., description="Статус заявки", examples=["Новая"])
+    version: int = Field(1, description="Версия заявки (ETag)", examples=[1])
     created_at: datetime = Field(
         ..., description="Дата создания", examples=["2025-01-15T10:30:00"]
     )
@@ -202,6 +202,28 @@ class BusinessRuleViolationError(BaseAppException):
         )
 
 
+class ResourceConflictError(BaseAppException):
+    """Запись изменена другим пользователем или недопустим переход статуса"""
+
+    def __init__(
+        self,
+        message: str,
+        resource: str,
+        identifier: Any,
+        details: Optional[Dict[str, Any]] = None,
+    ):
+        conflict_details = {"resource": resource, "identifier": str(identifier)}
+        if details:
+            conflict_details.update(details)
+
+        super().__init__(
+            message=message,
+            error_code=ErrorCode.RESOURCE_CONFLICT,
+            status_code=status.HTTP_409_CONFLICT,
+            details=conflict_details,
+        )
+
+
 class FileError(BaseAppException):
     """Ошибка работы с файлами"""
 
@@ -0,0 +1,305 @@
+"""
+Idempotency-Key для POST/PATCH запросов
+
+Мобильные клиенты повторяют POST при обрыве сети. Если запрос пришел с
+заголовком Idempotency-Key, первое выполнение занимает ключ в Redis
+(SET NX), а ответ (статус, заголовки, тело) сохраняется на IDEMPOTENCY_TTL.
+Повтор с тем же ключом получает сохраненный ответ с заголовком
+Idempotent-Replayed, а параллельный дубликат ждет завершения первого
+выполнения. Ключ с другим телом запроса отклоняется (422). Ключи
+разделяются по пользователю (хеш токена), чтобы не пересекаться.
+
+Пока первое выполнение идет, его отметка "processing" продлевается
+каждые IDEMPOTENCY_LOCK_TTL/3 секунд: иначе запрос дольше
+IDEMPOTENCY_LOCK_TTL потерял бы ключ, и повтор выполнился бы второй раз.
+
+Если Redis недоступен, запрос выполняется без дедупликации: ожидание
+ключа, который некому записать, закончилось бы 409 через
+IDEMPOTENCY_LOCK_TTL.
+"""
+
+import asyncio
+import base64
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.requests import cookie_parser
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+from ..monitoring.prometheus_metrics import metrics_collector as prometheus_collector
+from ..monitoring.query_tracker import UNMATCHED_ENDPOINT
+from .cache import cache_manager
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"POST", "PATCH"}
+KEY_HEADER = b"idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+RECORD_KEY = "idempotency:{principal}:{key}"
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+# Запрос не выполнялся (или его стоит повторить) - ответ не сохраняем
+NOT_STORED_STATUSES = {401, 403, 408, 429}
+# Заголовки, которые не отдаются при повторе
+NOT_REPLAYED_HEADERS = {b"set-cookie", b"date", b"server"}
+
+
+def request_fingerprint(method: str, path: str, query: bytes, body: bytes) -> str:
+    """Отпечаток запроса: тот же ключ с другим телом - ошибка клиента"""
+    digest = hashlib.sha256()
+    for part in (method.encode(), path.encode(), query, body):
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+def _principal(headers: Dict[bytes, bytes]) -> str:
+    """Хеш учетных данных запроса (Bearer или cookie access_token)"""
+    credentials = headers.get(b"authorization", b"")
+    if not credentials and b"cookie" in headers:
+        cookies = cookie_parser(headers[b"cookie"].decode("latin-1"))
+        credentials = cookies.get("access_token", "").encode()
+    if not credentials:
+        return "anonymous"
+    return hashlib.sha256(credentials).hexdigest()[:32]
+
+
+async def _read_body(receive) -> Optional[bytes]:
+    """Тело запроса целиком; None, если клиент отключился"""
+    chunks: List[bytes] = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+def _endpoint(scope) -> str:
+    """Шаблон маршрута для метки метрики (до роутинга - подбором по маршрутам)"""
+    route = scope.get("route")
+    if route is None:
+        router = getattr(scope.get("app"), "router", None)
+        for candidate in getattr(router, "routes", ()):
+            match, _ = candidate.matches(scope)
+            if match == Match.FULL:
+                route = candidate
+                break
+    return getattr(route, "path", None) or UNMATCHED_ENDPOINT
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware: сохранение и повтор ответов по Idempotency-Key"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in IDEMPOTENT_METHODS
+            or not settings.IDEMPOTENCY_ENABLED
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        raw_key = headers.get(KEY_HEADER)
+        if raw_key is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = raw_key.decode("latin-1").strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            response = JSONResponse(
+                status_code=400,
+                content={
+                    "detail": f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"
+                },
+            )
+            await response(scope, receive, send)
+            return
+
+        body = await _read_body(receive)
+        if body is None:
+            return
+        fingerprint = request_fingerprint(
+            scope["method"], scope["path"], scope.get("query_string", b""), body
+        )
+        record_key = RECORD_KEY.format(principal=_principal(headers), key=key)
+        await self._handle(scope, receive, send, record_key, fingerprint, body)
+
+    async def _handle(self, scope, receive, send, record_key, fingerprint, body):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.IDEMPOTENCY_LOCK_TTL
+        waited = False
+
+        while True:
+            claimed = await cache_manager.add(
+                record_key,
+                {"state": "processing", "fingerprint": fingerprint},
+                settings.IDEMPOTENCY_LOCK_TTL,
+            )
+            if claimed is None:
+                # Кеш недоступен - выполняем запрос без дедупликации
+                logger.warning("Idempotency-Key ignored: cache is unavailable")
+                self._record_metric(_endpoint(scope), "cache_unavailable")
+                await self.app(scope, self._replay_body(receive, body), send)
+                return
+            if claimed:
+                await self._execute(scope, receive, send, record_key, fingerprint, body)
+                return
+
+            record = await cache_manager.get(record_key)
+            if record is not None:
+                if record.get("fingerprint") != fingerprint:
+                    self._record_metric(
+                        record.get("endpoint") or _endpoint(scope), "mismatch"
+                    )
+                    response = JSONResponse(
+                        status_code=422,
+                        content={
+                            "detail": "Idempotency-Key was already used "
+                            "with a different request"
+                        },
+                    )
+                    await response(scope, receive, send)
+                    return
+                if record.get("state") == "done":
+                    self._record_metric(
+                        record.get("endpoint") or _endpoint(scope),
+                        "waited" if waited else "replayed",
+                    )
+                    await self._replay(send, record)
+                    return
+
+            # Запись пропала (первое выполнение упало) - пробуем занять ключ сами
+            if loop.time() >= deadline:
+                self._record_metric(_endpoint(scope), "in_progress")
+                response = JSONResponse(
+                    status_code=409,
+                    content={
+                        "detail": "Request with this Idempotency-Key is in progress"
+                    },
+                )
+                await response(scope, receive, send)
+                return
+            waited = True
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def _execute(self, scope, receive, send, record_key, fingerprint, body):
+        """Первое выполнение: ответ уходит клиенту и сохраняется"""
+        status: Optional[int] = None
+        response_headers: List[Tuple[bytes, bytes]] = []
+        chunks: List[bytes] = []
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers.extend(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if size <= settings.IDEMPOTENCY_MAX_RESPONSE_BYTES:
+                    chunks.append(chunk)
+            await send(message)
+
+        heartbeat = asyncio.create_task(self._keep_claim(record_key, fingerprint))
+        try:
+            await self.app(scope, self._replay_body(receive, body), send_wrapper)
+        except BaseException:
+            await self._stop(heartbeat)
+            await cache_manager.delete(record_key)
+            raise
+        # Продление не должно перезаписать итоговую запись
+        await self._stop(heartbeat)
+
+        endpoint = _endpoint(scope)
+        if (
+            status is None
+            or status >= 500
+            or status in NOT_STORED_STATUSES
+            or size > settings.IDEMPOTENCY_MAX_RESPONSE_BYTES
+        ):
+            # Повтор выполнит запрос заново
+            await cache_manager.delete(record_key)
+            self._record_metric(endpoint, "not_stored")
+            return
+
+        record: Dict[str, Any] = {
+            "state": "done",
+            "fingerprint": fingerprint,
+            "endpoint": endpoint,
+            "status": status,
+            "headers": [
+                [name.decode("latin-1"), value.decode("latin-1")]
+                for name, value in response_headers
+                if name.lower() not in NOT_REPLAYED_HEADERS
+            ],
+            "body": base64.b64encode(b"".join(chunks)).decode("ascii"),
+        }
+        await cache_manager.set(record_key, record, settings.IDEMPOTENCY_TTL)
+        self._record_metric(endpoint, "stored")
+
+    @staticmethod
+    async def _keep_claim(record_key: str, fingerprint: str):
+        """Продление отметки "processing", пока идет первое выполнение"""
+        interval = settings.IDEMPOTENCY_LOCK_TTL / 3
+        while True:
+            await asyncio.sleep(interval)
+            await cache_manager.set(
+                record_key,
+                {"state": "processing", "fingerprint": fingerprint},
+                settings.IDEMPOTENCY_LOCK_TTL,
+            )
+
+    @staticmethod
+    async def _stop(task: asyncio.Task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    @staticmethod
+    def _replay_body(receive, body: bytes):
+        """receive для приложения: уже прочитанное тело, затем исходный канал"""
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        return replay_receive
+
+    @staticmethod
+    async def _replay(send, record: Dict[str, Any]):
+        headers = [
+            (name.encode("latin-1"), value.encode("latin-1"))
+            for name, value in record["headers"]
+        ]
+        headers.append((REPLAYED_HEADER, b"true"))
+        await send(
+            {
+                "type": "http.response.start",
+                "status": record["status"],
+                "headers": headers,
+            }
+        )
+        await send(
+            {"type": "http.response.body", "body": base64.b64decode(record["body"])}
+        )
+
+    @staticmethod
+    def _record_metric(endpoint: str, result: str):
+        prometheus_collector.record_idempotency(endpoint, result)
+        logger.debug(f"Idempotency-Key {result} on {endpoint}")
@@ -10,6 +10,8 @@ from sqlalchemy import (
     ForeignKey,
     CheckConstraint,
     Numeric,
+    Index,
+    BigInteger,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -77,7 +79,7 @@ class AdvertisingCampaign(Base):
     id = Column(Integer, primary_key=True, index=True)
     city_id = Column(Integer, ForeignKey("cities.id"), nullable=False)
     name = Column(String(200), nullable=False)
-    phone_number = Column(String(20), nullable=False)
+    phone_number = Column(String(20), nullable=False, index=True)  # E.164
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationships
@@ -91,7 +93,7 @@ class Master(Base):
     id = Column(Integer, primary_key=True, index=True)
     city_id = Column(Integer, ForeignKey("cities.id"), nullable=False)
     full_name = Column(String(200), nullable=False)
-    phone_number = Column(String(20), nullable=False)
+    phone_number = Column(String(20), nullable=False, index=True)  # E.164
     birth_date = Column(Date)
     passport = Column(String(20))
     status = Column(String(50), default="active")
@@ -167,6 +169,8 @@ class Request(Base):
     expense_file_path = Column(String(500))
     recording_file_path = Column(String(500))
     avito_chat_id = Column(String(100))
+    # Версия строки для оптимистичной блокировки (If-Match/ETag)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -180,6 +184,9 @@ class Request(Base):
     master = relationship("Master", back_populates="requests", lazy="select")
     files = relationship("File", back_populates="request", lazy="select")
 
+    # ORM-обновления заявки проверяют и увеличивают version
+    __mapper_args__ = {"version_id_col": version}
+
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -228,3 +235,160 @@ class File(Base):
     # Relationships
     request = relationship("Request", back_populates="files")
     transaction = relationship("Transaction", back_populates="files")
+
+
+# Обработанные звонки Mango: первичный ключ call_id отсекает повторы вебхука.
+# Отдельная таблица, так как уникальность на партиционированной requests
+# возможна только вместе с created_at.
+class MangoCallEvent(Base):
+    __tablename__ = "mango_call_events"
+
+    call_id = Column(String(100), primary_key=True)
+    request_id = Column(Integer)  # Созданная или найденная по телефону заявка
+    from_number = Column(String(20))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# Справочник клиентов: обновляется при создании заявки, поэтому вопросы
+# "Впервые/Повтор" и "была ли заявка за 30 минут" решаются поиском по ключу.
+class Client(Base):
+    __tablename__ = "clients"
+
+    phone = Column(String(20), primary_key=True)
+    first_seen = Column(DateTime(timezone=True), nullable=False)
+    last_request_at = Column(DateTime(timezone=True), nullable=False)
+    request_count = Column(Integer, nullable=False, default=0)
+    last_request_id = Column(Integer)
+
+
+# Очередь входящих событий вебхука Mango: событие сохраняется как есть и
+# обрабатывается воркерами (app/services/mango_ingest.py) после ответа 200.
+class MangoWebhookEvent(Base):
+    __tablename__ = "mango_webhook_events"
+    __table_args__ = (
+        Index("idx_mango_webhook_events_pending", "status", "next_attempt_at"),
+        Index("idx_mango_webhook_events_phone", "from_number", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    call_id = Column(String(100))
+    from_number = Column(String(20))  # Ключ упорядочивания событий
+    payload = Column(Text, nullable=False)  # JSON события без изменений
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    received_at = Column(DateTime(timezone=True), nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False)
+    claimed_at = Column(DateTime(timezone=True))
+    processed_at = Column(DateTime(timezone=True))
+
+
+# Файлы в контентно-адресуемом хранилище: одно содержимое хранится один раз,
+# ref_count - число ссылок (заявки, транзакции, загрузки) на этот путь.
+class MediaBlob(Base):
+    __tablename__ = "media_blobs"
+
+    path = Column(String(500), primary_key=True)  # путь относительно корня
+    sha256 = Column(String(64), nullable=False, index=True)
+    size_bytes = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# Состояние инкрементальной синхронизации почтового ящика с записями звонков:
+# письма с UID не больше last_uid уже обработаны (пока не сменится UIDVALIDITY).
+class MailSyncState(Base):
+    __tablename__ = "mail_sync_state"
+
+    mailbox = Column(String(255), primary_key=True)  # user@host/INBOX
+    uidvalidity = Column(BigInteger, nullable=False)
+    last_uid = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+# Архив (холодное хранение) закрытых заявок, транзакций и их файлов.
+# Колонки повторяют горячие таблицы, чтобы архивные записи отдавались
+# теми же сериализаторами.
+class RequestArchive(Base):
+    __tablename__ = "requests_archive"
+
+    id = Column(Integer, primary_key=True)
+    advertising_campaign_id = Column(Integer, ForeignKey("advertising_campaigns.id"))
+    city_id = Column(Integer, ForeignKey("cities.id"), nullable=False)
+    request_type_id = Column(Integer, ForeignKey("request_types.id"), nullable=False)
+    client_phone = Column(String(20), nullable=False, index=True)
+    client_name = Column(String(200), nullable=True)
+    address = Column(Text)
+    meeting_date = Column(DateTime(timezone=True))
+    direction_id = Column(Integer, ForeignKey("directions.id"))
+    problem = Column(Text)
+    status = Column(String(50))
+    master_id = Column(Integer, ForeignKey("masters.id"))
+    master_notes = Column(Text)
+    result = Column(Numeric(10, 2), nullable=True)
+    expenses: Column = Column(DECIMAL(10, 2), default=0)
+    net_amount: Column = Column(DECIMAL(10, 2), default=0)
+    master_handover: Column = Column(DECIMAL(10, 2), default=0)
+    ats_number = Column(String(50))
+    call_center_name = Column(String(200))
+    call_center_notes = Column(Text)
+    bso_file_path = Column(String(500))
+    expense_file_path = Column(String(500))
+    recording_file_path = Column(String(500))
+    avito_chat_id = Column(String(100))
+    created_at = Column(DateTime(timezone=True), index=True)
+    updated_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    advertising_campaign = relationship("AdvertisingCampaign", lazy="select")
+    city = relationship("City", lazy="select")
+    request_type = relationship("RequestType", lazy="select")
+    direction = relationship("Direction", lazy="select")
+    master = relationship("Master", lazy="select")
+    files = relationship(
+        "FileArchive",
+        primaryjoin="RequestArchive.id == foreign(FileArchive.request_id)",
+        viewonly=True,
+        lazy="select",
+    )
+
+
+class TransactionArchive(Base):
+    __tablename__ = "transactions_archive"
+
+    id = Column(Integer, primary_key=True)
+    city_id = Column(Integer, ForeignKey("cities.id"), nullable=False)
+    transaction_type_id = Column(
+        Integer, ForeignKey("transaction_types.id"), nullable=False
+    )
+    amount: Column = Column(DECIMAL(10, 2), nullable=False)
+    notes = Column(Text)
+    file_path = Column(String(500))
+    specified_date = Column(Date, nullable=False)
+    payment_reason = Column(Text, nullable=True)
+    expense_receipt_path = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), index=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    city = relationship("City", lazy="select")
+    transaction_type = relationship("TransactionType", lazy="select")
+    files = relationship(
+        "FileArchive",
+        primaryjoin="TransactionArchive.id == foreign(FileArchive.transaction_id)",
+        viewonly=True,
+        lazy="select",
+    )
+
+
+class FileArchive(Base):
+    __tablename__ = "files_archive"
+
+    id = Column(Integer, primary_key=True)
+    request_id = Column(Integer, index=True)
+    transaction_id = Column(Integer, index=True)
+    file_type = Column(String(50), nullable=False)
+    file_path = Column(String(500), nullable=False)
+    uploaded_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
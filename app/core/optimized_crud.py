@@ -25,10 +25,77 @@ from .models import (
 )
 from .schemas import RequestCreate, RequestUpdate, TransactionCreate, TransactionUpdate
 from .performance import performance_monitor
+from .phone import canonical_phone, phone_filter_clause
 
 logger = logging.getLogger(__name__)
 
 
+def _as_date(value: Optional[date]) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def _live_freshness() -> Dict[str, Any]:
+    """Данные посчитаны по базовым таблицам в момент запроса"""
+    return {
+        "source": "base_tables",
+        "refreshed_at": datetime.now().isoformat(),
+        "staleness_seconds": 0.0,
+    }
+
+
+async def _read_view_statistics(
+    db: AsyncSession,
+    view: str,
+    sql: str,
+    date_column: str,
+    city_id: Optional[int],
+    date_from: Optional[date],
+    date_to: Optional[date],
+):
+    """
+    Чтение агрегатов из материализованного представления
+
+    Возвращает (строки, freshness) или None, если представление не подходит:
+    не PostgreSQL, период выходит за окно представления или оно еще ни разу
+    не обновлялось.
+    """
+    from ..materialized_views import VIEW_WINDOW_DAYS, freshness, get_view_watermark
+
+    date_from = _as_date(date_from)
+    date_to = _as_date(date_to)
+    window_start = date.today() - timedelta(days=VIEW_WINDOW_DAYS)
+    if db.bind.dialect.name != "postgresql" or date_from is None:
+        return None
+    if date_from < window_start:
+        return None
+
+    watermark = await get_view_watermark(view)
+    if watermark is None:
+        return None
+
+    conditions = [f"{date_column} >= :date_from"]
+    params: Dict[str, Any] = {"date_from": date_from}
+    if date_to:
+        conditions.append(f"{date_column} <= :date_to")
+        params["date_to"] = date_to
+    if city_id:
+        conditions.append("city_id = :city_id")
+        params["city_id"] = city_id
+    where = "WHERE " + " AND ".join(conditions)
+
+    try:
+        # Savepoint: ошибка чтения представления не должна прерывать транзакцию
+        async with db.begin_nested():
+            result = await db.execute(text(sql.format(where=where)), params)
+            rows = result.fetchall()
+        return rows, freshness(watermark, view)
+    except Exception as e:
+        logger.warning(f"Failed to read {view}, falling back to base tables: {e}")
+        return None
+
+
 class OptimizedRequestCRUD:
     """Оптимизированные операции с заявками"""
 
@@ -74,7 +141,7 @@ class OptimizedRequestCRUD:
         if date_to:
             filters.append(Request.created_at <= date_to)
         if phone_filter:
-            filters.append(Request.client_phone.like(f"%{phone_filter}%"))
+            filters.append(phone_filter_clause(Request.client_phone, phone_filter))
 
         if filters:
             query = query.where(and_(*filters))
@@ -121,7 +188,7 @@ class OptimizedRequestCRUD:
             select(Request)
             .where(
                 and_(
-                    Request.client_phone == client_phone,
+                    Request.client_phone == canonical_phone(client_phone),
                     Request.created_at >= time_threshold,
                 )
             )
@@ -144,7 +211,7 @@ class OptimizedRequestCRUD:
             select(Request)
             .where(
                 and_(
-                    Request.client_phone == client_phone,
+                    Request.client_phone == canonical_phone(client_phone),
                     Request.created_at >= start_time,
                     Request.created_at <= end_time,
                 )
@@ -166,7 +233,38 @@ class OptimizedRequestCRUD:
         """
         Оптимизированная статистика для колл-центра
         Использует агрегированные запросы с индексами
+
+        Если период целиком входит в окно mv_requests_summary, данные берутся
+        из материализованного представления; в ответе указывается, на какой
+        момент они актуальны.
         """
+        view_result = await _read_view_statistics(
+            db,
+            "mv_requests_summary",
+            """
+            SELECT status AS key, 'status' AS kind, SUM(request_count) AS count
+            FROM mv_requests_summary {where} GROUP BY status
+            UNION ALL
+            SELECT city_name AS key, 'city' AS kind, SUM(request_count) AS count
+            FROM mv_requests_summary {where} GROUP BY city_name
+            """,
+            "request_date",
+            city_id,
+            date_from,
+            date_to,
+        )
+        if view_result is not None:
+            rows, freshness_info = view_result
+            return {
+                "status_distribution": {
+                    row.key: int(row.count) for row in rows if row.kind == "status"
+                },
+                "city_distribution": {
+                    row.key: int(row.count) for row in rows if row.kind == "city"
+                },
+                "freshness": freshness_info,
+            }
+
         base_query = select(Request)
 
         filters = []
@@ -199,6 +297,7 @@ class OptimizedRequestCRUD:
                 row.status: row.count for row in status_stats.fetchall()
             },
             "city_distribution": {row.name: row.count for row in city_stats.fetchall()},
+            "freshness": _live_freshness(),
         }
 
 
@@ -256,7 +355,35 @@ class OptimizedTransactionCRUD:
         date_from: Optional[date] = None,
         date_to: Optional[date] = None,
     ) -> Dict[str, Any]:
-        """Финансовая сводка с агрегацией"""
+        """Финансовая сводка с агрегацией
+
+        Для периодов внутри окна mv_financial_summary читает представление.
+        """
+        view_result = await _read_view_statistics(
+            db,
+            "mv_financial_summary",
+            """
+            SELECT SUM(total_amount) AS total_amount, SUM(income) AS income,
+                   SUM(expenses) AS expenses,
+                   SUM(transaction_count) AS transaction_count
+            FROM mv_financial_summary {where}
+            """,
+            "transaction_date",
+            city_id,
+            date_from,
+            date_to,
+        )
+        if view_result is not None:
+            rows, freshness_info = view_result
+            row = rows[0] if rows else None
+            return {
+                "total_amount": float(row.total_amount or 0) if row else 0.0,
+                "income": float(row.income or 0) if row else 0.0,
+                "expenses": float(row.expenses or 0) if row else 0.0,
+                "transaction_count": int(row.transaction_count or 0) if row else 0,
+                "freshness": freshness_info,
+            }
+
         base_query = select(Transaction)
 
         filters = []
@@ -291,6 +418,7 @@ class OptimizedTransactionCRUD:
                 "income": float(result.income or 0),
                 "expenses": float(result.expenses or 0),
                 "transaction_count": result.transaction_count or 0,
+                "freshness": _live_freshness(),
             }
         else:
             return {
@@ -298,6 +426,7 @@ class OptimizedTransactionCRUD:
                 "income": 0.0,
                 "expenses": 0.0,
                 "transaction_count": 0,
+                "freshness": _live_freshness(),
             }
 
 
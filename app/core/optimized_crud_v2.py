@@ -28,6 +28,7 @@ from .models import (
 )
 from .schemas import RequestCreate, RequestUpdate, TransactionCreate, TransactionUpdate
 from .cache import cache_manager, QueryCache, cached
+from .phone import canonical_phone, phone_filter_clause
 from .performance import performance_monitor
 
 logger = logging.getLogger(__name__)
@@ -222,7 +223,7 @@ class OptimizedCRUDv2:
         if date_to:
             filters.append(Request.created_at <= date_to)
         if phone_filter:
-            filters.append(Request.client_phone.like(f"%{phone_filter}%"))
+            filters.append(phone_filter_clause(Request.client_phone, phone_filter))
 
         if filters:
             query = query.where(and_(*filters))
@@ -271,7 +272,7 @@ class OptimizedCRUDv2:
             select(Request)
             .where(
                 and_(
-                    Request.client_phone == client_phone,
+                    Request.client_phone == canonical_phone(client_phone),
                     Request.created_at >= time_threshold,
                 )
             )
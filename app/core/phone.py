@@ -0,0 +1,44 @@
+"""
+Нормализация номеров телефонов
+
+Номера приходят в разных форматах (Mango, имена файлов записей, ручной
+ввод); при записи и поиске они приводятся к единому виду E.164
+(+7XXXXXXXXXX), чтобы поиск шел по равенству и использовал B-tree индекс.
+Частичный поиск ("последние 4 цифры") использует триграммный индекс.
+"""
+
+import re
+from typing import Optional
+
+from sqlalchemy.sql.elements import ColumnElement
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Номер в формате E.164 (+7XXXXXXXXXX) или None, если номер не распознан"""
+    if not phone:
+        return None
+    digits = re.sub(r"\D", "", str(phone))
+    if len(digits) == 10:
+        digits = "7" + digits
+    elif len(digits) == 11 and digits.startswith("8"):
+        digits = "7" + digits[1:]
+    if len(digits) == 11 and digits.startswith("7"):
+        return "+" + digits
+    return None
+
+
+def canonical_phone(phone: Optional[str]) -> Optional[str]:
+    """Номер для записи в БД: E.164, а нераспознанный - как есть"""
+    if phone is None:
+        return None
+    return normalize_phone(phone) or str(phone).strip()
+
+
+def phone_filter_clause(column, query: str) -> ColumnElement:
+    """Условие поиска по номеру: полный номер - равенство, часть - по цифрам"""
+    normalized = normalize_phone(query)
+    if normalized:
+        return column == normalized
+    digits = re.sub(r"\D", "", query)
+    # LIKE '%...%' обслуживается триграммным индексом (pg_trgm)
+    return column.like(f"%{digits or query}%")
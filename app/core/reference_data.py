@@ -0,0 +1,88 @@
+"""
+Справочники в памяти для сборки ответов без дополнительных SELECT
+
+Города, типы заявок и транзакций, направления и рекламные кампании меняются
+редко, поэтому после INSERT/UPDATE ... RETURNING связанные объекты берутся
+отсюда, а не догружаются selectinload. Таблица справочника загружается
+целиком одним запросом и живет REFERENCE_CACHE_TTL секунд; при промахе по id
+справочник перечитывается.
+"""
+
+import logging
+import time
+from typing import Any, Dict, Optional, Type
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceData:
+    """Кеш строк справочных таблиц в памяти процесса"""
+
+    def __init__(self):
+        self._rows: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._loaded_at: Dict[str, float] = {}
+
+    async def _load(self, db: AsyncSession, model) -> Dict[int, Dict[str, Any]]:
+        table = model.__table__
+        result = await db.execute(select(*table.columns))
+        rows = {row.id: dict(row._mapping) for row in result}
+        self._rows[table.name] = rows
+        self._loaded_at[table.name] = time.monotonic()
+        return rows
+
+    async def _table_rows(
+        self, db: AsyncSession, model, object_id: Optional[int] = None
+    ) -> Dict[int, Dict[str, Any]]:
+        name = model.__table__.name
+        rows = self._rows.get(name)
+        expired = (
+            time.monotonic() - self._loaded_at.get(name, 0)
+            > settings.REFERENCE_CACHE_TTL
+        )
+        if rows is None or expired or (object_id is not None and object_id not in rows):
+            rows = await self._load(db, model)
+        return rows
+
+    @staticmethod
+    def _instance(model, row: Dict[str, Any]):
+        # Объект помечается как уже сохраненный: сессия не попытается его вставить
+        instance = model(**row)
+        make_transient_to_detached(instance)
+        return instance
+
+    async def get(self, db: AsyncSession, model: Type, object_id: Optional[int]):
+        """Объект справочника по id (из сессии, если он уже загружен)"""
+        if object_id is None:
+            return None
+        existing = db.identity_map.get(identity_key(model, object_id))
+        if existing is not None:
+            return existing
+        row = (await self._table_rows(db, model, object_id)).get(object_id)
+        return self._instance(model, row) if row is not None else None
+
+    async def find(self, db: AsyncSession, model: Type, **filters):
+        """Первый объект справочника с совпадающими полями"""
+        rows = await self._table_rows(db, model)
+        for row in rows.values():
+            if all(row.get(field) == value for field, value in filters.items()):
+                return await self.get(db, model, row["id"])
+        return None
+
+    def invalidate(self, model: Optional[Type] = None):
+        if model is None:
+            self._rows.clear()
+            self._loaded_at.clear()
+        else:
+            self._rows.pop(model.__table__.name, None)
+            self._loaded_at.pop(model.__table__.name, None)
+
+
+# Создаем глобальный экземпляр
+reference_data = ReferenceData()
@@ -0,0 +1,14 @@
+"""
+Контекст текущего HTTP-запроса
+
+ASGI scope запроса хранится в ContextVar (его устанавливает
+QueryTrackingMiddleware) и доступен коду, которому не передается Request:
+метрикам по эндпоинтам и зависимости get_db (read-your-writes).
+"""
+
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+current_request_scope: ContextVar[Optional[Dict[str, Any]]] = ContextVar(
+    "current_request_scope", default=None
+)
@@ -0,0 +1,204 @@
+"""
+Переходы статусов заявок с оптимистичной блокировкой
+
+Изменение заявки применяется одним условным
+UPDATE ... WHERE id = ? AND version = ? RETURNING: допустимость перехода
+статуса и ожидаемая версия проверяются в самом UPDATE, поэтому диспетчер и
+мастер, редактирующие одну заявку, не затирают изменения друг друга.
+Транзакция "Приход" создается или удаляется в той же транзакции БД.
+Если UPDATE не вернул строку, причина (версия или статус) определяется
+отдельным SELECT только на этом пути и отдается как 409.
+"""
+
+import logging
+import re
+from typing import Any, Dict, FrozenSet, Optional, cast
+
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.engine import CursorResult, Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .enhanced_schemas import RequestStatus
+from .exceptions import ResourceConflictError
+from .models import Request, Transaction, TransactionType
+from .reference_data import reference_data
+
+logger = logging.getLogger(__name__)
+
+INCOME_TRANSACTION_TYPE = "Приход"
+INCOME_NOTES = "Приход по заявке {request_id}"
+
+# Закрытые заявки нельзя вернуть в очередь диспетчера: только переоткрыть
+# в работу или исправить итоговый статус
+CLOSED_STATUSES = frozenset(
+    {
+        RequestStatus.COMPLETED.value,
+        RequestStatus.CANCELLED.value,
+        RequestStatus.NOT_ORDER.value,
+        RequestStatus.TNO.value,
+    }
+)
+REOPEN_STATUSES = frozenset(
+    {RequestStatus.IN_PROGRESS.value, RequestStatus.MODERN.value}
+)
+
+ALL_STATUSES = frozenset(status.value for status in RequestStatus)
+
+# Текущий статус -> статусы, в которые разрешен переход
+ALLOWED_TRANSITIONS: Dict[str, FrozenSet[str]] = {
+    status: (
+        CLOSED_STATUSES | REOPEN_STATUSES if status in CLOSED_STATUSES else ALL_STATUSES
+    )
+    for status in ALL_STATUSES
+}
+
+_ETAG_RE = re.compile(r'^(?:W/)?"(\d+)"$')
+
+
+def is_transition_allowed(current: Optional[str], target: str) -> bool:
+    """Статусы вне справочника (старые данные) не ограничиваются"""
+    if current is None or current not in ALLOWED_TRANSITIONS:
+        return True
+    return target in ALLOWED_TRANSITIONS[current]
+
+
+def forbidden_sources(target: str) -> FrozenSet[str]:
+    """Текущие статусы, из которых нельзя перейти в target"""
+    return frozenset(
+        status
+        for status, targets in ALLOWED_TRANSITIONS.items()
+        if target not in targets
+    )
+
+
+def request_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def parse_if_match(value: Optional[str]) -> Optional[int]:
+    """Версия из If-Match; None для отсутствующего заголовка и '*'"""
+    if value is None or value.strip() == "*":
+        return None
+    match = _ETAG_RE.match(value.strip())
+    if match is None:
+        raise ValueError(f"Unsupported If-Match value: {value}")
+    return int(match.group(1))
+
+
+async def _sync_request_income(
+    db: AsyncSession, db_request: Request, status_changed: bool
+):
+    """Транзакция "Приход" по заявке в статусе "Готово" без предварительного SELECT"""
+    notes = INCOME_NOTES.format(request_id=db_request.id)
+    if db_request.status != RequestStatus.COMPLETED.value:
+        if status_changed:
+            # Заявка ушла из "Готово" (или не была в нем) - прихода быть не должно
+            await db.execute(delete(Transaction).where(Transaction.notes == notes))
+        return
+
+    transaction_type = await reference_data.find(
+        db, TransactionType, name=INCOME_TRANSACTION_TYPE
+    )
+    if transaction_type is None:
+        return
+    values = {
+        "city_id": db_request.city_id,
+        "transaction_type_id": transaction_type.id,
+        "amount": db_request.master_handover,
+        "specified_date": (db_request.updated_at or db_request.created_at).date(),
+    }
+    result = cast(
+        CursorResult,
+        await db.execute(
+            update(Transaction).where(Transaction.notes == notes).values(**values)
+        ),
+    )
+    if result.rowcount == 0:
+        await db.execute(insert(Transaction).values(notes=notes, **values))
+
+
+async def _raise_conflict(
+    db: AsyncSession,
+    request_id: int,
+    expected_version: Optional[int],
+    target_status: Optional[str],
+):
+    """Причина, по которой условный UPDATE не затронул строку"""
+    current: Optional[Row[Any]] = (
+        await db.execute(
+            select(Request.version, Request.status).where(Request.id == request_id)
+        )
+    ).first()
+    await db.rollback()
+    if current is None:
+        return
+    details = {"current_version": current.version, "current_status": current.status}
+    if (
+        expected_version is None or current.version == expected_version
+    ) and not is_transition_allowed(current.status, target_status or ""):
+        raise ResourceConflictError(
+            f"Status transition '{current.status}' -> '{target_status}' "
+            "is not allowed",
+            "request",
+            request_id,
+            details,
+        )
+    raise ResourceConflictError(
+        "Request was modified by another user", "request", request_id, details
+    )
+
+
+async def apply_request_update(
+    db: AsyncSession,
+    request_id: int,
+    data: Dict[str, Any],
+    expected_version: Optional[int] = None,
+) -> Optional[Request]:
+    """
+    Условное обновление заявки и синхронизация прихода одной транзакцией БД.
+
+    None - заявка не найдена; ResourceConflictError - версия устарела или
+    переход статуса запрещен.
+    """
+    columns = Request.__table__.columns.keys()
+    values = {key: value for key, value in data.items() if key in columns}
+    body_version = values.pop("version", None)
+    if expected_version is None:
+        expected_version = body_version
+    values.pop("id", None)
+    if isinstance(values.get("status"), RequestStatus):
+        # У str-Enum свой hash: во множествах статусов сравниваем строки
+        values["status"] = values["status"].value
+    target_status = values.get("status")
+
+    statement = (
+        update(Request)
+        .where(Request.id == request_id)
+        .values(**values, version=Request.version + 1)
+        .returning(Request)
+        .execution_options(populate_existing=True)
+    )
+    if expected_version is not None:
+        statement = statement.where(Request.version == expected_version)
+    if target_status is not None:
+        forbidden = forbidden_sources(target_status)
+        if forbidden:
+            statement = statement.where(
+                or_(Request.status.is_(None), Request.status.notin_(forbidden))
+            )
+
+    try:
+        db_request = (await db.execute(statement)).scalar_one_or_none()
+        if db_request is None:
+            await _raise_conflict(db, request_id, expected_version, target_status)
+            return None
+        await _sync_request_income(db, db_request, "status" in values)
+        await db.commit()
+    except ResourceConflictError:
+        raise
+    except Exception:
+        await db.rollback()
+        raise
+
+    logger.debug(f"Request {request_id} updated to version {db_request.version}")
+    return db_request
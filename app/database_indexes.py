@@ -6,6 +6,7 @@ from sqlalchemy import Index, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from .core.models import Request, Transaction, Master, Employee, Administrator, File
 from .core.database import engine
+from .index_builder import index_builder
 import logging
 
 logger = logging.getLogger(__name__)
@@ -168,36 +169,20 @@ PERFORMANCE_INDEXES = [
 
 
 async def create_database_indexes():
-    """Создание всех индексов для оптимизации производительности"""
-    logger.info("Creating database indexes for performance optimization...")
-
-    async with engine.begin() as conn:
-        try:
-            # Создаем основные индексы
-            for index in DATABASE_INDEXES:
-                try:
-                    await conn.run_sync(index.create, checkfirst=True)
-                    logger.info(f"Created index: {index.name}")
-                except Exception as e:
-                    logger.warning(
-                        f"Index {index.name} already exists or failed to create: {e}"
-                    )
+    """Создание всех индексов для оптимизации производительности
 
-            # Создаем индексы для производительности
-            for index in PERFORMANCE_INDEXES:
-                try:
-                    await conn.run_sync(index.create, checkfirst=True)
-                    logger.info(f"Created performance index: {index.name}")
-                except Exception as e:
-                    logger.warning(
-                        f"Performance index {index.name} already exists or failed to create: {e}"
-                    )
+    Индексы строятся CONCURRENTLY и не блокируют запись в таблицы.
+    """
+    logger.info("Creating database indexes for performance optimization...")
 
-            logger.info("Database indexes creation completed!")
+    job = await index_builder.run(DATABASE_INDEXES + PERFORMANCE_INDEXES)
+    if job["status"] == "failed":
+        raise RuntimeError(
+            f"Failed to create indexes: {job.get('error') or job['errors']}"
+        )
 
-        except Exception as e:
-            logger.error(f"Error creating database indexes: {e}")
-            raise
+    logger.info("Database indexes creation completed!")
+    return job
 
 
 async def drop_database_indexes():
@@ -3,7 +3,9 @@
 Версия 2.0 - с дополнительными оптимизациями
 """
 
-from sqlalchemy import Index, text
+from typing import cast
+
+from sqlalchemy import Index, Table, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from .core.models import (
     Request,
@@ -17,6 +19,7 @@ from .core.models import (
     TransactionType,
 )
 from .core.database import engine
+from .index_builder import index_builder
 import logging
 
 logger = logging.getLogger(__name__)
@@ -227,77 +230,29 @@ FUNCTIONAL_INDEXES = [
     ),
 ]
 
+# Выражения функциональных индексов есть только в PostgreSQL: их создает
+# index_builder, а не Base.metadata.create_all
+for _index in FUNCTIONAL_INDEXES:
+    cast(Table, _index.table).indexes.discard(_index)
 
-async def create_performance_indexes_v2():
-    """Создание улучшенных индексов для производительности"""
-    logger.info("Создание индексов производительности v2...")
-
-    async with engine.begin() as conn:
-        try:
-            # Создаем основные индексы
-            for index in PERFORMANCE_INDEXES_V2:
-                try:
-                    await conn.execute(
-                        text(
-                            f"CREATE INDEX IF NOT EXISTS {index.name} ON {index.table.name} {index._create_index_sql()}"
-                        )
-                    )
-                    logger.info(f"Создан индекс: {index.name}")
-                except Exception as e:
-                    if "already exists" not in str(e):
-                        logger.warning(f"Ошибка создания индекса {index.name}: {e}")
-
-            # Создаем специализированные индексы
-            for index in SPECIALIZED_INDEXES:
-                try:
-                    await conn.execute(
-                        text(
-                            f"CREATE INDEX IF NOT EXISTS {index.name} ON {index.table.name} {index._create_index_sql()}"
-                        )
-                    )
-                    logger.info(f"Создан специализированный индекс: {index.name}")
-                except Exception as e:
-                    if "already exists" not in str(e):
-                        logger.warning(
-                            f"Ошибка создания специализированного индекса {index.name}: {e}"
-                        )
-
-            # Создаем функциональные индексы
-            functional_index_queries = [
-                """
-                CREATE INDEX IF NOT EXISTS idx_requests_phone_partial_v2 
-                ON requests (substring(client_phone, 1, 10), created_at DESC)
-                """,
-                """
-                CREATE INDEX IF NOT EXISTS idx_requests_date_only_v2 
-                ON requests (DATE(created_at), city_id)
-                """,
-                """
-                CREATE INDEX IF NOT EXISTS idx_transactions_month_year_v2 
-                ON transactions (EXTRACT(YEAR FROM specified_date), EXTRACT(MONTH FROM specified_date), city_id)
-                """,
-            ]
 
-            for query in functional_index_queries:
-                try:
-                    await conn.execute(text(query))
-                    logger.info("Создан функциональный индекс")
-                except Exception as e:
-                    if "already exists" not in str(e):
-                        logger.warning(f"Ошибка создания функционального индекса: {e}")
+async def create_performance_indexes_v2():
+    """Создание улучшенных индексов для производительности
 
-            # Обновляем статистику таблиц
-            await conn.execute(text("ANALYZE requests"))
-            await conn.execute(text("ANALYZE transactions"))
-            await conn.execute(text("ANALYZE masters"))
-            await conn.execute(text("ANALYZE employees"))
-            await conn.execute(text("ANALYZE files"))
+    Индексы строятся CONCURRENTLY вне транзакции, статистика таблиц
+    обновляется после сборки.
+    """
+    logger.info("Создание индексов производительности v2...")
 
-            logger.info("Индексы производительности v2 созданы успешно")
+    job = await index_builder.run(
+        PERFORMANCE_INDEXES_V2 + SPECIALIZED_INDEXES + FUNCTIONAL_INDEXES
+    )
+    if job["status"] == "failed":
+        logger.error(f"Ошибка создания индексов: {job.get('error') or job['errors']}")
+        raise RuntimeError("Не удалось создать индексы производительности v2")
 
-        except Exception as e:
-            logger.error(f"Ошибка создания индексов: {e}")
-            raise
+    logger.info("Индексы производительности v2 созданы успешно")
+    return job
 
 
 async def optimize_database_settings():
@@ -13,6 +13,7 @@ from .database_indexes import (
     analyze_query_performance,
     get_database_statistics,
 )
+from .db_partitioning import partition_manager
 
 logger = logging.getLogger(__name__)
 
@@ -107,110 +108,33 @@ class DatabaseOptimizer:
         """Создание материализованных представлений для отчетов"""
         logger.info("Creating materialized views...")
 
-        views = [
-            {
-                "name": "mv_requests_summary",
-                "sql": """
-                CREATE MATERIALIZED VIEW IF NOT EXISTS mv_requests_summary AS
-                SELECT 
-                    r.city_id,
-                    c.name as city_name,
-                    r.status,
-                    rt.name as request_type,
-                    DATE(r.created_at) as request_date,
-                    COUNT(*) as request_count,
-                    COUNT(CASE WHEN r.master_id IS NOT NULL THEN 1 END) as assigned_count,
-                    AVG(r.result) as avg_result,
-                    SUM(r.expenses) as total_expenses
-                FROM requests r
-                JOIN cities c ON r.city_id = c.id
-                JOIN request_types rt ON r.request_type_id = rt.id
-                WHERE r.created_at >= CURRENT_DATE - INTERVAL '30 days'
-                GROUP BY r.city_id, c.name, r.status, rt.name, DATE(r.created_at)
-                WITH DATA;
-                
-                CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_requests_summary 
-                ON mv_requests_summary (city_id, status, request_type, request_date);
-                """,
-            },
-            {
-                "name": "mv_financial_summary",
-                "sql": """
-                CREATE MATERIALIZED VIEW IF NOT EXISTS mv_financial_summary AS
-                SELECT 
-                    t.city_id,
-                    c.name as city_name,
-                    tt.name as transaction_type,
-                    DATE(t.specified_date) as transaction_date,
-                    COUNT(*) as transaction_count,
-                    SUM(t.amount) as total_amount,
-                    SUM(CASE WHEN t.amount > 0 THEN t.amount ELSE 0 END) as income,
-                    SUM(CASE WHEN t.amount < 0 THEN t.amount ELSE 0 END) as expenses
-                FROM transactions t
-                JOIN cities c ON t.city_id = c.id
-                JOIN transaction_types tt ON t.transaction_type_id = tt.id
-                WHERE t.specified_date >= CURRENT_DATE - INTERVAL '30 days'
-                GROUP BY t.city_id, c.name, tt.name, DATE(t.specified_date)
-                WITH DATA;
-                
-                CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_financial_summary 
-                ON mv_financial_summary (city_id, transaction_type, transaction_date);
-                """,
-            },
-        ]
+        from .materialized_views import view_refresher
 
-        async with self.engine.begin() as conn:
-            for view in views:
-                try:
-                    await conn.execute(text(view["sql"]))
-                    logger.info(f"Created materialized view: {view['name']}")
-                except Exception as e:
-                    logger.warning(f"Failed to create view {view['name']}: {e}")
+        created = await view_refresher.ensure_views()
+        logger.info(f"Materialized views ready: {created}")
 
     async def refresh_materialized_views(self):
-        """Обновление материализованных представлений"""
+        """Принудительное обновление материализованных представлений"""
         logger.info("Refreshing materialized views...")
 
-        views = ["mv_requests_summary", "mv_financial_summary"]
+        from .materialized_views import view_refresher
 
-        async with self.engine.begin() as conn:
-            for view in views:
-                try:
-                    await conn.execute(
-                        text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
-                    )
-                    logger.info(f"Refreshed materialized view: {view}")
-                except Exception as e:
-                    logger.warning(f"Failed to refresh view {view}: {e}")
+        refreshed = await view_refresher.refresh_dirty(force=True)
+        logger.info(f"Refreshed materialized views: {refreshed}")
 
     async def cleanup_old_data(self, days_to_keep: int = 365):
-        """Очистка старых данных"""
-        logger.info(f"Cleaning up data older than {days_to_keep} days...")
-
-        cleanup_queries = [
-            # Удаляем старые файлы без связанных записей
-            f"""
-            DELETE FROM files 
-            WHERE uploaded_at < NOW() - INTERVAL '{days_to_keep} days'
-            AND request_id IS NULL 
-            AND transaction_id IS NULL
-            """,
-            # Архивируем старые заявки (можно настроить логику)
-            f"""
-            UPDATE requests 
-            SET status = 'archived' 
-            WHERE created_at < NOW() - INTERVAL '{days_to_keep} days'
-            AND status IN ('done', 'cancelled')
-            """,
-        ]
+        """Перенос старых данных в архив
 
-        async with self.engine.begin() as conn:
-            for query in cleanup_queries:
-                try:
-                    result = await conn.execute(text(query))
-                    logger.info(f"Cleanup query affected {result.rowcount} rows")
-                except Exception as e:
-                    logger.warning(f"Cleanup query failed: {e}")
+        Записи не удаляются: закрытые заявки, транзакции и их файлы
+        переносятся в таблицы *_archive небольшими пакетами.
+        """
+        logger.info(f"Archiving data older than {days_to_keep} days...")
+
+        from .services.archive_service import archive_service
+
+        totals = await archive_service.run(days=days_to_keep)
+        logger.info(f"Archived records: {totals}")
+        return totals
 
     async def vacuum_analyze_tables(self):
         """VACUUM и ANALYZE для всех таблиц"""
@@ -231,6 +155,11 @@ class DatabaseOptimizer:
             "roles",
         ]
 
+        # Партиционированную requests обслуживаем по отдельным партициям
+        partitions = [p["name"] for p in await partition_manager.list_partitions()]
+        if partitions:
+            tables = partitions + [table for table in tables if table != "requests"]
+
         # VACUUM ANALYZE требует отдельного соединения
         async with self.engine.connect() as conn:
             for table in tables:
@@ -250,10 +179,21 @@ class DatabaseOptimizer:
             "index_usage": await self._get_index_usage(),
             "slow_queries": await self._get_slow_queries(),
             "connection_info": await self._get_connection_info(),
+            "index_advisor": await self._get_index_advice(),
         }
 
         return report
 
+    async def _get_index_advice(self) -> Dict[str, Any]:
+        """Дублирующиеся, неиспользуемые и недостающие индексы"""
+        from .index_advisor import index_advisor
+
+        try:
+            return await index_advisor.build_report()
+        except Exception as e:
+            logger.error(f"Failed to build index advice: {e}")
+            return {"error": str(e)}
+
     async def _get_index_usage(self) -> Dict[str, Any]:
         """Статистика использования индексов"""
         async with self.engine.begin() as conn:
@@ -382,8 +322,8 @@ async def refresh_database_views():
 
 
 async def cleanup_database(days_to_keep: int = 365):
-    """Очистка старых данных"""
-    await db_optimizer.cleanup_old_data(days_to_keep)
+    """Архивирование старых данных"""
+    return await db_optimizer.cleanup_old_data(days_to_keep)
 
 
 async def get_database_optimization_report():
@@ -0,0 +1,450 @@
+"""
+Управление помесячными партициями таблицы requests
+
+Таблица requests партиционирована по диапазону created_at (миграция 003).
+Здесь создаются будущие партиции, старые переносятся в requests_archive и
+выполняется VACUUM/ANALYZE по отдельным партициям.
+"""
+
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from .core.config import settings
+from .core.database import engine
+from .core.models import File, FileArchive, Request, RequestArchive
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "requests"
+DEFAULT_PARTITION = "requests_default"
+ARCHIVE_PREFIX = "requests_archive_"
+
+# Ключ advisory lock, чтобы обслуживание выполнял только один воркер
+MAINTENANCE_LOCK_KEY = 804_032
+
+# SQLSTATE lock_not_available: истек lock_timeout
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def month_start(value: datetime) -> date:
+    """Первый день месяца в UTC"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    """Сдвиг первого дня месяца на указанное количество месяцев"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def partition_bounds(month: date) -> Tuple[datetime, datetime]:
+    """Границы партиции [начало месяца, начало следующего) в UTC"""
+    start = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+    end_month = add_months(month, 1)
+    end = datetime(end_month.year, end_month.month, 1, tzinfo=timezone.utc)
+    return start, end
+
+
+def create_partition_sql(month: date) -> str:
+    start, end = partition_bounds(month)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} "
+        f"PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+
+
+def detach_partition_sql(name: str, pending: bool = False) -> str:
+    """Отсоединение партиции от requests
+
+    DETACH ... CONCURRENTLY недоступен, пока у таблицы есть default-партиция
+    (миграция 003), поэтому партиция отсоединяется обычным DETACH: он
+    берет ACCESS EXCLUSIVE блокировку requests, но только на изменение
+    каталога. FINALIZE завершает отсоединение CONCURRENTLY, прерванное до
+    появления default-партиции.
+    """
+    mode = " FINALIZE" if pending else ""
+    return f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}{mode}"
+
+
+def archive_table_name(month: date) -> str:
+    """Имя отсоединенной партиции до переноса ее строк в архив"""
+    return f"{ARCHIVE_PREFIX}{month.year:04d}_{month.month:02d}"
+
+
+def archive_columns(model, archive_model) -> List[str]:
+    """Общие колонки горячей и архивной таблиц"""
+    columns = set(archive_model.__table__.columns.keys())
+    return [name for name in model.__table__.columns.keys() if name in columns]
+
+
+def move_rows_sql(source: str, target: str, columns: List[str], condition: str) -> str:
+    """Перенос пакета строк одним запросом: DELETE ... RETURNING в архив"""
+    column_list = ", ".join(columns)
+    return (
+        f"WITH moved AS (DELETE FROM {source} WHERE {condition} "
+        f"RETURNING {column_list}) "
+        f"INSERT INTO {target} ({column_list}, archived_at) "
+        f"SELECT {column_list}, now() FROM moved"
+    )
+
+
+def parse_partition_month(name: str) -> Optional[date]:
+    """Месяц партиции по имени requests_pYYYY_MM"""
+    prefix = f"{PARENT_TABLE}_p"
+    if not name.startswith(prefix):
+        return None
+    try:
+        year, month = name[len(prefix) :].split("_")
+        return date(int(year), int(month), 1)
+    except ValueError:
+        return None
+
+
+class RequestPartitionManager:
+    """Обслуживание партиций таблицы requests"""
+
+    def __init__(self):
+        self.engine = engine
+        self.last_run: Optional[datetime] = None
+        self.last_result: Dict[str, Any] = {}
+
+    async def is_partitioned(self, conn) -> bool:
+        if conn.dialect.name != "postgresql":
+            return False
+        result = await conn.execute(
+            text(
+                """
+                SELECT 1 FROM pg_partitioned_table pt
+                JOIN pg_class c ON c.oid = pt.partrelid
+                WHERE c.relname = :table
+                """
+            ),
+            {"table": PARENT_TABLE},
+        )
+        return result.scalar() is not None
+
+    async def list_partitions(self) -> List[Dict[str, Any]]:
+        """Партиции requests с границами и размерами"""
+        async with self.engine.connect() as conn:
+            if not await self.is_partitioned(conn):
+                return []
+            result = await conn.execute(
+                text(
+                    """
+                    SELECT c.relname AS name,
+                           pg_get_expr(c.relpartbound, c.oid) AS bounds,
+                           pg_total_relation_size(c.oid) AS size_bytes,
+                           c.reltuples::bigint AS estimated_rows
+                    FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    JOIN pg_class p ON p.oid = i.inhparent
+                    WHERE p.relname = :table
+                    ORDER BY c.relname
+                    """
+                ),
+                {"table": PARENT_TABLE},
+            )
+            return [dict(row._mapping) for row in result]
+
+    async def ensure_future_partitions(
+        self, months_ahead: Optional[int] = None
+    ) -> List[str]:
+        """Создание партиций с текущего месяца на months_ahead вперед"""
+        if months_ahead is None:
+            months_ahead = settings.REQUESTS_PARTITION_MONTHS_AHEAD
+
+        current = month_start(datetime.now(timezone.utc))
+        created = []
+
+        async with self.engine.connect() as conn:
+            if not await self.is_partitioned(conn):
+                return []
+            existing = {
+                row[0]
+                for row in await conn.execute(
+                    text(
+                        """
+                        SELECT c.relname FROM pg_inherits i
+                        JOIN pg_class c ON c.oid = i.inhrelid
+                        JOIN pg_class p ON p.oid = i.inhparent
+                        WHERE p.relname = :table
+                        """
+                    ),
+                    {"table": PARENT_TABLE},
+                )
+            }
+            await conn.commit()
+
+            for offset in range(months_ahead + 1):
+                month = add_months(current, offset)
+                name = partition_name(month)
+                if name in existing:
+                    continue
+                try:
+                    await conn.execute(text(create_partition_sql(month)))
+                    await conn.commit()
+                    created.append(name)
+                    logger.info(f"Created partition {name}")
+                except Exception as e:
+                    # Например, строки за этот месяц уже лежат в default-партиции
+                    await conn.rollback()
+                    logger.warning(f"Failed to create partition {name}: {e}")
+
+        return created
+
+    async def detach_old_partitions(
+        self, retention_months: Optional[int] = None
+    ) -> List[str]:
+        """Перенос партиций старше retention_months в requests_archive
+
+        Партиция отсоединяется обычным DETACH PARTITION под коротким
+        lock_timeout с повторами (см. _detach_partition) и переименовывается
+        в requests_archive_YYYY_MM. Затем ее строки вместе с файлами пакетами
+        переносятся в requests_archive / files_archive, где их находят
+        архивные чтения, и пустая таблица удаляется. Прерванное
+        отсоединение или перенос продолжаются при следующем запуске.
+        """
+        if retention_months is None:
+            retention_months = settings.REQUESTS_PARTITION_RETENTION_MONTHS
+        if retention_months <= 0:
+            return []
+
+        cutoff = add_months(month_start(datetime.now(timezone.utc)), -retention_months)
+        archived = []
+
+        async with self.engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            pending = await self._pending_detach(conn)
+
+            for partition in await self.list_partitions():
+                month = parse_partition_month(partition["name"])
+                if month is None or month >= cutoff:
+                    continue
+
+                try:
+                    await self._detach_partition(
+                        conn, partition["name"], partition["name"] in pending
+                    )
+                    await conn.execute(
+                        text(
+                            f"ALTER TABLE {partition['name']} "
+                            f"RENAME TO {archive_table_name(month)}"
+                        )
+                    )
+                    logger.info(f"Detached partition {partition['name']}")
+                except Exception as e:
+                    logger.warning(
+                        f"Failed to detach partition {partition['name']}: {e}"
+                    )
+
+            for table in await self._detached_tables(conn):
+                try:
+                    moved = await self._move_to_archive(conn, table)
+                    archived.append(table)
+                    logger.info(f"Moved {moved} requests from {table} to archive")
+                except Exception as e:
+                    logger.warning(f"Failed to archive detached partition {table}: {e}")
+
+        return archived
+
+    async def _detach_partition(self, conn, name: str, pending: bool):
+        """DETACH PARTITION, который не ждет блокировку дольше lock_timeout
+
+        Ожидающий ACCESS EXCLUSIVE блокировку запрос задерживает за собой
+        все чтения и записи requests, поэтому при занятой таблице DETACH
+        отступает и повторяется после паузы.
+        """
+        attempts = max(settings.REQUESTS_PARTITION_DETACH_ATTEMPTS, 1)
+        await conn.execute(
+            text(
+                "SET lock_timeout = "
+                f"'{settings.REQUESTS_PARTITION_DETACH_LOCK_TIMEOUT}'"
+            )
+        )
+        try:
+            for attempt in range(1, attempts + 1):
+                try:
+                    await conn.execute(text(detach_partition_sql(name, pending)))
+                    return
+                except DBAPIError as e:
+                    sqlstate = getattr(e.orig, "sqlstate", None)
+                    if sqlstate != LOCK_NOT_AVAILABLE or attempt == attempts:
+                        raise
+                    logger.info(
+                        f"Partition {name} is busy, detach retry {attempt}/{attempts}"
+                    )
+                    await asyncio.sleep(
+                        settings.REQUESTS_PARTITION_DETACH_RETRY_SECONDS
+                    )
+        finally:
+            await conn.execute(text("RESET lock_timeout"))
+
+    @staticmethod
+    async def _pending_detach(conn) -> Set[str]:
+        """Партиции, отсоединение которых было прервано"""
+        result = await conn.execute(
+            text(
+                """
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = :table AND i.inhdetachpending
+                """
+            ),
+            {"table": PARENT_TABLE},
+        )
+        return {row[0] for row in result}
+
+    @staticmethod
+    async def _detached_tables(conn) -> List[str]:
+        """Отсоединенные партиции, строки которых еще не перенесены в архив"""
+        result = await conn.execute(
+            text(
+                """
+                SELECT c.relname FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = 'public' AND c.relkind = 'r'
+                  AND NOT c.relispartition
+                  AND c.relname ~ :pattern
+                ORDER BY c.relname
+                """
+            ),
+            {"pattern": f"^{ARCHIVE_PREFIX}[0-9]{{4}}_[0-9]{{2}}$"},
+        )
+        return [row[0] for row in result]
+
+    async def _move_to_archive(self, conn, table: str) -> int:
+        """Пакетный перенос строк отсоединенной партиции и их файлов
+
+        Каждый запрос - отдельная короткая транзакция (соединение в режиме
+        AUTOCOMMIT). Файлы пакета переносятся раньше заявок, поэтому
+        прерванный перенос ничего не теряет.
+        """
+        batch_ids = (
+            f"(SELECT id FROM {table} ORDER BY id "
+            f"LIMIT {settings.ARCHIVE_BATCH_SIZE})"
+        )
+        move_files = text(
+            move_rows_sql(
+                File.__tablename__,
+                FileArchive.__tablename__,
+                archive_columns(File, FileArchive),
+                f"request_id IN {batch_ids}",
+            )
+        )
+        move_requests = text(
+            move_rows_sql(
+                table,
+                RequestArchive.__tablename__,
+                archive_columns(Request, RequestArchive),
+                f"id IN {batch_ids}",
+            )
+        )
+
+        total = 0
+        while True:
+            await conn.execute(move_files)
+            moved = (await conn.execute(move_requests)).rowcount
+            total += moved
+            if moved < settings.ARCHIVE_BATCH_SIZE:
+                break
+            await asyncio.sleep(settings.ARCHIVE_BATCH_PAUSE_SECONDS)
+
+        await conn.execute(text(f"DROP TABLE {table}"))
+        return total
+
+    async def vacuum_analyze_partitions(self, recent_months: int = 2) -> List[str]:
+        """VACUUM ANALYZE последних партиций и default
+
+        Старые месяцы почти не меняются, поэтому обслуживаются только
+        текущая и предыдущие recent_months - 1 партиции.
+        """
+        current = month_start(datetime.now(timezone.utc))
+        targets = [
+            partition_name(add_months(current, -offset))
+            for offset in range(recent_months)
+        ]
+        targets.append(DEFAULT_PARTITION)
+
+        existing = {p["name"] for p in await self.list_partitions()}
+        processed = []
+
+        # VACUUM нельзя выполнять внутри транзакции
+        async with self.engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            for name in targets:
+                if name not in existing:
+                    continue
+                try:
+                    await conn.execute(text(f"VACUUM ANALYZE {name}"))
+                    processed.append(name)
+                    logger.info(f"VACUUM ANALYZE completed for partition: {name}")
+                except Exception as e:
+                    logger.warning(f"VACUUM ANALYZE failed for {name}: {e}")
+
+        return processed
+
+    async def run_maintenance(self) -> Dict[str, Any]:
+        """Полный цикл обслуживания под advisory lock"""
+        async with self.engine.connect() as lock_conn:
+            if not await self.is_partitioned(lock_conn):
+                return {"partitioned": False}
+
+            locked = (
+                await lock_conn.execute(
+                    text("SELECT pg_try_advisory_lock(:key)"),
+                    {"key": MAINTENANCE_LOCK_KEY},
+                )
+            ).scalar()
+            await lock_conn.commit()
+            if not locked:
+                return {"partitioned": True, "skipped": "locked"}
+
+            try:
+                result = {
+                    "partitioned": True,
+                    "created": await self.ensure_future_partitions(),
+                    "detached": await self.detach_old_partitions(),
+                    "vacuumed": await self.vacuum_analyze_partitions(),
+                }
+            finally:
+                await lock_conn.execute(
+                    text("SELECT pg_advisory_unlock(:key)"),
+                    {"key": MAINTENANCE_LOCK_KEY},
+                )
+                await lock_conn.commit()
+
+        self.last_run = datetime.now(timezone.utc)
+        self.last_result = result
+        return result
+
+
+# Создаем глобальный экземпляр
+partition_manager = RequestPartitionManager()
+
+
+async def start_partition_maintenance():
+    """Периодическое обслуживание партиций requests"""
+    logger.info("Starting requests partition maintenance")
+
+    while True:
+        try:
+            result = await partition_manager.run_maintenance()
+            if result.get("partitioned"):
+                logger.info(f"Partition maintenance: {result}")
+        except Exception as e:
+            logger.error(f"Error in partition maintenance: {e}")
+
+        await asyncio.sleep(settings.REQUESTS_PARTITION_MAINTENANCE_HOURS * 3600)
@@ -0,0 +1,805 @@
+"""
+Советник по индексам
+
+Собирает индексы из pg_index/pg_stat_user_indexes, частые запросы из
+pg_stat_statements и планы зарегистрированных горячих запросов приложения.
+Формирует отчет о дублирующихся, поглощенных, неиспользуемых и
+недостающих индексах с оценкой стоимости записи и текст миграции Alembic
+для их консолидации.
+
+Без PostgreSQL анализируются только индексы, объявленные в
+database_indexes.py и database_indexes_v2.py.
+"""
+
+import logging
+import re
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from .core.config import settings
+from .core.database import engine
+
+logger = logging.getLogger(__name__)
+
+# Минимальное число сканов, при котором индекс считается используемым
+UNUSED_SCAN_THRESHOLD = 0
+
+# Горячие запросы приложения: их планы проверяются на Seq Scan
+HOT_QUERIES: Dict[str, Dict[str, Any]] = {
+    "get_client": {
+        "sql": "SELECT * FROM clients WHERE phone = :phone",
+        "params": {"phone": "+79990000000"},
+    },
+    "client_recent_requests": {
+        "sql": (
+            "SELECT id, status, created_at FROM requests "
+            "WHERE client_phone = :phone ORDER BY created_at DESC LIMIT 10"
+        ),
+        "params": {"phone": "+79990000000"},
+    },
+    "link_recordings_batch": {
+        "sql": (
+            "SELECT id, client_phone, created_at FROM requests "
+            "WHERE client_phone IN (:phone, :other_phone) "
+            "AND created_at >= now() - interval '1 day' "
+            "AND created_at <= now() + interval '30 minutes'"
+        ),
+        "params": {"phone": "+79990000000", "other_phone": "+79990000001"},
+    },
+    "callcenter_report": {
+        "sql": (
+            "SELECT * FROM requests WHERE city_id = :city_id AND status = :status "
+            "AND created_at >= now() - interval '30 days'"
+        ),
+        "params": {"city_id": 1, "status": "Новая"},
+    },
+    "requests_by_master": {
+        "sql": "SELECT * FROM requests WHERE master_id = :master_id AND status = :status",
+        "params": {"master_id": 1, "status": "В работе"},
+    },
+    "financial_summary": {
+        "sql": (
+            "SELECT * FROM transactions WHERE city_id = :city_id "
+            "AND specified_date >= current_date - 30"
+        ),
+        "params": {"city_id": 1},
+    },
+    "request_files": {
+        "sql": "SELECT * FROM files WHERE request_id = :request_id",
+        "params": {"request_id": 1},
+    },
+}
+
+
+def register_hot_query(name: str, sql: str, params: Optional[Dict] = None):
+    """Регистрация горячего запроса для проверки плана советником"""
+    HOT_QUERIES[name] = {"sql": sql, "params": params or {}}
+
+
+@dataclass
+class IndexInfo:
+    """Описание индекса для анализа"""
+
+    name: str
+    table: str
+    columns: Tuple[str, ...]
+    unique: bool = False
+    primary: bool = False
+    predicate: Optional[str] = None
+    method: str = "btree"
+    definition: Optional[str] = None
+    size_bytes: int = 0
+    scans: Optional[int] = None
+    partitioned: bool = False
+
+    @property
+    def key(self) -> Tuple[str, ...]:
+        """Ключ для сравнения: полностью обратный порядок эквивалентен"""
+        reversed_key = tuple(_reverse_direction(column) for column in self.columns)
+        return min(self.columns, reversed_key)
+
+    @property
+    def droppable(self) -> bool:
+        return not (self.unique or self.primary)
+
+
+@dataclass
+class IndexFinding:
+    """Рекомендация советника"""
+
+    kind: str  # duplicate | redundant | unused | missing
+    table: str
+    index: str
+    reason: str
+    covered_by: Optional[str] = None
+    size_bytes: int = 0
+    estimated_writes_per_day: Optional[float] = None
+    definition: Optional[str] = None
+    sources: List[str] = field(default_factory=list)
+
+
+def _reverse_direction(column: str) -> str:
+    if column.endswith(" DESC"):
+        return column[: -len(" DESC")]
+    return f"{column} DESC"
+
+
+def _normalize_predicate(predicate: Optional[str]) -> Optional[str]:
+    if not predicate:
+        return None
+    return re.sub(r"[\s()]+", "", predicate).lower()
+
+
+def _split_top_level(value: str) -> Tuple[List[str], str]:
+    """Элементы списка до закрывающей скобки и остаток строки
+
+    Запятые внутри скобок и строковых литералов (lower(x),
+    COALESCE(a, b), ',') элементы не разделяют.
+    """
+    items: List[str] = []
+    depth = 0
+    quoted = False
+    start = 0
+    for position, char in enumerate(value):
+        if char == "'":
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            if depth == 0:
+                items.append(value[start:position])
+                return items, value[position + 1 :]
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append(value[start:position])
+            start = position + 1
+    return [], ""
+
+
+def parse_index_definition(
+    definition: str,
+) -> Tuple[str, Tuple[str, ...], Optional[str]]:
+    """Метод, колонки (или выражения) и условие из pg_get_indexdef"""
+    match = re.search(r"USING (\w+) \(", definition)
+    if not match:
+        return "btree", (), None
+    items, rest = _split_top_level(definition[match.end() :])
+    if not items:
+        return "btree", (), None
+    parsed = tuple(
+        re.sub(r"\s+ASC$", "", item.strip()).replace('"', "") for item in items
+    )
+    predicate = re.search(r"\sWHERE (.*)$", rest)
+    return match.group(1), parsed, predicate.group(1) if predicate else None
+
+
+def index_from_sqlalchemy(index) -> IndexInfo:
+    """IndexInfo из объявленного sqlalchemy.Index"""
+    columns = []
+    for expression in index.expressions:
+        compiled = str(expression)
+        # "requests.created_at DESC" -> "created_at DESC"
+        compiled = re.sub(r"^\w+\.", "", compiled)
+        columns.append(compiled)
+    predicate = index.dialect_options["postgresql"].get("where")
+    return IndexInfo(
+        name=index.name,
+        table=index.table.name if index.table is not None else "",
+        columns=tuple(columns),
+        unique=bool(index.unique),
+        predicate=str(predicate) if predicate is not None else None,
+        definition=str(CreateIndex(index).compile(dialect=postgresql.dialect())),
+    )
+
+
+def declared_indexes() -> List[IndexInfo]:
+    """Индексы, объявленные в модулях database_indexes*"""
+    from .database_indexes import DATABASE_INDEXES, PERFORMANCE_INDEXES
+    from .database_indexes_v2 import (
+        FUNCTIONAL_INDEXES,
+        PERFORMANCE_INDEXES_V2,
+        SPECIALIZED_INDEXES,
+    )
+
+    indexes = []
+    for group in (
+        DATABASE_INDEXES,
+        PERFORMANCE_INDEXES,
+        PERFORMANCE_INDEXES_V2,
+        SPECIALIZED_INDEXES,
+        FUNCTIONAL_INDEXES,
+    ):
+        for index in group:
+            try:
+                indexes.append(index_from_sqlalchemy(index))
+            except Exception as e:
+                logger.debug(f"Skipping index {index.name}: {e}")
+    return indexes
+
+
+def _preferred(indexes: List[IndexInfo]) -> IndexInfo:
+    """Какой из эквивалентных индексов оставить"""
+    return sorted(
+        indexes,
+        key=lambda index: (
+            not index.primary,
+            not index.unique,
+            -(index.scans or 0),
+            index.name.endswith("_v2"),
+            len(index.name),
+            index.name,
+        ),
+    )[0]
+
+
+def find_duplicate_indexes(indexes: Iterable[IndexInfo]) -> List[IndexFinding]:
+    """Индексы с одинаковыми колонками, методом и условием"""
+    groups: Dict[Tuple, List[IndexInfo]] = {}
+    for index in indexes:
+        if not index.columns:
+            continue
+        group_key = (
+            index.table,
+            index.method,
+            index.key,
+            _normalize_predicate(index.predicate),
+        )
+        groups.setdefault(group_key, []).append(index)
+
+    findings = []
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        keep = _preferred(group)
+        for index in group:
+            if index is keep or not index.droppable:
+                continue
+            findings.append(
+                IndexFinding(
+                    kind="duplicate",
+                    table=index.table,
+                    index=index.name,
+                    reason=f"same definition as {keep.name}",
+                    covered_by=keep.name,
+                    size_bytes=index.size_bytes,
+                    definition=index.definition,
+                )
+            )
+    return findings
+
+
+def find_redundant_indexes(indexes: Iterable[IndexInfo]) -> List[IndexFinding]:
+    """B-tree индексы, чьи колонки - левый префикс другого индекса"""
+    btree = [
+        index
+        for index in indexes
+        if index.method == "btree" and index.columns and not index.predicate
+    ]
+    findings = []
+    for index in btree:
+        if not index.droppable:
+            continue
+        width = len(index.columns)
+        for other in btree:
+            if other is index or other.table != index.table:
+                continue
+            if len(other.columns) <= width:
+                continue
+            prefix = other.columns[:width]
+            reversed_prefix = tuple(_reverse_direction(c) for c in prefix)
+            if index.columns in (prefix, reversed_prefix):
+                findings.append(
+                    IndexFinding(
+                        kind="redundant",
+                        table=index.table,
+                        index=index.name,
+                        reason=f"leading columns of {other.name}",
+                        covered_by=other.name,
+                        size_bytes=index.size_bytes,
+                        definition=index.definition,
+                    )
+                )
+                break
+    return findings
+
+
+def backs_foreign_key(
+    index: IndexInfo, foreign_keys: Iterable[Tuple[str, Tuple[str, ...]]]
+) -> bool:
+    """Ведущие колонки индекса покрывают внешний ключ (table, columns)"""
+    leading = [column.replace(" DESC", "") for column in index.columns]
+    return any(
+        table == index.table and set(leading[: len(columns)]) == set(columns)
+        for table, columns in foreign_keys
+    )
+
+
+def find_unused_indexes(
+    indexes: Iterable[IndexInfo],
+    stats_age_days: Optional[float] = None,
+    foreign_keys: Iterable[Tuple[str, Tuple[str, ...]]] = (),
+) -> List[IndexFinding]:
+    """Индексы без сканов с момента сброса статистики
+
+    Сразу после сброса статистики, рестарта или переключения на реплику
+    у всех индексов 0 сканов, поэтому при статистике моложе
+    INDEX_ADVISOR_MIN_STATS_AGE_DAYS (или неизвестного возраста) ничего не
+    предлагается. Индексы под внешними ключами не предлагаются никогда:
+    они нужны для проверок при удалении и изменении родительских строк.
+    """
+    if (
+        stats_age_days is None
+        or stats_age_days < settings.INDEX_ADVISOR_MIN_STATS_AGE_DAYS
+    ):
+        return []
+    foreign_keys = list(foreign_keys)
+    return [
+        IndexFinding(
+            kind="unused",
+            table=index.table,
+            index=index.name,
+            reason=(
+                f"{index.scans} scans in {stats_age_days:.0f} days "
+                "since statistics reset"
+            ),
+            size_bytes=index.size_bytes,
+            definition=index.definition,
+        )
+        for index in indexes
+        if index.droppable
+        and index.scans is not None
+        and index.scans <= UNUSED_SCAN_THRESHOLD
+        and not backs_foreign_key(index, foreign_keys)
+    ]
+
+
+def analyze_indexes(
+    indexes: List[IndexInfo],
+    stats_age_days: Optional[float] = None,
+    foreign_keys: Iterable[Tuple[str, Tuple[str, ...]]] = (),
+) -> List[IndexFinding]:
+    """Дубликаты, затем поглощенные и неиспользуемые среди оставшихся"""
+    findings = find_duplicate_indexes(indexes)
+    flagged = {finding.index for finding in findings}
+    remaining = [index for index in indexes if index.name not in flagged]
+
+    findings += find_redundant_indexes(remaining)
+    flagged = {finding.index for finding in findings}
+    findings += [
+        finding
+        for finding in find_unused_indexes(remaining, stats_age_days, foreign_keys)
+        if finding.index not in flagged
+    ]
+    return findings
+
+
+FILTER_COLUMN_RE = re.compile(
+    r"\(?\(?(\w+)\)?(?:::[\w ]+)?\s*(?:=|>=|<=|>|<|~~|IS NULL|= ANY)"
+)
+
+
+def seq_scan_filters(plan_json: Any) -> List[Tuple[str, List[str]]]:
+    """(таблица, колонки фильтра) для узлов Seq Scan в плане"""
+    root = plan_json[0]["Plan"] if isinstance(plan_json, list) else plan_json
+    found = []
+
+    def walk(node: Dict[str, Any]):
+        if node.get("Node Type") == "Seq Scan" and node.get("Filter"):
+            columns = []
+            for column in FILTER_COLUMN_RE.findall(node["Filter"]):
+                if column not in columns and not column.isdigit():
+                    columns.append(column)
+            if columns:
+                found.append((node.get("Relation Name", ""), columns))
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(root)
+    return found
+
+
+def suggest_missing_indexes(
+    filters: Iterable[Tuple[str, List[str], str]], indexes: Iterable[IndexInfo]
+) -> List[IndexFinding]:
+    """Недостающие индексы для колонок фильтров Seq Scan"""
+    leading = {
+        (index.table, index.columns[0].replace(" DESC", ""))
+        for index in indexes
+        if index.columns
+    }
+    suggestions: Dict[Tuple[str, Tuple[str, ...]], IndexFinding] = {}
+    for table, columns, source in filters:
+        if not table or (table, columns[0]) in leading:
+            continue
+        key = (table, tuple(columns))
+        name = f"idx_{table}_{'_'.join(columns)}"[:63]
+        finding = suggestions.get(key)
+        if finding is None:
+            finding = IndexFinding(
+                kind="missing",
+                table=table,
+                index=name,
+                reason=f"Seq Scan filtering on {', '.join(columns)}",
+                definition=f"CREATE INDEX {name} ON {table} ({', '.join(columns)})",
+            )
+            suggestions[key] = finding
+        finding.sources.append(source)
+    return list(suggestions.values())
+
+
+MIGRATION_TEMPLATE = '''"""Consolidate indexes (generated by index advisor)
+
+Revision ID: {revision}
+Revises: {down_revision}
+Create Date: {created}
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "{revision}"
+down_revision = {down_revision_literal}
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+{upgrade_body}
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+{downgrade_body}
+'''
+
+
+def _create_statement(definition: str, concurrently: bool) -> str:
+    keyword = (
+        "INDEX CONCURRENTLY IF NOT EXISTS " if concurrently else "INDEX IF NOT EXISTS "
+    )
+    return re.sub(
+        r"^CREATE (UNIQUE )?INDEX ",
+        lambda match: f"CREATE {match.group(1) or ''}{keyword}",
+        definition.strip(),
+    )
+
+
+def _drop_statement(name: str, concurrently: bool) -> str:
+    keyword = (
+        "DROP INDEX CONCURRENTLY IF EXISTS" if concurrently else "DROP INDEX IF EXISTS"
+    )
+    return f"{keyword} {name}"
+
+
+def render_migration(
+    findings: Iterable[IndexFinding],
+    revision: str = "index_consolidation",
+    down_revision: Optional[str] = None,
+    partitioned_tables: Iterable[str] = (),
+) -> str:
+    """Текст миграции Alembic: удалить лишние, создать недостающие индексы
+
+    Для партиционированных таблиц CONCURRENTLY не поддерживается, поэтому
+    их индексы удаляются и создаются обычными командами.
+    """
+    partitioned = set(partitioned_tables)
+    upgrade_lines = []
+    downgrade_lines = []
+    dropped = set()
+    for finding in findings:
+        concurrently = finding.table not in partitioned
+        if finding.kind == "missing":
+            create = _create_statement(finding.definition or "", concurrently)
+            upgrade_lines.append(f"op.execute({create!r})")
+            drop = _drop_statement(finding.index, concurrently)
+            downgrade_lines.append(f"op.execute({drop!r})")
+        elif finding.index not in dropped:
+            dropped.add(finding.index)
+            drop = _drop_statement(finding.index, concurrently)
+            upgrade_lines.append(f"op.execute({drop!r})")
+            if finding.definition:
+                create = _create_statement(finding.definition, concurrently)
+                downgrade_lines.append(f"op.execute({create!r})")
+
+    def body(lines: List[str]) -> str:
+        return "\n".join(f"        {line}" for line in lines) or "        pass"
+
+    return MIGRATION_TEMPLATE.format(
+        revision=revision,
+        down_revision=down_revision,
+        down_revision_literal=(
+            f'"{down_revision}"' if down_revision is not None else "None"
+        ),
+        created=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_body=body(upgrade_lines),
+        downgrade_body=body(downgrade_lines),
+    )
+
+
+class IndexAdvisor:
+    """Отчет по индексам на основе статистики PostgreSQL"""
+
+    def __init__(self):
+        self.engine = engine
+
+    async def _load_indexes(self, conn) -> List[IndexInfo]:
+        """Индексы таблиц (не партиций) со сканами и размером
+
+        Для партиционированных таблиц сканы и размер суммируются по индексам
+        партиций, унаследованным от индекса родителя.
+        """
+        result = await conn.execute(
+            text(
+                """
+                SELECT t.relname AS table_name,
+                       c.relname AS index_name,
+                       i.indisunique, i.indisprimary,
+                       t.relkind = 'p' AS partitioned,
+                       pg_get_indexdef(c.oid) AS definition,
+                       COALESCE(s.idx_scan, 0) + COALESCE((
+                           SELECT sum(cs.idx_scan) FROM pg_inherits ih
+                           JOIN pg_stat_user_indexes cs ON cs.indexrelid = ih.inhrelid
+                           WHERE ih.inhparent = c.oid
+                       ), 0) AS idx_scan,
+                       pg_relation_size(c.oid) + COALESCE((
+                           SELECT sum(pg_relation_size(ih.inhrelid)) FROM pg_inherits ih
+                           WHERE ih.inhparent = c.oid
+                       ), 0) AS size_bytes
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_class t ON t.oid = i.indrelid
+                JOIN pg_namespace n ON n.oid = t.relnamespace
+                LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = c.oid
+                WHERE n.nspname = 'public' AND NOT t.relispartition
+                  AND t.relkind IN ('r', 'p')
+                """
+            )
+        )
+        indexes = []
+        for row in result:
+            method, columns, predicate = parse_index_definition(row.definition)
+            indexes.append(
+                IndexInfo(
+                    name=row.index_name,
+                    table=row.table_name,
+                    columns=columns,
+                    unique=row.indisunique,
+                    primary=row.indisprimary,
+                    predicate=predicate,
+                    method=method,
+                    definition=row.definition,
+                    size_bytes=int(row.size_bytes or 0),
+                    scans=int(row.idx_scan or 0),
+                    partitioned=row.partitioned,
+                )
+            )
+        return indexes
+
+    async def _stats_age_days(self, conn) -> Optional[float]:
+        """Возраст статистики сканов: с последнего сброса или рестарта"""
+        result = await conn.execute(
+            text(
+                """
+                SELECT EXTRACT(EPOCH FROM now() - COALESCE(
+                    stats_reset, pg_postmaster_start_time()
+                )) FROM pg_stat_database
+                WHERE datname = current_database()
+                """
+            )
+        )
+        seconds = result.scalar()
+        return float(seconds) / 86400 if seconds is not None else None
+
+    async def _foreign_keys(self, conn) -> List[Tuple[str, Tuple[str, ...]]]:
+        """Колонки внешних ключей таблиц (не партиций)"""
+        result = await conn.execute(
+            text(
+                """
+                SELECT t.relname AS table_name,
+                       array_agg(a.attname ORDER BY k.ord) AS columns
+                FROM pg_constraint con
+                JOIN pg_class t ON t.oid = con.conrelid
+                JOIN pg_namespace n ON n.oid = t.relnamespace
+                CROSS JOIN LATERAL unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+                JOIN pg_attribute a
+                  ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+                WHERE con.contype = 'f' AND n.nspname = 'public'
+                  AND NOT t.relispartition
+                GROUP BY con.oid, t.relname
+                """
+            )
+        )
+        return [(row.table_name, tuple(row.columns)) for row in result]
+
+    async def _table_write_rates(self, conn) -> Dict[str, float]:
+        """Изменений строк в сутки на таблицу (каждое обновляет все индексы)"""
+        result = await conn.execute(
+            text(
+                """
+                SELECT COALESCE(p.relname, t.relname) AS relname,
+                       sum(t.n_tup_ins + t.n_tup_del
+                           + (t.n_tup_upd - t.n_tup_hot_upd)) AS index_writes,
+                       max(EXTRACT(EPOCH FROM now() - COALESCE(
+                           d.stats_reset, pg_postmaster_start_time()
+                       ))) AS seconds
+                FROM pg_stat_user_tables t
+                LEFT JOIN pg_inherits ih ON ih.inhrelid = t.relid
+                LEFT JOIN pg_class p ON p.oid = ih.inhparent
+                CROSS JOIN pg_stat_database d
+                WHERE d.datname = current_database()
+                GROUP BY COALESCE(p.relname, t.relname)
+                """
+            )
+        )
+        rates = {}
+        for row in result:
+            days = max(float(row.seconds or 0) / 86400, 1 / 24)
+            rates[row.relname] = round(float(row.index_writes or 0) / days, 1)
+        return rates
+
+    async def _top_statements(self, conn, limit: int = 20) -> List[Dict[str, Any]]:
+        try:
+            async with conn.begin_nested():
+                result = await conn.execute(
+                    text(
+                        """
+                        SELECT query, calls, total_exec_time, mean_exec_time, rows
+                        FROM pg_stat_statements
+                        ORDER BY total_exec_time DESC
+                        LIMIT :limit
+                        """
+                    ),
+                    {"limit": limit},
+                )
+                return [dict(row._mapping) for row in result]
+        except Exception as e:
+            logger.debug(f"pg_stat_statements is not available: {e}")
+            return []
+
+    async def _explain(
+        self, conn, sql: str, params: Dict, options: str = "FORMAT JSON"
+    ) -> Optional[Any]:
+        try:
+            async with conn.begin_nested():
+                result = await conn.execute(text(f"EXPLAIN ({options}) {sql}"), params)
+                plan = result.scalar()
+            return plan
+        except Exception as e:
+            logger.debug(f"EXPLAIN failed: {e}")
+            return None
+
+    async def _plan_filters(
+        self, conn, statements: List[Dict[str, Any]]
+    ) -> List[Tuple[str, List[str], str]]:
+        """Колонки фильтров Seq Scan из планов горячих и частых запросов"""
+        filters = []
+        for name, query in HOT_QUERIES.items():
+            plan = await self._explain(conn, query["sql"], query["params"])
+            if plan is not None:
+                for table, columns in seq_scan_filters(plan):
+                    filters.append((table, columns, f"hot:{name}"))
+
+        # Запросы pg_stat_statements содержат $N: нужен generic plan (PG 16+)
+        server_version = conn.dialect.server_version_info or (0,)
+        if server_version >= (16,):
+            for statement in statements:
+                query = statement["query"]
+                if not query.lstrip().upper().startswith("SELECT"):
+                    continue
+                plan = await self._explain(
+                    conn, query, {}, options="FORMAT JSON, GENERIC_PLAN"
+                )
+                if plan is not None:
+                    for table, columns in seq_scan_filters(plan):
+                        filters.append((table, columns, "pg_stat_statements"))
+        return filters
+
+    @staticmethod
+    def _slow_query_seq_scans() -> Dict[str, int]:
+        """Таблицы, которые читались Seq Scan в захваченных медленных запросах"""
+        from .monitoring.slow_queries import slow_query_log
+
+        counts: Dict[str, int] = {}
+        for entry in slow_query_log.get_slow_queries(limit=200):
+            for table in (entry.get("plan") or {}).get("seq_scans", []):
+                counts[table] = counts.get(table, 0) + entry["calls"]
+        return counts
+
+    async def build_report(self, down_revision: Optional[str] = None) -> Dict[str, Any]:
+        """Полный отчет советника с текстом миграции"""
+        async with self.engine.connect() as conn:
+            if conn.dialect.name != "postgresql":
+                indexes = declared_indexes()
+                return self._report(
+                    "declared",
+                    indexes,
+                    analyze_indexes(indexes),
+                    {},
+                    [],
+                    down_revision,
+                )
+
+            indexes = await self._load_indexes(conn)
+            stats_age_days = await self._stats_age_days(conn)
+            foreign_keys = await self._foreign_keys(conn)
+            write_rates = await self._table_write_rates(conn)
+            statements = await self._top_statements(conn)
+            filters = await self._plan_filters(conn, statements)
+
+        findings = analyze_indexes(indexes, stats_age_days, foreign_keys)
+        findings += suggest_missing_indexes(filters, indexes)
+
+        for finding in findings:
+            finding.estimated_writes_per_day = write_rates.get(finding.table)
+
+        return self._report(
+            "postgresql", indexes, findings, write_rates, statements, down_revision
+        )
+
+    def _report(
+        self,
+        source: str,
+        indexes: List[IndexInfo],
+        findings: List[IndexFinding],
+        write_rates: Dict[str, float],
+        statements: List[Dict[str, Any]],
+        down_revision: Optional[str],
+    ) -> Dict[str, Any]:
+        removable = [finding for finding in findings if finding.kind != "missing"]
+        if source == "declared":
+            # Миграция 003 партиционирует requests
+            from .db_partitioning import PARENT_TABLE
+
+            partitioned_tables = {PARENT_TABLE}
+        else:
+            partitioned_tables = {index.table for index in indexes if index.partitioned}
+        indexes_per_table: Dict[str, int] = {}
+        for index in indexes:
+            indexes_per_table[index.table] = indexes_per_table.get(index.table, 0) + 1
+
+        return {
+            "source": source,
+            "summary": {
+                "indexes": len(indexes),
+                "duplicate": sum(1 for f in findings if f.kind == "duplicate"),
+                "redundant": sum(1 for f in findings if f.kind == "redundant"),
+                "unused": sum(1 for f in findings if f.kind == "unused"),
+                "missing": sum(1 for f in findings if f.kind == "missing"),
+                "reclaimable_bytes": sum(f.size_bytes for f in removable),
+                # Каждое изменение строки обновляет каждый индекс таблицы
+                "avoidable_index_writes_per_day": round(
+                    sum(write_rates.get(f.table, 0) for f in removable), 1
+                ),
+            },
+            "indexes_per_table": indexes_per_table,
+            "slow_query_seq_scans": self._slow_query_seq_scans(),
+            "findings": [asdict(finding) for finding in findings],
+            "top_statements": [
+                {
+                    "query": str(statement["query"])[:300],
+                    "calls": statement["calls"],
+                    "mean_time_ms": round(float(statement["mean_exec_time"]), 2),
+                }
+                for statement in statements
+            ],
+            "migration": render_migration(
+                findings,
+                down_revision=down_revision,
+                partitioned_tables=partitioned_tables,
+            ),
+        }
+
+
+# Создаем глобальный экземпляр
+index_advisor = IndexAdvisor()
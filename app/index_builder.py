@@ -0,0 +1,482 @@
+"""
+Неблокирующее создание индексов
+
+CREATE INDEX CONCURRENTLY не блокирует запись в таблицу, но не может
+выполняться внутри транзакции, поэтому сборка идет через отдельное
+AUTOCOMMIT-соединение. Для партиционированной requests индекс родителя
+создается через ON ONLY, индексы партиций строятся CONCURRENTLY и
+присоединяются через ALTER INDEX ... ATTACH PARTITION. Невалидные индексы,
+оставшиеся после прерванной сборки, удаляются и строятся заново; у
+невалидного индекса родителя достраиваются индексы партиций.
+
+Сборка запускается фоновой задачей; состояние задачи хранится в кеше
+(общем для воркеров), прогресс берется из pg_stat_progress_create_index.
+"""
+
+import asyncio
+import hashlib
+import logging
+import re
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from .core.cache import cache_manager
+from .core.config import settings
+from .core.database import engine
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory lock, чтобы индексы собирал только один воркер
+BUILD_LOCK_KEY = 804_036
+
+JOB_KEY = "index_job:{job_id}"
+JOB_TTL = 7 * 24 * 3600
+
+# Остатки прерванного REINDEX CONCURRENTLY
+REINDEX_LEFTOVER_RE = re.compile(r"_cc(new|old)\d*$")
+
+DDL_RE = re.compile(
+    r"^CREATE (UNIQUE )?INDEX (?:CONCURRENTLY )?(?:IF NOT EXISTS )?(\S+) "
+    r"ON (?:ONLY )?(\S+) (.*)$",
+    re.DOTALL,
+)
+
+
+@dataclass
+class IndexSpec:
+    """Индекс, который нужно создать"""
+
+    name: str
+    table: str
+    body: str  # "(колонки) [WHERE ...]"
+    unique: bool = False
+
+    @classmethod
+    def from_definition(cls, definition: str) -> "IndexSpec":
+        match = DDL_RE.match(" ".join(definition.split()))
+        if not match:
+            raise ValueError(f"Unsupported index definition: {definition}")
+        unique, name, table, body = match.groups()
+        table = table.replace("public.", "", 1)
+        return cls(name=name, table=table, body=body, unique=bool(unique))
+
+    @classmethod
+    def from_index(cls, index) -> "IndexSpec":
+        """IndexSpec из объявленного sqlalchemy.Index"""
+        ddl = str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+        return cls.from_definition(ddl)
+
+    def create_sql(
+        self,
+        concurrently: bool = True,
+        only: bool = False,
+        name: Optional[str] = None,
+        table: Optional[str] = None,
+    ) -> str:
+        return (
+            f"CREATE {'UNIQUE ' if self.unique else ''}INDEX "
+            f"{'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS "
+            f"{name or self.name} ON {'ONLY ' if only else ''}"
+            f"{table or self.table} {self.body}"
+        )
+
+
+def partition_index_name(partition: str, index_name: str) -> str:
+    """Имя индекса партиции (не длиннее 63 символов)"""
+    name = f"{partition}_{index_name}"
+    if len(name) <= 63:
+        return name
+    digest = hashlib.md5(name.encode()).hexdigest()[:8]
+    return f"{name[:54]}_{digest}"
+
+
+def index_specs(indexes: Iterable[Any]) -> List[IndexSpec]:
+    """IndexSpec для объявленных индексов без повторов по имени"""
+    specs: Dict[str, IndexSpec] = {}
+    for index in indexes:
+        try:
+            spec = (
+                index if isinstance(index, IndexSpec) else IndexSpec.from_index(index)
+            )
+        except Exception as e:
+            logger.warning(f"Skipping index {getattr(index, 'name', index)}: {e}")
+            continue
+        specs.setdefault(spec.name, spec)
+    return list(specs.values())
+
+
+def _progress_percent(done: Optional[int], total: Optional[int]) -> Optional[float]:
+    if not total:
+        return None
+    return round(100.0 * (done or 0) / total, 1)
+
+
+class IndexBuilder:
+    """Сборка индексов CONCURRENTLY фоновыми задачами"""
+
+    def __init__(self):
+        self.engine = engine
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._tasks: set = set()
+
+    async def _save_job(self, job: Dict[str, Any]):
+        job["updated_at"] = datetime.now(timezone.utc).isoformat()
+        self.jobs[job["id"]] = job
+        await cache_manager.set(JOB_KEY.format(job_id=job["id"]), job, ttl=JOB_TTL)
+
+    async def _short_ddl(self, conn, sql: str):
+        """DDL с короткой блокировкой: не ждать ее дольше lock_timeout
+
+        Ожидающий эксклюзивную блокировку запрос задерживает все записи за
+        собой, поэтому лучше упасть и повторить сборку позже.
+        """
+        await conn.execute(
+            text(f"SET lock_timeout = '{settings.INDEX_BUILD_LOCK_TIMEOUT}'")
+        )
+        try:
+            await conn.execute(text(sql))
+        finally:
+            await conn.execute(text("RESET lock_timeout"))
+
+    @staticmethod
+    async def _index_state(conn, name: str) -> Optional[bool]:
+        """None - индекса нет, иначе признак indisvalid"""
+        result = await conn.execute(
+            text(
+                """
+                SELECT i.indisvalid FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE c.relname = :name AND n.nspname = 'public'
+                """
+            ),
+            {"name": name},
+        )
+        return result.scalar()
+
+    @staticmethod
+    async def _partitions(conn, table: str) -> Optional[List[str]]:
+        """Партиции таблицы или None, если таблица не партиционирована"""
+        partitioned = await conn.execute(
+            text(
+                """
+                SELECT 1 FROM pg_partitioned_table pt
+                JOIN pg_class c ON c.oid = pt.partrelid
+                WHERE c.relname = :table
+                """
+            ),
+            {"table": table},
+        )
+        if partitioned.scalar() is None:
+            return None
+        result = await conn.execute(
+            text(
+                """
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = :table
+                ORDER BY c.relname
+                """
+            ),
+            {"table": table},
+        )
+        return [row[0] for row in result]
+
+    @staticmethod
+    async def _is_attached(conn, index_name: str, parent_name: str) -> bool:
+        result = await conn.execute(
+            text(
+                """
+                SELECT 1 FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE c.relname = :index AND p.relname = :parent
+                """
+            ),
+            {"index": index_name, "parent": parent_name},
+        )
+        return result.scalar() is not None
+
+    async def _build_concurrently(
+        self, conn, spec: IndexSpec, name: str, table: str
+    ) -> str:
+        """CREATE INDEX CONCURRENTLY; невалидный индекс пересоздается"""
+        state = await self._index_state(conn, name)
+        if state:
+            return "exists"
+        action = "created"
+        if state is False:
+            logger.warning(f"Rebuilding invalid index {name}")
+            await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            action = "rebuilt"
+        await conn.execute(text(spec.create_sql(name=name, table=table)))
+        return action
+
+    async def build_index(self, conn, spec: IndexSpec) -> str:
+        """Создание одного индекса без блокировки записи"""
+        partitions = await self._partitions(conn, spec.table)
+        if partitions is None:
+            return await self._build_concurrently(conn, spec, spec.name, spec.table)
+
+        # CONCURRENTLY не поддерживается для партиционированной таблицы:
+        # пустой индекс родителя + индексы партиций + ATTACH PARTITION
+        if await self._index_state(conn, spec.name):
+            return "exists"
+        await self._short_ddl(conn, spec.create_sql(concurrently=False, only=True))
+        for partition in partitions:
+            name = partition_index_name(partition, spec.name)
+            await self._build_concurrently(conn, spec, name, partition)
+            if not await self._is_attached(conn, name, spec.name):
+                await self._short_ddl(
+                    conn, f"ALTER INDEX {spec.name} ATTACH PARTITION {name}"
+                )
+        return "created"
+
+    async def _attached_partitions(self, conn, index_name: str) -> Dict[str, Any]:
+        """Партиции, индексы которых присоединены к индексу родителя"""
+        result = await conn.execute(
+            text(
+                """
+                SELECT t.relname AS partition, c.relname AS name, i.indisvalid
+                FROM pg_inherits ih
+                JOIN pg_class c ON c.oid = ih.inhrelid
+                JOIN pg_class p ON p.oid = ih.inhparent
+                JOIN pg_index i ON i.indexrelid = c.oid
+                JOIN pg_class t ON t.oid = i.indrelid
+                WHERE p.relname = :index
+                """
+            ),
+            {"index": index_name},
+        )
+        return {row.partition: row for row in result}
+
+    async def repair_partitioned_index(self, conn, spec: IndexSpec) -> List[str]:
+        """Достройка невалидного индекса партиционированной таблицы
+
+        Индекс родителя невалиден, пока у какой-то партиции нет валидного
+        присоединенного индекса (прерванная сборка или новая партиция).
+        Недостающие индексы партиций строятся CONCURRENTLY и присоединяются,
+        невалидные присоединенные - перестраиваются REINDEX CONCURRENTLY.
+        """
+        attached = await self._attached_partitions(conn, spec.name)
+        repaired = []
+        for partition in await self._partitions(conn, spec.table) or []:
+            child = attached.get(partition)
+            if child is None:
+                name = partition_index_name(partition, spec.name)
+                await self._build_concurrently(conn, spec, name, partition)
+                await self._short_ddl(
+                    conn, f"ALTER INDEX {spec.name} ATTACH PARTITION {name}"
+                )
+            elif not child.indisvalid:
+                name = child.name
+                await conn.execute(text(f"REINDEX INDEX CONCURRENTLY {name}"))
+            else:
+                continue
+            repaired.append(name)
+        return repaired
+
+    async def rebuild_invalid_indexes(self, conn) -> List[str]:
+        """Пересоздание невалидных индексов
+
+        Индексы, которые сейчас строятся (pg_stat_progress_create_index по
+        индексу, таблице или ее партициям), пропускаются: до конца сборки
+        они невалидны штатно.
+        """
+        result = await conn.execute(
+            text(
+                """
+                SELECT c.relname AS name, pg_get_indexdef(c.oid) AS definition,
+                       t.relkind
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_class t ON t.oid = i.indrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = 'public' AND NOT i.indisvalid
+                  AND t.relkind IN ('r', 'p')
+                  AND NOT EXISTS (
+                      SELECT 1 FROM pg_inherits ih WHERE ih.inhrelid = c.oid
+                  )
+                  AND NOT EXISTS (
+                      SELECT 1 FROM pg_stat_progress_create_index pr
+                      WHERE pr.index_relid = c.oid
+                         OR pr.relid = t.oid
+                         OR pr.relid IN (
+                             SELECT ih.inhrelid FROM pg_inherits ih
+                             WHERE ih.inhparent = t.oid
+                         )
+                  )
+                """
+            )
+        )
+        rebuilt = []
+        for row in result.fetchall():
+            if row.relkind == "p":
+                # Индекс родителя не перестраивается: достраиваются партиции
+                spec = IndexSpec.from_definition(row.definition)
+                partitions = await self.repair_partitioned_index(conn, spec)
+                rebuilt.append(row.name)
+                logger.info(f"Repaired partitioned index {row.name}: {partitions}")
+                continue
+
+            await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {row.name}"))
+            if REINDEX_LEFTOVER_RE.search(row.name):
+                logger.info(f"Dropped leftover index {row.name}")
+                continue
+            spec = IndexSpec.from_definition(row.definition)
+            await conn.execute(text(spec.create_sql()))
+            rebuilt.append(row.name)
+            logger.info(f"Rebuilt invalid index {row.name}")
+        return rebuilt
+
+    async def run(
+        self, indexes: Iterable[Any], job: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Сборка индексов с записью хода работы в job"""
+        specs = index_specs(indexes)
+        job = job or self._new_job(specs)
+        job["status"] = "running"
+        job["started_at"] = datetime.now(timezone.utc).isoformat()
+        await self._save_job(job)
+
+        async with self.engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            postgres = conn.dialect.name == "postgresql"
+            if postgres:
+                locked = (
+                    await conn.execute(
+                        text("SELECT pg_try_advisory_lock(:key)"),
+                        {"key": BUILD_LOCK_KEY},
+                    )
+                ).scalar()
+                if not locked:
+                    job["status"] = "skipped"
+                    job["error"] = "another index build is running"
+                    await self._save_job(job)
+                    return job
+                job["pid"] = (
+                    await conn.execute(text("SELECT pg_backend_pid()"))
+                ).scalar()
+
+            try:
+                for spec in specs:
+                    job["current"] = spec.name
+                    await self._save_job(job)
+                    try:
+                        if postgres:
+                            action = await self.build_index(conn, spec)
+                        else:
+                            await conn.execute(
+                                text(spec.create_sql(concurrently=False))
+                            )
+                            action = "created"
+                        job["indexes"][spec.name] = action
+                        logger.info(f"Index {spec.name}: {action}")
+                    except Exception as e:
+                        job["indexes"][spec.name] = "failed"
+                        job["errors"][spec.name] = str(e)
+                        logger.warning(f"Failed to build index {spec.name}: {e}")
+                    job["done"] += 1
+
+                job["current"] = None
+                if postgres:
+                    job["rebuilt_invalid"] = await self.rebuild_invalid_indexes(conn)
+                    for table in sorted({spec.table for spec in specs}):
+                        await conn.execute(text(f"ANALYZE {table}"))
+                job["status"] = "failed" if job["errors"] else "completed"
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = str(e)
+                logger.error(f"Index build job {job['id']} failed: {e}")
+            finally:
+                if postgres:
+                    await conn.execute(
+                        text("SELECT pg_advisory_unlock(:key)"),
+                        {"key": BUILD_LOCK_KEY},
+                    )
+
+        job["finished_at"] = datetime.now(timezone.utc).isoformat()
+        await self._save_job(job)
+        return job
+
+    @staticmethod
+    def _new_job(specs: List[IndexSpec]) -> Dict[str, Any]:
+        return {
+            "id": uuid.uuid4().hex,
+            "status": "pending",
+            "total": len(specs),
+            "done": 0,
+            "current": None,
+            "pid": None,
+            "indexes": {spec.name: "pending" for spec in specs},
+            "errors": {},
+            "rebuilt_invalid": [],
+        }
+
+    async def start_job(self, indexes: Iterable[Any]) -> Dict[str, Any]:
+        """Запуск сборки фоновой задачей"""
+        specs = index_specs(indexes)
+        job = self._new_job(specs)
+        await self._save_job(job)
+
+        task = asyncio.create_task(self.run(specs, job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Состояние задачи с текущим прогрессом сборки"""
+        job = await cache_manager.get(JOB_KEY.format(job_id=job_id))
+        job = dict(job or self.jobs.get(job_id) or {})
+        if not job:
+            return None
+        job["progress"] = None
+        if job.get("status") == "running" and job.get("pid"):
+            job["progress"] = await self.get_progress(job["pid"])
+        return job
+
+    async def get_progress(self, pid: int) -> Optional[Dict[str, Any]]:
+        """Строка pg_stat_progress_create_index для процесса сборки"""
+        try:
+            async with self.engine.connect() as conn:
+                result = await conn.execute(
+                    text(
+                        """
+                        SELECT p.phase,
+                               p.relid::regclass::text AS relation,
+                               p.index_relid::regclass::text AS index,
+                               p.lockers_total, p.lockers_done,
+                               p.blocks_total, p.blocks_done,
+                               p.tuples_total, p.tuples_done,
+                               p.partitions_total, p.partitions_done
+                        FROM pg_stat_progress_create_index p
+                        WHERE p.pid = :pid
+                        """
+                    ),
+                    {"pid": pid},
+                )
+                row = result.mappings().first()
+        except Exception as e:
+            logger.warning(f"Failed to read index build progress: {e}")
+            return None
+        if row is None:
+            return None
+        progress = dict(row)
+        progress["blocks_percent"] = _progress_percent(
+            row["blocks_done"], row["blocks_total"]
+        )
+        progress["tuples_percent"] = _progress_percent(
+            row["tuples_done"], row["tuples_total"]
+        )
+        return progress
+
+
+# Создаем глобальный экземпляр
+index_builder = IndexBuilder()
@@ -8,7 +8,7 @@ import logging
 from datetime import datetime
 from contextlib import asynccontextmanager
 from .core.config import settings
-from .core.database import engine, Base
+from .core.database import engine, Base, read_router
 from .api import auth, requests, transactions, users
 from .api import files
 from .api import file_access
@@ -56,9 +56,12 @@ from .monitoring.metrics import (
     performance_collector,
 )
 from .monitoring.connection_pool_monitor import start_pool_monitoring
+from .monitoring.query_tracker import QueryTrackingMiddleware
+from .core.idempotency import IdempotencyMiddleware
 from .monitoring.redis_monitor import start_redis_monitoring
 from .monitoring.alerts import start_alert_monitoring
 from .monitoring.external_services import start_external_services_monitoring
+from .db_partitioning import start_partition_maintenance
 
 # Инициализация логирования
 setup_logging()
@@ -101,6 +104,14 @@ async def lifespan(app: FastAPI):
         await cache_manager.initialize()
         logger.info("Redis cache initialized")
 
+        # Загрузка справочника рекламных кампаний по номеру линии
+        from .core.database import AsyncSessionLocal
+        from .core.campaign_directory import campaign_directory
+
+        async with AsyncSessionLocal() as db:
+            campaigns = await campaign_directory.load(db)
+        logger.info(f"Campaign directory loaded: {campaigns} line numbers")
+
         # Запуск сервиса записей звонков
         from .services.recording_service import start_recording_service
 
@@ -116,6 +127,13 @@ async def lifespan(app: FastAPI):
         background_tasks.append(pool_monitoring_task)
         logger.info("Connection pool monitoring started")
 
+        # Замер задержки event loop
+        from .monitoring.event_loop_monitor import start_event_loop_monitoring
+
+        loop_lag_task = asyncio.create_task(start_event_loop_monitoring())
+        background_tasks.append(loop_lag_task)
+        logger.info("Event loop lag monitoring started")
+
         # Запуск мониторинга Redis
         redis_monitoring_task = asyncio.create_task(start_redis_monitoring())
         background_tasks.append(redis_monitoring_task)
@@ -138,6 +156,32 @@ async def lifespan(app: FastAPI):
         background_tasks.append(security_cleanup_task)
         logger.info("Security cleanup task started")
 
+        # Запуск обслуживания партиций requests
+        partition_task = asyncio.create_task(start_partition_maintenance())
+        background_tasks.append(partition_task)
+        logger.info("Requests partition maintenance started")
+
+        # Запуск архивирования старых заявок и транзакций
+        from .services.archive_service import start_archive_service
+
+        archive_task = asyncio.create_task(start_archive_service())
+        background_tasks.append(archive_task)
+        logger.info("Archive service started")
+
+        # Запуск обновления материализованных представлений
+        from .materialized_views import start_view_refresh_scheduler
+
+        view_refresh_task = asyncio.create_task(start_view_refresh_scheduler())
+        background_tasks.append(view_refresh_task)
+        logger.info("Materialized view refresh scheduler started")
+
+        # Запуск воркеров очереди вебхуков Mango
+        from .services.mango_ingest import start_mango_ingest_workers
+
+        mango_ingest_task = asyncio.create_task(start_mango_ingest_workers())
+        background_tasks.append(mango_ingest_task)
+        logger.info("Mango ingest workers started")
+
         logger.info("Application startup completed successfully")
 
         yield  # Приложение работает
@@ -200,6 +244,7 @@ async def lifespan(app: FastAPI):
         # Закрытие соединений с базой данных
         try:
             await engine.dispose()
+            await read_router.dispose()
             logger.info("Database connections closed")
         except Exception as e:
             logger.error(f"Error closing database connections: {e}")
@@ -239,6 +284,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Idempotent-Replayed"],
 )
 
 # Настройка интерактивной документации
@@ -253,6 +299,8 @@ app.add_middleware(ErrorHandlingMiddleware)
 
 # 3. Безопасность и ограничения размера
 app.add_middleware(SecurityHeadersMiddleware)
+# Повтор POST по Idempotency-Key (внутри ограничения размера: тело читается целиком)
+app.add_middleware(IdempotencyMiddleware)
 app.add_middleware(RequestSizeLimitMiddleware, max_size=10 * 1024 * 1024)  # 10MB
 
 # 4. Rate limiting (после проверок безопасности)
@@ -266,7 +314,10 @@ app.add_middleware(
 # 6. Логирование запросов (последним, чтобы логировать все)
 app.add_middleware(RequestLoggingMiddleware)
 
-# 7. CSRF middleware (отключен пока)
+# 7. Счетчик запросов к БД и детектор N+1
+app.add_middleware(QueryTrackingMiddleware)
+
+# 8. CSRF middleware (отключен пока)
 # app.add_middleware(CSRFMiddleware)
 
 # Подключение статических файлов
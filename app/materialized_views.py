@@ -0,0 +1,296 @@
+"""
+Материализованные представления для отчетов и их обновление
+
+Записи в базовые таблицы помечают зависящие от них представления как
+"грязные" (флаг в кеше, общий для всех воркеров). Планировщик обновляет
+только грязные представления через REFRESH ... CONCURRENTLY, записывает
+длительность обновления и время, на которое данные актуальны (watermark).
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from .core.cache import cache_manager
+from .core.config import settings
+from .core.database import engine
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory lock, чтобы обновлял только один воркер
+REFRESH_LOCK_KEY = 804_034
+
+DIRTY_KEY = "mv_dirty:{view}"
+STATE_KEY = "mv_state:{view}"
+STATE_TTL = 7 * 24 * 3600
+
+# Окно данных в представлениях (см. WHERE ... INTERVAL '30 days')
+VIEW_WINDOW_DAYS = 30
+
+MATERIALIZED_VIEWS: Dict[str, Dict[str, Any]] = {
+    "mv_requests_summary": {
+        "tables": {"requests", "cities", "request_types"},
+        "statements": [
+            """
+            CREATE MATERIALIZED VIEW IF NOT EXISTS mv_requests_summary AS
+            SELECT
+                r.city_id,
+                c.name as city_name,
+                r.status,
+                rt.name as request_type,
+                DATE(r.created_at) as request_date,
+                COUNT(*) as request_count,
+                COUNT(CASE WHEN r.master_id IS NOT NULL THEN 1 END) as assigned_count,
+                AVG(r.result) as avg_result,
+                SUM(r.expenses) as total_expenses
+            FROM requests r
+            JOIN cities c ON r.city_id = c.id
+            JOIN request_types rt ON r.request_type_id = rt.id
+            WHERE r.created_at >= CURRENT_DATE - INTERVAL '30 days'
+            GROUP BY r.city_id, c.name, r.status, rt.name, DATE(r.created_at)
+            WITH DATA
+            """,
+            # Уникальный индекс обязателен для REFRESH ... CONCURRENTLY
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_requests_summary
+            ON mv_requests_summary (city_id, status, request_type, request_date)
+            """,
+        ],
+    },
+    "mv_financial_summary": {
+        "tables": {"transactions", "cities", "transaction_types"},
+        "statements": [
+            """
+            CREATE MATERIALIZED VIEW IF NOT EXISTS mv_financial_summary AS
+            SELECT
+                t.city_id,
+                c.name as city_name,
+                tt.name as transaction_type,
+                DATE(t.specified_date) as transaction_date,
+                COUNT(*) as transaction_count,
+                SUM(t.amount) as total_amount,
+                SUM(CASE WHEN t.amount > 0 THEN t.amount ELSE 0 END) as income,
+                SUM(CASE WHEN t.amount < 0 THEN t.amount ELSE 0 END) as expenses
+            FROM transactions t
+            JOIN cities c ON t.city_id = c.id
+            JOIN transaction_types tt ON t.transaction_type_id = tt.id
+            WHERE t.specified_date >= CURRENT_DATE - INTERVAL '30 days'
+            GROUP BY t.city_id, c.name, tt.name, DATE(t.specified_date)
+            WITH DATA
+            """,
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_financial_summary
+            ON mv_financial_summary (city_id, transaction_type, transaction_date)
+            """,
+        ],
+    },
+}
+
+
+def views_for_tables(tables: Set[str]) -> Set[str]:
+    """Представления, зависящие от изменившихся таблиц"""
+    return {
+        name
+        for name, definition in MATERIALIZED_VIEWS.items()
+        if definition["tables"] & tables
+    }
+
+
+# Отслеживание изменений базовых таблиц
+@event.listens_for(Session, "after_flush")
+def collect_flushed_tables(session, flush_context):
+    tables = session.info.setdefault("mv_written_tables", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None:
+            tables.add(table.name)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def collect_bulk_tables(orm_execute_state):
+    if not (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        return
+    table = getattr(orm_execute_state.statement, "table", None)
+    if table is not None and getattr(table, "name", None):
+        orm_execute_state.session.info.setdefault("mv_written_tables", set()).add(
+            table.name
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def mark_views_dirty_on_commit(session):
+    tables = session.info.pop("mv_written_tables", None)
+    if tables:
+        view_refresher.mark_tables_dirty(tables)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def forget_rolled_back_tables(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop("mv_written_tables", None)
+
+
+class MaterializedViewRefresher:
+    """Обновление грязных материализованных представлений"""
+
+    def __init__(self):
+        self.engine = engine
+        # Локально помеченные представления, еще не опубликованные в кеш
+        self.pending_dirty: Dict[str, float] = {}
+        self.state: Dict[str, Dict[str, Any]] = {}
+
+    def mark_tables_dirty(self, tables: Set[str]):
+        now = time.time()
+        for view in views_for_tables(set(tables)):
+            self.pending_dirty[view] = now
+
+    async def publish_dirty(self):
+        """Публикация локальных флагов в кеш, общий для воркеров"""
+        pending, self.pending_dirty = self.pending_dirty, {}
+        for view, marked_at in pending.items():
+            current = await cache_manager.get(DIRTY_KEY.format(view=view))
+            if not current or float(current) < marked_at:
+                await cache_manager.set(
+                    DIRTY_KEY.format(view=view), marked_at, ttl=STATE_TTL
+                )
+
+    async def get_state(self, view: str) -> Dict[str, Any]:
+        """Последнее обновление представления (из кеша или локально)"""
+        state = await cache_manager.get(STATE_KEY.format(view=view))
+        return state or self.state.get(view, {})
+
+    async def ensure_views(self) -> List[str]:
+        """Создание представлений и их уникальных индексов"""
+        created: List[str] = []
+        async with self.engine.connect() as conn:
+            if conn.dialect.name != "postgresql":
+                return created
+            for view, definition in MATERIALIZED_VIEWS.items():
+                try:
+                    for statement in definition["statements"]:
+                        await conn.execute(text(statement))
+                    await conn.commit()
+                    created.append(view)
+                except Exception as e:
+                    await conn.rollback()
+                    logger.warning(f"Failed to create view {view}: {e}")
+        return created
+
+    async def refresh_view(self, view: str) -> Dict[str, Any]:
+        """REFRESH MATERIALIZED VIEW CONCURRENTLY с замером длительности"""
+        from .monitoring.prometheus_metrics import metrics_collector
+
+        watermark = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        status = "success"
+        try:
+            async with self.engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await conn.execute(
+                    text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
+                )
+        except Exception as e:
+            status = "error"
+            logger.warning(f"Failed to refresh view {view}: {e}")
+        duration = time.perf_counter() - started
+
+        metrics_collector.record_view_refresh(view, duration, status)
+        state = dict(await self.get_state(view))
+        state["last_duration_ms"] = round(duration * 1000, 2)
+        state["last_status"] = status
+        if status == "success":
+            state["refreshed_at"] = watermark.isoformat()
+            state["refreshed_ts"] = watermark.timestamp()
+        self.state[view] = state
+        await cache_manager.set(STATE_KEY.format(view=view), state, ttl=STATE_TTL)
+        return state
+
+    async def refresh_dirty(self, force: bool = False) -> List[str]:
+        """Обновление только тех представлений, чьи таблицы менялись"""
+        await self.publish_dirty()
+
+        async with self.engine.connect() as lock_conn:
+            if lock_conn.dialect.name != "postgresql":
+                return []
+            locked = (
+                await lock_conn.execute(
+                    text("SELECT pg_try_advisory_lock(:key)"),
+                    {"key": REFRESH_LOCK_KEY},
+                )
+            ).scalar()
+            await lock_conn.commit()
+            if not locked:
+                return []
+
+            refreshed = []
+            try:
+                for view in MATERIALIZED_VIEWS:
+                    dirty_at = await cache_manager.get(DIRTY_KEY.format(view=view))
+                    state = await self.get_state(view)
+                    last_ts = state.get("refreshed_ts")
+                    stale = last_ts is None or (
+                        dirty_at is not None and float(dirty_at) >= last_ts
+                    )
+                    if force or stale:
+                        new_state = await self.refresh_view(view)
+                        if new_state["last_status"] == "success":
+                            refreshed.append(view)
+            finally:
+                await lock_conn.execute(
+                    text("SELECT pg_advisory_unlock(:key)"),
+                    {"key": REFRESH_LOCK_KEY},
+                )
+                await lock_conn.commit()
+
+        return refreshed
+
+
+def freshness(state: Dict[str, Any], source: str) -> Dict[str, Any]:
+    """Метаданные актуальности для ответа статистики"""
+    refreshed_ts = state.get("refreshed_ts")
+    return {
+        "source": source,
+        "refreshed_at": state.get("refreshed_at"),
+        "staleness_seconds": (
+            round(time.time() - refreshed_ts, 1) if refreshed_ts else None
+        ),
+    }
+
+
+# Создаем глобальный экземпляр
+view_refresher = MaterializedViewRefresher()
+
+
+async def start_view_refresh_scheduler():
+    """Периодическое обновление грязных материализованных представлений"""
+    logger.info("Starting materialized view refresh scheduler")
+
+    try:
+        await view_refresher.ensure_views()
+    except Exception as e:
+        logger.error(f"Error creating materialized views: {e}")
+
+    while True:
+        try:
+            refreshed = await view_refresher.refresh_dirty()
+            if refreshed:
+                logger.info(f"Refreshed materialized views: {refreshed}")
+        except Exception as e:
+            logger.error(f"Error in materialized view refresh: {e}")
+
+        await asyncio.sleep(settings.MV_REFRESH_INTERVAL_SECONDS)
+
+
+async def get_view_watermark(view: str) -> Optional[Dict[str, Any]]:
+    """Состояние представления, если оно хотя бы раз обновлялось"""
+    state = await view_refresher.get_state(view)
+    return state if state.get("refreshed_ts") else None
@@ -5,7 +5,7 @@
 import asyncio
 import time
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime, timedelta
 from dataclasses import dataclass
 from enum import Enum
@@ -15,9 +15,14 @@ from sqlalchemy import text, event
 from collections import deque, defaultdict
 import threading
 
-from app.core.database import engine, get_db
+from app.core.database import engine, get_db, get_all_engines, read_router
 from app.core.cache import cache_manager
+from app.core.config import settings
 from app.monitoring.metrics import metrics_collector, MetricType, MetricDefinition
+from app.monitoring.prometheus_metrics import (
+    metrics_collector as prometheus_collector,
+)
+from app.monitoring.query_tracker import current_endpoint
 
 logger = logging.getLogger(__name__)
 
@@ -46,9 +51,11 @@ class ConnectionPoolMetrics:
     wait_time_ms: float
     connection_errors: int
     status: PoolStatus
+    engine: str = "primary"
 
     def to_dict(self) -> Dict[str, Any]:
         return {
+            "engine": self.engine,
             "timestamp": self.timestamp.isoformat(),
             "pool_size": self.pool_size,
             "checked_out": self.checked_out,
@@ -63,6 +70,24 @@ class ConnectionPoolMetrics:
         }
 
 
+def latency_percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 (в миллисекундах) по выборке в секундах"""
+    if not samples:
+        return {"count": 0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    ordered = sorted(samples)
+
+    def pick(pct: float) -> float:
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return round(ordered[index] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": pick(50),
+        "p95_ms": pick(95),
+        "p99_ms": pick(99),
+    }
+
+
 @dataclass
 class SlowQueryInfo:
     """Информация о медленном запросе"""
@@ -96,6 +121,18 @@ class ConnectionPoolMonitor:
         # Счетчики событий
         self.connection_counters: defaultdict = defaultdict(int)
         self.query_counters: defaultdict = defaultdict(int)
+        # Счетчики событий по движкам (primary, replica_1, ...)
+        self.engine_counters: Dict[str, defaultdict] = defaultdict(
+            lambda: defaultdict(int)
+        )
+        # Измеренные ожидание checkout и удержание соединений:
+        # (engine, endpoint) -> deque[(monotonic time, seconds)]
+        self.checkout_waits: Dict[Tuple[str, str], deque] = defaultdict(
+            lambda: deque(maxlen=1000)
+        )
+        self.connection_holds: Dict[Tuple[str, str], deque] = defaultdict(
+            lambda: deque(maxlen=1000)
+        )
 
         # Регистрируем метрики
         self._register_metrics()
@@ -156,66 +193,156 @@ class ConnectionPoolMonitor:
             metrics_collector.register_metric(metric)
 
     def _setup_pool_events(self):
-        """Настройка событий пула соединений"""
-        pool = engine.pool
+        """Настройка событий пула соединений для всех движков"""
+        for engine_name, db_engine in get_all_engines().items():
+            self._setup_engine_pool_events(engine_name, db_engine.pool)
 
-        @event.listens_for(pool, "connect")
-        def on_connect(dbapi_connection, connection_record):
-            """Событие подключения"""
+    def _setup_engine_pool_events(self, engine_name: str, pool):
+        """Подписка на события пула конкретного движка"""
+        tags = {"engine": engine_name}
+
+        def track(event_name: str, dbapi_connection):
             with self._lock:
-                self.connection_counters["created"] += 1
+                self.connection_counters[event_name] += 1
+                self.engine_counters[engine_name][event_name] += 1
                 self.connection_events.append(
                     {
-                        "event": "connect",
+                        "event": event_name,
+                        "engine": engine_name,
                         "timestamp": datetime.now(),
                         "connection_id": id(dbapi_connection),
                     }
                 )
-                metrics_collector.increment("db_connection_created")
+
+        @event.listens_for(pool, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            """Событие подключения"""
+            track("created", dbapi_connection)
+            metrics_collector.increment("db_connection_created", tags=tags)
 
         @event.listens_for(pool, "close")
         def on_close(dbapi_connection, connection_record):
             """Событие закрытия соединения"""
-            with self._lock:
-                self.connection_counters["closed"] += 1
-                self.connection_events.append(
-                    {
-                        "event": "close",
-                        "timestamp": datetime.now(),
-                        "connection_id": id(dbapi_connection),
-                    }
-                )
-                metrics_collector.increment("db_connection_closed")
+            track("closed", dbapi_connection)
+            metrics_collector.increment("db_connection_closed", tags=tags)
 
         @event.listens_for(pool, "checkout")
         def on_checkout(dbapi_connection, connection_record, connection_proxy):
             """Событие получения соединения из пула"""
-            with self._lock:
-                self.connection_counters["checkout"] += 1
-                self.connection_events.append(
-                    {
-                        "event": "checkout",
-                        "timestamp": datetime.now(),
-                        "connection_id": id(dbapi_connection),
-                    }
-                )
+            track("checkout", dbapi_connection)
+
+            endpoint = current_endpoint() or "background"
+            connection_record.info["checkout_endpoint"] = endpoint
+            connection_record.info["checked_out_at"] = time.perf_counter()
+
+            # Время ожидания измеряет InstrumentedQueuePool
+            wait = connection_record.info.pop("checkout_wait", None)
+            if wait is not None:
+                self.record_checkout_wait(engine_name, endpoint, wait)
 
         @event.listens_for(pool, "checkin")
         def on_checkin(dbapi_connection, connection_record):
             """Событие возврата соединения в пул"""
-            with self._lock:
-                self.connection_counters["checkin"] += 1
-                self.connection_events.append(
-                    {
-                        "event": "checkin",
-                        "timestamp": datetime.now(),
-                        "connection_id": id(dbapi_connection),
-                    }
+            track("checkin", dbapi_connection)
+
+            if connection_record is None:
+                return
+            started = connection_record.info.pop("checked_out_at", None)
+            endpoint = connection_record.info.pop("checkout_endpoint", "background")
+            if started is not None:
+                self.record_connection_hold(
+                    engine_name, endpoint, time.perf_counter() - started
                 )
 
-    def get_pool_metrics(self) -> ConnectionPoolMetrics:
-        """Получение текущих метрик пула"""
-        pool = engine.pool
+    def record_checkout_wait(self, engine_name: str, endpoint: str, wait: float):
+        """Запись измеренного времени ожидания соединения"""
+        with self._lock:
+            self.checkout_waits[(engine_name, endpoint)].append(
+                (time.monotonic(), wait)
+            )
+        prometheus_collector.record_pool_checkout(engine_name, endpoint, wait)
+
+    def record_connection_hold(self, engine_name: str, endpoint: str, held: float):
+        """Запись времени удержания соединения"""
+        with self._lock:
+            self.connection_holds[(engine_name, endpoint)].append(
+                (time.monotonic(), held)
+            )
+        prometheus_collector.record_connection_hold(engine_name, endpoint, held)
+
+    def _recent_samples(
+        self,
+        source: Dict[Tuple[str, str], deque],
+        engine_name: str,
+        endpoint: Optional[str] = None,
+        window_seconds: float = 300,
+    ) -> List[float]:
+        """Значения за последние window_seconds"""
+        since = time.monotonic() - window_seconds
+        with self._lock:
+            return [
+                value
+                for (sample_engine, sample_endpoint), samples in source.items()
+                if sample_engine == engine_name
+                and (endpoint is None or sample_endpoint == endpoint)
+                for timestamp, value in samples
+                if timestamp >= since
+            ]
+
+    def get_checkout_statistics(
+        self, engine_name: str = "primary", window_seconds: float = 300
+    ) -> Dict[str, Any]:
+        """Перцентили ожидания и удержания соединений по эндпоинтам"""
+        with self._lock:
+            endpoints = {
+                endpoint
+                for source in (self.checkout_waits, self.connection_holds)
+                for (sample_engine, endpoint) in source
+                if sample_engine == engine_name
+            }
+
+        per_endpoint = {
+            endpoint: {
+                "wait": latency_percentiles(
+                    self._recent_samples(
+                        self.checkout_waits, engine_name, endpoint, window_seconds
+                    )
+                ),
+                "hold": latency_percentiles(
+                    self._recent_samples(
+                        self.connection_holds, engine_name, endpoint, window_seconds
+                    )
+                ),
+            }
+            for endpoint in endpoints
+        }
+
+        return {
+            "engine": engine_name,
+            "window_seconds": window_seconds,
+            "wait": latency_percentiles(
+                self._recent_samples(
+                    self.checkout_waits, engine_name, None, window_seconds
+                )
+            ),
+            "hold": latency_percentiles(
+                self._recent_samples(
+                    self.connection_holds, engine_name, None, window_seconds
+                )
+            ),
+            # Эндпоинты, дольше всех удерживающие соединения, - первыми
+            "endpoints": dict(
+                sorted(
+                    per_endpoint.items(),
+                    key=lambda item: item[1]["hold"]["p95_ms"],
+                    reverse=True,
+                )
+            ),
+        }
+
+    def get_pool_metrics(self, engine_name: str = "primary") -> ConnectionPoolMetrics:
+        """Получение текущих метрик пула указанного движка"""
+        pool = get_all_engines()[engine_name].pool
 
         # Получаем базовые метрики
         pool_size = getattr(pool, "size", lambda: 0)()
@@ -232,8 +359,8 @@ class ConnectionPoolMonitor:
             utilization_percent, available_connections, invalid
         )
 
-        # Время ожидания (приблизительное)
-        wait_time_ms = self._estimate_wait_time(utilization_percent)
+        # Измеренное время ожидания соединения (p95 за 5 минут)
+        wait_time_ms = self._measured_wait_time(engine_name)
 
         metrics = ConnectionPoolMetrics(
             timestamp=datetime.now(),
@@ -245,8 +372,9 @@ class ConnectionPoolMonitor:
             available_connections=available_connections,
             utilization_percent=utilization_percent,
             wait_time_ms=wait_time_ms,
-            connection_errors=self.connection_counters.get("errors", 0),
+            connection_errors=self.engine_counters[engine_name].get("errors", 0),
             status=status,
+            engine=engine_name,
         )
 
         # Сохраняем в историю
@@ -258,6 +386,10 @@ class ConnectionPoolMonitor:
 
         return metrics
 
+    def get_all_pool_metrics(self) -> Dict[str, ConnectionPoolMetrics]:
+        """Метрики пулов всех движков (primary и реплики)"""
+        return {name: self.get_pool_metrics(name) for name in get_all_engines()}
+
     def _determine_pool_status(
         self, utilization_percent: float, available_connections: int, invalid: int
     ) -> PoolStatus:
@@ -272,25 +404,22 @@ class ConnectionPoolMonitor:
         else:
             return PoolStatus.HEALTHY
 
-    def _estimate_wait_time(self, utilization_percent: float) -> float:
-        """Оценка времени ожидания соединения"""
-        if utilization_percent < 50:
-            return 0.1
-        elif utilization_percent < 80:
-            return 1.0
-        elif utilization_percent < 95:
-            return 10.0
-        else:
-            return 100.0
+    def _measured_wait_time(self, engine_name: str) -> float:
+        """p95 измеренного времени ожидания соединения (мс)"""
+        samples = self._recent_samples(self.checkout_waits, engine_name)
+        return latency_percentiles(samples)["p95_ms"]
 
     def _record_metrics(self, metrics: ConnectionPoolMetrics):
         """Запись метрик в систему мониторинга"""
-        metrics_collector.set_gauge("db_pool_size", metrics.pool_size)
-        metrics_collector.set_gauge("db_pool_checked_out", metrics.checked_out)
-        metrics_collector.set_gauge("db_pool_overflow", metrics.overflow)
-        metrics_collector.set_gauge("db_pool_invalid", metrics.invalid)
-        metrics_collector.set_gauge("db_pool_utilization", metrics.utilization_percent)
-        metrics_collector.record("db_pool_wait_time", metrics.wait_time_ms)
+        tags = {"engine": metrics.engine}
+        metrics_collector.set_gauge("db_pool_size", metrics.pool_size, tags)
+        metrics_collector.set_gauge("db_pool_checked_out", metrics.checked_out, tags)
+        metrics_collector.set_gauge("db_pool_overflow", metrics.overflow, tags)
+        metrics_collector.set_gauge("db_pool_invalid", metrics.invalid, tags)
+        metrics_collector.set_gauge(
+            "db_pool_utilization", metrics.utilization_percent, tags
+        )
+        metrics_collector.record("db_pool_wait_time", metrics.wait_time_ms, tags)
 
         # Статус как число
         status_value = {
@@ -299,7 +428,7 @@ class ConnectionPoolMonitor:
             PoolStatus.CRITICAL: 2,
             PoolStatus.UNKNOWN: 3,
         }[metrics.status]
-        metrics_collector.set_gauge("db_pool_status", status_value)
+        metrics_collector.set_gauge("db_pool_status", status_value, tags)
 
     def record_slow_query(
         self, query: str, duration_ms: float, connection_id: Optional[str] = None
@@ -324,23 +453,35 @@ class ConnectionPoolMonitor:
                 f"Slow query detected: {duration_ms:.2f}ms - {query[:100]}..."
             )
 
-    def record_connection_error(self, error: Exception):
+    def record_connection_error(self, error: Exception, engine_name: str = "primary"):
         """Запись ошибки соединения"""
         with self._lock:
             self.connection_counters["errors"] += 1
+            self.engine_counters[engine_name]["errors"] += 1
             self.connection_events.append(
-                {"event": "error", "timestamp": datetime.now(), "error": str(error)}
+                {
+                    "event": "error",
+                    "engine": engine_name,
+                    "timestamp": datetime.now(),
+                    "error": str(error),
+                }
             )
 
-        metrics_collector.increment("db_connection_errors")
+        metrics_collector.increment(
+            "db_connection_errors", tags={"engine": engine_name}
+        )
         logger.error(f"Connection error: {error}")
 
     async def check_pool_health(self) -> Dict[str, Any]:
         """Проверка здоровья пула соединений"""
-        metrics = self.get_pool_metrics()
+        all_metrics = self.get_all_pool_metrics()
+        metrics = all_metrics["primary"]
 
         # Проверяем алерты
         alerts = self._check_alerts(metrics)
+        for name, replica_metrics in all_metrics.items():
+            if name != "primary":
+                alerts.extend(self._check_alerts(replica_metrics))
 
         # Получаем статистику
         stats = self.get_pool_statistics()
@@ -349,6 +490,14 @@ class ConnectionPoolMonitor:
             "status": metrics.status.value,
             "metrics": metrics.to_dict(),
             "statistics": stats,
+            "engines": {
+                name: {
+                    **engine_metrics.to_dict(),
+                    "healthy": name == "primary" or read_router.is_healthy(name),
+                    "statistics": self.get_pool_statistics(name),
+                }
+                for name, engine_metrics in all_metrics.items()
+            },
             "alerts": alerts,
             "recent_events": list(self.connection_events)[-10:],
             "slow_queries": [q.to_dict() for q in list(self.slow_queries)[-5:]],
@@ -356,17 +505,19 @@ class ConnectionPoolMonitor:
 
     def _check_alerts(self, metrics: ConnectionPoolMetrics) -> List[Dict[str, Any]]:
         """Проверка алертов"""
-        alerts = []
+        alerts: List[Dict[str, Any]] = []
         now = datetime.now()
+        prefix = "" if metrics.engine == "primary" else f"{metrics.engine}:"
 
         # Алерт высокого использования
         if metrics.utilization_percent > 90:
-            alert_key = "high_utilization"
+            alert_key = f"{prefix}high_utilization"
             if self._should_send_alert(alert_key, now):
                 alerts.append(
                     {
                         "type": "high_utilization",
                         "severity": "critical",
+                        "engine": metrics.engine,
                         "message": f"High pool utilization: {metrics.utilization_percent:.1f}%",
                         "timestamp": now.isoformat(),
                     }
@@ -374,12 +525,13 @@ class ConnectionPoolMonitor:
 
         # Алерт недоступных соединений
         if metrics.available_connections < 2:
-            alert_key = "low_connections"
+            alert_key = f"{prefix}low_connections"
             if self._should_send_alert(alert_key, now):
                 alerts.append(
                     {
                         "type": "low_connections",
                         "severity": "critical",
+                        "engine": metrics.engine,
                         "message": f"Low available connections: {metrics.available_connections}",
                         "timestamp": now.isoformat(),
                     }
@@ -387,17 +539,41 @@ class ConnectionPoolMonitor:
 
         # Алерт недействительных соединений
         if metrics.invalid > 0:
-            alert_key = "invalid_connections"
+            alert_key = f"{prefix}invalid_connections"
             if self._should_send_alert(alert_key, now):
                 alerts.append(
                     {
                         "type": "invalid_connections",
                         "severity": "warning",
+                        "engine": metrics.engine,
                         "message": f"Invalid connections detected: {metrics.invalid}",
                         "timestamp": now.isoformat(),
                     }
                 )
 
+        # Алерт долгого ожидания соединения из пула
+        if metrics.wait_time_ms > settings.DB_POOL_WAIT_ALERT_MS:
+            alert_key = f"{prefix}slow_checkout"
+            if self._should_send_alert(alert_key, now):
+                checkout_stats = self.get_checkout_statistics(metrics.engine)
+                top_holders = list(checkout_stats["endpoints"])[:3]
+                alerts.append(
+                    {
+                        "type": "slow_checkout",
+                        "severity": "warning",
+                        "engine": metrics.engine,
+                        "message": (
+                            f"Pool checkout wait p95 {metrics.wait_time_ms:.1f}ms "
+                            f"exceeds {settings.DB_POOL_WAIT_ALERT_MS}ms; "
+                            f"longest holders: {', '.join(top_holders)}"
+                        ),
+                        "timestamp": now.isoformat(),
+                    }
+                )
+
+        if metrics.engine != "primary":
+            return alerts
+
         # Алерт медленных запросов
         recent_slow_queries = len(
             [q for q in self.slow_queries if now - q.timestamp < timedelta(minutes=5)]
@@ -424,13 +600,14 @@ class ConnectionPoolMonitor:
             return True
         return False
 
-    def get_pool_statistics(self) -> Dict[str, Any]:
+    def get_pool_statistics(self, engine_name: str = "primary") -> Dict[str, Any]:
         """Получение статистики пула"""
         with self._lock:
             recent_metrics = [
                 m
                 for m in self.metrics_history
-                if datetime.now() - m.timestamp < timedelta(hours=1)
+                if m.engine == engine_name
+                and datetime.now() - m.timestamp < timedelta(hours=1)
             ]
 
         if not recent_metrics:
@@ -439,10 +616,11 @@ class ConnectionPoolMonitor:
         utilizations = [m.utilization_percent for m in recent_metrics]
         wait_times = [m.wait_time_ms for m in recent_metrics]
 
+        counters = self.engine_counters[engine_name]
         return {
-            "total_connections_created": self.connection_counters.get("created", 0),
-            "total_connections_closed": self.connection_counters.get("closed", 0),
-            "total_connection_errors": self.connection_counters.get("errors", 0),
+            "total_connections_created": counters.get("created", 0),
+            "total_connections_closed": counters.get("closed", 0),
+            "total_connection_errors": counters.get("errors", 0),
             "total_slow_queries": self.query_counters.get("slow", 0),
             "avg_utilization_1h": sum(utilizations) / len(utilizations),
             "max_utilization_1h": max(utilizations),
@@ -450,6 +628,7 @@ class ConnectionPoolMonitor:
             "max_wait_time_1h": max(wait_times),
             "metrics_collected": len(self.metrics_history),
             "events_recorded": len(self.connection_events),
+            "checkout_latency": self.get_checkout_statistics(engine_name),
         }
 
     async def get_cached_metrics(self) -> Optional[Dict[str, Any]]:
@@ -462,7 +641,9 @@ class ConnectionPoolMonitor:
 
 
 # Глобальный экземпляр монитора
-pool_monitor = ConnectionPoolMonitor()
+pool_monitor = ConnectionPoolMonitor(
+    slow_query_threshold_ms=settings.SLOW_QUERY_THRESHOLD_MS
+)
 
 
 async def start_pool_monitoring():
@@ -471,6 +652,10 @@ async def start_pool_monitoring():
 
     while True:
         try:
+            # Проверяем реплики, чтобы вернуть восстановившиеся в ротацию
+            if read_router.enabled:
+                await read_router.check_health()
+
             # Собираем метрики
             health_info = await pool_monitor.check_pool_health()
 
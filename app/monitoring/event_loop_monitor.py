@@ -0,0 +1,66 @@
+"""
+Замер задержки event loop
+
+Задача засыпает на EVENT_LOOP_LAG_INTERVAL_SECONDS и измеряет, насколько
+позже запланированного она проснулась. Рост задержки означает, что в
+event loop выполняется блокирующий код (синхронный ввод-вывод, тяжелые
+вычисления) и остальные запросы воркера в это время не обслуживаются.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.monitoring.connection_pool_monitor import latency_percentiles
+from app.monitoring.prometheus_metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoopMonitor:
+    """Задержка пробуждения задачи в event loop"""
+
+    def __init__(self, history: int = 1200):
+        self.samples: deque = deque(maxlen=history)
+        self.max_lag = 0.0
+
+    def record(self, lag: float):
+        self.samples.append(lag)
+        self.max_lag = max(self.max_lag, lag)
+        metrics_collector.record_event_loop_lag(lag)
+
+    async def sample(self, interval: Optional[float] = None) -> float:
+        """Один замер: задержка сверх запрошенного сна (секунды)"""
+        interval = interval or settings.EVENT_LOOP_LAG_INTERVAL_SECONDS
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        self.record(lag)
+        return lag
+
+    def stats(self) -> Dict[str, Any]:
+        """Перцентили по последним замерам и максимум с запуска"""
+        return {
+            **latency_percentiles(list(self.samples)),
+            "max_ms": round(self.max_lag * 1000, 3),
+        }
+
+
+# Создаем глобальный экземпляр
+event_loop_monitor = EventLoopMonitor()
+
+
+async def start_event_loop_monitoring():
+    """Непрерывный замер задержки event loop"""
+    logger.info("Starting event loop lag monitoring")
+    while True:
+        try:
+            await event_loop_monitor.sample()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in event loop monitoring: {e}")
+            await asyncio.sleep(60)
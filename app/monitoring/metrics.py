@@ -22,7 +22,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Request, Response
 from starlette.middleware.base import BaseHTTPMiddleware
 
-from app.core.database import get_db
+from app.core.database import read_router
 from app.core.models import (
     Request as RequestModel,
     Transaction,
@@ -705,17 +705,16 @@ async def collect_metrics_background():
     """Фоновая задача для сбора метрик с улучшенной стабильностью"""
     while True:
         try:
-            async for db in get_db():
+            # Агрегаты читаем с реплики, если она настроена
+            async with read_router.session() as db:
                 # Сбор бизнес-метрик
                 await business_collector.collect_all_business_metrics(db)
 
-                # Сбор системных метрик
-                performance_collector.record_system_metrics()
+            # Сбор системных метрик
+            performance_collector.record_system_metrics()
 
-                # Очистка старых метрик
-                metrics_collector.clear_old_metrics()
-
-                break  # Выходим из цикла async for
+            # Очистка старых метрик
+            metrics_collector.clear_old_metrics()
 
         except Exception as e:
             logger.error(f"Error in metrics collection background task: {e}")
@@ -15,7 +15,7 @@ from prometheus_client import (
 import time
 import psutil
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -88,6 +88,120 @@ database_query_duration_seconds = Histogram(
     registry=registry,
 )
 
+database_prepared_statements_total = Counter(
+    "database_prepared_statements_total",
+    "Prepared statement cache lookups",
+    ["engine", "result"],
+    registry=registry,
+)
+
+http_request_db_queries = Histogram(
+    "http_request_db_queries",
+    "Number of database queries per HTTP request",
+    ["endpoint"],
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100, 250),
+    registry=registry,
+)
+
+http_request_db_time_seconds = Histogram(
+    "http_request_db_time_seconds",
+    "Database time per HTTP request in seconds",
+    ["endpoint"],
+    registry=registry,
+)
+
+database_replica_fallbacks_total = Counter(
+    "database_replica_fallbacks_total",
+    "Reads moved to primary because the chosen replica was unavailable",
+    ["replica"],
+    registry=registry,
+)
+
+database_n_plus_one_total = Counter(
+    "database_n_plus_one_total",
+    "HTTP requests with repeated same-shape queries (N+1)",
+    ["endpoint"],
+    registry=registry,
+)
+
+POOL_LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+database_pool_checkout_wait_seconds = Histogram(
+    "database_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the pool",
+    ["engine", "endpoint"],
+    buckets=POOL_LATENCY_BUCKETS,
+    registry=registry,
+)
+
+database_connection_hold_seconds = Histogram(
+    "database_connection_hold_seconds",
+    "Time a connection is held between checkout and checkin",
+    ["engine", "endpoint"],
+    buckets=POOL_LATENCY_BUCKETS,
+    registry=registry,
+)
+
+# Материализованные представления
+materialized_view_refresh_seconds = Histogram(
+    "materialized_view_refresh_seconds",
+    "Duration of REFRESH MATERIALIZED VIEW",
+    ["view", "status"],
+    buckets=[0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0],
+    registry=registry,
+)
+
+# Повторы запросов по Idempotency-Key
+idempotency_requests_total = Counter(
+    "idempotency_requests_total",
+    "Requests with Idempotency-Key by outcome",
+    ["endpoint", "result"],
+    registry=registry,
+)
+
+# Очередь вебхуков Mango
+mango_ingest_events_total = Counter(
+    "mango_ingest_events_total",
+    "Mango webhook events by ingestion outcome",
+    ["result"],
+    registry=registry,
+)
+
+mango_ingest_lag_seconds = Histogram(
+    "mango_ingest_lag_seconds",
+    "Time from webhook receipt to event processing",
+    buckets=[0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0],
+    registry=registry,
+)
+
+mango_ingest_queue_depth = Gauge(
+    "mango_ingest_queue_depth",
+    "Mango webhook events waiting for processing",
+    registry=registry,
+)
+
+# Задержка event loop
+event_loop_lag_seconds = Histogram(
+    "event_loop_lag_seconds",
+    "Delay of a scheduled event loop wakeup",
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0],
+    registry=registry,
+)
+
 # Redis метрики
 redis_operations_total = Counter(
     "redis_operations_total",
@@ -124,6 +238,13 @@ file_storage_usage_bytes = Gauge(
     "file_storage_usage_bytes", "File storage usage in bytes", registry=registry
 )
 
+media_store_writes_total = Counter(
+    "media_store_writes_total",
+    "Media store writes by outcome (new blob or deduplicated)",
+    ["result"],
+    registry=registry,
+)
+
 # Кастомные метрики для health checks
 health_check_status = Gauge(
     "health_check_status",
@@ -236,6 +357,91 @@ class MetricsCollector:
         except Exception as e:
             logger.error(f"Error recording database connection metric: {e}")
 
+    def record_prepared_statement(self, engine: str, result: str):
+        """Записать метрику обращения к кешу prepared statements"""
+        try:
+            database_prepared_statements_total.labels(
+                engine=engine, result=result
+            ).inc()
+        except Exception as e:
+            logger.error(f"Error recording prepared statement metric: {e}")
+
+    def record_replica_fallback(self, replica: str):
+        """Записать переход чтения с недоступной реплики на primary"""
+        try:
+            database_replica_fallbacks_total.labels(replica=replica).inc()
+        except Exception as e:
+            logger.error(f"Error recording replica fallback metric: {e}")
+
+    def record_request_queries(
+        self, endpoint: str, query_count: int, db_time: float, n_plus_one: bool
+    ):
+        """Записать метрики запросов к БД для HTTP запроса"""
+        try:
+            http_request_db_queries.labels(endpoint=endpoint).observe(query_count)
+            http_request_db_time_seconds.labels(endpoint=endpoint).observe(db_time)
+            if n_plus_one:
+                database_n_plus_one_total.labels(endpoint=endpoint).inc()
+        except Exception as e:
+            logger.error(f"Error recording request query metrics: {e}")
+
+    def record_pool_checkout(self, engine: str, endpoint: str, wait: float):
+        """Записать время ожидания соединения из пула"""
+        try:
+            database_pool_checkout_wait_seconds.labels(
+                engine=engine, endpoint=endpoint
+            ).observe(wait)
+        except Exception as e:
+            logger.error(f"Error recording pool checkout metric: {e}")
+
+    def record_connection_hold(self, engine: str, endpoint: str, held: float):
+        """Записать время удержания соединения"""
+        try:
+            database_connection_hold_seconds.labels(
+                engine=engine, endpoint=endpoint
+            ).observe(held)
+        except Exception as e:
+            logger.error(f"Error recording connection hold metric: {e}")
+
+    def record_view_refresh(self, view: str, duration: float, status: str):
+        """Записать длительность обновления материализованного представления"""
+        try:
+            materialized_view_refresh_seconds.labels(view=view, status=status).observe(
+                duration
+            )
+        except Exception as e:
+            logger.error(f"Error recording view refresh metric: {e}")
+
+    def record_idempotency(self, endpoint: str, result: str):
+        """Записать исход запроса с Idempotency-Key"""
+        try:
+            idempotency_requests_total.labels(endpoint=endpoint, result=result).inc()
+        except Exception as e:
+            logger.error(f"Error recording idempotency metric: {e}")
+
+    def record_mango_ingest(self, result: str, lag: Optional[float] = None):
+        """Записать исход обработки события вебхука Mango"""
+        try:
+            mango_ingest_events_total.labels(result=result).inc()
+            if lag is not None:
+                mango_ingest_lag_seconds.observe(lag)
+        except Exception as e:
+            logger.error(f"Error recording mango ingest metric: {e}")
+
+    def update_mango_queue_depth(self, depth: int):
+        """Обновить длину очереди вебхуков Mango"""
+        try:
+            mango_ingest_queue_depth.set(depth)
+        except Exception as e:
+            logger.error(f"Error updating mango queue depth: {e}")
+
+    def record_event_loop_lag(self, lag: float):
+        """Записать задержку event loop"""
+        try:
+            event_loop_lag_seconds.observe(lag)
+        except Exception as e:
+            logger.error(f"Error recording event loop lag metric: {e}")
+
     def record_health_check(self, service: str, status: bool, duration: float):
         """Записать метрику health check"""
         try:
@@ -258,6 +464,13 @@ class MetricsCollector:
         except Exception as e:
             logger.error(f"Error updating Redis memory usage: {e}")
 
+    def record_media_store_write(self, result: str):
+        """Записать исход сохранения файла в хранилище"""
+        try:
+            media_store_writes_total.labels(result=result).inc()
+        except Exception as e:
+            logger.error(f"Error recording media store metric: {e}")
+
     def update_file_storage_usage(self, storage_bytes: int):
         """Обновить метрику использования файлового хранилища"""
         try:
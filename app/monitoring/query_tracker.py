@@ -0,0 +1,250 @@
+"""
+Счетчик запросов к БД на HTTP-запрос и детектор N+1
+
+Считает количество запросов, строк и время в БД для каждого HTTP-запроса
+через события SQLAlchemy before/after_cursor_execute и отмечает
+повторяющиеся запросы одной формы (N+1).
+"""
+
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+from app.core.request_context import current_request_scope
+from app.monitoring.prometheus_metrics import (
+    metrics_collector as prometheus_collector,
+)
+
+logger = logging.getLogger(__name__)
+
+# Списки параметров IN (...) разной длины приводим к одной форме
+_PARAM_LIST_RE = re.compile(
+    r"\(\s*(?:\$\d+|\?|%\(\w+\)s)(?:\s*,\s*(?:\$\d+|\?|%\(\w+\)s))*\s*\)"
+)
+_LITERAL_RE = re.compile(r"\b\d+\b|'(?:[^']|'')*'")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_statement(statement: str) -> str:
+    """Форма запроса без литералов и с схлопнутыми списками параметров"""
+    normalized = _PARAM_LIST_RE.sub("(?)", statement)
+    normalized = _LITERAL_RE.sub("?", normalized)
+    return _WHITESPACE_RE.sub(" ", normalized).strip()
+
+
+@dataclass
+class QueryStats:
+    """Статистика запросов к БД в рамках одного HTTP-запроса"""
+
+    endpoint: str = ""
+    query_count: int = 0
+    rows: int = 0
+    db_time: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+
+    def record(self, statement: str, duration: float, rowcount: int):
+        """Учет одного выполненного запроса"""
+        self.query_count += 1
+        self.db_time += duration
+        if rowcount and rowcount > 0:
+            self.rows += rowcount
+        self.statements[normalize_statement(statement)] += 1
+
+    def repeated_statements(
+        self, threshold: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """SELECT-запросы одной формы, выполненные threshold и более раз"""
+        threshold = threshold or settings.QUERY_N_PLUS_ONE_THRESHOLD
+        return [
+            {"statement": statement[:200], "count": count}
+            for statement, count in self.statements.most_common()
+            if count >= threshold and statement.upper().startswith("SELECT")
+        ]
+
+    @property
+    def has_n_plus_one(self) -> bool:
+        return bool(self.repeated_statements())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "endpoint": self.endpoint,
+            "query_count": self.query_count,
+            "rows": self.rows,
+            "db_time_ms": round(self.db_time * 1000, 2),
+            "n_plus_one": self.repeated_statements(),
+        }
+
+
+current_query_stats: ContextVar[Optional[QueryStats]] = ContextVar(
+    "current_query_stats", default=None
+)
+
+
+# Метка запросов без найденного маршрута: сырой путь (404, сканеры)
+# давал бы неограниченное число значений метки в Prometheus
+UNMATCHED_ENDPOINT = "unmatched"
+
+
+def current_endpoint() -> Optional[str]:
+    """Шаблон маршрута текущего HTTP-запроса; None вне запроса"""
+    scope = current_request_scope.get()
+    if scope is None:
+        return None
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ENDPOINT
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_tracker_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # Упавший запрос не доходит до after_cursor_execute: снимаем его время
+    # начала, иначе следующие замеры этого соединения сместятся
+    conn = exception_context.connection
+    if conn is not None and exception_context.execution_context is not None:
+        starts = conn.info.get("query_tracker_start")
+        if starts:
+            starts.pop()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_tracker_start")
+    if not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    rowcount = getattr(cursor, "rowcount", -1)
+
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.record(statement, duration, rowcount)
+
+    if duration * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+        from app.monitoring.slow_queries import slow_query_log
+
+        slow_query_log.record(
+            conn, statement, parameters, duration * 1000, rowcount, executemany
+        )
+
+
+@contextmanager
+def track_queries(endpoint: str = "") -> Iterator[QueryStats]:
+    """
+    Отслеживание запросов к БД внутри блока
+
+    Пример (в тестах):
+        with track_queries() as stats:
+            await crud.get_requests(db)
+        assert stats.query_count <= 2
+    """
+    stats = QueryStats(endpoint=endpoint)
+    token = current_query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_query_stats.reset(token)
+
+
+class QueryTrackingMiddleware:
+    """
+    ASGI middleware: статистика запросов к БД на каждый HTTP-запрос
+
+    Результат пишется в лог запросов и в Prometheus гистограммы;
+    в development (или при QUERY_TRACKING_HEADERS) добавляются заголовки
+    X-DB-Query-Count, X-DB-Time-Ms и X-DB-N-Plus-One.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        scope_token = current_request_scope.set(scope)
+        try:
+            if (
+                not settings.QUERY_TRACKING_ENABLED
+                or random.random() >= settings.QUERY_TRACKING_SAMPLE_RATE
+            ):
+                await self.app(scope, receive, send)
+            else:
+                await self._call_tracked(scope, receive, send)
+        finally:
+            current_request_scope.reset(scope_token)
+
+    async def _call_tracked(self, scope, receive, send):
+        """Обработка запроса с подсчетом запросов к БД"""
+        expose_headers = (
+            settings.QUERY_TRACKING_HEADERS or settings.ENVIRONMENT == "development"
+        )
+
+        with track_queries(scope.get("path", "")) as stats:
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start" and expose_headers:
+                    headers = list(message.get("headers", []))
+                    headers.append(
+                        (b"x-db-query-count", str(stats.query_count).encode())
+                    )
+                    headers.append(
+                        (b"x-db-time-ms", f"{stats.db_time * 1000:.2f}".encode())
+                    )
+                    if stats.has_n_plus_one:
+                        headers.append((b"x-db-n-plus-one", b"1"))
+                    message["headers"] = headers
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                self._report(scope, stats)
+
+    @staticmethod
+    def _report(scope, stats: QueryStats):
+        """Запись статистики в лог и метрики"""
+        if not stats.query_count:
+            return
+
+        # Шаблон маршрута вместо конкретного пути (ограничиваем кардинальность)
+        endpoint = current_endpoint() or stats.endpoint
+        stats.endpoint = endpoint
+
+        repeated = stats.repeated_statements()
+        prometheus_collector.record_request_queries(
+            endpoint, stats.query_count, stats.db_time, bool(repeated)
+        )
+
+        if repeated:
+            logger.warning(
+                f"Possible N+1 on {scope.get('method')} {endpoint}: "
+                f"{repeated[0]['count']}x {repeated[0]['statement']}",
+                extra=stats.to_dict(),
+            )
+        else:
+            # Обычные запросы - только на DEBUG, чтобы выборка не засоряла лог
+            level = (
+                logging.INFO
+                if stats.query_count >= settings.QUERY_COUNT_LOG_THRESHOLD
+                else logging.DEBUG
+            )
+            logger.log(
+                level,
+                f"DB queries for {scope.get('method')} {endpoint}: "
+                f"{stats.query_count} queries, {stats.db_time * 1000:.2f}ms",
+                extra=stats.to_dict(),
+            )
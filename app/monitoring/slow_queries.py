@@ -0,0 +1,266 @@
+"""
+Захват медленных запросов с планами EXPLAIN
+
+Медленные запросы группируются по нормализованной форме (fingerprint).
+Для части из них асинхронно и с ограничением частоты выполняется
+EXPLAIN (ANALYZE off, FORMAT JSON); краткая сводка плана хранится
+вместе с запросом в ограниченном хранилище.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from app.core.config import settings
+from app.monitoring.query_tracker import current_endpoint, normalize_statement
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE_PREFIXES = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+
+def parameter_shape(parameters: Any, executemany: bool = False) -> List[str]:
+    """Типы связанных параметров без значений (значения могут содержать ПДн)"""
+    if executemany:
+        return [f"executemany[{len(parameters or [])}]"]
+    if isinstance(parameters, dict):
+        parameters = list(parameters.values())
+    shape = []
+    for value in parameters or ():
+        if isinstance(value, (list, tuple)):
+            shape.append(f"{type(value).__name__}[{len(value)}]")
+        else:
+            shape.append(type(value).__name__)
+    return shape
+
+
+def summarize_plan(plan_json: Any, actual_rows: Optional[int] = None) -> Dict:
+    """Краткая сводка плана EXPLAIN FORMAT JSON"""
+    if isinstance(plan_json, str):
+        plan_json = json.loads(plan_json)
+    root = plan_json[0]["Plan"]
+
+    seq_scans: List[str] = []
+    node_types: List[str] = []
+
+    def walk(node: Dict[str, Any]):
+        node_types.append(node.get("Node Type", ""))
+        if node.get("Node Type") == "Seq Scan":
+            seq_scans.append(node.get("Relation Name", "?"))
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(root)
+
+    estimated_rows = root.get("Plan Rows")
+    summary: Dict[str, Any] = {
+        "root_node": root.get("Node Type"),
+        "total_cost": root.get("Total Cost"),
+        "estimated_rows": estimated_rows,
+        "actual_rows": actual_rows,
+        "seq_scans": seq_scans,
+        "node_types": sorted(set(node_types)),
+    }
+    if actual_rows is not None and actual_rows >= 0 and estimated_rows:
+        summary["rows_misestimate"] = round(
+            max(actual_rows, 1) / max(estimated_rows, 1), 2
+        )
+    return summary
+
+
+@dataclass
+class SlowQueryEntry:
+    """Медленный запрос, сгруппированный по fingerprint"""
+
+    fingerprint: str
+    statement: str
+    parameter_shape: List[str]
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    last_rows: Optional[int] = None
+    endpoints: Set[str] = field(default_factory=set)
+    first_seen: datetime = field(default_factory=datetime.now)
+    last_seen: datetime = field(default_factory=datetime.now)
+    plan: Optional[Dict[str, Any]] = None
+    plan_error: Optional[str] = None
+    explained_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "fingerprint": self.fingerprint,
+            "query": (
+                self.statement[:500] + "..."
+                if len(self.statement) > 500
+                else self.statement
+            ),
+            "parameter_shape": self.parameter_shape,
+            "calls": self.count,
+            "mean_time": round(self.total_ms / self.count, 2) if self.count else 0,
+            "max_time": round(self.max_ms, 2),
+            "total_time": round(self.total_ms, 2),
+            "rows": self.last_rows,
+            "endpoints": sorted(self.endpoints),
+            "first_seen": self.first_seen.isoformat(),
+            "last_seen": self.last_seen.isoformat(),
+            "plan": self.plan,
+            "plan_error": self.plan_error,
+        }
+
+
+class SlowQueryLog:
+    """Ограниченное хранилище медленных запросов"""
+
+    def __init__(self, max_entries: int = 200):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, SlowQueryEntry]" = OrderedDict()
+        self._explain_times: deque = deque()
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def fingerprint(statement: str) -> str:
+        return hashlib.sha1(normalize_statement(statement).encode()).hexdigest()[:16]
+
+    def record(
+        self,
+        conn,
+        statement: str,
+        parameters: Any,
+        duration_ms: float,
+        rowcount: int = -1,
+        executemany: bool = False,
+    ):
+        """Запись медленного запроса (вызывается из after_cursor_execute)"""
+        if statement.lstrip().upper().startswith("EXPLAIN"):
+            return
+
+        key = self.fingerprint(statement)
+        endpoint = current_endpoint()
+
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = SlowQueryEntry(
+                    fingerprint=key,
+                    statement=normalize_statement(statement),
+                    parameter_shape=parameter_shape(parameters, executemany),
+                )
+                self.entries[key] = entry
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            else:
+                self.entries.move_to_end(key)
+
+            entry.count += 1
+            entry.total_ms += duration_ms
+            entry.max_ms = max(entry.max_ms, duration_ms)
+            entry.last_seen = datetime.now()
+            if rowcount is not None and rowcount >= 0:
+                entry.last_rows = rowcount
+            if endpoint:
+                entry.endpoints.add(endpoint)
+
+        from app.monitoring.connection_pool_monitor import pool_monitor
+
+        pool_monitor.record_slow_query(statement, duration_ms)
+
+        if not executemany and self._should_explain(conn, statement, entry):
+            self._schedule_explain(conn, statement, parameters, entry)
+
+    def _should_explain(self, conn, statement: str, entry: SlowQueryEntry) -> bool:
+        """Выборка и ограничение частоты EXPLAIN"""
+        if not settings.SLOW_QUERY_EXPLAIN_ENABLED:
+            return False
+        if conn.dialect.name != "postgresql":
+            return False
+        if not statement.lstrip().upper().startswith(EXPLAINABLE_PREFIXES):
+            return False
+
+        now = time.monotonic()
+        if (
+            entry.explained_at is not None
+            and now - entry.explained_at < settings.SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS
+        ):
+            return False
+
+        with self._lock:
+            while self._explain_times and now - self._explain_times[0] > 60:
+                self._explain_times.popleft()
+            if len(self._explain_times) >= settings.SLOW_QUERY_EXPLAIN_PER_MINUTE:
+                return False
+            self._explain_times.append(now)
+
+        entry.explained_at = now
+        return True
+
+    def _schedule_explain(
+        self, conn, statement: str, parameters: Any, entry: SlowQueryEntry
+    ):
+        """Запуск EXPLAIN в фоне, чтобы не задерживать текущий запрос"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        task = loop.create_task(
+            self._explain(conn.engine, statement, parameters, entry)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _explain(
+        self, sync_engine, statement: str, parameters: Any, entry: SlowQueryEntry
+    ):
+        """EXPLAIN (ANALYZE off, FORMAT JSON) на том же движке"""
+        from app.core.database import get_all_engines
+
+        target = next(
+            (
+                async_engine
+                for async_engine in get_all_engines().values()
+                if async_engine.sync_engine is sync_engine
+            ),
+            None,
+        )
+        if target is None:
+            return
+
+        try:
+            async with target.connect() as conn:
+                result = await conn.exec_driver_sql(
+                    f"EXPLAIN (ANALYZE off, FORMAT JSON) {statement}",
+                    tuple(parameters or ()),
+                )
+                plan_json = result.scalar()
+            entry.plan = summarize_plan(plan_json, entry.last_rows)
+            entry.plan_error = None
+        except Exception as e:
+            entry.plan_error = str(e)[:200]
+            logger.debug(f"EXPLAIN failed for slow query {entry.fingerprint}: {e}")
+
+    def get_slow_queries(
+        self, limit: int = 10, min_time_ms: float = 0.0
+    ) -> List[Dict[str, Any]]:
+        """Медленные запросы, отсортированные по суммарному времени"""
+        with self._lock:
+            entries = [
+                entry for entry in self.entries.values() if entry.max_ms >= min_time_ms
+            ]
+        entries.sort(key=lambda entry: entry.total_ms, reverse=True)
+        return [entry.to_dict() for entry in entries[:limit]]
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self._explain_times.clear()
+
+
+slow_query_log = SlowQueryLog(max_entries=settings.SLOW_QUERY_STORE_SIZE)
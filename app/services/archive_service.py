@@ -0,0 +1,274 @@
+"""
+Архивирование закрытых заявок и старых транзакций
+
+Записи переносятся в таблицы *_archive небольшими пакетами: каждый пакет -
+отдельная короткая транзакция (INSERT ... SELECT, затем DELETE), поэтому
+горячие таблицы не блокируются надолго. Чтение архивных записей выполняется
+через get_archived_request / get_archived_transaction, когда запись не
+найдена в горячей таблице.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..core.models import (
+    File,
+    FileArchive,
+    Request,
+    RequestArchive,
+    Transaction,
+    TransactionArchive,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _copy_columns(model, archive_model) -> List[str]:
+    """Общие колонки горячей и архивной таблиц"""
+    archive_columns = set(archive_model.__table__.columns.keys())
+    return [name for name in model.__table__.columns.keys() if name in archive_columns]
+
+
+async def _select_batch_ids(db: AsyncSession, query, batch_size: int) -> List[int]:
+    """Выбор пакета id с блокировкой строк (PostgreSQL пропускает занятые)"""
+    query = query.limit(batch_size)
+    if db.bind.dialect.name == "postgresql":
+        query = query.with_for_update(skip_locked=True)
+    result = await db.execute(query)
+    return [row[0] for row in result]
+
+
+async def _move_rows(db: AsyncSession, model, archive_model, condition) -> None:
+    """INSERT ... SELECT в архив и DELETE из горячей таблицы"""
+    columns = _copy_columns(model, archive_model)
+    source = select(
+        *[model.__table__.c[name] for name in columns],
+        literal(datetime.now(timezone.utc)).label("archived_at"),
+    ).where(condition)
+    await db.execute(
+        insert(archive_model.__table__).from_select(columns + ["archived_at"], source)
+    )
+    await db.execute(delete(model.__table__).where(condition))
+
+
+class ArchiveService:
+    """Перенос старых записей в архивные таблицы"""
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+        self.last_run: Optional[datetime] = None
+        self.last_result: Dict[str, Any] = {}
+
+    def cutoff(self, days: Optional[int] = None) -> datetime:
+        if days is None:
+            days = settings.ARCHIVE_AFTER_DAYS
+        return datetime.now(timezone.utc) - timedelta(days=days)
+
+    async def archive_requests_batch(
+        self, db: AsyncSession, cutoff: datetime, batch_size: int
+    ) -> int:
+        """Один пакет закрытых заявок вместе с их файлами"""
+        ids = await _select_batch_ids(
+            db,
+            select(Request.id)
+            .where(
+                Request.created_at < cutoff,
+                Request.status.in_(settings.get_archive_request_statuses),
+            )
+            .order_by(Request.id),
+            batch_size,
+        )
+        if not ids:
+            return 0
+
+        await _move_rows(db, File, FileArchive, File.request_id.in_(ids))
+        await _move_rows(db, Request, RequestArchive, Request.id.in_(ids))
+        await db.commit()
+        return len(ids)
+
+    async def archive_transactions_batch(
+        self, db: AsyncSession, cutoff: datetime, batch_size: int
+    ) -> int:
+        """Один пакет старых транзакций вместе с их файлами"""
+        ids = await _select_batch_ids(
+            db,
+            select(Transaction.id)
+            .where(Transaction.created_at < cutoff)
+            .order_by(Transaction.id),
+            batch_size,
+        )
+        if not ids:
+            return 0
+
+        await _move_rows(db, File, FileArchive, File.transaction_id.in_(ids))
+        await _move_rows(db, Transaction, TransactionArchive, Transaction.id.in_(ids))
+        await db.commit()
+        return len(ids)
+
+    async def run(
+        self,
+        days: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        max_batches: Optional[int] = None,
+    ) -> Dict[str, int]:
+        """Архивирование пакетами до исчерпания подходящих записей"""
+        cutoff = self.cutoff(days)
+        batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+        totals = {"requests": 0, "transactions": 0}
+
+        for key, archive_batch in (
+            ("requests", self.archive_requests_batch),
+            ("transactions", self.archive_transactions_batch),
+        ):
+            batches = 0
+            while max_batches is None or batches < max_batches:
+                async with self.session_factory() as db:
+                    try:
+                        moved = await archive_batch(db, cutoff, batch_size)
+                    except Exception as e:
+                        await db.rollback()
+                        logger.error(f"Archiving {key} failed: {e}")
+                        break
+
+                totals[key] += moved
+                batches += 1
+                if moved < batch_size:
+                    break
+                await asyncio.sleep(settings.ARCHIVE_BATCH_PAUSE_SECONDS)
+
+        self.last_run = datetime.now(timezone.utc)
+        self.last_result = totals
+        if totals["requests"] or totals["transactions"]:
+            logger.info(f"Archived records: {totals}")
+        return totals
+
+
+async def get_archived_request(
+    db: AsyncSession, request_id: int
+) -> Optional[RequestArchive]:
+    """Заявка из архива (для ответа, когда в горячей таблице ее нет)"""
+    result = await db.execute(
+        select(RequestArchive)
+        .options(
+            selectinload(RequestArchive.advertising_campaign),
+            selectinload(RequestArchive.city),
+            selectinload(RequestArchive.request_type),
+            selectinload(RequestArchive.direction),
+            selectinload(RequestArchive.master),
+            selectinload(RequestArchive.files),
+        )
+        .where(RequestArchive.id == request_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def get_archived_transaction(
+    db: AsyncSession, transaction_id: int
+) -> Optional[TransactionArchive]:
+    """Транзакция из архива"""
+    result = await db.execute(
+        select(TransactionArchive)
+        .options(
+            selectinload(TransactionArchive.city),
+            selectinload(TransactionArchive.transaction_type),
+            selectinload(TransactionArchive.files),
+        )
+        .where(TransactionArchive.id == transaction_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def search_archived_requests(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    city_id: Optional[int] = None,
+    status: Optional[str] = None,
+    master_id: Optional[int] = None,
+) -> List[RequestArchive]:
+    """Поиск в архиве заявок с теми же фильтрами, что и у списка"""
+    query = select(RequestArchive).options(
+        selectinload(RequestArchive.advertising_campaign),
+        selectinload(RequestArchive.city),
+        selectinload(RequestArchive.request_type),
+        selectinload(RequestArchive.direction),
+        selectinload(RequestArchive.master),
+        selectinload(RequestArchive.files),
+    )
+    if city_id:
+        query = query.where(RequestArchive.city_id == city_id)
+    if status:
+        query = query.where(RequestArchive.status == status)
+    if master_id:
+        query = query.where(RequestArchive.master_id == master_id)
+
+    result = await db.execute(
+        query.order_by(RequestArchive.id).offset(skip).limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def count_hot_requests(
+    db: AsyncSession,
+    city_id: Optional[int] = None,
+    status: Optional[str] = None,
+    master_id: Optional[int] = None,
+) -> int:
+    """Количество подходящих заявок в горячей таблице (для сквозной пагинации)"""
+    query = select(func.count(Request.id))
+    if city_id:
+        query = query.where(Request.city_id == city_id)
+    if status:
+        query = query.where(Request.status == status)
+    if master_id:
+        query = query.where(Request.master_id == master_id)
+    return (await db.execute(query)).scalar() or 0
+
+
+async def count_hot_transactions(db: AsyncSession) -> int:
+    """Количество транзакций в горячей таблице"""
+    return (await db.execute(select(func.count(Transaction.id)))).scalar() or 0
+
+
+async def search_archived_transactions(
+    db: AsyncSession, skip: int = 0, limit: int = 100
+) -> List[TransactionArchive]:
+    """Список архивных транзакций"""
+    result = await db.execute(
+        select(TransactionArchive)
+        .options(
+            selectinload(TransactionArchive.city),
+            selectinload(TransactionArchive.transaction_type),
+            selectinload(TransactionArchive.files),
+        )
+        .order_by(TransactionArchive.id)
+        .offset(skip)
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+# Создаем глобальный экземпляр
+archive_service = ArchiveService()
+
+
+async def start_archive_service():
+    """Периодическое архивирование старых записей"""
+    logger.info("Starting archive service")
+
+    while True:
+        try:
+            if settings.ARCHIVE_ENABLED:
+                await archive_service.run()
+        except Exception as e:
+            logger.error(f"Error in archive service: {e}")
+
+        await asyncio.sleep(settings.ARCHIVE_INTERVAL_HOURS * 3600)
@@ -1,17 +1,163 @@
 import imaplib
 import email
 import email.header
+import base64
+import hashlib
+import quopri
 import os
 import re
 import logging
 import socket
+import urllib.parse
 from datetime import datetime, timedelta
-from typing import List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import parsedate_to_datetime
 
 from ..core.config import settings
+from ..utils.media_store import media_store
+
+MAILBOX = "INBOX"
+
+# UID за один запрос FETCH BODYSTRUCTURE
+BODYSTRUCTURE_BATCH_SIZE = 100
+
+_IMAP_TOKEN = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+
+
+def _flatten_fetch_response(data: List[Any]) -> bytes:
+    """Ответ FETCH от imaplib в одну строку: литералы {n} становятся строками"""
+    chunks = []
+    for item in data:
+        if isinstance(item, tuple):
+            prefix, literal = item[0], item[1]
+            prefix = re.sub(rb"\{\d+\}$", b"", prefix)
+            escaped = literal.replace(b"\\", b"\\\\").replace(b'"', b'\\"')
+            chunks.append(prefix + b'"' + escaped + b'"')
+        elif isinstance(item, bytes):
+            chunks.append(item)
+    return b" ".join(chunks)
+
+
+def _parse_imap_list(data: bytes) -> List[Any]:
+    """Разбор скобочной записи IMAP (BODYSTRUCTURE) во вложенные списки"""
+    stack: List[List[Any]] = [[]]
+    for match in _IMAP_TOKEN.finditer(data):
+        opened, closed, quoted, atom = match.groups()
+        if opened:
+            stack.append([])
+        elif closed:
+            if len(stack) > 1:
+                finished = stack.pop()
+                stack[-1].append(finished)
+        elif quoted is not None:
+            stack[-1].append(
+                re.sub(rb"\\(.)", rb"\1", quoted).decode("utf-8", "replace")
+            )
+        else:
+            value = atom.decode("utf-8", "replace")
+            stack[-1].append(None if value.upper() == "NIL" else value)
+    return stack[0]
+
+
+def _params(value: Any) -> Dict[str, str]:
+    """Список параметров IMAP ("NAME" "x.mp3" ...) в словарь"""
+    if not isinstance(value, list):
+        return {}
+    return {
+        str(value[i]).lower(): value[i + 1]
+        for i in range(0, len(value) - 1, 2)
+        if isinstance(value[i + 1], str)
+    }
+
+
+def _decode_filename(params: Dict[str, str]) -> Optional[str]:
+    """Имя файла из параметров части (RFC 2231 и RFC 2047)"""
+    for key in ("filename*", "name*"):
+        if key in params:
+            charset, _, encoded = params[key].rpartition("'")
+            charset = charset.split("'")[0] or "utf-8"
+            return urllib.parse.unquote(encoded, encoding=charset, errors="replace")
+    for key in ("filename", "name"):
+        if key in params:
+            return str(
+                email.header.make_header(email.header.decode_header(params[key]))
+            )
+    return None
+
+
+def find_attachment_parts(structure: List[Any], prefix: str = "") -> List[Dict]:
+    """Части письма с именем файла: номер для BODY[n], имя и кодировка"""
+    parts = []
+    if structure and isinstance(structure[0], list):
+        # multipart: вложенные части идут первыми
+        for index, child in enumerate(structure, start=1):
+            if not isinstance(child, list):
+                break
+            number = f"{prefix}.{index}" if prefix else str(index)
+            parts.extend(find_attachment_parts(child, number))
+        return parts
+
+    if len(structure) < 7:
+        return parts
+    params = _params(structure[2])
+    # Расширение disposition ("ATTACHMENT" ("FILENAME" ...)) ищем по форме
+    for field in structure[7:]:
+        if (
+            isinstance(field, list)
+            and len(field) == 2
+            and isinstance(field[0], str)
+            and field[0].upper() in ("ATTACHMENT", "INLINE")
+        ):
+            params = {**params, **_params(field[1])}
+    filename = _decode_filename(params)
+    if filename:
+        parts.append(
+            {
+                "part": prefix or "1",
+                "filename": filename,
+                "encoding": (structure[5] or "7BIT").upper(),
+                "size": int(structure[6]) if str(structure[6]).isdigit() else 0,
+            }
+        )
+    return parts
+
+
+def decode_part(data: bytes, encoding: str) -> bytes:
+    """Декодирование содержимого части по Content-Transfer-Encoding"""
+    if encoding == "BASE64":
+        return base64.b64decode(data)
+    if encoding == "QUOTED-PRINTABLE":
+        return quopri.decodestring(data)
+    return data
+
+
+class _PartDecoder:
+    """Потоковое декодирование части письма, пришедшей несколькими кусками"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self.pending = b""
+
+    def feed(self, data: bytes) -> bytes:
+        if self.encoding == "BASE64":
+            # Декодируем только целые группы по 4 символа
+            data = self.pending + b"".join(data.split())
+            usable = len(data) // 4 * 4
+            self.pending = data[usable:]
+            return base64.b64decode(data[:usable])
+        if self.encoding == "QUOTED-PRINTABLE":
+            # Мягкий перенос "=\r\n" может оказаться на границе куска
+            data = self.pending + data
+            cut = data.rfind(b"\n") + 1
+            self.pending = data[cut:]
+            return quopri.decodestring(data[:cut])
+        return data
+
+    def flush(self) -> bytes:
+        data, self.pending = self.pending, b""
+        return decode_part(data, self.encoding) if data else b""
 
 
 class RamblerEmailClient:
@@ -24,6 +170,16 @@ class RamblerEmailClient:
         self.password = settings.RAMBLER_IMAP_PASSWORD
         self.use_ssl = settings.RAMBLER_IMAP_USE_SSL
         self.connection = None
+        # Состояние синхронизации после последнего download_recordings
+        self.sync_state: Optional[Dict[str, int]] = None
+        self.last_sync_stats: Dict[str, int] = {}
+        # UIDNEXT выбранного ящика: UID, который получит следующее письмо
+        self.uidnext: Optional[int] = None
+
+    @property
+    def mailbox_key(self) -> str:
+        """Ключ состояния синхронизации ящика"""
+        return f"{self.username}@{self.host}/{MAILBOX}"
 
     def connect(self) -> bool:
         """Подключение к IMAP серверу"""
@@ -56,95 +212,121 @@ class RamblerEmailClient:
                 logging.warning(f"Error during IMAP disconnect: {e}")
             self.connection = None
 
-    def search_emails(self, days_back: int = 1) -> List[int]:
-        """Поиск писем с записями звонков за последние дни"""
+    def select_mailbox(self) -> Optional[int]:
+        """Выбор INBOX (только чтение); возвращает UIDVALIDITY
+
+        UIDNEXT из ответа SELECT сохраняется в self.uidnext.
+        """
+        self.uidnext = None
+        status, _ = self.connection.select(MAILBOX, readonly=True)
+        if status != "OK":
+            return None
+        _, data = self.connection.response("UIDNEXT")
+        if data and data[0]:
+            self.uidnext = int(data[0])
+        _, data = self.connection.response("UIDVALIDITY")
+        if not data or not data[0]:
+            return None
+        return int(data[0])
+
+    def search_new_uids(self, last_uid: Optional[int], days_back: int = 1) -> List[int]:
+        """UID писем новее last_uid; без состояния - письма за последние дни"""
         try:
-            if not self.connection:
-                return []
-
-            self.connection.select("INBOX")
-
-            # Ищем письма за последние дни
-            since_date = (datetime.now() - timedelta(days=days_back)).strftime(
-                "%d-%b-%Y"
-            )
-
-            # Поиск писем от Mango Office или с записями звонков
-            search_criteria = [
-                f'(SINCE "{since_date}")',
-                '(FROM "mango")',
-                '(SUBJECT "recording")',
-                '(SUBJECT "запись")',
-                '(SUBJECT "звонок")',
-            ]
-
-            message_ids = []
-            for criteria in search_criteria:
-                try:
-                    status, messages = self.connection.search(None, criteria)
-                    if status == "OK" and messages and messages[0]:
-                        ids = messages[0].split()
-                        message_ids.extend([int(id) for id in ids])
-                except (imaplib.IMAP4.error, ValueError) as e:
-                    logging.warning(
-                        f"Error searching emails with criteria '{criteria}': {e}"
-                    )
-                    continue
-
-            # Убираем дубликаты
-            unique_ids = list(set(message_ids))
-            logging.info(f"RAMBLER: Found {len(unique_ids)} emails")
-            return unique_ids
+            if last_uid is not None:
+                criteria = f"UID {last_uid + 1}:*"
+            else:
+                since_date = (datetime.now() - timedelta(days=days_back)).strftime(
+                    "%d-%b-%Y"
+                )
+                criteria = f'SINCE "{since_date}"'
 
-        except Exception as e:
+            status, messages = self.connection.uid("SEARCH", None, criteria)
+            if status != "OK" or not messages or not messages[0]:
+                return []
+            uids = sorted(int(uid) for uid in messages[0].split())
+            # "N:*" всегда возвращает последнее письмо, даже если оно старое
+            if last_uid is not None:
+                uids = [uid for uid in uids if uid > last_uid]
+            logging.info(f"RAMBLER: Found {len(uids)} new emails")
+            return uids
+
+        except (imaplib.IMAP4.error, ValueError) as e:
             logging.error(f"RAMBLER: Search error: {e}")
             return []
 
-    def get_email_attachments(self, message_id: int) -> List[Tuple[str, bytes]]:
-        """Получение вложений из письма"""
-        try:
-            if not self.connection:
-                return []
-
-            status, message_data = self.connection.fetch(str(message_id), "(RFC822)")
-            if status != "OK" or not message_data or len(message_data) == 0:
-                return []
-
-            raw_email = (
-                message_data[0][1]
-                if message_data[0] and len(message_data[0]) > 1
-                else None
+    def fetch_recording_parts(self, uids: List[int]) -> Dict[int, List[Dict]]:
+        """BODYSTRUCTURE писем пакетами: части-вложения с записями звонков"""
+        recording_parts: Dict[int, List[Dict]] = {}
+        for start in range(0, len(uids), BODYSTRUCTURE_BATCH_SIZE):
+            batch = uids[start : start + BODYSTRUCTURE_BATCH_SIZE]
+            status, data = self.connection.uid(
+                "FETCH", ",".join(str(uid) for uid in batch), "(UID BODYSTRUCTURE)"
             )
-            if not raw_email or not isinstance(raw_email, bytes):
-                return []
-
-            email_message = email.message_from_bytes(raw_email)
+            if status != "OK" or not data:
+                continue
 
-            attachments = []
-
-            for part in email_message.walk():
-                if part.get_content_disposition() == "attachment":
-                    filename = part.get_filename()
-                    if filename:
-                        # Декодируем имя файла если нужно
-                        decoded_header = email.header.decode_header(filename)[0][0]
-                        if isinstance(decoded_header, bytes):
-                            filename = decoded_header.decode("utf-8")
-                        else:
-                            filename = decoded_header
-
-                        # Проверяем, что это запись звонка по формату имени
-                        if self.is_call_recording_filename(filename):
-                            file_data = part.get_payload(decode=True)
-                            if isinstance(file_data, bytes):
-                                attachments.append((filename, file_data))
-                                logging.info(f"RAMBLER: Found recording: {filename}")
-
-            return attachments
-
-        except Exception as e:
-            logging.error(f"RAMBLER: Error getting attachments: {e}")
-            return []
+            # Ответ: порядковый номер и список (UID n BODYSTRUCTURE (...))
+            for item in _parse_imap_list(_flatten_fetch_response(data)):
+                if not isinstance(item, list):
+                    continue
+                fields = {
+                    str(item[i]).upper(): item[i + 1]
+                    for i in range(0, len(item) - 1, 2)
+                }
+                if "UID" not in fields or "BODYSTRUCTURE" not in fields:
+                    continue
+                parts = [
+                    part
+                    for part in find_attachment_parts(fields["BODYSTRUCTURE"])
+                    if self.is_call_recording_filename(part["filename"])
+                ]
+                recording_parts[int(fields["UID"])] = parts
+        return recording_parts
+
+    def fetch_part_to_file(
+        self, uid: int, part: Dict, file_path: str
+    ) -> Tuple[int, str]:
+        """
+        Потоковая загрузка части письма в файл кусками BODY.PEEK[n]<offset.size>
+        (без отметки "прочитано"). Хеш считается по ходу записи.
+        Возвращает размер записанных данных и SHA-256 содержимого.
+        """
+        chunk_size = settings.RECORDINGS_FETCH_CHUNK_BYTES
+        decoder = _PartDecoder(part["encoding"])
+        digest = hashlib.sha256()
+        written = 0
+        offset = 0
+        try:
+            with open(file_path, "wb") as f:
+                while True:
+                    status, data = self.connection.uid(
+                        "FETCH",
+                        str(uid),
+                        f"(BODY.PEEK[{part['part']}]<{offset}.{chunk_size}>)",
+                    )
+                    if status != "OK" or not data:
+                        raise imaplib.IMAP4.error(f"FETCH {uid} failed: {status}")
+                    # За концом части сервер возвращает пустую строку, не литерал
+                    chunk = b""
+                    for item in data:
+                        if isinstance(item, tuple) and len(item) > 1:
+                            chunk = item[1]
+                            break
+                    offset += len(chunk)
+                    last = len(chunk) < chunk_size
+                    decoded = decoder.feed(chunk)
+                    if last:
+                        decoded += decoder.flush()
+                    f.write(decoded)
+                    digest.update(decoded)
+                    written += len(decoded)
+                    if last:
+                        break
+            return written, digest.hexdigest()
+        except BaseException:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
 
     def is_call_recording_filename(self, filename: str) -> bool:
         """Проверка, что файл - это запись звонка по формату имени"""
@@ -183,58 +365,99 @@ class RamblerEmailClient:
 
         return None
 
-    def download_recordings(self, days_back: int = 1) -> List[dict]:
-        """Скачивание записей звонков"""
+    def download_recordings(
+        self, days_back: int = 1, sync_state: Optional[Dict[str, int]] = None
+    ) -> List[dict]:
+        """
+        Скачивание новых записей звонков.
+
+        sync_state - {"uidvalidity", "last_uid"} прошлой синхронизации: берутся
+        только письма с большим UID. Без состояния или при смене UIDVALIDITY
+        просматриваются письма за days_back дней. Новое состояние сохраняется
+        в self.sync_state; если обработанных писем нет, last_uid берется из
+        UIDNEXT - 1, а без него состояние не записывается (None) - нулевой
+        last_uid означал бы повторную загрузку всего ящика.
+
+        Записи возвращаются во временных файлах (spool_path, sha256) для
+        переноса в хранилище media_store.put_file.
+        """
         downloaded_files: List[dict] = []
+        stats = {"messages": 0, "parts": 0, "bytes": 0}
+        self.last_sync_stats = stats
+        self.sync_state = None
 
         try:
             if not self.connect():
                 return downloaded_files
 
-            # Создаем директорию для записей
-            download_path = settings.RECORDINGS_DOWNLOAD_PATH
-            os.makedirs(download_path, exist_ok=True)
+            uidvalidity = self.select_mailbox()
+            last_uid = None
+            if (
+                sync_state
+                and uidvalidity is not None
+                and sync_state.get("uidvalidity") == uidvalidity
+            ):
+                # Нулевой last_uid - не курсор, а отсутствие состояния
+                last_uid = sync_state.get("last_uid") or None
+            elif sync_state:
+                logging.warning("RAMBLER: UIDVALIDITY changed, full resync")
 
-            # Используем текущую рабочую директорию как корень проекта
-            project_root = os.getcwd()
+            download_path = settings.RECORDINGS_DOWNLOAD_PATH
 
-            # Ищем письма
-            message_ids = self.search_emails(days_back)
+            uids = self.search_new_uids(last_uid, days_back)
+            recording_parts = self.fetch_recording_parts(uids) if uids else {}
+            stats["messages"] = len(uids)
 
-            for message_id in message_ids:
-                attachments = self.get_email_attachments(message_id)
+            # Состояние двигается только по непрерывно обработанным UID:
+            # письмо с ошибкой будет просмотрено снова в следующем цикле
+            processed_uid = last_uid
+            advancing = True
 
-                for filename, file_data in attachments:
-                    # Парсим имя файла
+            for uid in uids:
+                message_ok = uid in recording_parts
+                for part in recording_parts.get(uid, []):
+                    filename = part["filename"]
                     file_info = self.parse_recording_filename(filename)
                     if not file_info:
                         continue
 
-                    # Путь для сохранения
-                    file_path = os.path.join(download_path, filename)
-
-                    # Проверяем, не существует ли файл уже
-                    if os.path.exists(file_path):
-                        logging.info(f"RAMBLER: File already exists: {filename}")
-                        continue
-
-                    # Сохраняем файл
+                    # Сохраняем файл кусками во временный файл хранилища;
+                    # в хранилище (по хешу) его переносит RecordingService
                     try:
-                        with open(file_path, "wb") as f:
-                            f.write(file_data)
+                        spool_path = media_store.spool_path(download_path)
+                        size, digest = self.fetch_part_to_file(uid, part, spool_path)
+                        stats["parts"] += 1
+                        stats["bytes"] += size
 
                         # Добавляем информацию о скачанном файле
-                        file_info["file_path"] = file_path
-                        file_info["relative_path"] = os.path.relpath(
-                            file_path, project_root
-                        )
+                        file_info["spool_path"] = spool_path
+                        file_info["sha256"] = digest
                         downloaded_files.append(file_info)
 
                         logging.info(f"RAMBLER: Downloaded recording: {filename}")
 
                     except Exception as e:
+                        message_ok = False
                         logging.error(f"RAMBLER: Error saving file {filename}: {e}")
 
+                advancing = advancing and message_ok
+                if advancing:
+                    processed_uid = uid
+
+            # Окно без писем: все, что уже есть в ящике, считается просмотренным
+            if processed_uid is None and not uids and self.uidnext:
+                processed_uid = self.uidnext - 1 or None
+
+            if uidvalidity is not None and processed_uid is not None:
+                self.sync_state = {
+                    "uidvalidity": uidvalidity,
+                    "last_uid": processed_uid,
+                }
+
+            logging.info(
+                f"RAMBLER: Sync done - {stats['messages']} new emails, "
+                f"{stats['parts']} recordings, {stats['bytes']} bytes"
+            )
             return downloaded_files
 
         except Exception as e:
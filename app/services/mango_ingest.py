@@ -0,0 +1,264 @@
+"""
+Асинхронный прием вебхуков Mango
+
+В режиме MANGO_INGEST_ASYNC вебхук только проверяет подпись, сохраняет
+событие в таблицу mango_webhook_events и сразу отвечает 200 - медленная
+обработка больше не вызывает повторных отправок Mango. Воркеры выбирают
+события пакетами и обрабатывают их тем же кодом, что и синхронный вебхук.
+
+Порядок по номеру телефона: в пакет попадает только самое раннее
+незавершенное событие каждого номера, следующее событие того же номера
+ждет, пока предыдущее будет обработано или окончательно отклонено.
+Ошибка обработки возвращает событие в очередь с экспоненциальной паузой.
+"""
+
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, cast
+
+from sqlalchemy import delete, exists, func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..core.models import MangoWebhookEvent
+from ..core.phone import canonical_phone
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory lock: выборку пакета выполняет один процесс за раз,
+# иначе два процесса могли бы взять события одного номера одновременно
+CLAIM_LOCK_KEY = 804_042
+
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+
+EventHandler = Callable[[AsyncSession, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+def _utc(value: datetime) -> datetime:
+    """SQLite возвращает даты без часового пояса - считаем их UTC"""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+async def enqueue_event(db: AsyncSession, data: Dict[str, Any]) -> int:
+    """Сохранение события вебхука в очередь (с COMMIT)"""
+    now = datetime.now(timezone.utc)
+    event = MangoWebhookEvent(
+        call_id=data.get("call_id"),
+        from_number=canonical_phone((data.get("from") or {}).get("number")),
+        payload=json.dumps(data, ensure_ascii=False),
+        status=PENDING,
+        attempts=0,
+        received_at=now,
+        next_attempt_at=now,
+    )
+    db.add(event)
+    await db.commit()
+    return cast(int, event.id)
+
+
+async def _default_handler(db: AsyncSession, data: Dict[str, Any]) -> Dict[str, Any]:
+    from ..api.mango import handle_call_event
+
+    return await handle_call_event(db, data)
+
+
+class MangoIngestWorker:
+    """Пул воркеров, обрабатывающих очередь вебхуков Mango"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        handler: Optional[EventHandler] = None,
+    ):
+        self.session_factory = session_factory
+        self.handler = handler or _default_handler
+        self.stats: Dict[str, int] = {"processed": 0, "retried": 0, "failed": 0}
+
+    async def claim_batch(self, batch_size: Optional[int] = None) -> List[int]:
+        """Выборка готовых событий (не более одного на номер) со статусом processing"""
+        batch_size = batch_size or settings.MANGO_INGEST_BATCH_SIZE
+        now = datetime.now(timezone.utc)
+        stale_before = now - timedelta(
+            seconds=settings.MANGO_INGEST_CLAIM_TIMEOUT_SECONDS
+        )
+        earlier = aliased(MangoWebhookEvent)
+
+        async with self.session_factory() as db:
+            if db.bind.dialect.name == "postgresql":
+                await db.execute(
+                    text("SELECT pg_advisory_xact_lock(:key)"), {"key": CLAIM_LOCK_KEY}
+                )
+
+            # Событие, не завершенное дольше таймаута, считаем брошенным
+            await db.execute(
+                update(MangoWebhookEvent)
+                .where(
+                    MangoWebhookEvent.status == PROCESSING,
+                    MangoWebhookEvent.claimed_at < stale_before,
+                )
+                .values(status=PENDING)
+            )
+
+            blocked_by_earlier = exists().where(
+                earlier.from_number == MangoWebhookEvent.from_number,
+                earlier.id < MangoWebhookEvent.id,
+                earlier.status.in_([PENDING, PROCESSING]),
+            )
+            result = await db.execute(
+                select(MangoWebhookEvent.id)
+                .where(
+                    MangoWebhookEvent.status == PENDING,
+                    MangoWebhookEvent.next_attempt_at <= now,
+                    ~blocked_by_earlier,
+                )
+                .order_by(MangoWebhookEvent.id)
+                .limit(batch_size)
+            )
+            ids = [row[0] for row in result]
+            if ids:
+                await db.execute(
+                    update(MangoWebhookEvent)
+                    .where(MangoWebhookEvent.id.in_(ids))
+                    .values(status=PROCESSING, claimed_at=now)
+                )
+            await db.commit()
+        return ids
+
+    async def process_event(self, event_id: int) -> str:
+        """Обработка одного события; возвращает итоговый статус"""
+        from ..monitoring.prometheus_metrics import metrics_collector
+
+        async with self.session_factory() as db:
+            event = await db.get(MangoWebhookEvent, event_id)
+            if event is None:
+                return FAILED
+            received_at = _utc(event.received_at)
+            attempts = event.attempts + 1
+            data = json.loads(event.payload)
+
+            try:
+                await self.handler(db, data)
+                error = None
+            except Exception as e:
+                await db.rollback()
+                error = str(e)
+
+        now = datetime.now(timezone.utc)
+        values: Dict[str, Any]
+        if error is None:
+            status, values = DONE, {"processed_at": now, "last_error": None}
+        elif attempts >= settings.MANGO_INGEST_MAX_ATTEMPTS:
+            status, values = FAILED, {"processed_at": now, "last_error": error}
+        else:
+            delay = settings.MANGO_INGEST_RETRY_DELAY_SECONDS * 2 ** (attempts - 1)
+            status, values = PENDING, {
+                "next_attempt_at": now + timedelta(seconds=delay),
+                "last_error": error,
+            }
+
+        async with self.session_factory() as db:
+            await db.execute(
+                update(MangoWebhookEvent)
+                .where(MangoWebhookEvent.id == event_id)
+                .values(status=status, attempts=attempts, claimed_at=None, **values)
+            )
+            await db.commit()
+
+        if status == DONE:
+            self.stats["processed"] += 1
+            metrics_collector.record_mango_ingest(
+                "processed", (now - received_at).total_seconds()
+            )
+        elif status == FAILED:
+            self.stats["failed"] += 1
+            metrics_collector.record_mango_ingest("failed")
+            logger.error(
+                f"Mango event {event_id} failed after {attempts} attempts: {error}"
+            )
+        else:
+            self.stats["retried"] += 1
+            metrics_collector.record_mango_ingest("retried")
+            logger.warning(f"Mango event {event_id} will be retried: {error}")
+        return status
+
+    async def run_once(self, batch_size: Optional[int] = None) -> int:
+        """Один пакет: выборка и параллельная обработка пулом воркеров"""
+        ids = await self.claim_batch(batch_size)
+        if not ids:
+            return 0
+
+        semaphore = asyncio.Semaphore(settings.MANGO_INGEST_WORKERS)
+
+        async def worker(event_id: int):
+            async with semaphore:
+                try:
+                    await self.process_event(event_id)
+                except Exception as e:
+                    # Событие останется в processing и вернется после таймаута
+                    logger.error(f"Error processing mango event {event_id}: {e}")
+
+        await asyncio.gather(*(worker(event_id) for event_id in ids))
+        return len(ids)
+
+    async def queue_depth(self) -> int:
+        """Количество событий, ожидающих обработки"""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(func.count(MangoWebhookEvent.id)).where(
+                    MangoWebhookEvent.status.in_([PENDING, PROCESSING])
+                )
+            )
+            return result.scalar() or 0
+
+    async def purge_processed(self, hours: Optional[int] = None) -> int:
+        """Удаление обработанных событий старше срока хранения"""
+        if hours is None:
+            hours = settings.MANGO_INGEST_RETENTION_HOURS
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
+        async with self.session_factory() as db:
+            result = await db.execute(
+                delete(MangoWebhookEvent).where(
+                    MangoWebhookEvent.status == DONE,
+                    MangoWebhookEvent.processed_at < cutoff,
+                )
+            )
+            await db.commit()
+            return result.rowcount or 0
+
+
+# Создаем глобальный экземпляр
+mango_ingest_worker = MangoIngestWorker()
+
+
+async def start_mango_ingest_workers():
+    """Непрерывная обработка очереди вебхуков Mango"""
+    from ..monitoring.prometheus_metrics import metrics_collector
+
+    logger.info("Starting mango ingest workers")
+    last_purge = 0.0
+    loop = asyncio.get_running_loop()
+
+    while True:
+        processed = 0
+        try:
+            if settings.MANGO_INGEST_ASYNC:
+                processed = await mango_ingest_worker.run_once()
+                metrics_collector.update_mango_queue_depth(
+                    await mango_ingest_worker.queue_depth()
+                )
+                if loop.time() - last_purge > 3600:
+                    await mango_ingest_worker.purge_processed()
+                    last_purge = loop.time()
+        except Exception as e:
+            logger.error(f"Error in mango ingest workers: {e}")
+
+        # Полный пакет - сразу следующий, иначе ждем новых событий
+        if processed < settings.MANGO_INGEST_BATCH_SIZE:
+            await asyncio.sleep(settings.MANGO_INGEST_POLL_SECONDS)
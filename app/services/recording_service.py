@@ -1,12 +1,139 @@
 import asyncio
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import List
+from typing import AsyncIterator, Dict, List, Optional, Tuple, cast
+
+from sqlalchemy import text
 
 from .email_client import rambler_client
-from ..core.database import get_db
-from ..core.crud import link_recording_to_request
+from ..core.database import AsyncSessionLocal, engine, get_db
+from ..core.crud import link_recordings_batch
 from ..core.config import settings
+from ..core.models import MailSyncState
+from ..utils.file_security import get_file_extension
+from ..utils.media_store import blob_key, media_store
+
+# Ключ advisory lock, чтобы почту синхронизировал только один воркер
+SYNC_LOCK_KEY = 804_047
+
+# imaplib и запись файлов блокируют поток - выполняем их вне event loop.
+# Один поток: клиент хранит соединение и состояние, вызовы не пересекаются.
+# Создается при первом вызове: после остановки приложения (и повторного
+# запуска в том же процессе) синхронизация получает новый поток
+_imap_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_imap_executor() -> ThreadPoolExecutor:
+    global _imap_executor
+    if _imap_executor is None:
+        _imap_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="imap-sync"
+        )
+    return _imap_executor
+
+
+def _download(
+    days_back: int, sync_state: Optional[Dict[str, int]]
+) -> Tuple[List[dict], Optional[Dict[str, int]]]:
+    recordings = rambler_client.download_recordings(
+        days_back=days_back, sync_state=sync_state
+    )
+    return recordings, rambler_client.sync_state
+
+
+async def download_recordings(
+    days_back: int, sync_state: Optional[Dict[str, int]] = None
+) -> Tuple[List[dict], Optional[Dict[str, int]]]:
+    """Скачивание записей в потоке IMAP; возвращает файлы и новое состояние"""
+    loop = asyncio.get_running_loop()
+    recordings, new_state = await loop.run_in_executor(
+        _get_imap_executor(), _download, days_back, sync_state
+    )
+    return await store_recordings(recordings), new_state
+
+
+async def store_recordings(recordings: List[dict]) -> List[dict]:
+    """Перенос скачанных записей в хранилище (повторные - без новой копии)"""
+    stored = []
+    for recording_info in recordings:
+        spool_path = recording_info.pop("spool_path")
+        try:
+            file_path, deduplicated = await media_store.put_file(
+                spool_path,
+                settings.RECORDINGS_DOWNLOAD_PATH,
+                recording_info["sha256"],
+                get_file_extension(recording_info["filename"]),
+            )
+        except Exception as e:
+            logging.error(
+                f"RECORDING SERVICE: Error storing {recording_info['filename']}: {e}"
+            )
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+            continue
+        recording_info["file_path"] = file_path
+        recording_info["relative_path"] = blob_key(file_path)
+        recording_info["deduplicated"] = deduplicated
+        stored.append(recording_info)
+    return stored
+
+
+@asynccontextmanager
+async def sync_leader_lock() -> AsyncIterator[bool]:
+    """
+    Лидерство в синхронизации почты: True, если этот процесс взял
+    advisory lock. Без PostgreSQL (SQLite, один процесс) - всегда True.
+    """
+    async with engine.connect() as lock_conn:
+        if lock_conn.dialect.name != "postgresql":
+            yield True
+            return
+        locked = (
+            await lock_conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": SYNC_LOCK_KEY}
+            )
+        ).scalar()
+        await lock_conn.commit()
+        try:
+            yield bool(locked)
+        finally:
+            if locked:
+                await lock_conn.execute(
+                    text("SELECT pg_advisory_unlock(:key)"), {"key": SYNC_LOCK_KEY}
+                )
+                await lock_conn.commit()
+
+
+async def load_sync_state() -> Optional[Dict[str, int]]:
+    """Сохраненное состояние синхронизации почтового ящика"""
+    async with AsyncSessionLocal() as db:
+        state = await db.get(MailSyncState, rambler_client.mailbox_key)
+        if state is None:
+            return None
+        return {
+            "uidvalidity": cast(int, state.uidvalidity),
+            "last_uid": cast(int, state.last_uid),
+        }
+
+
+async def save_sync_state(sync_state: Optional[Dict[str, int]]):
+    """Сохранение состояния; last_uid для того же UIDVALIDITY не уменьшается"""
+    if not sync_state or not sync_state.get("last_uid"):
+        return
+    async with AsyncSessionLocal() as db:
+        state = await db.get(MailSyncState, rambler_client.mailbox_key)
+        if state is None:
+            db.add(MailSyncState(mailbox=rambler_client.mailbox_key, **sync_state))
+        elif (
+            state.uidvalidity != sync_state["uidvalidity"]
+            or state.last_uid < sync_state["last_uid"]
+        ):
+            for field, value in sync_state.items():
+                setattr(state, field, value)
+        await db.commit()
 
 
 class RecordingService:
@@ -21,38 +148,52 @@ class RecordingService:
         linked_count = 0
 
         try:
-            # Скачиваем записи за последний день
-            recordings = rambler_client.download_recordings(days_back=1)
-
-            if not recordings:
-                logging.info("RECORDING SERVICE: No new recordings found")
-                return 0
-
-            # Связываем записи с заявками
-            async for db in get_db():
-                try:
-                    for recording_info in recordings:
-                        request = await link_recording_to_request(db, recording_info)
-                        if request:
-                            linked_count += 1
-                            logging.info(
-                                f"RECORDING SERVICE: Linked {recording_info['filename']} to request {request.id}"
-                            )
-                        else:
-                            logging.warning(
-                                f"RECORDING SERVICE: Could not link {recording_info['filename']}"
-                            )
-
-                    break  # Выходим из цикла после обработки
-
-                except Exception as e:
-                    logging.error(f"RECORDING SERVICE: Database error: {e}")
+            async with sync_leader_lock() as leader:
+                if not leader:
+                    logging.info("RECORDING SERVICE: Sync is running in another worker")
+                    return 0
+                linked_count = await self._sync_and_link()
 
         except Exception as e:
             logging.error(f"RECORDING SERVICE: Error downloading recordings: {e}")
 
         return linked_count
 
+    async def _sync_and_link(self) -> int:
+        linked_count = 0
+
+        # Скачиваем только письма новее последнего обработанного UID
+        sync_state = await load_sync_state()
+        recordings, new_state = await download_recordings(1, sync_state)
+        await save_sync_state(new_state)
+
+        if not recordings:
+            logging.info("RECORDING SERVICE: No new recordings found")
+            return 0
+
+        # Связываем записи с заявками одним пакетом
+        async for db in get_db():
+            try:
+                results = await link_recordings_batch(db, recordings)
+                for result in results:
+                    if result["status"] == "linked":
+                        linked_count += 1
+                        logging.info(
+                            f"RECORDING SERVICE: Linked {result['filename']} to request {result['request_id']}"
+                        )
+                    else:
+                        logging.warning(
+                            f"RECORDING SERVICE: Could not link {result['filename']}: {result['status']}"
+                        )
+
+                break  # Выходим из цикла после обработки
+
+            except Exception as e:
+                await db.rollback()
+                logging.error(f"RECORDING SERVICE: Database error: {e}")
+
+        return linked_count
+
     async def run_periodic_check(self):
         """Периодическая проверка новых записей"""
         while self.is_running:
@@ -95,24 +236,34 @@ class RecordingService:
             start_time = datetime.now()
             linked_count = 0
 
-            # Скачиваем записи
-            recordings = rambler_client.download_recordings(days_back=days_back)
-
-            if recordings:
-                # Связываем с заявками
-                async for db in get_db():
-                    try:
-                        for recording_info in recordings:
-                            request = await link_recording_to_request(
-                                db, recording_info
+            async with sync_leader_lock() as leader:
+                if not leader:
+                    return {
+                        "success": False,
+                        "error": "Recordings sync is running in another worker",
+                        "downloaded_count": 0,
+                        "linked_count": 0,
+                    }
+
+                # Скачиваем записи за days_back дней (повторная проверка окна)
+                recordings, new_state = await download_recordings(days_back)
+                await save_sync_state(new_state)
+
+                link_results = []
+                if recordings:
+                    # Связываем с заявками одним пакетом
+                    async for db in get_db():
+                        try:
+                            link_results = await link_recordings_batch(db, recordings)
+                            break
+                        except Exception as e:
+                            await db.rollback()
+                            logging.error(
+                                f"RECORDING SERVICE: Manual download DB error: {e}"
                             )
-                            if request:
-                                linked_count += 1
-                        break
-                    except Exception as e:
-                        logging.error(
-                            f"RECORDING SERVICE: Manual download DB error: {e}"
-                        )
+                linked_count = sum(
+                    1 for result in link_results if result["status"] == "linked"
+                )
 
             end_time = datetime.now()
             duration = (end_time - start_time).total_seconds()
@@ -123,6 +274,7 @@ class RecordingService:
                 "linked_count": linked_count,
                 "duration_seconds": duration,
                 "recordings": recordings,
+                "link_results": link_results,
             }
 
             logging.info(
@@ -157,5 +309,9 @@ async def start_recording_service():
 
 async def stop_recording_service():
     """Остановка сервиса при завершении приложения"""
+    global _imap_executor
     recording_service.stop()
+    if _imap_executor is not None:
+        _imap_executor.shutdown(wait=False, cancel_futures=True)
+        _imap_executor = None
     logging.info("RECORDING SERVICE: Stopped on shutdown")
@@ -0,0 +1,457 @@
+"""
+Массовый импорт транзакций из выписок (CSV/XLSX)
+
+Строки читаются потоково (пакетами в отдельном потоке, чтобы разбор файла
+не блокировал event loop) и проверяются TransactionValidator; названия
+городов и типов транзакций разрешаются по справочнику в памяти. Валидные
+строки пакетами загружаются через COPY (asyncpg copy_records_to_table) во
+временную staging-таблицу, затем одним INSERT ... SELECT переносятся в
+transactions. По каждой отклоненной строке возвращается ошибка.
+"""
+
+import asyncio
+import csv
+import io
+import logging
+import re
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import CursorResult, Result
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.config import settings
+from ..core.models import City, TransactionType
+from ..validators import TransactionValidator, ValidationError
+
+try:
+    from openpyxl import load_workbook
+
+    HAS_OPENPYXL = True
+except ImportError:
+    HAS_OPENPYXL = False
+
+logger = logging.getLogger(__name__)
+
+STAGING_TABLE = "transaction_import_staging"
+STAGING_COLUMNS = [
+    "row_number",
+    "city_id",
+    "transaction_type_id",
+    "amount",
+    "specified_date",
+    "notes",
+    "payment_reason",
+]
+
+# Сколько ошибок строк возвращать в отчете
+MAX_REPORTED_ERRORS = 1000
+
+# Заголовки колонок выписки -> поля транзакции
+HEADER_ALIASES = {
+    "city": "city",
+    "city_id": "city",
+    "город": "city",
+    "transaction_type": "transaction_type",
+    "transaction_type_id": "transaction_type",
+    "type": "transaction_type",
+    "тип": "transaction_type",
+    "тип транзакции": "transaction_type",
+    "amount": "amount",
+    "сумма": "amount",
+    "specified_date": "specified_date",
+    "date": "specified_date",
+    "дата": "specified_date",
+    "notes": "notes",
+    "примечание": "notes",
+    "комментарий": "notes",
+    "payment_reason": "payment_reason",
+    "основание": "payment_reason",
+    "назначение платежа": "payment_reason",
+}
+
+REQUIRED_FIELDS = ["city", "transaction_type", "amount", "specified_date"]
+
+# Строк выписки, читаемых за один переход в поток
+READ_CHUNK_ROWS = 1000
+
+# Номера дней Excel (система дат 1900): 1 - 01.01.1900, 2958465 - 31.12.9999
+EXCEL_EPOCH = date(1899, 12, 30)
+EXCEL_MIN_SERIAL = 1
+EXCEL_MAX_SERIAL = 2958465
+
+
+def normalize_header(header: Any) -> Optional[str]:
+    if header is None:
+        return None
+    return HEADER_ALIASES.get(str(header).strip().lower())
+
+
+def _rows_from_table(rows: Iterator[Iterable[Any]]) -> Iterator[Dict[str, Any]]:
+    """Словари строк по первой строке-заголовку"""
+    try:
+        header = [normalize_header(cell) for cell in next(rows)]
+    except StopIteration:
+        return
+    missing = [field for field in REQUIRED_FIELDS if field not in header]
+    if missing:
+        raise ValidationError(f"Missing columns: {', '.join(missing)}", "header")
+    for values in rows:
+        row = {
+            field: value
+            for field, value in zip(header, values)
+            if field is not None and value not in (None, "")
+        }
+        if row:
+            yield row
+        else:
+            # Пустая строка: номер все равно занят
+            yield {}
+
+
+def iter_csv_rows(fileobj) -> Iterator[Dict[str, Any]]:
+    """Потоковое чтение CSV (разделитель ',' ';' или табуляция)"""
+    stream = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    sample = stream.read(4096)
+    stream.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    try:
+        yield from _rows_from_table(iter(csv.reader(stream, dialect)))
+    finally:
+        stream.detach()
+
+
+def iter_xlsx_rows(fileobj) -> Iterator[Dict[str, Any]]:
+    """Потоковое чтение первого листа XLSX (read_only режим openpyxl)"""
+    if not HAS_OPENPYXL:
+        raise ValidationError("XLSX import requires openpyxl", "file")
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        yield from _rows_from_table(workbook.active.iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+async def read_in_thread(
+    rows: Iterable[Dict[str, Any]], chunk_size: int = READ_CHUNK_ROWS
+) -> AsyncIterator[Dict[str, Any]]:
+    """Чтение строк пакетами в потоке: разбор CSV/XLSX (openpyxl) не
+    блокирует event loop на время всего файла"""
+    iterator = iter(rows)
+    while True:
+        chunk = await asyncio.to_thread(list, islice(iterator, chunk_size))
+        if not chunk:
+            return
+        for row in chunk:
+            yield row
+
+
+def _normalize_amount(value: Any) -> Decimal:
+    """'1 234,56' -> Decimal('1234.56'); ValidationError для нечисел"""
+    if isinstance(value, str):
+        value = re.sub(r"[\s ]", "", value)
+        if "," in value and "." not in value:
+            value = value.replace(",", ".")
+    elif isinstance(value, bool) or not isinstance(value, (int, float, Decimal)):
+        raise ValidationError(f"Invalid amount: {value!r}", "amount")
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise ValidationError(f"Invalid amount: {value!r}", "amount")
+    if not amount.is_finite():
+        raise ValidationError(f"Invalid amount: {value!r}", "amount")
+    return amount
+
+
+def _normalize_date(value: Any) -> date:
+    """Дата XLSX, номер дня Excel, 'ДД.ММ.ГГГГ' или 'ГГГГ-ММ-ДД' -> date
+
+    Все остальное (пустая ячейка, текст, другие типы) - ValidationError
+    по полю, а не ошибка COPY в колонку DATE NOT NULL.
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # Ячейка без формата даты хранит порядковый номер дня Excel
+        if EXCEL_MIN_SERIAL <= value <= EXCEL_MAX_SERIAL:
+            return EXCEL_EPOCH + timedelta(days=int(value))
+    elif isinstance(value, str):
+        value = value.strip()
+        match = re.fullmatch(r"(\d{2})\.(\d{2})\.(\d{4})", value)
+        if match:
+            day, month, year = match.groups()
+            value = f"{year}-{month}-{day}"
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            pass
+    raise ValidationError(
+        f"Invalid date: {value!r}. Use YYYY-MM-DD or DD.MM.YYYY", "specified_date"
+    )
+
+
+class ReferenceLookup:
+    """Справочник городов и типов транзакций в памяти (по имени или id)"""
+
+    def __init__(self, cities: Dict[str, int], transaction_types: Dict[str, int]):
+        self.cities = cities
+        self.transaction_types = transaction_types
+
+    @classmethod
+    async def load(cls, db: AsyncSession) -> "ReferenceLookup":
+        cities: Result[Any] = await db.execute(select(City.id, City.name))
+        types: Result[Any] = await db.execute(
+            select(TransactionType.id, TransactionType.name)
+        )
+        return cls(
+            {name.strip().casefold(): id_ for id_, name in cities},
+            {name.strip().casefold(): id_ for id_, name in types},
+        )
+
+    @staticmethod
+    def _resolve(values: Dict[str, int], value: Any, field: str) -> int:
+        if isinstance(value, (int, float)) or str(value).strip().isdigit():
+            id_ = int(value)
+            if id_ in values.values():
+                return id_
+        else:
+            by_name = values.get(str(value).strip().casefold())
+            if by_name is not None:
+                return by_name
+        raise ValidationError(f"Unknown {field}: {value}", field)
+
+    def city_id(self, value: Any) -> int:
+        return self._resolve(self.cities, value, "city")
+
+    def transaction_type_id(self, value: Any) -> int:
+        return self._resolve(self.transaction_types, value, "transaction_type")
+
+
+def validate_row(row: Dict[str, Any], lookup: ReferenceLookup) -> Dict[str, Any]:
+    """Проверка строки выписки; ValidationError с полем при ошибке"""
+    for field in REQUIRED_FIELDS:
+        if field not in row:
+            raise ValidationError(f"{field} is required", field)
+
+    data = {
+        "city_id": lookup.city_id(row["city"]),
+        "transaction_type_id": lookup.transaction_type_id(row["transaction_type"]),
+        "amount": _normalize_amount(row["amount"]),
+        "specified_date": _normalize_date(row["specified_date"]),
+    }
+    if "notes" in row:
+        data["notes"] = str(row["notes"])
+    validated = TransactionValidator.validate_transaction_data(data)
+    if "payment_reason" in row:
+        validated["payment_reason"] = str(row["payment_reason"]).strip()[:1000]
+    return validated
+
+
+class TransactionImporter:
+    """Импорт строк выписки через staging-таблицу"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.batch_size = settings.TRANSACTION_IMPORT_BATCH_SIZE
+        self.max_rows = settings.TRANSACTION_IMPORT_MAX_ROWS
+
+    async def _create_staging(self, postgres: bool):
+        await self.db.execute(text(f"DROP TABLE IF EXISTS {STAGING_TABLE}"))
+        await self.db.execute(
+            text(
+                f"""
+                CREATE TEMPORARY TABLE {STAGING_TABLE} (
+                    row_number INTEGER NOT NULL,
+                    city_id INTEGER NOT NULL,
+                    transaction_type_id INTEGER NOT NULL,
+                    amount NUMERIC(10, 2) NOT NULL,
+                    specified_date DATE NOT NULL,
+                    notes TEXT,
+                    payment_reason TEXT
+                ){' ON COMMIT DROP' if postgres else ''}
+                """
+            )
+        )
+
+    async def _load_batch(self, batch: List[Tuple], postgres: bool):
+        """COPY пакета в staging (для других СУБД - executemany)"""
+        if not batch:
+            return
+        if postgres:
+            connection = await self.db.connection()
+            raw = await connection.get_raw_connection()
+            driver = cast(Any, raw.driver_connection)
+            await driver.copy_records_to_table(
+                STAGING_TABLE, records=batch, columns=STAGING_COLUMNS
+            )
+            return
+        await self.db.execute(
+            text(
+                f"INSERT INTO {STAGING_TABLE} ({', '.join(STAGING_COLUMNS)}) "
+                f"VALUES ({', '.join(':' + c for c in STAGING_COLUMNS)})"
+            ),
+            [
+                {
+                    column: (
+                        str(value) if isinstance(value, (Decimal, date)) else value
+                    )
+                    for column, value in zip(STAGING_COLUMNS, record)
+                }
+                for record in batch
+            ],
+        )
+
+    async def _merge(self, skip_existing: bool) -> Tuple[int, List[int]]:
+        """Перенос staging -> transactions; (добавлено, номера дублей)"""
+        exists = """
+            EXISTS (
+                SELECT 1 FROM transactions t
+                WHERE t.city_id = s.city_id
+                  AND t.transaction_type_id = s.transaction_type_id
+                  AND t.amount = s.amount
+                  AND t.specified_date = s.specified_date
+                  AND t.notes IS NOT DISTINCT FROM s.notes
+            )
+        """
+        duplicates: List[int] = []
+        if skip_existing:
+            result = await self.db.execute(
+                text(
+                    f"SELECT row_number FROM {STAGING_TABLE} s "
+                    f"WHERE {exists} ORDER BY row_number"
+                )
+            )
+            duplicates = list(result.scalars())
+
+        inserted = await self.db.execute(
+            text(
+                f"""
+                INSERT INTO transactions (
+                    city_id, transaction_type_id, amount, specified_date,
+                    notes, payment_reason
+                )
+                SELECT city_id, transaction_type_id, amount, specified_date,
+                       notes, payment_reason
+                FROM {STAGING_TABLE} s
+                {f'WHERE NOT {exists}' if skip_existing else ''}
+                ORDER BY row_number
+                """
+            )
+        )
+        return cast(CursorResult, inserted).rowcount, duplicates
+
+    async def run(
+        self,
+        rows: Union[Iterable[Dict[str, Any]], AsyncIterable[Dict[str, Any]]],
+        dry_run: bool = False,
+        skip_existing: bool = True,
+    ) -> Dict[str, Any]:
+        """Проверка и загрузка строк; отчет с ошибками по строкам
+
+        Обычный итератор строк (iter_csv_rows, iter_xlsx_rows) читается в
+        потоке через read_in_thread.
+        """
+        if not isinstance(rows, AsyncIterable):
+            rows = read_in_thread(rows)
+        connection = await self.db.connection()
+        postgres = connection.dialect.name == "postgresql"
+        lookup = await ReferenceLookup.load(self.db)
+        if not dry_run:
+            await self._create_staging(postgres)
+
+        errors: List[Dict[str, Any]] = []
+        error_count = 0
+        valid = 0
+        total = 0
+        batch: List[Tuple] = []
+
+        try:
+            # Строка 1 - заголовок
+            number = 1
+            async for row in rows:
+                number += 1
+                if not row:
+                    continue
+                total += 1
+                if total > self.max_rows:
+                    raise ValidationError(
+                        f"Import is limited to {self.max_rows} rows", "file"
+                    )
+                try:
+                    data = validate_row(row, lookup)
+                except ValidationError as e:
+                    error_count += 1
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append(
+                            {"row": number, "field": e.field, "error": e.message}
+                        )
+                    continue
+
+                valid += 1
+                batch.append(
+                    (
+                        number,
+                        data["city_id"],
+                        data["transaction_type_id"],
+                        data["amount"],
+                        data["specified_date"],
+                        data.get("notes"),
+                        data.get("payment_reason"),
+                    )
+                )
+                if len(batch) >= self.batch_size and not dry_run:
+                    await self._load_batch(batch, postgres)
+                    batch = []
+
+            imported = 0
+            duplicates: List[int] = []
+            if not dry_run:
+                await self._load_batch(batch, postgres)
+                imported, duplicates = await self._merge(skip_existing)
+                if not postgres:
+                    await self.db.execute(text(f"DROP TABLE IF EXISTS {STAGING_TABLE}"))
+                await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+
+        if imported:
+            from ..materialized_views import view_refresher
+
+            # INSERT ... SELECT идет мимо ORM, представления помечаем явно
+            view_refresher.mark_tables_dirty({"transactions"})
+
+        logger.info(
+            f"Transaction import: {total} rows, {imported} imported, "
+            f"{len(duplicates)} duplicates, {error_count} rejected"
+        )
+        return {
+            "dry_run": dry_run,
+            "total_rows": total,
+            "valid_rows": valid,
+            "imported": imported,
+            "skipped_duplicates": duplicates,
+            "failed": error_count,
+            "errors": errors,
+            "errors_truncated": error_count > len(errors),
+        }
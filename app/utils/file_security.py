@@ -2,9 +2,11 @@
 Утилиты для безопасной обработки файлов
 """
 
+import asyncio
 import os
 import hashlib
 import uuid
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, List, Tuple
 from fastapi import UploadFile, HTTPException
@@ -12,6 +14,7 @@ import logging
 import io
 
 from app.core.config import settings
+from app.utils.media_store import media_store
 
 # Импорты с обработкой ошибок
 try:
@@ -81,6 +84,9 @@ AUDIO_MIME_TYPES = {"audio/mpeg", "audio/mp3", "audio/wav", "audio/x-wav", "audi
 # Все разрешенные MIME типы
 ALLOWED_MIME_TYPES = IMAGE_MIME_TYPES | DOCUMENT_MIME_TYPES | AUDIO_MIME_TYPES
 
+# Сколько первых байт файла нужно libmagic для определения типа
+MIME_SNIFF_BYTES = 2048
+
 
 class FileSecurityError(Exception):
     """Исключение для ошибок безопасности файлов"""
@@ -249,9 +255,23 @@ def validate_image_file(file_content: bytes, filename: str) -> bool:
     Raises:
         FileSecurityError: Если изображение повреждено или подозрительно
     """
+    return _validate_image(io.BytesIO(file_content), filename)
+
+
+def validate_image_path(file_path: str, filename: str) -> bool:
+    """
+    Проверка изображения, сохраненного на диск (см. validate_image_file)
+
+    Pillow читает файл сам, содержимое не загружается в память целиком.
+    Блокирующая функция - вызывать в потоке.
+    """
+    return _validate_image(file_path, filename)
+
+
+def _validate_image(source, filename: str) -> bool:
     try:
         # Проверяем, что файл действительно является изображением
-        with Image.open(io.BytesIO(file_content)) as img:
+        with Image.open(source) as img:
             # Проверяем основные параметры
             if img.width <= 0 or img.height <= 0:
                 raise FileSecurityError("Неверные размеры изображения")
@@ -341,6 +361,55 @@ def create_secure_upload_path(upload_dir: str, subfolder: str = "") -> Path:
     return full_path
 
 
+@dataclass
+class SpooledUpload:
+    """Загрузка, записанная во временный файл хранилища"""
+
+    path: str
+    size: int
+    sha256: str
+    head: bytes  # первые байты для определения MIME типа
+
+
+def _write_chunk(f, digest, chunk: bytes):
+    digest.update(chunk)
+    f.write(chunk)
+
+
+async def spool_upload(file: UploadFile, upload_dir: str) -> SpooledUpload:
+    """
+    Потоковая запись загрузки во временный файл.
+
+    Файл читается кусками по UPLOAD_CHUNK_SIZE: хеш считается по ходу
+    записи, лимит размера проверяется до записи очередного куска, в памяти
+    остаются только текущий кусок и первые MIME_SNIFF_BYTES байт.
+
+    Raises:
+        FileSecurityError: Если размер превышает лимит
+    """
+    spooled_path = media_store.spool_path(upload_dir)
+    digest = hashlib.sha256()
+    head = b""
+    size = 0
+    try:
+        with open(spooled_path, "wb") as f:
+            while True:
+                chunk = await file.read(settings.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                validate_file_size(size)
+                if len(head) < MIME_SNIFF_BYTES:
+                    head += chunk[: MIME_SNIFF_BYTES - len(head)]
+                await asyncio.to_thread(_write_chunk, f, digest, chunk)
+    except BaseException:
+        if os.path.exists(spooled_path):
+            os.remove(spooled_path)
+        raise
+
+    return SpooledUpload(spooled_path, size, digest.hexdigest(), head)
+
+
 async def validate_and_save_file(
     file: UploadFile,
     upload_dir: str,
@@ -368,37 +437,42 @@ async def validate_and_save_file(
         if not file.filename:
             raise FileSecurityError("Имя файла не может быть пустым")
 
-        # Читаем содержимое файла
-        file_content = await file.read()
-
-        # Проверяем размер файла
-        validate_file_size(len(file_content))
-
-        # Проверяем расширение файла
+        # Проверяем расширение и заявленный размер до чтения файла
         validate_file_extension(file.filename)
-
-        # Проверяем MIME тип
-        mime_type = validate_mime_type(file_content, file.filename)
-
-        # Дополнительная проверка для изображений
-        if mime_type in IMAGE_MIME_TYPES:
-            validate_image_file(file_content, file.filename)
-
-        # Генерируем безопасное имя файла
-        safe_filename = generate_safe_filename(file.filename)
+        declared_size = getattr(file, "size", None)
+        if declared_size is not None:
+            validate_file_size(declared_size)
 
         # Создаем безопасный путь
         upload_path = create_secure_upload_path(upload_dir, subfolder)
-        file_path = upload_path / safe_filename
 
-        # Сохраняем файл
-        with open(file_path, "wb") as f:
-            f.write(file_content)
+        # Записываем файл кусками во временный файл рядом с хранилищем
+        spooled = await spool_upload(file, str(upload_path))
+        try:
+            # Проверяем MIME тип по первым байтам
+            mime_type = validate_mime_type(spooled.head, file.filename)
 
-        # Получаем хеш файла
-        file_hash = get_file_hash(file_content)
+            # Дополнительная проверка для изображений (Pillow - в потоке)
+            if mime_type in IMAGE_MIME_TYPES:
+                await asyncio.to_thread(
+                    validate_image_path, spooled.path, file.filename
+                )
 
-        logger.info(f"Файл успешно сохранен: {file_path}")
+            # Переносим файл в хранилище по хешу содержимого: повторная
+            # загрузка того же файла добавляет ссылку, а не новую копию
+            file_hash = spooled.sha256
+            extension = get_file_extension(sanitize_filename(file.filename))
+            file_path, deduplicated = await media_store.put_file(
+                spooled.path, str(upload_path), file_hash, extension
+            )
+        finally:
+            if os.path.exists(spooled.path):
+                os.remove(spooled.path)
+
+        logger.info(
+            f"Файл успешно сохранен: {file_path}"
+            + (" (дубликат)" if deduplicated else "")
+        )
 
         return str(file_path), file.filename, file_hash
 
@@ -409,17 +483,24 @@ async def validate_and_save_file(
         raise HTTPException(status_code=500, detail="Ошибка сохранения файла")
 
 
-def delete_file_safely(file_path: str) -> bool:
+async def delete_file_safely(file_path: str) -> bool:
     """
     Безопасное удаление файла
 
+    Файл из хранилища (media_blobs) удаляется с диска только вместе с
+    последней ссылкой на него.
+
     Args:
         file_path: Путь к файлу
 
     Returns:
-        True если файл успешно удален
+        True если ссылка на файл (или сам файл) успешно удалена
     """
     try:
+        released = await media_store.release(file_path)
+        if released is not None:
+            return True
+
         path = Path(file_path)
         if path.exists() and path.is_file():
             path.unlink()
@@ -0,0 +1,198 @@
+"""
+Контентно-адресуемое хранилище медиафайлов
+
+Файл сохраняется по SHA-256 содержимого: <каталог>/<ab>/<cd>/<sha256>.<ext>.
+Одинаковые чеки и повторно пересланные записи звонков занимают место на
+диске один раз. Каталог (gorod/rashod, zayvka/zapis, ...) остается частью
+пути, поэтому правила доступа по пути в file_access продолжают работать.
+
+Файл сначала пишется во временный файл в <каталог>/.tmp на той же файловой
+системе и переименовывается на место атомарно - читатель никогда не видит
+недописанный файл. Число ссылок на каждый файл хранится в media_blobs;
+файл удаляется с диска, только когда исчезает последняя ссылка.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.core.database import AsyncSessionLocal
+from app.core.models import MediaBlob
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR = ".tmp"
+
+
+def blob_key(path: str) -> str:
+    """Ключ ссылки: путь относительно рабочего каталога приложения"""
+    return os.path.relpath(os.path.abspath(path))
+
+
+class MediaStore:
+    """Хранилище файлов с дедупликацией по содержимому и счетчиком ссылок"""
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+
+    def spool_path(self, directory: str, suffix: str = ".part") -> str:
+        """Новый временный файл на той же файловой системе, что и хранилище"""
+        spool_dir = Path(directory) / SPOOL_DIR
+        spool_dir.mkdir(parents=True, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=spool_dir, suffix=suffix)
+        os.close(fd)
+        return path
+
+    @staticmethod
+    def blob_path(directory: str, digest: str, extension: str = "") -> str:
+        """Шардированный путь файла по хешу содержимого"""
+        name = f"{digest}.{extension}" if extension else digest
+        return os.path.join(directory, digest[:2], digest[2:4], name)
+
+    async def _acquire(self, key: str, digest: str, size: int) -> int:
+        """Плюс одна ссылка на файл; возвращает новое число ссылок"""
+        async with self.session_factory() as db:
+            connection = await db.connection()
+            dialect_insert = (
+                postgresql.insert
+                if connection.dialect.name == "postgresql"
+                else sqlite.insert
+            )
+            statement = dialect_insert(MediaBlob.__table__).values(
+                path=key, sha256=digest, size_bytes=size, ref_count=1
+            )
+            result = await db.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["path"],
+                    set_={"ref_count": MediaBlob.__table__.c.ref_count + 1},
+                ).returning(MediaBlob.__table__.c.ref_count)
+            )
+            ref_count = result.scalar()
+            await db.commit()
+            return ref_count
+
+    async def put_file(
+        self, spooled_path: str, directory: str, digest: str, extension: str = ""
+    ) -> Tuple[str, bool]:
+        """
+        Перенос записанного временного файла в хранилище.
+
+        Ссылка учитывается до проверки файла на диске: удаление последней
+        ссылки параллельно с сохранением либо завершится раньше (и файл
+        будет записан заново), либо увидит новую ссылку и не удалит файл.
+
+        Returns:
+            Кортеж (путь к файлу, был ли файл уже в хранилище)
+        """
+        path = self.blob_path(directory, digest, extension)
+        size = os.path.getsize(spooled_path)
+        await self._acquire(blob_key(path), digest, size)
+
+        if os.path.exists(path):
+            os.remove(spooled_path)
+            deduplicated = True
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(spooled_path, path)
+            deduplicated = False
+
+        from app.monitoring.prometheus_metrics import metrics_collector
+
+        metrics_collector.record_media_store_write(
+            "deduplicated" if deduplicated else "new"
+        )
+        return path, deduplicated
+
+    async def put_bytes(
+        self,
+        content: bytes,
+        directory: str,
+        extension: str = "",
+        digest: Optional[str] = None,
+    ) -> Tuple[str, bool]:
+        """Сохранение содержимого из памяти (см. put_file)"""
+        digest = digest or hashlib.sha256(content).hexdigest()
+        spooled_path = self.spool_path(directory)
+        try:
+            with open(spooled_path, "wb") as f:
+                f.write(content)
+            return await self.put_file(spooled_path, directory, digest, extension)
+        except BaseException:
+            if os.path.exists(spooled_path):
+                os.remove(spooled_path)
+            raise
+
+    async def release(self, path: str) -> Optional[bool]:
+        """
+        Минус одна ссылка на файл.
+
+        Returns:
+            True - удалена последняя ссылка и файл; False - ссылки остались;
+            None - путь не из хранилища
+        """
+        key = blob_key(path)
+        table = MediaBlob.__table__
+        async with self.session_factory() as db:
+            # Строка остается заблокированной до COMMIT: параллельное
+            # сохранение того же файла дождется удаления
+            result = await db.execute(
+                update(table)
+                .where(table.c.path == key)
+                .values(ref_count=table.c.ref_count - 1)
+                .returning(table.c.ref_count)
+            )
+            ref_count = result.scalar()
+            if ref_count is None:
+                await db.rollback()
+                return None
+            if ref_count > 0:
+                await db.commit()
+                return False
+
+            await db.execute(delete(table).where(table.c.path == key))
+            if os.path.exists(path):
+                os.remove(path)
+            await db.commit()
+            logger.info(f"Файл удален из хранилища: {path}")
+            return True
+
+    async def stats(self) -> Dict[str, Any]:
+        """Размер хранилища и экономия от дедупликации"""
+        async with self.session_factory() as db:
+            row = (
+                await db.execute(
+                    select(
+                        func.count(MediaBlob.path),
+                        func.coalesce(func.sum(MediaBlob.ref_count), 0),
+                        func.coalesce(func.sum(MediaBlob.size_bytes), 0),
+                        func.coalesce(
+                            func.sum(MediaBlob.size_bytes * MediaBlob.ref_count), 0
+                        ),
+                    )
+                )
+            ).one()
+        blobs, references, stored_bytes, logical_bytes = (int(value) for value in row)
+
+        from app.monitoring.prometheus_metrics import metrics_collector
+
+        metrics_collector.update_file_storage_usage(stored_bytes)
+        return {
+            "blobs": blobs,
+            "references": references,
+            "stored_bytes": stored_bytes,
+            "logical_bytes": logical_bytes,
+            "saved_bytes": logical_bytes - stored_bytes,
+            "dedup_ratio": (
+                round(logical_bytes / stored_bytes, 3) if stored_bytes else 1.0
+            ),
+        }
+
+
+# Создаем глобальный экземпляр
+media_store = MediaStore()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк горячих запросов с кешем prepared statements и без него
+
+Пример:
+    python scripts/benchmark_statement_cache.py --iterations 2000 --modes disabled direct pgbouncer
+"""
+import asyncio
+import argparse
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Добавляем путь к app модулю
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app.core.config import settings
+from app.core.database import StatementCacheStats, create_database_engine
+from app.core.models import City, Employee, Master, Request
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Запросы, которые выполняются практически на каждом HTTP-запросе
+HOT_QUERIES = {
+    "principal_master": lambda: select(Master)
+    .options(selectinload(Master.city))
+    .where(Master.id == 1),
+    "principal_employee": lambda: select(Employee)
+    .options(selectinload(Employee.role), selectinload(Employee.city))
+    .where(Employee.id == 1),
+    "request_by_id": lambda: select(Request).where(Request.id == 1),
+    "cities_list": lambda: select(City).order_by(City.name),
+}
+
+
+def percentile(samples, pct: float) -> float:
+    """Перцентиль в миллисекундах"""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index] * 1000
+
+
+async def benchmark_mode(mode: str, iterations: int, warmup: int) -> dict:
+    """Прогон всех горячих запросов в одном режиме кеша"""
+    settings.DB_STATEMENT_CACHE_MODE = mode
+    engine = create_database_engine(
+        settings.DATABASE_URL, pool_size=1, max_overflow=0, name=f"bench_{mode}"
+    )
+    results = {}
+
+    try:
+        async with engine.connect() as conn:
+            for name, build_query in HOT_QUERIES.items():
+                for _ in range(warmup):
+                    await conn.execute(build_query())
+
+                samples = []
+                for _ in range(iterations):
+                    started = time.perf_counter()
+                    await conn.execute(build_query())
+                    samples.append(time.perf_counter() - started)
+
+                results[name] = {
+                    "p50_ms": round(percentile(samples, 50), 3),
+                    "p99_ms": round(percentile(samples, 99), 3),
+                    "mean_ms": round(statistics.mean(samples) * 1000, 3),
+                }
+    finally:
+        await engine.dispose()
+
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Prepared statement cache benchmark")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=["disabled", "direct", "pgbouncer"],
+        default=["disabled", "direct"],
+    )
+    args = parser.parse_args()
+
+    report = {}
+    for mode in args.modes:
+        logger.info(f"Benchmarking statement cache mode: {mode}")
+        report[mode] = await benchmark_mode(mode, args.iterations, args.warmup)
+
+    header = f"{'query':<22}" + "".join(
+        f"{mode + ' p50':>16}{mode + ' p99':>16}" for mode in args.modes
+    )
+    print(header)
+    print("-" * len(header))
+    for name in HOT_QUERIES:
+        row = f"{name:<22}"
+        for mode in args.modes:
+            row += f"{report[mode][name]['p50_ms']:>16.3f}"
+            row += f"{report[mode][name]['p99_ms']:>16.3f}"
+        print(row)
+
+    print()
+    print(f"Statement cache: {StatementCacheStats.get_stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
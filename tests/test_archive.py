@@ -0,0 +1,115 @@
+"""
+Тесты архивирования заявок и транзакций
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import func, select
+
+from app.core.models import (
+    City,
+    File,
+    FileArchive,
+    Request,
+    RequestArchive,
+    RequestType,
+    Transaction,
+    TransactionArchive,
+    TransactionType,
+)
+from app.services.archive_service import (
+    ArchiveService,
+    get_archived_request,
+    get_archived_transaction,
+    search_archived_requests,
+)
+from tests.conftest import TestingSessionLocal
+
+
+async def _create_records(db_session):
+    city = City(name="Архивный город")
+    request_type = RequestType(name="Архивный тип")
+    transaction_type = TransactionType(name="Расход")
+    db_session.add_all([city, request_type, transaction_type])
+    await db_session.commit()
+
+    old = datetime.now(timezone.utc) - timedelta(days=400)
+    closed = Request(
+        city_id=city.id,
+        request_type_id=request_type.id,
+        client_phone="+79990000001",
+        status="Готово",
+        created_at=old,
+    )
+    still_open = Request(
+        city_id=city.id,
+        request_type_id=request_type.id,
+        client_phone="+79990000002",
+        status="В работе",
+        created_at=old,
+    )
+    recent = Request(
+        city_id=city.id,
+        request_type_id=request_type.id,
+        client_phone="+79990000003",
+        status="Готово",
+    )
+    transaction = Transaction(
+        city_id=city.id,
+        transaction_type_id=transaction_type.id,
+        amount=Decimal("100.00"),
+        specified_date=date(2025, 1, 1),
+        created_at=old,
+    )
+    db_session.add_all([closed, still_open, recent, transaction])
+    await db_session.commit()
+
+    db_session.add(File(request_id=closed.id, file_type="bso", file_path="bso.jpg"))
+    await db_session.commit()
+    return closed, still_open, recent, transaction
+
+
+class TestArchiveService:
+    """Тесты переноса записей в архив"""
+
+    async def test_moves_closed_old_records_in_batches(self, db_session):
+        closed, still_open, recent, transaction = await _create_records(db_session)
+
+        service = ArchiveService(session_factory=TestingSessionLocal)
+        totals = await service.run(days=365, batch_size=1)
+
+        assert totals == {"requests": 1, "transactions": 1}
+
+        hot_ids = set((await db_session.execute(select(Request.id))).scalars())
+        assert hot_ids == {still_open.id, recent.id}
+        assert (await db_session.execute(select(func.count(File.id)))).scalar() == 0
+        assert (
+            await db_session.execute(select(func.count(Transaction.id)))
+        ).scalar() == 0
+
+        archived_file = (await db_session.execute(select(FileArchive))).scalar_one()
+        assert archived_file.request_id == closed.id
+
+        archived_ids = set(
+            (await db_session.execute(select(TransactionArchive.id))).scalars()
+        )
+        assert archived_ids == {transaction.id}
+
+    async def test_transparent_reads(self, db_session):
+        closed, _, _, transaction = await _create_records(db_session)
+        await ArchiveService(session_factory=TestingSessionLocal).run(days=365)
+
+        request = await get_archived_request(db_session, closed.id)
+        assert isinstance(request, RequestArchive)
+        assert request.client_phone == "+79990000001"
+        assert request.city.name == "Архивный город"
+        assert [f.file_path for f in request.files] == ["bso.jpg"]
+
+        archived_transaction = await get_archived_transaction(
+            db_session, transaction.id
+        )
+        assert archived_transaction.amount == Decimal("100.00")
+
+        found = await search_archived_requests(db_session, status="Готово")
+        assert [r.id for r in found] == [closed.id]
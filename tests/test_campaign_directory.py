@@ -0,0 +1,81 @@
+"""
+Тесты справочника рекламных кампаний по номеру линии
+"""
+
+from sqlalchemy import update
+
+from app.core import crud
+from app.core.cache import cache_manager
+from app.core.campaign_directory import CampaignDirectory, campaign_directory
+from app.core.config import settings
+from app.core.models import AdvertisingCampaign, City
+from app.core.schemas import AdvertisingCampaignCreate, AdvertisingCampaignUpdate
+
+
+async def _city(db_session):
+    city = City(name="Город РК")
+    db_session.add(city)
+    await db_session.commit()
+    return city
+
+
+class TestCampaignDirectory:
+    """Тесты поиска кампании без запросов к БД"""
+
+    async def test_lookup_by_any_phone_format(self, db_session):
+        city = await _city(db_session)
+        created = await crud.create_advertising_campaign(
+            db_session,
+            AdvertisingCampaignCreate(
+                city_id=city.id, name="РК Авито", phone_number="8 (495) 000-00-01"
+            ),
+        )
+
+        for phone in ("74950000001", "+7 495 000 00 01", "4950000001"):
+            campaign = await crud.get_advertising_campaign_by_phone(db_session, phone)
+            assert campaign.id == created.id
+            assert campaign.city_id == city.id
+        assert await crud.get_advertising_campaign_by_phone(db_session, "1") is None
+
+    async def test_update_is_visible_immediately(self, db_session):
+        city = await _city(db_session)
+        created = await crud.create_advertising_campaign(
+            db_session,
+            AdvertisingCampaignCreate(
+                city_id=city.id, name="РК", phone_number="74950000002"
+            ),
+        )
+        await crud.update_advertising_campaign(
+            db_session,
+            created.id,
+            AdvertisingCampaignUpdate(phone_number="74950000003"),
+        )
+
+        assert await campaign_directory.find_by_phone(db_session, "74950000002") is None
+        moved = await campaign_directory.find_by_phone(db_session, "74950000003")
+        assert moved.id == created.id
+
+    async def test_other_process_reloads_on_version_change(
+        self, db_session, monkeypatch
+    ):
+        monkeypatch.setattr(settings, "CAMPAIGN_DIRECTORY_SYNC_SECONDS", 0)
+        cache_manager.local_cache.clear()
+        city = await _city(db_session)
+        db_session.add(
+            AdvertisingCampaign(city_id=city.id, name="РК", phone_number="74950000004")
+        )
+        await db_session.commit()
+
+        other = CampaignDirectory()
+        await other.load(db_session)
+        assert await other.find_by_phone(db_session, "74950000004") is not None
+
+        # Изменение в другом процессе: строка и версия в общем кеше
+        await db_session.execute(
+            update(AdvertisingCampaign).values(phone_number="74950000005")
+        )
+        await db_session.commit()
+        assert await other.find_by_phone(db_session, "74950000005") is None
+
+        await campaign_directory.changed(db_session)
+        assert await other.find_by_phone(db_session, "74950000005") is not None
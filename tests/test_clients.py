@@ -0,0 +1,83 @@
+"""
+Тесты справочника клиентов
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import update
+
+from app.core import crud
+from app.core.models import City, Client, RequestType
+from app.core.schemas import RequestCreate
+
+
+@pytest.fixture
+async def references(db_session):
+    city = City(name="Город клиентов")
+    request_type = RequestType(name="Тип клиентов")
+    db_session.add_all([city, request_type])
+    await db_session.commit()
+    return city, request_type
+
+
+async def _create(db_session, references, phone="79991234567"):
+    city, request_type = references
+    return await crud.create_request(
+        db_session,
+        RequestCreate(
+            city_id=city.id, request_type_id=request_type.id, client_phone=phone
+        ),
+    )
+
+
+class TestClientDirectory:
+    """Тесты учета клиентов при создании заявок"""
+
+    async def test_counters_updated_on_create(self, db_session, references):
+        assert await crud.check_client_first_time(db_session, "79991234567")
+
+        first = await _create(db_session, references)
+        second = await _create(db_session, references)
+
+        client = await crud.get_client(db_session, "79991234567")
+        assert client.request_count == 2
+        assert client.last_request_id == second.id
+        assert client.first_seen <= client.last_request_at
+        assert not await crud.check_client_first_time(db_session, "79991234567")
+
+        existing = await crud.get_existing_new_request_by_phone(
+            db_session, "79991234567"
+        )
+        assert existing.id == second.id
+        assert first.id != second.id
+
+    async def test_duplicate_window(self, db_session, references):
+        await _create(db_session, references)
+        client = await crud.get_client(db_session, "79991234567")
+        assert crud.client_has_recent_request(client)
+
+        await db_session.execute(
+            update(Client).values(
+                last_request_at=datetime.now(timezone.utc) - timedelta(hours=1)
+            )
+        )
+        await db_session.commit()
+
+        client = await crud.get_client(db_session, "79991234567")
+        assert not crud.client_has_recent_request(client)
+        assert (
+            await crud.get_existing_new_request_by_phone(db_session, "79991234567")
+            is None
+        )
+
+    async def test_recent_requests_history(self, db_session, references):
+        for _ in range(3):
+            await _create(db_session, references)
+        await _create(db_session, references, phone="79990000000")
+
+        history = await crud.get_client_recent_requests(
+            db_session, "79991234567", limit=2
+        )
+        assert len(history) == 2
+        assert {row["status"] for row in history} == {"Новая"}
@@ -0,0 +1,258 @@
+"""
+Тесты инкрементальной синхронизации почты с записями звонков
+"""
+
+import asyncio
+import base64
+import hashlib
+import re
+import time
+
+from app.core.config import settings
+from app.services.email_client import (
+    RamblerEmailClient,
+    find_attachment_parts,
+    _parse_imap_list,
+)
+
+RECORDING = "2025.07.15__11-03-07__79173250913__79923298774.mp3"
+
+
+def _structure(filename: str) -> bytes:
+    return (
+        b'(("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 10 1 NIL NIL NIL)'
+        b'("AUDIO" "MPEG" ("NAME" "' + filename.encode() + b'") NIL NIL "BASE64" 8 '
+        b'NIL ("ATTACHMENT" ("FILENAME" "' + filename.encode() + b'")) NIL) "MIXED")'
+    )
+
+
+class FakeIMAP:
+    """IMAP-сервер с письмами {uid: имя вложения}"""
+
+    def __init__(
+        self,
+        messages,
+        uidvalidity=7,
+        content=b"audio",
+        delay=0.0,
+        window=None,
+        broken=(),
+    ):
+        self.messages = messages
+        self.uidvalidity = uidvalidity
+        # UID писем, попадающих в окно SINCE (по умолчанию все)
+        self.window = window
+        # UID писем, загрузка вложений которых падает
+        self.broken = set(broken)
+        self.body = base64.encodebytes(content).replace(b"\n", b"\r\n")
+        self.delay = delay
+        self.commands = []
+
+    def login(self, username, password):
+        pass
+
+    def select(self, mailbox, readonly=False):
+        return "OK", [b"1"]
+
+    def response(self, code):
+        if code == "UIDNEXT":
+            return code, [str(max(self.messages, default=0) + 1).encode()]
+        return code, [str(self.uidvalidity).encode()]
+
+    def uid(self, command, *args):
+        self.commands.append((command, args[-1]))
+        if command == "SEARCH":
+            criteria = args[-1]
+            uids = sorted(self.messages)
+            if criteria.startswith("UID "):
+                start = int(criteria[4:].split(":")[0])
+                # Как настоящий сервер: "N:*" всегда включает последнее письмо
+                uids = [uid for uid in uids if uid >= start] or uids[-1:]
+            elif self.window is not None:
+                uids = sorted(self.window)
+            return "OK", [" ".join(str(uid) for uid in uids).encode()]
+        if command == "FETCH" and "BODYSTRUCTURE" in args[-1]:
+            data = [
+                f"{uid} (UID {uid} BODYSTRUCTURE ".encode()
+                + _structure(self.messages[uid])
+                + b")"
+                for uid in (int(value) for value in args[0].split(","))
+            ]
+            return "OK", data
+        # Частичная загрузка BODY.PEEK[n]<offset.size>
+        if int(args[0]) in self.broken:
+            raise OSError("connection reset")
+        time.sleep(self.delay)
+        offset, size = map(int, re.search(r"<(\d+)\.(\d+)>", args[-1]).groups())
+        chunk = self.body[offset : offset + size]
+        if not chunk:
+            return "OK", [b'1 (UID 10 BODY[2]<%d> "")' % offset]
+        header = b"1 (UID 10 BODY[2]<%d> {%d}" % (offset, len(chunk))
+        return "OK", [(header, chunk), b")"]
+
+    def close(self):
+        pass
+
+    def logout(self):
+        pass
+
+
+def _client(monkeypatch, tmp_path, server):
+    # RECORDINGS_DOWNLOAD_PATH - свойство класса настроек, подменяем его
+    monkeypatch.setattr(
+        type(settings), "RECORDINGS_DOWNLOAD_PATH", property(lambda self: str(tmp_path))
+    )
+    client = RamblerEmailClient()
+    client.username, client.password = "user", "secret"
+    monkeypatch.setattr(
+        client, "connect", lambda: setattr(client, "connection", server) or True
+    )
+    return client
+
+
+class TestBodyStructure:
+    """Тесты разбора BODYSTRUCTURE"""
+
+    def test_attachment_parts_are_found(self):
+        structure = _parse_imap_list(_structure(RECORDING))[0]
+        parts = find_attachment_parts(structure)
+        assert parts == [
+            {"part": "2", "filename": RECORDING, "encoding": "BASE64", "size": 8}
+        ]
+
+
+class TestIncrementalSync:
+    """Тесты синхронизации по UID"""
+
+    def test_only_new_uids_are_downloaded(self, monkeypatch, tmp_path):
+        server = FakeIMAP({10: RECORDING, 11: RECORDING.replace("11-03", "12-03")})
+        client = _client(monkeypatch, tmp_path, server)
+
+        files = client.download_recordings(
+            sync_state={"uidvalidity": 7, "last_uid": 10}
+        )
+
+        assert [f["filename"] for f in files] == [server.messages[11]]
+        assert client.sync_state == {"uidvalidity": 7, "last_uid": 11}
+        with open(files[0]["spool_path"], "rb") as f:
+            assert f.read() == b"audio"
+
+        # Повторный запуск: "12:*" вернет письмо 11, но оно уже обработано
+        assert client.download_recordings(sync_state=client.sync_state) == []
+        assert client.sync_state["last_uid"] == 11
+
+    def test_uidvalidity_change_triggers_window_resync(self, monkeypatch, tmp_path):
+        server = FakeIMAP({3: RECORDING}, uidvalidity=8)
+        client = _client(monkeypatch, tmp_path, server)
+
+        files = client.download_recordings(
+            sync_state={"uidvalidity": 7, "last_uid": 500}
+        )
+
+        assert len(files) == 1
+        assert server.commands[0][1].startswith("SINCE")
+        assert client.sync_state == {"uidvalidity": 8, "last_uid": 3}
+
+    def test_empty_window_without_state_starts_at_uidnext(self, monkeypatch, tmp_path):
+        server = FakeIMAP({10: RECORDING, 11: RECORDING}, window=[])
+        client = _client(monkeypatch, tmp_path, server)
+
+        assert client.download_recordings(sync_state=None) == []
+
+        # Старые письма не перечитываются: следующий цикл ищет "12:*"
+        assert client.sync_state == {"uidvalidity": 7, "last_uid": 11}
+
+    def test_failed_first_message_without_state_keeps_no_cursor(
+        self, monkeypatch, tmp_path
+    ):
+        server = FakeIMAP(
+            {10: RECORDING, 11: RECORDING.replace("11-03", "12-03")}, broken={10}
+        )
+        client = _client(monkeypatch, tmp_path, server)
+
+        files = client.download_recordings(sync_state=None)
+
+        assert [f["filename"] for f in files] == [server.messages[11]]
+        # Курсора нет, следующий цикл снова просмотрит окно SINCE
+        assert client.sync_state is None
+
+    def test_zero_last_uid_is_not_a_cursor(self, monkeypatch, tmp_path):
+        server = FakeIMAP({10: RECORDING}, window=[])
+        client = _client(monkeypatch, tmp_path, server)
+
+        client.download_recordings(sync_state={"uidvalidity": 7, "last_uid": 0})
+
+        assert server.commands[0][1].startswith("SINCE")
+        assert client.sync_state == {"uidvalidity": 7, "last_uid": 10}
+
+
+class TestStreamingDownload:
+    """Тесты потоковой загрузки вложений"""
+
+    def test_attachment_is_written_in_chunks(self, monkeypatch, tmp_path):
+        content = bytes(range(256)) * 40
+        server = FakeIMAP({10: RECORDING}, content=content)
+        client = _client(monkeypatch, tmp_path, server)
+        monkeypatch.setattr(settings, "RECORDINGS_FETCH_CHUNK_BYTES", 1000)
+
+        files = client.download_recordings(sync_state=None)
+
+        assert len(files) == 1
+        with open(files[0]["spool_path"], "rb") as f:
+            assert f.read() == content
+        assert files[0]["sha256"] == hashlib.sha256(content).hexdigest()
+        # Часть читается кусками по 1000 байт подряд, без полного BODY[2]
+        chunk_fetches = [c[1] for c in server.commands if "BODY.PEEK" in c[1]]
+        assert chunk_fetches == [
+            f"(BODY.PEEK[2]<{offset}.1000>)"
+            for offset in range(0, len(server.body) + 1, 1000)
+        ]
+        assert client.last_sync_stats["bytes"] == len(content)
+
+    async def test_sync_does_not_block_event_loop(
+        self, db_session, monkeypatch, tmp_path
+    ):
+        from app.monitoring.event_loop_monitor import EventLoopMonitor
+        from app.services import recording_service
+        from tests.conftest import TestingSessionLocal
+
+        server = FakeIMAP({10: RECORDING}, delay=0.3)
+        client = _client(monkeypatch, tmp_path, server)
+        monkeypatch.setattr(recording_service, "rambler_client", client)
+        monkeypatch.setattr(
+            recording_service.media_store, "session_factory", TestingSessionLocal
+        )
+
+        monitor = EventLoopMonitor()
+        download = asyncio.ensure_future(recording_service.download_recordings(1))
+        while not download.done():
+            await monitor.sample(0.05)
+
+        files, state = await download
+        assert len(files) == 1
+        with open(files[0]["file_path"], "rb") as f:
+            assert f.read() == b"audio"
+        assert state == {"uidvalidity": 7, "last_uid": 10}
+        # Блокирующий FETCH длится 0.3 с, но event loop продолжает работать:
+        # замеры идут все это время, и ни один не задержан на время FETCH
+        assert len(monitor.samples) >= 4
+        assert monitor.max_lag < 0.2
+
+    async def test_sync_works_after_service_restart(
+        self, db_session, monkeypatch, tmp_path
+    ):
+        from app.services import recording_service
+        from tests.conftest import TestingSessionLocal
+
+        client = _client(monkeypatch, tmp_path, FakeIMAP({10: RECORDING}))
+        monkeypatch.setattr(recording_service, "rambler_client", client)
+        monkeypatch.setattr(
+            recording_service.media_store, "session_factory", TestingSessionLocal
+        )
+
+        # Остановка приложения завершает поток IMAP; следующий запуск
+        # в том же процессе должен получить новый
+        await recording_service.stop_recording_service()
+        files, _ = await recording_service.download_recordings(1)
+
+        assert len(files) == 1
@@ -0,0 +1,157 @@
+"""
+Тесты повтора POST по Idempotency-Key
+"""
+
+import asyncio
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from httpx import ASGITransport, AsyncClient
+
+from app.core.cache import cache_manager
+from app.core.config import settings
+from app.core.idempotency import IdempotencyMiddleware
+from app.monitoring.prometheus_metrics import metrics_collector
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+async def client(calls):
+    app = FastAPI()
+    app.add_middleware(IdempotencyMiddleware)
+
+    @app.post("/items/")
+    async def create_item(request: Request):
+        payload = await request.json()
+        calls.append(payload)
+        await asyncio.sleep(payload.get("delay", 0))
+        return JSONResponse(
+            status_code=payload.get("status", 201), content={"id": len(calls)}
+        )
+
+    cache_manager.local_cache.clear()
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        yield client
+    cache_manager.local_cache.clear()
+
+
+def _headers(key, token="user-1"):
+    return {"Idempotency-Key": key, "Authorization": f"Bearer {token}"}
+
+
+class TestIdempotencyKey:
+    """Тесты сохранения и повтора ответа"""
+
+    async def test_retry_replays_response(self, client, calls):
+        first = await client.post("/items/", json={"a": 1}, headers=_headers("k1"))
+        second = await client.post("/items/", json={"a": 1}, headers=_headers("k1"))
+
+        assert len(calls) == 1
+        assert second.status_code == first.status_code == 201
+        assert second.json() == first.json()
+        assert second.headers["idempotent-replayed"] == "true"
+        assert "idempotent-replayed" not in first.headers
+
+    async def test_without_key_not_deduplicated(self, client, calls):
+        await client.post("/items/", json={"a": 1})
+        await client.post("/items/", json={"a": 1})
+
+        assert len(calls) == 2
+
+    async def test_key_reused_with_other_body(self, client, calls):
+        await client.post("/items/", json={"a": 1}, headers=_headers("k2"))
+        response = await client.post("/items/", json={"a": 2}, headers=_headers("k2"))
+
+        assert response.status_code == 422
+        assert len(calls) == 1
+
+    async def test_concurrent_duplicate_waits(self, client, calls):
+        responses = await asyncio.gather(
+            *[
+                client.post("/items/", json={"delay": 0.2}, headers=_headers("k3"))
+                for _ in range(3)
+            ]
+        )
+
+        assert len(calls) == 1
+        assert {r.json()["id"] for r in responses} == {1}
+        assert sum("idempotent-replayed" in r.headers for r in responses) == 2
+
+    async def test_server_error_not_stored(self, client, calls):
+        await client.post("/items/", json={"status": 503}, headers=_headers("k4"))
+        await client.post("/items/", json={"status": 503}, headers=_headers("k4"))
+
+        assert len(calls) == 2
+
+    async def test_keys_scoped_by_user(self, client, calls):
+        await client.post("/items/", json={"a": 1}, headers=_headers("k5", "user-1"))
+        await client.post("/items/", json={"a": 1}, headers=_headers("k5", "user-2"))
+
+        assert len(calls) == 2
+
+    async def test_cache_error_runs_without_dedup(self, client, calls, monkeypatch):
+        class BrokenRedis:
+            async def set(self, *args, **kwargs):
+                raise ConnectionError("redis down")
+
+            get = delete = setex = set
+
+        monkeypatch.setattr(cache_manager, "redis_client", BrokenRedis())
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        first = await client.post("/items/", json={"a": 1}, headers=_headers("k6"))
+        second = await client.post("/items/", json={"a": 1}, headers=_headers("k6"))
+
+        # Без Redis запрос выполняется сразу, а не ждет ключ до 409
+        assert first.status_code == second.status_code == 201
+        assert "idempotent-replayed" not in second.headers
+        assert len(calls) == 2
+        assert loop.time() - started < 1
+
+    async def test_long_request_keeps_claim(self, client, calls, monkeypatch):
+        monkeypatch.setattr(settings, "IDEMPOTENCY_LOCK_TTL", 1)
+
+        async def retry():
+            # Повтор приходит, когда исходная отметка уже истекла бы
+            await asyncio.sleep(1.2)
+            return await client.post(
+                "/items/", json={"delay": 1.5}, headers=_headers("k7")
+            )
+
+        first, second = await asyncio.gather(
+            client.post("/items/", json={"delay": 1.5}, headers=_headers("k7")),
+            retry(),
+        )
+
+        assert len(calls) == 1
+        assert second.json() == first.json()
+        assert second.headers["idempotent-replayed"] == "true"
+
+    async def test_metric_labels_use_route_template(self, client, monkeypatch):
+        class BrokenRedis:
+            async def set(self, *args, **kwargs):
+                raise ConnectionError("redis down")
+
+        recorded = []
+        monkeypatch.setattr(cache_manager, "redis_client", BrokenRedis())
+        monkeypatch.setattr(
+            metrics_collector,
+            "record_idempotency",
+            lambda endpoint, result: recorded.append((endpoint, result)),
+        )
+
+        await client.post("/items/", json={"a": 1}, headers=_headers("k8"))
+        await client.post("/random/a1b2c3/", json={}, headers=_headers("k9"))
+
+        assert recorded == [
+            ("/items/", "cache_unavailable"),
+            ("unmatched", "cache_unavailable"),
+        ]
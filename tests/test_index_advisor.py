@@ -0,0 +1,193 @@
+"""
+Тесты советника по индексам
+"""
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.index_advisor import (
+    IndexAdvisor,
+    IndexInfo,
+    analyze_indexes,
+    declared_indexes,
+    parse_index_definition,
+    render_migration,
+    seq_scan_filters,
+    suggest_missing_indexes,
+)
+
+
+class TestIndexAnalysis:
+    """Тесты поиска дублирующих, избыточных и неиспользуемых индексов"""
+
+    def test_declared_duplicates_found(self):
+        findings = {f.index: f for f in analyze_indexes(declared_indexes())}
+
+        duplicate = findings["idx_requests_phone_created_v2"]
+        assert duplicate.kind == "duplicate"
+        assert duplicate.covered_by == "idx_requests_phone_created"
+        assert findings["idx_requests_phone_time_window_v2"].kind == "duplicate"
+        assert "idx_requests_phone_created" not in findings
+
+    def test_left_prefix_is_redundant(self):
+        indexes = [
+            IndexInfo("idx_a", "requests", ("city_id",), scans=10),
+            IndexInfo("idx_ab", "requests", ("city_id", "status"), scans=10),
+            IndexInfo(
+                "idx_partial", "requests", ("city_id",), predicate="x > 0", scans=0
+            ),
+        ]
+
+        findings = analyze_indexes(indexes, stats_age_days=30)
+
+        assert [(f.kind, f.index, f.covered_by) for f in findings] == [
+            ("redundant", "idx_a", "idx_ab"),
+            ("unused", "idx_partial", None),
+        ]
+
+    def test_unique_index_never_dropped(self):
+        indexes = [
+            IndexInfo("requests_pkey", "requests", ("id",), primary=True, scans=0),
+            IndexInfo("idx_id", "requests", ("id",), scans=5),
+        ]
+
+        findings = analyze_indexes(indexes)
+
+        assert [f.index for f in findings] == ["idx_id"]
+
+    def test_parse_index_definition(self):
+        method, columns, predicate = parse_index_definition(
+            "CREATE INDEX idx ON public.requests USING btree "
+            "(client_phone, created_at DESC) WHERE (status)::text = 'Новая'::text"
+        )
+
+        assert method == "btree"
+        assert columns == ("client_phone", "created_at DESC")
+        assert predicate == "(status)::text = 'Новая'::text"
+
+    def test_parse_expression_index_definition(self):
+        method, columns, predicate = parse_index_definition(
+            "CREATE INDEX idx ON public.requests USING btree "
+            "(lower((client_name)::text), COALESCE(city_id, 0), created_at DESC) "
+            "INCLUDE (status) WHERE (master_id IS NOT NULL)"
+        )
+
+        assert method == "btree"
+        assert columns == (
+            "lower((client_name)::text)",
+            "COALESCE(city_id, 0)",
+            "created_at DESC",
+        )
+        assert predicate == "(master_id IS NOT NULL)"
+
+    def test_unused_requires_old_statistics(self):
+        indexes = [IndexInfo("idx_status", "requests", ("status",), scans=0)]
+
+        # Сразу после сброса статистики или рестарта сканов нет ни у кого
+        assert analyze_indexes(indexes) == []
+        assert analyze_indexes(indexes, stats_age_days=0.5) == []
+        assert [f.index for f in analyze_indexes(indexes, stats_age_days=30)] == [
+            "idx_status"
+        ]
+
+    def test_foreign_key_index_never_unused(self):
+        indexes = [
+            IndexInfo("idx_files_request_id", "files", ("request_id",), scans=0),
+            IndexInfo(
+                "idx_requests_master_status",
+                "requests",
+                ("master_id", "status"),
+                scans=0,
+            ),
+            IndexInfo("idx_requests_status", "requests", ("status",), scans=0),
+        ]
+        foreign_keys = [("files", ("request_id",)), ("requests", ("master_id",))]
+
+        findings = analyze_indexes(
+            indexes, stats_age_days=30, foreign_keys=foreign_keys
+        )
+
+        assert [f.index for f in findings] == ["idx_requests_status"]
+
+
+class TestMissingIndexes:
+    """Тесты предложений по недостающим индексам"""
+
+    def test_seq_scan_filter_suggestion(self):
+        plan = [
+            {
+                "Plan": {
+                    "Node Type": "Limit",
+                    "Plans": [
+                        {
+                            "Node Type": "Seq Scan",
+                            "Relation Name": "files",
+                            "Filter": "(request_id = 1)",
+                        }
+                    ],
+                }
+            }
+        ]
+
+        filters = [
+            (table, columns, "request_files")
+            for table, columns in seq_scan_filters(plan)
+        ]
+        suggestions = suggest_missing_indexes(filters, [])
+
+        assert len(suggestions) == 1
+        assert suggestions[0].definition == (
+            "CREATE INDEX idx_files_request_id ON files (request_id)"
+        )
+        assert suggestions[0].sources == ["request_files"]
+
+        indexed = [IndexInfo("idx_files_request_id", "files", ("request_id",))]
+        assert suggest_missing_indexes(filters, indexed) == []
+
+
+class TestMigration:
+    """Тесты генерации миграции"""
+
+    def test_render_migration(self):
+        indexes = [
+            IndexInfo(
+                "idx_a",
+                "requests",
+                ("city_id",),
+                definition="CREATE INDEX idx_a ON requests (city_id)",
+            ),
+            IndexInfo("idx_ab", "requests", ("city_id", "status")),
+            IndexInfo(
+                "idx_t",
+                "transactions",
+                ("amount",),
+                definition="CREATE INDEX idx_t ON transactions (amount)",
+                scans=0,
+            ),
+        ]
+
+        migration = render_migration(
+            analyze_indexes(indexes, stats_age_days=30),
+            down_revision="004",
+            partitioned_tables={"requests"},
+        )
+
+        assert 'down_revision = "004"' in migration
+        assert "op.execute('DROP INDEX IF EXISTS idx_a')" in migration
+        assert "DROP INDEX CONCURRENTLY IF EXISTS idx_t" in migration
+        assert "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_t" in migration
+        compile(migration, "migration.py", "exec")
+
+    async def test_report_from_declared_indexes(self, tmp_path):
+        advisor = IndexAdvisor()
+        advisor.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'advisor.db'}"
+        )
+
+        try:
+            report = await advisor.build_report(down_revision="004")
+        finally:
+            await advisor.engine.dispose()
+
+        assert report["source"] == "declared"
+        assert report["summary"]["duplicate"] >= 2
+        assert "idx_requests_phone_created_v2" in report["migration"]
@@ -0,0 +1,170 @@
+"""
+Тесты фоновой сборки индексов
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.database_indexes import PERFORMANCE_INDEXES
+from app.index_builder import IndexBuilder, IndexSpec, partition_index_name
+
+
+class TestIndexSpec:
+    """Тесты построения DDL"""
+
+    def test_spec_from_declared_index(self):
+        index = next(i for i in PERFORMANCE_INDEXES if i.name == "idx_masters_active")
+
+        spec = IndexSpec.from_index(index)
+
+        assert spec.table == "masters"
+        assert spec.body == "(city_id, status) WHERE status = 'active'"
+        assert spec.create_sql() == (
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_masters_active "
+            "ON masters (city_id, status) WHERE status = 'active'"
+        )
+
+    def test_spec_for_partitioned_parent(self):
+        spec = IndexSpec.from_definition(
+            "CREATE UNIQUE INDEX idx ON public.requests USING btree (id, created_at)"
+        )
+
+        assert spec.unique
+        assert spec.create_sql(concurrently=False, only=True) == (
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx ON ONLY requests "
+            "USING btree (id, created_at)"
+        )
+
+    def test_partition_index_name_fits_identifier(self):
+        assert partition_index_name("requests_p2026_10", "idx_a") == (
+            "requests_p2026_10_idx_a"
+        )
+        long_name = partition_index_name("requests_p2026_10", "idx_" + "x" * 60)
+        assert len(long_name) == 63
+        assert long_name != partition_index_name("requests_p2026_11", "idx_" + "x" * 60)
+
+
+class TestIndexBuildJob:
+    """Тесты фоновой задачи сборки"""
+
+    async def test_job_builds_indexes_and_reports_state(self, tmp_path):
+        builder = IndexBuilder()
+        builder.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'indexes.db'}"
+        )
+        specs = [
+            IndexSpec("idx_items_name", "items", "(name)"),
+            IndexSpec("idx_missing_table", "missing", "(name)"),
+        ]
+
+        try:
+            async with builder.engine.begin() as conn:
+                await conn.execute(text("CREATE TABLE items (id INTEGER, name TEXT)"))
+
+            job = await builder.start_job(specs)
+            assert job["status"] == "pending"
+            await asyncio.gather(*builder._tasks)
+
+            state = await builder.get_job(job["id"])
+            assert state["status"] == "failed"
+            assert state["done"] == 2
+            assert state["indexes"] == {
+                "idx_items_name": "created",
+                "idx_missing_table": "failed",
+            }
+            assert "idx_missing_table" in state["errors"]
+
+            async with builder.engine.connect() as conn:
+                names = (
+                    await conn.execute(
+                        text("SELECT name FROM sqlite_master WHERE type = 'index'")
+                    )
+                ).scalars()
+                assert "idx_items_name" in set(names)
+        finally:
+            await builder.engine.dispose()
+
+    async def test_unknown_job(self):
+        assert await IndexBuilder().get_job("missing") is None
+
+
+class FakeCatalogConnection:
+    """Соединение с заготовленными ответами каталога PostgreSQL"""
+
+    def __init__(self, invalid, partitions, attached):
+        self.invalid = invalid
+        self.partitions = partitions
+        self.attached = attached
+        self.statements = []
+
+    async def execute(self, statement, params=None):
+        sql = " ".join(str(statement).split())
+        self.statements.append(sql)
+        if "pg_get_indexdef" in sql:
+            rows = self.invalid
+        elif "pg_partitioned_table" in sql:
+            rows = [(1,)]
+        elif "AS partition" in sql:
+            rows = self.attached
+        elif "SELECT c.relname FROM pg_inherits" in sql:
+            rows = [(name,) for name in self.partitions]
+        else:
+            rows = []
+        return FakeResult(rows)
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+    def scalar(self):
+        return self.rows[0][0] if self.rows else None
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class TestRebuildInvalidIndexes:
+    """Тесты восстановления невалидных индексов"""
+
+    async def test_partitioned_parent_gets_missing_partitions(self):
+        definition = (
+            "CREATE INDEX idx_trgm ON ONLY public.requests "
+            "USING gin (client_phone gin_trgm_ops)"
+        )
+        conn = FakeCatalogConnection(
+            invalid=[
+                SimpleNamespace(name="idx_trgm", definition=definition, relkind="p")
+            ],
+            partitions=["requests_p2026_09", "requests_p2026_10", "requests_p2026_11"],
+            attached=[
+                SimpleNamespace(
+                    partition="requests_p2026_09", name="p09_trgm", indisvalid=True
+                ),
+                SimpleNamespace(
+                    partition="requests_p2026_10", name="p10_trgm", indisvalid=False
+                ),
+            ],
+        )
+
+        assert await IndexBuilder().rebuild_invalid_indexes(conn) == ["idx_trgm"]
+
+        # Индексы, которые сейчас строятся, не трогаются
+        assert "pg_stat_progress_create_index" in conn.statements[0]
+        ddl = [
+            sql
+            for sql in conn.statements
+            if sql.startswith(("CREATE", "ALTER INDEX", "REINDEX", "DROP"))
+        ]
+        assert ddl == [
+            "REINDEX INDEX CONCURRENTLY p10_trgm",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS requests_p2026_11_idx_trgm "
+            "ON requests_p2026_11 USING gin (client_phone gin_trgm_ops)",
+            "ALTER INDEX idx_trgm ATTACH PARTITION requests_p2026_11_idx_trgm",
+        ]
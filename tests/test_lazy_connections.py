@@ -0,0 +1,112 @@
+"""
+Тесты ленивого получения и раннего возврата соединений
+"""
+
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.api.users import read_masters
+from app.core.auth import check_permissions, get_current_active_user
+from app.core.database import Base, InstrumentedQueuePool, release_connection
+from app.core.models import City
+
+
+@pytest.fixture
+async def session_factory(tmp_path):
+    pool_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'lazy.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+    )
+    async with pool_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    yield pool_engine, async_sessionmaker(
+        pool_engine, class_=AsyncSession, expire_on_commit=False
+    )
+    await pool_engine.dispose()
+
+
+class TestLazyConnections:
+    """Тесты использования пула сессией"""
+
+    async def test_session_without_queries_uses_no_connection(self, session_factory):
+        pool_engine, factory = session_factory
+
+        async with factory() as session:
+            assert pool_engine.pool.checkedout() == 0
+            assert await release_connection(session) is False
+
+    async def test_release_after_read(self, session_factory):
+        pool_engine, factory = session_factory
+
+        async with factory() as session:
+            session.add(City(name="Москва"))
+            await session.commit()
+
+            city = (await session.execute(select(City))).scalar_one()
+            assert pool_engine.pool.checkedout() == 1
+
+            assert await release_connection(session) is True
+            assert pool_engine.pool.checkedout() == 0
+            # Загруженные объекты остаются доступными
+            assert city.name == "Москва"
+
+    async def test_uncommitted_writes_are_kept(self, session_factory):
+        pool_engine, factory = session_factory
+
+        async with factory() as session:
+            session.add(City(name="Казань"))
+            await session.flush()
+
+            assert await release_connection(session) is False
+            assert pool_engine.pool.checkedout() == 1
+
+            await session.rollback()
+            assert await release_connection(session) is False
+
+
+class TestEarlyRelease:
+    """Тесты возврата соединения в зависимостях и read-only эндпоинтах"""
+
+    async def test_permission_denied_releases_connection(self, session_factory):
+        pool_engine, factory = session_factory
+        manager = SimpleNamespace(role=SimpleNamespace(name="manager"))
+
+        async with factory() as session:
+            await session.execute(select(City))
+            assert pool_engine.pool.checkedout() == 1
+
+            with pytest.raises(HTTPException) as exc_info:
+                await check_permissions(["admin"])(current_user=manager, db=session)
+
+            assert exc_info.value.status_code == 403
+            assert pool_engine.pool.checkedout() == 0
+
+    async def test_inactive_user_releases_connection(self, session_factory):
+        pool_engine, factory = session_factory
+        user = SimpleNamespace(status="inactive")
+
+        async with factory() as session:
+            await session.execute(select(City))
+
+            with pytest.raises(HTTPException):
+                await get_current_active_user(current_user=user, db=session)
+
+            assert pool_engine.pool.checkedout() == 0
+
+    async def test_list_endpoint_releases_before_serialization(self, session_factory):
+        pool_engine, factory = session_factory
+
+        async with factory() as session:
+            response = await read_masters(
+                skip=0, limit=10, db=session, current_user=None
+            )
+
+            assert response.status_code == 200
+            assert pool_engine.pool.checkedout() == 0
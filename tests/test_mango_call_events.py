@@ -0,0 +1,160 @@
+"""
+Тесты идемпотентности вебхука Mango по call_id
+"""
+
+import hashlib
+import hmac
+import json
+import urllib.parse
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import func, select
+
+from app.api import mango
+from app.core import crud
+from app.core.cache import cache_manager
+from app.core.campaign_directory import campaign_directory
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.models import (
+    AdvertisingCampaign,
+    City,
+    MangoCallEvent,
+    Request,
+    RequestType,
+)
+
+
+def _event(call_id, from_number="79991234567"):
+    return {
+        "json": json.dumps(
+            {
+                "call_id": call_id,
+                "call_state": "Disconnected",
+                "from": {"number": from_number},
+                "to": {"number": "74950000000", "line_number": "74950000000"},
+            }
+        )
+    }
+
+
+@pytest.fixture
+async def client(db_session):
+    city = City(name="Город Mango")
+    db_session.add(city)
+    await db_session.commit()
+    db_session.add_all(
+        [
+            AdvertisingCampaign(
+                city_id=city.id, name="РК Mango", phone_number="74950000000"
+            ),
+            RequestType(name="Впервые"),
+            RequestType(name="Повтор"),
+        ]
+    )
+    await db_session.commit()
+    await campaign_directory.load(db_session)
+
+    app = FastAPI()
+    app.include_router(mango.router, prefix="/mango")
+
+    async def override_get_db():
+        yield db_session
+
+    app.dependency_overrides[get_db] = override_get_db
+    cache_manager.local_cache.clear()
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        yield client
+    cache_manager.local_cache.clear()
+
+
+async def _count(db_session, model):
+    return (await db_session.execute(select(func.count()).select_from(model))).scalar()
+
+
+class TestCallEventClaim:
+    """Тесты регистрации call_id в БД"""
+
+    async def test_second_claim_rejected(self, db_session):
+        assert await crud.claim_call_event(db_session, "call-1", "79990000000")
+        await db_session.commit()
+
+        assert not await crud.claim_call_event(db_session, "call-1", "79990000000")
+        assert await _count(db_session, MangoCallEvent) == 1
+
+
+class TestMangoWebhook:
+    """Тесты повторов события вебхука"""
+
+    async def test_repeated_event_creates_one_request(self, client, db_session):
+        first = await client.post("/mango/webhook", data=_event("call-2"))
+        request_id = first.json()["request_id"]
+
+        event = await db_session.get(MangoCallEvent, "call-2")
+        assert event.request_id == request_id
+
+        # Быстрый путь: ответ из Redis без обращения к БД
+        second = await client.post("/mango/webhook", data=_event("call-2"))
+        assert "request_id" not in second.json()
+
+        # Ключ в Redis потерян - повтор отклоняет первичный ключ в БД
+        cache_manager.local_cache.clear()
+        third = await client.post("/mango/webhook", data=_event("call-2"))
+        assert str(request_id) in third.json()["detail"]
+        assert await _count(db_session, Request) == 1
+
+    async def test_same_phone_call_linked_to_request(self, client, db_session):
+        first = await client.post("/mango/webhook", data=_event("call-3"))
+        await client.post("/mango/webhook", data=_event("call-4"))
+
+        event = await db_session.get(MangoCallEvent, "call-4")
+        assert event.request_id == first.json()["request_id"]
+        assert await _count(db_session, Request) == 1
+
+    async def test_cache_error_falls_through_to_db_claim(
+        self, client, db_session, monkeypatch
+    ):
+        class BrokenRedis:
+            async def set(self, *args, **kwargs):
+                raise ConnectionError("redis down")
+
+            get = delete = setex = set
+
+        monkeypatch.setattr(cache_manager, "redis_client", BrokenRedis())
+
+        first = await client.post("/mango/webhook", data=_event("call-5"))
+        second = await client.post("/mango/webhook", data=_event("call-5"))
+
+        # Без Redis событие не теряется, а повтор отклоняет первичный ключ в БД
+        request_id = first.json()["request_id"]
+        assert str(request_id) in second.json()["detail"]
+        assert await _count(db_session, Request) == 1
+
+
+class TestWebhookSignature:
+    """Тесты проверки подписи вебхука"""
+
+    async def test_signature_checked_against_body(self, client, monkeypatch):
+        monkeypatch.setattr(settings, "MANGO_WEBHOOK_SECRET", "mango-secret")
+        body = urllib.parse.urlencode(_event("call-6")).encode()
+        signature = hmac.new(b"mango-secret", body, hashlib.sha256).hexdigest()
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+
+        forged = await client.post(
+            "/mango/webhook",
+            content=body,
+            headers={**headers, "X-Signature": "0" * 64},
+        )
+        signed = await client.post(
+            "/mango/webhook",
+            content=body,
+            headers={**headers, "X-Signature": f"sha256={signature}"},
+        )
+
+        assert forged.status_code == 403
+        assert signed.status_code == 200
+        assert "request_id" in signed.json()
@@ -0,0 +1,140 @@
+"""
+Тесты очереди вебхуков Mango
+"""
+
+import json
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import func, select
+
+from app.api import mango
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.models import MangoWebhookEvent
+from app.services.mango_ingest import MangoIngestWorker, enqueue_event
+from tests.conftest import TestingSessionLocal
+
+
+def _data(call_id, from_number="79991234567", call_state="Disconnected"):
+    return {
+        "call_id": call_id,
+        "call_state": call_state,
+        "from": {"number": from_number},
+        "to": {"number": "74950000000", "line_number": "74950000000"},
+    }
+
+
+class RecordingHandler:
+    """Обработчик, запоминающий порядок событий и падающий по запросу"""
+
+    def __init__(self, failing=()):
+        self.calls = []
+        self.failing = set(failing)
+
+    async def __call__(self, db, data):
+        self.calls.append(data["call_id"])
+        if data["call_id"] in self.failing:
+            raise RuntimeError("database is unavailable")
+        return {"ok": True}
+
+
+@pytest.fixture
+def async_ingest(monkeypatch):
+    monkeypatch.setattr(settings, "MANGO_INGEST_ASYNC", True)
+    monkeypatch.setattr(settings, "MANGO_INGEST_RETRY_DELAY_SECONDS", 0)
+    # Тестовая SQLite - одно соединение на все сессии
+    monkeypatch.setattr(settings, "MANGO_INGEST_WORKERS", 1)
+
+
+class TestWebhookIngestion:
+    """Тесты приема события в очередь"""
+
+    async def test_final_event_is_queued_without_processing(
+        self, db_session, async_ingest
+    ):
+        app = FastAPI()
+        app.include_router(mango.router, prefix="/mango")
+
+        async def override_get_db():
+            yield db_session
+
+        app.dependency_overrides[get_db] = override_get_db
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            queued = await client.post(
+                "/mango/webhook", data={"json": json.dumps(_data("call-1"))}
+            )
+            skipped = await client.post(
+                "/mango/webhook",
+                data={"json": json.dumps(_data("call-1", call_state="Appeared"))},
+            )
+
+        assert queued.status_code == 200
+        assert queued.json()["queued"] is True
+        assert "queued" not in skipped.json()
+
+        event = await db_session.get(MangoWebhookEvent, queued.json()["event_id"])
+        assert event.status == "pending"
+        assert event.from_number == "+79991234567"
+        assert json.loads(event.payload)["call_id"] == "call-1"
+
+
+class TestIngestWorker:
+    """Тесты обработки очереди"""
+
+    async def test_events_of_one_phone_are_processed_in_order(
+        self, db_session, async_ingest
+    ):
+        await enqueue_event(db_session, _data("call-1", "79990000001"))
+        await enqueue_event(db_session, _data("call-2", "79990000002"))
+        await enqueue_event(db_session, _data("call-3", "79990000001"))
+
+        handler = RecordingHandler()
+        worker = MangoIngestWorker(TestingSessionLocal, handler)
+
+        # Второе событие номера ждет завершения первого
+        assert await worker.run_once() == 2
+        assert handler.calls == ["call-1", "call-2"]
+        assert await worker.run_once() == 1
+        assert handler.calls[-1] == "call-3"
+        assert await worker.queue_depth() == 0
+
+    async def test_failed_event_is_retried_and_blocks_phone(
+        self, db_session, async_ingest, monkeypatch
+    ):
+        monkeypatch.setattr(settings, "MANGO_INGEST_MAX_ATTEMPTS", 2)
+        first_id = await enqueue_event(db_session, _data("call-1"))
+        await enqueue_event(db_session, _data("call-2"))
+
+        handler = RecordingHandler(failing={"call-1"})
+        worker = MangoIngestWorker(TestingSessionLocal, handler)
+
+        await worker.run_once()
+        await worker.run_once()
+        assert handler.calls == ["call-1", "call-1"]
+        assert worker.stats == {"processed": 0, "retried": 1, "failed": 1}
+
+        async with TestingSessionLocal() as db:
+            event = await db.get(MangoWebhookEvent, first_id)
+            assert event.status == "failed"
+            assert event.attempts == 2
+            assert "unavailable" in event.last_error
+
+        # Окончательно отклоненное событие больше не блокирует номер
+        await worker.run_once()
+        assert handler.calls[-1] == "call-2"
+
+    async def test_processed_events_are_purged(self, db_session, async_ingest):
+        await enqueue_event(db_session, _data("call-1"))
+        worker = MangoIngestWorker(TestingSessionLocal, RecordingHandler())
+        await worker.run_once()
+
+        assert await worker.purge_processed(hours=1) == 0
+        assert await worker.purge_processed(hours=-1) == 1
+        count = await db_session.execute(
+            select(func.count()).select_from(MangoWebhookEvent)
+        )
+        assert count.scalar() == 0
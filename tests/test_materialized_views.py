@@ -0,0 +1,78 @@
+"""
+Тесты обновления материализованных представлений
+"""
+
+import time
+from datetime import date, timedelta
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.models import City, RequestType
+from app.core.optimized_crud import OptimizedRequestCRUD
+from app.materialized_views import (
+    MaterializedViewRefresher,
+    freshness,
+    view_refresher,
+    views_for_tables,
+)
+
+
+class TestDirtyTracking:
+    """Тесты пометки представлений при записи"""
+
+    def test_views_for_tables(self):
+        assert views_for_tables({"requests"}) == {"mv_requests_summary"}
+        assert views_for_tables({"cities"}) == {
+            "mv_requests_summary",
+            "mv_financial_summary",
+        }
+        assert views_for_tables({"masters"}) == set()
+
+    async def test_commit_marks_views_dirty(self, db_session):
+        view_refresher.pending_dirty.clear()
+
+        db_session.add(RequestType(name="Ремонт"))
+        await db_session.rollback()
+        assert view_refresher.pending_dirty == {}
+
+        db_session.add(RequestType(name="Ремонт"))
+        await db_session.commit()
+        assert set(view_refresher.pending_dirty) == {"mv_requests_summary"}
+
+        view_refresher.pending_dirty.clear()
+
+    async def test_refresh_skipped_without_postgresql(self, tmp_path):
+        refresher = MaterializedViewRefresher()
+        refresher.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'views.db'}"
+        )
+
+        try:
+            assert await refresher.ensure_views() == []
+            assert await refresher.refresh_dirty() == []
+        finally:
+            await refresher.engine.dispose()
+
+
+class TestFreshness:
+    """Тесты метаданных актуальности"""
+
+    def test_freshness_from_state(self):
+        state = {"refreshed_at": "2026-10-19T10:00:00+00:00"}
+        state["refreshed_ts"] = time.time() - 30
+
+        info = freshness(state, "mv_requests_summary")
+
+        assert info["source"] == "mv_requests_summary"
+        assert 29 <= info["staleness_seconds"] <= 31
+
+    async def test_statistics_fall_back_to_base_tables(self, db_session):
+        db_session.add(City(name="Самара"))
+        await db_session.commit()
+
+        stats = await OptimizedRequestCRUD.get_callcenter_statistics(
+            db_session, date_from=date.today() - timedelta(days=7)
+        )
+
+        assert stats["freshness"]["source"] == "base_tables"
+        assert stats["freshness"]["staleness_seconds"] == 0.0
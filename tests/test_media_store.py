@@ -0,0 +1,111 @@
+"""
+Тесты контентно-адресуемого хранилища файлов и потоковой загрузки
+"""
+
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import UploadFile
+
+from app.core.config import settings
+from app.utils.file_security import FileSecurityError, validate_and_save_file
+from app.utils.media_store import MediaStore
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def store(db_session):
+    return MediaStore(TestingSessionLocal)
+
+
+class TestMediaStore:
+    """Тесты дедупликации и счетчика ссылок"""
+
+    async def test_identical_content_is_stored_once(self, store, tmp_path):
+        directory = str(tmp_path / "gorod" / "rashod")
+
+        first, first_dup = await store.put_bytes(b"receipt", directory, "jpg")
+        second, second_dup = await store.put_bytes(b"receipt", directory, "jpg")
+        other, _ = await store.put_bytes(b"other receipt", directory, "jpg")
+
+        assert first == second != other
+        assert (first_dup, second_dup) == (False, True)
+        digest = os.path.basename(first).split(".")[0]
+        assert first.endswith(os.path.join(digest[:2], digest[2:4], f"{digest}.jpg"))
+        # Временные файлы не остаются
+        assert os.listdir(os.path.join(directory, ".tmp")) == []
+
+        stats = await store.stats()
+        assert stats["blobs"] == 2
+        assert stats["references"] == 3
+        assert stats["saved_bytes"] == len(b"receipt")
+
+    async def test_blob_removed_with_last_reference(self, store, tmp_path):
+        directory = str(tmp_path / "zayvka" / "zapis")
+        path, _ = await store.put_bytes(b"audio", directory, "mp3")
+        await store.put_bytes(b"audio", directory, "mp3")
+
+        assert await store.release(path) is False
+        assert os.path.exists(path)
+        assert await store.release(path) is True
+        assert not os.path.exists(path)
+        assert await store.release(path) is None
+
+        # После удаления то же содержимое сохраняется заново
+        path, deduplicated = await store.put_bytes(b"audio", directory, "mp3")
+        assert not deduplicated
+        assert os.path.exists(path)
+
+
+class TestStreamingUpload:
+    """Тесты потоковой загрузки через validate_and_save_file"""
+
+    @pytest.fixture
+    def uploads(self, store, monkeypatch, tmp_path):
+        from app.utils import file_security
+
+        monkeypatch.setattr(file_security, "media_store", store)
+        monkeypatch.setattr(settings, "UPLOAD_CHUNK_SIZE", 16)
+        return str(tmp_path)
+
+    @staticmethod
+    def _spool_dir(uploads):
+        # create_secure_upload_path оставляет от подпапки последний сегмент:
+        # "gorod/rashod" -> "rashod"
+        return os.path.join(uploads, "rashod", ".tmp")
+
+    async def test_upload_is_spooled_and_deduplicated(self, uploads):
+        content = b"%PDF-1.4\n" + b"0" * 100
+        saved = [
+            await validate_and_save_file(
+                UploadFile(io.BytesIO(content), filename="receipt.pdf"),
+                uploads,
+                "gorod/rashod",
+            )
+            for _ in range(2)
+        ]
+
+        (path, name, digest), (second_path, _, _) = saved
+        assert path == second_path
+        assert name == "receipt.pdf"
+        assert digest == hashlib.sha256(content).hexdigest()
+        assert os.path.dirname(os.path.dirname(os.path.dirname(path))) == (
+            os.path.join(uploads, "rashod")
+        )
+        with open(path, "rb") as f:
+            assert f.read() == content
+        assert os.listdir(self._spool_dir(uploads)) == []
+
+    async def test_size_limit_enforced_while_reading(self, uploads, monkeypatch):
+        monkeypatch.setattr(settings, "MAX_FILE_SIZE", 50)
+
+        with pytest.raises(FileSecurityError):
+            await validate_and_save_file(
+                UploadFile(io.BytesIO(b"%PDF-1.4\n" + b"0" * 100), filename="big.pdf"),
+                uploads,
+                "gorod/rashod",
+            )
+
+        assert os.listdir(self._spool_dir(uploads)) == []
@@ -0,0 +1,185 @@
+"""
+Тесты помесячного партиционирования requests
+"""
+
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.config import settings
+from app.db_partitioning import (
+    LOCK_NOT_AVAILABLE,
+    RequestPartitionManager,
+    add_months,
+    archive_table_name,
+    create_partition_sql,
+    detach_partition_sql,
+    month_start,
+    move_rows_sql,
+    parse_partition_month,
+    partition_bounds,
+    partition_name,
+)
+
+
+class TestPartitionNaming:
+    """Тесты имен и границ партиций"""
+
+    def test_month_arithmetic(self):
+        assert add_months(date(2026, 11, 1), 2) == date(2027, 1, 1)
+        assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+        # Границы считаются в UTC
+        msk = timezone(timedelta(hours=3))
+        assert month_start(datetime(2026, 11, 1, 1, 0, tzinfo=msk)) == date(2026, 10, 1)
+
+    def test_bounds_and_sql(self):
+        month = date(2026, 12, 1)
+
+        start, end = partition_bounds(month)
+
+        assert partition_name(month) == "requests_p2026_12"
+        assert parse_partition_month("requests_p2026_12") == month
+        assert parse_partition_month("requests_default") is None
+        assert start == datetime(2026, 12, 1, tzinfo=timezone.utc)
+        assert end == datetime(2027, 1, 1, tzinfo=timezone.utc)
+        assert create_partition_sql(month) == (
+            "CREATE TABLE IF NOT EXISTS requests_p2026_12 PARTITION OF requests "
+            "FOR VALUES FROM ('2026-12-01T00:00:00+00:00') "
+            "TO ('2027-01-01T00:00:00+00:00')"
+        )
+
+    def test_detached_partition_moves_to_archive(self):
+        source = archive_table_name(date(2025, 3, 1))
+
+        sql = move_rows_sql(
+            source, "requests_archive", ["id", "client_phone"], "id IN (1, 2)"
+        )
+
+        assert source == "requests_archive_2025_03"
+        assert sql == (
+            "WITH moved AS (DELETE FROM requests_archive_2025_03 "
+            "WHERE id IN (1, 2) RETURNING id, client_phone) "
+            "INSERT INTO requests_archive (id, client_phone, archived_at) "
+            "SELECT id, client_phone, now() FROM moved"
+        )
+
+
+class PgError(Exception):
+    """Ошибка драйвера с кодом SQLSTATE, как у asyncpg"""
+
+    def __init__(self, sqlstate):
+        super().__init__(sqlstate)
+        self.sqlstate = sqlstate
+
+
+class FakeDetachConnection:
+    """Соединение с правилами PostgreSQL для DETACH PARTITION
+
+    У requests есть default-партиция, поэтому DETACH ... CONCURRENTLY
+    отклоняется; первые busy попыток DETACH упираются в lock_timeout.
+    """
+
+    def __init__(self, busy=0):
+        self.busy = busy
+        self.statements = []
+
+    async def execution_options(self, **options):
+        return self
+
+    async def execute(self, statement, params=None):
+        sql = " ".join(str(statement).split())
+        self.statements.append(sql)
+        if "DETACH PARTITION" in sql:
+            if "CONCURRENTLY" in sql:
+                raise DBAPIError(sql, None, PgError("55000"))
+            if self.busy:
+                self.busy -= 1
+                raise DBAPIError(sql, None, PgError(LOCK_NOT_AVAILABLE))
+        return []
+
+
+class FakeEngine:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def connect(self):
+        return self
+
+    async def __aenter__(self):
+        return self.conn
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class TestDetachPartitions:
+    """Тесты отсоединения старых партиций при наличии default-партиции"""
+
+    def _manager(self, monkeypatch, conn, names):
+        manager = RequestPartitionManager()
+        manager.engine = FakeEngine(conn)
+
+        async def list_partitions():
+            return [{"name": name} for name in names]
+
+        monkeypatch.setattr(manager, "list_partitions", list_partitions)
+        monkeypatch.setattr(settings, "REQUESTS_PARTITION_DETACH_RETRY_SECONDS", 0)
+        return manager
+
+    def test_detach_sql_without_concurrently(self):
+        assert detach_partition_sql("requests_p2025_01") == (
+            "ALTER TABLE requests DETACH PARTITION requests_p2025_01"
+        )
+        assert detach_partition_sql("requests_p2025_01", pending=True).endswith(
+            " FINALIZE"
+        )
+
+    async def test_old_partition_detached_with_default_partition(self, monkeypatch):
+        conn = FakeDetachConnection(busy=2)
+        current = partition_name(month_start(datetime.now(timezone.utc)))
+        manager = self._manager(
+            monkeypatch, conn, ["requests_p2020_01", current, "requests_default"]
+        )
+
+        await manager.detach_old_partitions(retention_months=12)
+
+        detach = "ALTER TABLE requests DETACH PARTITION requests_p2020_01"
+        ddl = [sql for sql in conn.statements if sql.startswith(("ALTER", "SET"))]
+        assert ddl == [
+            f"SET lock_timeout = '{settings.REQUESTS_PARTITION_DETACH_LOCK_TIMEOUT}'",
+            detach,
+            detach,
+            detach,
+            "ALTER TABLE requests_p2020_01 RENAME TO requests_archive_2020_01",
+        ]
+        assert "RESET lock_timeout" in conn.statements
+
+    async def test_detach_gives_up_after_attempts(self, monkeypatch):
+        monkeypatch.setattr(settings, "REQUESTS_PARTITION_DETACH_ATTEMPTS", 2)
+        conn = FakeDetachConnection(busy=5)
+        manager = self._manager(monkeypatch, conn, [])
+
+        with pytest.raises(DBAPIError):
+            await manager._detach_partition(conn, "requests_p2020_01", False)
+
+        assert sum("DETACH" in sql for sql in conn.statements) == 2
+        assert conn.statements[-1] == "RESET lock_timeout"
+
+
+class TestPartitionManager:
+    """Тесты менеджера на непартиционированной БД"""
+
+    async def test_maintenance_is_noop_without_partitioning(self, tmp_path):
+        manager = RequestPartitionManager()
+        manager.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'partitions.db'}"
+        )
+
+        try:
+            assert await manager.run_maintenance() == {"partitioned": False}
+            assert await manager.list_partitions() == []
+            assert await manager.ensure_future_partitions() == []
+        finally:
+            await manager.engine.dispose()
@@ -0,0 +1,65 @@
+"""
+Тесты нормализации номеров телефонов
+"""
+
+import pytest
+from sqlalchemy import select
+
+from app.core import crud
+from app.core.models import City, Request, RequestType
+from app.core.phone import canonical_phone, normalize_phone, phone_filter_clause
+from app.core.schemas import RequestCreate, RequestUpdate
+
+
+class TestNormalizePhone:
+    """Тесты приведения к E.164"""
+
+    @pytest.mark.parametrize(
+        "phone",
+        ["79991234567", "89991234567", "9991234567", "+7 (999) 123-45-67"],
+    )
+    def test_russian_formats(self, phone):
+        assert normalize_phone(phone) == "+79991234567"
+
+    def test_unrecognized_kept_on_write(self):
+        assert normalize_phone("12345") is None
+        assert canonical_phone(" 12345 ") == "12345"
+        assert canonical_phone(None) is None
+
+    def test_filter_clause(self):
+        full = phone_filter_clause(Request.client_phone, "8 999 123 45 67")
+        assert full.right.value == "+79991234567"
+
+        suffix = phone_filter_clause(Request.client_phone, "45-67")
+        assert suffix.right.value == "%4567%"
+
+
+class TestPhoneOnWrite:
+    """Тесты нормализации при записи заявок"""
+
+    async def test_request_phone_normalized(self, db_session):
+        city = City(name="Город телефонов")
+        request_type = RequestType(name="Тип телефонов")
+        db_session.add_all([city, request_type])
+        await db_session.commit()
+
+        created = await crud.create_request(
+            db_session,
+            RequestCreate(
+                city_id=city.id,
+                request_type_id=request_type.id,
+                client_phone="8 (999) 123-45-67",
+            ),
+        )
+        assert created.client_phone == "+79991234567"
+
+        client = await crud.get_client(db_session, "9991234567")
+        assert client.last_request_id == created.id
+
+        await crud.update_request(
+            db_session, created.id, RequestUpdate(client_phone="79990000000")
+        )
+        result = await db_session.execute(
+            select(Request.client_phone).where(Request.id == created.id)
+        )
+        assert result.scalar() == "+79990000000"
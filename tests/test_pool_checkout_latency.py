@@ -0,0 +1,67 @@
+"""
+Тесты измерения ожидания и удержания соединений пула
+"""
+
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.database import InstrumentedQueuePool
+from app.monitoring.connection_pool_monitor import (
+    ConnectionPoolMonitor,
+    latency_percentiles,
+)
+from app.monitoring.query_tracker import current_request_scope
+
+
+@pytest.fixture
+async def instrumented_engine(tmp_path):
+    test_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=2,
+        max_overflow=0,
+    )
+    yield test_engine
+    await test_engine.dispose()
+
+
+class TestCheckoutLatency:
+    """Тесты измеренных метрик пула"""
+
+    def test_percentiles(self):
+        samples = [i / 1000 for i in range(1, 101)]
+
+        stats = latency_percentiles(samples)
+
+        assert stats["count"] == 100
+        assert stats["p50_ms"] == pytest.approx(51.0, abs=1)
+        assert stats["p99_ms"] == pytest.approx(99.0, abs=1)
+        assert latency_percentiles([])["count"] == 0
+
+    async def test_wait_and_hold_recorded_per_endpoint(self, instrumented_engine):
+        monitor = ConnectionPoolMonitor()
+        monitor._setup_engine_pool_events("test", instrumented_engine.pool)
+
+        scope_token = current_request_scope.set(
+            {
+                "type": "http",
+                "path": "/api/requests/",
+                "route": SimpleNamespace(path="/api/requests/"),
+            }
+        )
+        try:
+            for _ in range(3):
+                async with instrumented_engine.connect() as conn:
+                    await conn.execute(text("SELECT 1"))
+        finally:
+            current_request_scope.reset(scope_token)
+
+        stats = monitor.get_checkout_statistics("test")
+
+        assert stats["wait"]["count"] == 3
+        assert stats["hold"]["count"] == 3
+        assert list(stats["endpoints"]) == ["/api/requests/"]
+        assert monitor._measured_wait_time("test") >= 0
@@ -0,0 +1,144 @@
+"""
+Тесты счетчика запросов к БД и детектора N+1
+"""
+
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+
+from app.core.config import settings
+from app.core.models import City
+from app.monitoring.query_tracker import (
+    UNMATCHED_ENDPOINT,
+    QueryStats,
+    QueryTrackingMiddleware,
+    current_endpoint,
+    current_query_stats,
+    current_request_scope,
+    normalize_statement,
+    track_queries,
+)
+from tests.conftest import test_engine
+
+
+class TestNormalizeStatement:
+    """Тесты нормализации формы запроса"""
+
+    def test_in_lists_collapsed(self):
+        short = "SELECT * FROM cities WHERE cities.id IN ($1, $2)"
+        long = "SELECT * FROM cities WHERE cities.id IN ($1, $2, $3, $4)"
+
+        assert normalize_statement(short) == normalize_statement(long)
+
+    def test_literals_replaced(self):
+        assert normalize_statement(
+            "SELECT * FROM requests WHERE id = 42 AND status = 'new'"
+        ) == normalize_statement(
+            "SELECT * FROM requests WHERE id = 7 AND status = 'done'"
+        )
+
+
+class TestTrackQueries:
+    """Тесты подсчета запросов"""
+
+    async def test_counts_queries_and_rows(self, db_session):
+        db_session.add_all([City(name="Москва"), City(name="Казань")])
+        await db_session.commit()
+
+        with track_queries() as stats:
+            result = await db_session.execute(select(City))
+            assert len(result.scalars().all()) == 2
+            await db_session.execute(text("SELECT 1"))
+
+        assert stats.query_count == 2
+        assert stats.db_time > 0
+        assert not stats.has_n_plus_one
+        assert current_query_stats.get() is None
+
+    async def test_detects_n_plus_one(self, db_session):
+        for index in range(settings.QUERY_N_PLUS_ONE_THRESHOLD):
+            db_session.add(City(name=f"Город {index}"))
+        await db_session.commit()
+
+        with track_queries() as stats:
+            for city_id in range(1, settings.QUERY_N_PLUS_ONE_THRESHOLD + 1):
+                await db_session.execute(select(City).where(City.id == city_id))
+
+        repeated = stats.repeated_statements()
+        assert stats.has_n_plus_one
+        assert repeated[0]["count"] == settings.QUERY_N_PLUS_ONE_THRESHOLD
+
+    async def test_untracked_outside_context(self, db_session):
+        await db_session.execute(text("SELECT 1"))
+
+        assert current_query_stats.get() is None
+
+    async def test_failed_statement_does_not_leak_start_time(self):
+        async with test_engine.connect() as conn:
+            with pytest.raises(OperationalError):
+                await conn.execute(text("SELECT * FROM missing_table"))
+
+            with track_queries() as stats:
+                await conn.execute(text("SELECT 1"))
+
+            assert not conn.sync_connection.info.get("query_tracker_start")
+        assert stats.query_count == 1
+
+
+class TestCurrentEndpoint:
+    """Тесты метки эндпоинта"""
+
+    def test_unmatched_path_gets_fixed_label(self):
+        assert current_endpoint() is None
+
+        token = current_request_scope.set({"type": "http", "path": "/wp-login.php"})
+        try:
+            assert current_endpoint() == UNMATCHED_ENDPOINT
+        finally:
+            current_request_scope.reset(token)
+
+
+class TestQueryTrackingMiddleware:
+    """Тесты middleware"""
+
+    def test_debug_headers(self, monkeypatch):
+        monkeypatch.setattr(settings, "QUERY_TRACKING_HEADERS", True)
+        monkeypatch.setattr(settings, "QUERY_TRACKING_SAMPLE_RATE", 1.0)
+
+        test_app = FastAPI()
+        test_app.add_middleware(QueryTrackingMiddleware)
+
+        @test_app.get("/probe")
+        async def probe():
+            async with test_engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+                await conn.execute(text("SELECT 2"))
+            return {"ok": True}
+
+        with TestClient(test_app) as test_client:
+            response = test_client.get("/probe")
+
+        assert response.status_code == 200
+        assert response.headers["x-db-query-count"] == "2"
+        assert "x-db-n-plus-one" not in response.headers
+
+    def test_log_level_depends_on_query_count(self, caplog):
+        scope = {"method": "GET"}
+        small = QueryStats(endpoint="/api/requests/", query_count=2)
+        large = QueryStats(
+            endpoint="/api/requests/",
+            query_count=settings.QUERY_COUNT_LOG_THRESHOLD,
+        )
+
+        with caplog.at_level(logging.DEBUG, logger="app.monitoring.query_tracker"):
+            QueryTrackingMiddleware._report(scope, small)
+            QueryTrackingMiddleware._report(scope, large)
+
+        assert [record.levelno for record in caplog.records] == [
+            logging.DEBUG,
+            logging.INFO,
+        ]
@@ -0,0 +1,158 @@
+"""
+Тесты маршрутизации чтения на реплики
+"""
+
+import pytest
+from unittest.mock import MagicMock
+from sqlalchemy import text
+
+from app.core import database
+from app.core.database import ReadReplicaRouter, get_db, get_read_db
+from app.core.request_context import current_request_scope
+
+
+def make_request(authorization=None, host="10.0.0.1"):
+    """Минимальный объект запроса для client_key"""
+    request = MagicMock()
+    request.headers = {"authorization": authorization} if authorization else {}
+    request.client.host = host
+    return request
+
+
+@pytest.fixture
+async def router(tmp_path):
+    replica_router = ReadReplicaRouter(
+        [
+            f"sqlite+aiosqlite:///{tmp_path / 'replica1.db'}",
+            f"sqlite+aiosqlite:///{tmp_path / 'replica2.db'}",
+        ]
+    )
+    yield replica_router
+    await replica_router.dispose()
+
+
+class TestReadReplicaRouter:
+    """Тесты ReadReplicaRouter"""
+
+    async def test_disabled_without_replicas(self):
+        replica_router = ReadReplicaRouter([])
+
+        assert replica_router.enabled is False
+        assert await replica_router.route(make_request()) is None
+
+    async def test_round_robin(self, router):
+        chosen = [await router.route(None) for _ in range(4)]
+
+        assert chosen == ["replica_1", "replica_2", "replica_1", "replica_2"]
+
+    async def test_unhealthy_replica_skipped(self, router):
+        router.mark_unhealthy("replica_1", Exception("connection refused"))
+
+        assert {await router.route(None) for _ in range(3)} == {"replica_2"}
+
+        router.mark_unhealthy("replica_2", Exception("connection refused"))
+        assert await router.route(None) is None
+
+        router.mark_healthy("replica_1")
+        assert await router.route(None) == "replica_1"
+
+    async def test_read_your_writes_pin(self, router, monkeypatch):
+        from app.core.cache import cache_manager
+
+        shared_cache = {}
+
+        async def cache_set(key, value, ttl=None):
+            shared_cache[key] = value
+            return True
+
+        async def cache_get(key):
+            return shared_cache.get(key)
+
+        monkeypatch.setattr(cache_manager, "set", cache_set)
+        monkeypatch.setattr(cache_manager, "get", cache_get)
+
+        writer = make_request(authorization="Bearer writer")
+        reader = make_request(authorization="Bearer reader")
+
+        await router.pin_to_primary(router.client_key(writer))
+
+        assert await router.route(writer) is None
+        assert await router.route(reader) is not None
+
+        # Привязка видна другим воркерам через общий кеш
+        router._local_pins.clear()
+        assert await router.route(writer) is None
+
+    async def test_client_key_falls_back_to_ip(self):
+        key_a = ReadReplicaRouter.client_key(make_request(host="10.0.0.1"))
+        key_b = ReadReplicaRouter.client_key(make_request(host="10.0.0.2"))
+
+        assert key_a and key_b and key_a != key_b
+        assert ReadReplicaRouter.client_key(None) is None
+
+    async def test_replica_session_and_health_check(self, router):
+        async with router.session("replica_1") as session:
+            assert (await session.execute(text("SELECT 1"))).scalar() == 1
+
+        assert await router.check_health() == {
+            "replica_1": True,
+            "replica_2": True,
+        }
+
+
+class TestReadDependencies:
+    """Тесты зависимостей get_read_db и get_db с репликами"""
+
+    async def test_unavailable_replica_falls_back_to_primary(
+        self, tmp_path, monkeypatch
+    ):
+        # Каталога нет: соединение с "репликой" не открывается
+        replica_router = ReadReplicaRouter(
+            [f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}"]
+        )
+        monkeypatch.setattr(database, "read_router", replica_router)
+        fallbacks = []
+        monkeypatch.setattr(
+            database.prometheus_collector,
+            "record_replica_fallback",
+            fallbacks.append,
+        )
+        primary = MagicMock()
+
+        dependency = get_read_db(make_request(), primary)
+        try:
+            assert await dependency.__anext__() is primary
+        finally:
+            await dependency.aclose()
+            await replica_router.dispose()
+
+        assert fallbacks == ["replica_1"]
+        assert replica_router.is_healthy("replica_1") is False
+
+    async def test_write_pins_client_from_request_scope(self, router, monkeypatch):
+        monkeypatch.setattr(database, "read_router", router)
+        pinned = []
+
+        async def pin_to_primary(key):
+            pinned.append(key)
+
+        monkeypatch.setattr(router, "pin_to_primary", pin_to_primary)
+        scope = {
+            "type": "http",
+            "headers": [(b"authorization", b"Bearer writer")],
+            "client": ("10.0.0.1", 1234),
+        }
+
+        token = current_request_scope.set(scope)
+        try:
+            dependency = get_db()
+            session = await dependency.__anext__()
+            session.info["has_writes"] = True
+            with pytest.raises(StopAsyncIteration):
+                await dependency.__anext__()
+        finally:
+            current_request_scope.reset(token)
+
+        assert pinned == [
+            router.client_key(make_request(authorization="Bearer writer"))
+        ]
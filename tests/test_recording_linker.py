@@ -0,0 +1,104 @@
+"""
+Тесты пакетного связывания записей звонков с заявками
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from app.core import crud
+from app.core.models import City, Request, RequestType
+from app.core.schemas import RequestCreate
+
+CALL_AT = datetime(2025, 7, 15, 11, 3, 7)
+
+
+@pytest.fixture
+async def references(db_session):
+    city = City(name="Город записей")
+    request_type = RequestType(name="Тип записей")
+    db_session.add_all([city, request_type])
+    await db_session.commit()
+    return city, request_type
+
+
+async def _request(db_session, references, phone, created_at):
+    city, request_type = references
+    request = await crud.create_request(
+        db_session,
+        RequestCreate(
+            city_id=city.id, request_type_id=request_type.id, client_phone=phone
+        ),
+    )
+    await db_session.execute(
+        update(Request).where(Request.id == request.id).values(created_at=created_at)
+    )
+    await db_session.commit()
+    return request.id
+
+
+def _recording(phone, call_at, name):
+    return {
+        "filename": name,
+        "from_number": phone,
+        "call_datetime": call_at,
+        "relative_path": f"media/zayvka/zapis/{name}",
+    }
+
+
+async def _paths(db_session, ids):
+    result = await db_session.execute(
+        select(Request.id, Request.recording_file_path).where(Request.id.in_(ids))
+    )
+    return dict(result.all())
+
+
+class TestBatchLinker:
+    """Тесты link_recordings_batch"""
+
+    async def test_nearest_request_is_linked(self, db_session, references):
+        far = await _request(
+            db_session, references, "79991234567", CALL_AT - timedelta(minutes=25)
+        )
+        near = await _request(
+            db_session, references, "79991234567", CALL_AT + timedelta(minutes=2)
+        )
+        other = await _request(db_session, references, "79990000000", CALL_AT)
+
+        results = await crud.link_recordings_batch(
+            db_session,
+            [
+                _recording("79991234567", CALL_AT, "a.mp3"),
+                _recording("89990000000", CALL_AT + timedelta(minutes=1), "b.mp3"),
+                _recording("79995555555", CALL_AT, "c.mp3"),
+                {"filename": "broken.mp3"},
+            ],
+        )
+
+        assert [(r["filename"], r["status"], r["request_id"]) for r in results] == [
+            ("a.mp3", "linked", near),
+            ("b.mp3", "linked", other),
+            ("c.mp3", "not_found", None),
+            ("broken.mp3", "invalid", None),
+        ]
+        paths = await _paths(db_session, [far, near, other])
+        assert paths[near].endswith("a.mp3")
+        assert paths[other].endswith("b.mp3")
+        assert paths[far] is None
+
+    async def test_request_goes_to_closest_recording(self, db_session, references):
+        request_id = await _request(db_session, references, "79991234567", CALL_AT)
+
+        results = await crud.link_recordings_batch(
+            db_session,
+            [
+                _recording("79991234567", CALL_AT + timedelta(minutes=20), "late.mp3"),
+                _recording("79991234567", CALL_AT + timedelta(minutes=1), "near.mp3"),
+                _recording("79991234567", CALL_AT + timedelta(hours=2), "out.mp3"),
+            ],
+        )
+
+        assert [r["status"] for r in results] == ["duplicate", "linked", "not_found"]
+        request = await db_session.get(Request, request_id, populate_existing=True)
+        assert request.recording_file_path.endswith("near.mp3")
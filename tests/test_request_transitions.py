@@ -0,0 +1,135 @@
+"""
+Тесты переходов статусов заявок и оптимистичной блокировки
+"""
+
+import pytest
+from sqlalchemy import select
+
+from app.core.crud import create_request, update_request
+from app.core.exceptions import ResourceConflictError
+from app.core.models import City, Request, RequestType, Transaction, TransactionType
+from app.core.reference_data import reference_data
+from app.core.request_transitions import (
+    is_transition_allowed,
+    parse_if_match,
+    request_etag,
+)
+from app.core.schemas import RequestCreate, RequestUpdate
+from tests.test_returning_writes import StatementCounter
+
+
+@pytest.fixture
+async def new_request(db_session):
+    reference_data.invalidate()
+    city = City(name="Город переходов")
+    request_type = RequestType(name="Тип переходов")
+    db_session.add_all([city, request_type, TransactionType(name="Приход")])
+    await db_session.commit()
+    db_request = await create_request(
+        db_session,
+        RequestCreate(
+            city_id=city.id, request_type_id=request_type.id, client_phone="79990001122"
+        ),
+    )
+    yield db_request
+    reference_data.invalidate()
+
+
+class TestETag:
+    """Тесты разбора If-Match"""
+
+    def test_parse_if_match(self):
+        assert parse_if_match(None) is None
+        assert parse_if_match("*") is None
+        assert parse_if_match(request_etag(3)) == 3
+        assert parse_if_match('W/"7"') == 7
+        with pytest.raises(ValueError):
+            parse_if_match("3")
+
+    def test_closed_request_cannot_return_to_queue(self):
+        assert is_transition_allowed("Новая", "Готово")
+        assert is_transition_allowed("Готово", "В работе")
+        assert not is_transition_allowed("Готово", "Новая")
+        assert is_transition_allowed("new", "Новая")
+
+
+class TestConditionalUpdate:
+    """Тесты условного UPDATE по версии"""
+
+    async def test_update_bumps_version(self, db_session, new_request):
+        assert new_request.version == 1
+
+        with StatementCounter() as counter:
+            updated = await update_request(
+                db_session,
+                new_request.id,
+                RequestUpdate(status="В работе"),
+                expected_version=1,
+            )
+
+        assert updated.version == 2
+        assert updated.status == "В работе"
+        assert "RETURNING" in counter.statements[0]
+
+    async def test_stale_version_conflict(self, db_session, new_request):
+        request_id = new_request.id
+        # Диспетчер сохранил изменения раньше мастера
+        await update_request(
+            db_session, request_id, RequestUpdate(client_name="Иван"), 1
+        )
+
+        with pytest.raises(ResourceConflictError) as exc_info:
+            await update_request(
+                db_session,
+                request_id,
+                RequestUpdate(master_notes="Заметка"),
+                expected_version=1,
+            )
+
+        assert exc_info.value.status_code == 409
+        assert exc_info.value.details["current_version"] == 2
+        row = (
+            await db_session.execute(
+                select(Request.client_name, Request.master_notes).where(
+                    Request.id == request_id
+                )
+            )
+        ).one()
+        assert row == ("Иван", None)
+
+    async def test_version_in_body(self, db_session, new_request):
+        with pytest.raises(ResourceConflictError):
+            await update_request(
+                db_session, new_request.id, RequestUpdate(client_name="A", version=5)
+            )
+
+    async def test_forbidden_transition(self, db_session, new_request):
+        await update_request(db_session, new_request.id, RequestUpdate(status="Отказ"))
+
+        with pytest.raises(ResourceConflictError) as exc_info:
+            await update_request(
+                db_session, new_request.id, RequestUpdate(status="Новая")
+            )
+
+        assert "not allowed" in exc_info.value.message
+        assert exc_info.value.details["current_status"] == "Отказ"
+
+    async def test_income_created_with_transition(self, db_session, new_request):
+        await update_request(
+            db_session,
+            new_request.id,
+            RequestUpdate(status="Готово", master_handover=300),
+            expected_version=1,
+        )
+        await update_request(
+            db_session, new_request.id, RequestUpdate(master_handover=450)
+        )
+
+        transactions = (await db_session.execute(select(Transaction))).scalars().all()
+        assert [t.amount for t in transactions] == [450]
+
+    async def test_orm_flush_bumps_version(self, db_session, new_request):
+        new_request.client_name = "Через ORM"
+        await db_session.commit()
+
+        assert new_request.version == 2
@@ -0,0 +1,163 @@
+"""
+Тесты записи через INSERT/UPDATE ... RETURNING
+"""
+
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event, select
+
+from app.core.crud import (
+    create_request,
+    create_transaction,
+    update_city,
+    update_request,
+    update_transaction,
+)
+from app.core.models import City, Master, RequestType, Transaction, TransactionType
+from app.core.reference_data import reference_data
+from app.core.schemas import (
+    CityUpdate,
+    RequestCreate,
+    RequestResponse,
+    RequestUpdate,
+    TransactionCreate,
+    TransactionResponse,
+    TransactionUpdate,
+)
+from tests.conftest import test_engine
+
+
+@pytest.fixture
+async def references(db_session):
+    reference_data.invalidate()
+    city = City(name="Город RETURNING")
+    request_type = RequestType(name="Тип RETURNING")
+    income = TransactionType(name="Приход")
+    db_session.add_all([city, request_type, income])
+    await db_session.commit()
+    yield city, request_type, income
+    reference_data.invalidate()
+
+
+class StatementCounter:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(test_engine.sync_engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(test_engine.sync_engine, "before_cursor_execute", self)
+
+
+class TestRequestWrites:
+    """Тесты создания и обновления заявок"""
+
+    async def test_create_request_single_statement(self, db_session, references):
+        city, request_type, _ = references
+        data = RequestCreate(
+            city_id=city.id, request_type_id=request_type.id, client_phone="79991112233"
+        )
+        await create_request(db_session, data)
+
+        with StatementCounter() as counter:
+            db_request = await create_request(db_session, data)
+
+        # INSERT ... RETURNING и учет клиента в той же транзакции
+        assert len(counter.statements) == 2
+        assert "RETURNING" in counter.statements[0]
+        assert "clients" in counter.statements[1]
+        response = RequestResponse.model_validate(db_request)
+        assert response.city.name == "Город RETURNING"
+        assert response.request_type.name == "Тип RETURNING"
+        assert response.master is None
+        assert response.files == []
+        assert response.status == "Новая"
+
+    async def test_update_request_creates_income(self, db_session, references):
+        city, request_type, income = references
+        master = Master(
+            city_id=city.id,
+            full_name="Мастер",
+            phone_number="79990000000",
+            login="master_returning",
+            password_hash="x",
+        )
+        db_session.add(master)
+        await db_session.commit()
+        db_request = await create_request(
+            db_session,
+            RequestCreate(
+                city_id=city.id,
+                request_type_id=request_type.id,
+                client_phone="79991112233",
+            ),
+        )
+
+        updated = await update_request(
+            db_session,
+            db_request.id,
+            RequestUpdate(
+                status="Готово", master_id=master.id, master_handover=Decimal("500")
+            ),
+        )
+
+        assert RequestResponse.model_validate(updated).master.id == master.id
+        transaction = (
+            await db_session.execute(
+                select(Transaction).where(
+                    Transaction.notes == f"Приход по заявке {db_request.id}"
+                )
+            )
+        ).scalar_one()
+        assert transaction.transaction_type_id == income.id
+        assert transaction.amount == Decimal("500")
+
+        await update_request(db_session, db_request.id, RequestUpdate(status="Отказ"))
+        remaining = await db_session.execute(select(Transaction))
+        assert remaining.first() is None
+
+    async def test_update_missing_request(self, db_session, references):
+        assert (
+            await update_request(db_session, 999, RequestUpdate(status="Отказ")) is None
+        )
+
+
+class TestTransactionWrites:
+    """Тесты создания и обновления транзакций"""
+
+    async def test_create_and_update_transaction(self, db_session, references):
+        city, _, income = references
+        db_transaction = await create_transaction(
+            db_session,
+            TransactionCreate(
+                city_id=city.id,
+                transaction_type_id=income.id,
+                amount=Decimal("100.00"),
+                specified_date=date(2025, 1, 15),
+            ),
+        )
+        response = TransactionResponse.model_validate(db_transaction)
+        assert response.transaction_type.name == "Приход"
+
+        updated = await update_transaction(
+            db_session, db_transaction.id, TransactionUpdate(amount=Decimal("250.00"))
+        )
+        assert updated.amount == Decimal("250.00")
+        assert TransactionResponse.model_validate(updated).city.id == city.id
+
+    async def test_reference_update_invalidates_cache(self, db_session, references):
+        city, _, _ = references
+        assert (await reference_data.get(db_session, City, city.id)) is not None
+
+        await update_city(db_session, city.id, CityUpdate(name="Новое имя"))
+        db_session.expunge_all()
+
+        refreshed = await reference_data.get(db_session, City, city.id)
+        assert refreshed.name == "Новое имя"
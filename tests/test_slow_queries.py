@@ -0,0 +1,104 @@
+"""
+Тесты захвата медленных запросов
+"""
+
+from types import SimpleNamespace
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.models import City
+from app.monitoring.query_tracker import current_request_scope
+from app.monitoring.slow_queries import (
+    SlowQueryLog,
+    parameter_shape,
+    slow_query_log,
+    summarize_plan,
+)
+
+PLAN = [
+    {
+        "Plan": {
+            "Node Type": "Hash Join",
+            "Total Cost": 120.5,
+            "Plan Rows": 10,
+            "Plans": [
+                {
+                    "Node Type": "Seq Scan",
+                    "Relation Name": "requests",
+                    "Plan Rows": 500,
+                },
+                {
+                    "Node Type": "Index Scan",
+                    "Relation Name": "cities",
+                    "Plan Rows": 1,
+                },
+            ],
+        }
+    }
+]
+
+
+class TestPlanSummary:
+    """Тесты сводки плана"""
+
+    def test_seq_scans_and_misestimate(self):
+        summary = summarize_plan(PLAN, actual_rows=1000)
+
+        assert summary["root_node"] == "Hash Join"
+        assert summary["seq_scans"] == ["requests"]
+        assert summary["estimated_rows"] == 10
+        assert summary["rows_misestimate"] == 100.0
+
+    def test_parameter_shape_hides_values(self):
+        assert parameter_shape(("79991234567", 5, [1, 2, 3])) == [
+            "str",
+            "int",
+            "list[3]",
+        ]
+        assert parameter_shape([(1,), (2,)], executemany=True) == ["executemany[2]"]
+
+
+class TestSlowQueryLog:
+    """Тесты хранилища медленных запросов"""
+
+    async def test_captures_slow_queries_with_endpoint(self, db_session, monkeypatch):
+        monkeypatch.setattr(settings, "SLOW_QUERY_THRESHOLD_MS", 0)
+        slow_query_log.clear()
+
+        scope_token = current_request_scope.set(
+            {
+                "type": "http",
+                "path": "/api/cities/",
+                "route": SimpleNamespace(path="/api/cities/"),
+            }
+        )
+        try:
+            for city_id in (1, 2):
+                await db_session.execute(select(City).where(City.id == city_id))
+        finally:
+            current_request_scope.reset(scope_token)
+
+        captured = slow_query_log.get_slow_queries(limit=50)
+        city_queries = [q for q in captured if "FROM cities" in q["query"]]
+
+        assert len(city_queries) == 1
+        assert city_queries[0]["calls"] == 2
+        assert city_queries[0]["endpoints"] == ["/api/cities/"]
+        assert city_queries[0]["parameter_shape"] == ["int"]
+        # EXPLAIN выполняется только для PostgreSQL
+        assert city_queries[0]["plan"] is None
+
+        slow_query_log.clear()
+
+    def test_store_is_bounded(self):
+        store = SlowQueryLog(max_entries=3)
+
+        class FakeConnection:
+            class dialect:
+                name = "sqlite"
+
+        for index in range(5):
+            store.record(FakeConnection(), f"SELECT * FROM table_{index}", (), 1000.0)
+
+        assert len(store.entries) == 3
@@ -0,0 +1,100 @@
+"""
+Тесты настроек кеша prepared statements
+"""
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.config import Settings, settings
+from app.core.database import (
+    StatementCacheStats,
+    get_statement_cache_connect_args,
+    pgbouncer_statement_name,
+    track_statement_cache,
+)
+
+
+class TestStatementCacheConnectArgs:
+    """Тесты параметров asyncpg для разных режимов"""
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(settings, "DB_STATEMENT_CACHE_MODE", "disabled")
+
+        assert get_statement_cache_connect_args() == {
+            "prepared_statement_cache_size": 0
+        }
+
+    def test_direct(self, monkeypatch):
+        monkeypatch.setattr(settings, "DB_STATEMENT_CACHE_MODE", "direct")
+        monkeypatch.setattr(settings, "DB_STATEMENT_CACHE_SIZE", 128)
+
+        assert get_statement_cache_connect_args() == {
+            "prepared_statement_cache_size": 128
+        }
+
+    def test_pgbouncer_uses_unique_names(self, monkeypatch):
+        monkeypatch.setattr(settings, "DB_STATEMENT_CACHE_MODE", "pgbouncer")
+
+        connect_args = get_statement_cache_connect_args()
+
+        assert connect_args["statement_cache_size"] == 0
+        assert connect_args["prepared_statement_cache_size"] > 0
+        name_func = connect_args["prepared_statement_name_func"]
+        assert name_func() != name_func()
+        assert pgbouncer_statement_name().startswith("__asyncpg_")
+
+    def test_invalid_mode_rejected(self, monkeypatch):
+        monkeypatch.setenv("DB_STATEMENT_CACHE_MODE", "always")
+
+        with pytest.raises(ValueError):
+            Settings()
+
+
+class TestStatementCacheStats:
+    """Тесты статистики попаданий в кеш"""
+
+    def test_hit_ratio(self):
+        StatementCacheStats.reset()
+
+        StatementCacheStats.record("primary", hit=False)
+        StatementCacheStats.record("primary", hit=True)
+        StatementCacheStats.record("primary", hit=True)
+        StatementCacheStats.record("primary", hit=True)
+
+        stats = StatementCacheStats.get_stats()
+        assert stats["primary"]["hits"] == 3
+        assert stats["primary"]["misses"] == 1
+        assert stats["primary"]["hit_ratio"] == 0.75
+
+        StatementCacheStats.reset()
+
+    async def test_tracked_engine_counts_hits_and_misses(self, monkeypatch):
+        engine = create_async_engine("sqlite+aiosqlite://")
+        track_statement_cache(engine, "tracked")
+        StatementCacheStats.reset()
+
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            # Без кеша у драйвера (aiosqlite) выполнения не учитываются
+            assert "tracked" not in StatementCacheStats.get_stats()
+
+            # Кеш asyncpg - словарь по тексту запроса; у адаптера aiosqlite
+            # есть __slots__, поэтому атрибут задается на классе
+            raw = await conn.get_raw_connection()
+            monkeypatch.setattr(
+                type(raw.dbapi_connection),
+                "_prepared_statement_cache",
+                {"SELECT 1": object()},
+                raising=False,
+            )
+            await conn.execute(text("SELECT 1"))
+            await conn.execute(text("SELECT 1"))
+            await conn.execute(text("SELECT 2"))
+        await engine.dispose()
+
+        stats = StatementCacheStats.get_stats()
+        assert stats["tracked"]["hits"] == 2
+        assert stats["tracked"]["misses"] == 1
+
+        StatementCacheStats.reset()
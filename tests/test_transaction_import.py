@@ -0,0 +1,176 @@
+"""
+Тесты массового импорта транзакций
+"""
+
+import io
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from app.core.models import Transaction, TransactionType
+from app.services.transaction_import import (
+    ReferenceLookup,
+    TransactionImporter,
+    iter_csv_rows,
+    validate_row,
+)
+from app.validators import ValidationError
+
+STATEMENT = (
+    "Город;Тип;Сумма;Дата;Примечание\n"
+    "Тестовый город;Тестовый тип транзакции;1 500,50;15.01.2025;Аренда\n"
+    "тестовый город;Тестовый тип транзакции;200;2025-01-16;\n"
+    "Другой город;Тестовый тип транзакции;300;2025-01-16;\n"
+    ";;;;\n"
+    "Тестовый город;Тестовый тип транзакции;0;2025-01-17;\n"
+).encode("utf-8-sig")
+
+
+class TestStatementParsing:
+    """Тесты чтения выписки"""
+
+    def test_csv_rows_with_russian_headers(self):
+        rows = list(iter_csv_rows(io.BytesIO(STATEMENT)))
+
+        assert rows[0] == {
+            "city": "Тестовый город",
+            "transaction_type": "Тестовый тип транзакции",
+            "amount": "1 500,50",
+            "specified_date": "15.01.2025",
+            "notes": "Аренда",
+        }
+        assert rows[3] == {}
+
+    def test_missing_columns(self):
+        with pytest.raises(ValidationError):
+            list(iter_csv_rows(io.BytesIO(b"city,amount\nA,1\n")))
+
+
+class TestRowValidation:
+    """Тесты проверки значений ячеек"""
+
+    lookup = ReferenceLookup({"город": 1}, {"аренда": 2})
+
+    def _row(self, **values):
+        row = {
+            "city": "Город",
+            "transaction_type": "Аренда",
+            "amount": "100",
+            "specified_date": "2025-01-15",
+        }
+        row.update(values)
+        return row
+
+    @pytest.mark.parametrize(
+        "value, expected",
+        [
+            ("15.01.2025", date(2025, 1, 15)),
+            (date(2025, 1, 15), date(2025, 1, 15)),
+            (datetime(2025, 1, 15, 10, 30), date(2025, 1, 15)),
+            # Ячейка XLSX без формата даты - номер дня Excel
+            (45672, date(2025, 1, 15)),
+        ],
+    )
+    def test_valid_dates(self, value, expected):
+        data = validate_row(self._row(specified_date=value), self.lookup)
+
+        assert data["specified_date"] == expected
+
+    @pytest.mark.parametrize(
+        "value", [None, "", "15/01/2025", 0, -5, float("nan"), True, b"2025-01-15"]
+    )
+    def test_invalid_dates_are_row_errors(self, value):
+        with pytest.raises(ValidationError) as error:
+            validate_row(self._row(specified_date=value), self.lookup)
+
+        assert error.value.field == "specified_date"
+
+    @pytest.mark.parametrize(
+        "value", [None, "abc", "NaN", float("inf"), True, date(2025, 1, 15)]
+    )
+    def test_invalid_amounts_are_row_errors(self, value):
+        with pytest.raises(ValidationError) as error:
+            validate_row(self._row(amount=value), self.lookup)
+
+        assert error.value.field == "amount"
+
+    def test_numeric_amount(self):
+        data = validate_row(self._row(amount=1500.5), self.lookup)
+
+        assert data["amount"] == Decimal("1500.50")
+
+
+@pytest.fixture
+async def transaction_type(db_session):
+    transaction_type = TransactionType(name="Тестовый тип транзакции")
+    db_session.add(transaction_type)
+    await db_session.commit()
+    return transaction_type
+
+
+class TestTransactionImporter:
+    """Тесты загрузки через staging-таблицу"""
+
+    async def test_import_with_row_errors(
+        self, db_session, test_city, transaction_type
+    ):
+        report = await TransactionImporter(db_session).run(
+            iter_csv_rows(io.BytesIO(STATEMENT))
+        )
+
+        assert report["total_rows"] == 4
+        assert report["imported"] == 2
+        assert [(e["row"], e["field"]) for e in report["errors"]] == [
+            (4, "city"),
+            (6, "amount"),
+        ]
+
+        transactions = (
+            (await db_session.execute(select(Transaction).order_by(Transaction.id)))
+            .scalars()
+            .all()
+        )
+        assert [t.amount for t in transactions] == [Decimal("1500.50"), Decimal("200")]
+        assert transactions[0].specified_date == date(2025, 1, 15)
+        assert transactions[0].city_id == test_city.id
+
+    async def test_reimport_skips_existing_rows(
+        self, db_session, test_city, transaction_type
+    ):
+        await TransactionImporter(db_session).run(iter_csv_rows(io.BytesIO(STATEMENT)))
+        report = await TransactionImporter(db_session).run(
+            iter_csv_rows(io.BytesIO(STATEMENT))
+        )
+
+        assert report["imported"] == 0
+        assert report["skipped_duplicates"] == [2, 3]
+
+    async def test_dry_run_does_not_write(
+        self, db_session, test_city, transaction_type
+    ):
+        report = await TransactionImporter(db_session).run(
+            iter_csv_rows(io.BytesIO(STATEMENT)), dry_run=True
+        )
+
+        assert report["valid_rows"] == 2
+        assert report["imported"] == 0
+        assert (await db_session.execute(select(Transaction))).first() is None
+
+    async def test_rows_are_read_outside_event_loop(
+        self, db_session, test_city, transaction_type
+    ):
+        loop_thread = threading.get_ident()
+        reader_threads = set()
+
+        def rows():
+            for row in iter_csv_rows(io.BytesIO(STATEMENT)):
+                reader_threads.add(threading.get_ident())
+                yield row
+
+        report = await TransactionImporter(db_session).run(rows(), dry_run=True)
+
+        assert report["valid_rows"] == 2
+        assert reader_threads and loop_thread not in reader_threads